@@ -362,6 +362,19 @@ class FlannConfig(ConfigBase):
         #General Params
         flann_cfg.algorithm = 'kdtree'  # linear
         flann_cfg.flann_cores = 0  # doesnt change config, just speed
+        # 'flann', 'brute' (exact), 'pq' (compressed), or 'auto' to search
+        # databases of at most brute_max_vecs descriptors by brute force
+        flann_cfg.knn_backend = 'auto'
+        flann_cfg.brute_max_vecs = 50000
+        # Compressed index params (bytes per descriptor, coarse lists (0 is
+        # automatic), lists probed per query and exact re-ranking factor).
+        # pq trades recall for memory: on benchmark_compressed_index (K=4)
+        # its recall is 0.49 with pq_rerank=4 (0.25 without re-ranking)
+        # against 0.62 for the default FLANN kdtrees.
+        flann_cfg.pq_subvectors = 16
+        flann_cfg.pq_nlist = 0
+        flann_cfg.pq_nprobe = 16
+        flann_cfg.pq_rerank = 4
         # KDTree params
         flann_cfg.trees = 8
         # KMeansTree params
@@ -380,6 +393,12 @@ class FlannConfig(ConfigBase):
             algorithm=flann_cfg.algorithm,
             trees=flann_cfg.trees,
             cores=flann_cfg.flann_cores,
+            knn_backend=flann_cfg.knn_backend,
+            brute_max_vecs=flann_cfg.brute_max_vecs,
+            pq_subvectors=flann_cfg.pq_subvectors,
+            pq_nlist=flann_cfg.pq_nlist,
+            pq_nprobe=flann_cfg.pq_nprobe,
+            pq_rerank=flann_cfg.pq_rerank,
         )
         return flann_params
 
@@ -405,6 +424,14 @@ class FlannConfig(ConfigBase):
             # HACK FOR GGR
             flann_cfgstrs += ['scalethrsh=%s,%s' % (flann_cfg.minscale_thresh, flann_cfg.maxscale_thresh)]
         #flann_cfgstrs += ['checks=%r' % flann_cfg.checks]
+        # 'auto' resolves per index (see NeighborIndex.get_cfgstr), so the
+        # cfgstr of existing FLANN caches stays the same
+        if flann_cfg.knn_backend == 'pq':
+            flann_cfgstrs += ['_knn=pq(%d,%d,%d,%d)' % (
+                flann_cfg.pq_subvectors, flann_cfg.pq_nlist,
+                flann_cfg.pq_nprobe, flann_cfg.pq_rerank)]
+        elif flann_cfg.knn_backend not in ['flann', 'auto']:
+            flann_cfgstrs += ['_knn=%s' % flann_cfg.knn_backend]
         flann_cfgstrs += [')']
         return flann_cfgstrs
 
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Batched inference over annotation chips.
+
+The annotation classifier, labeler and AoI computes used to load their
+inputs through the depcache one by one in the calling process and hand the
+whole list to the model. Here the inputs are read by a pool of threads
+(chips that are already in the depcache are read from disk, the others are
+warped straight from the image without being stored) and fed to the model in
+fixed-size batches with a DetectionPipeline, so reading overlaps inference.
+Results come back in input order.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import utool as ut
+(print, rrr, profile) = ut.inject2(__name__, '[annot_inference]')
+
+
+# Config params of the harness. They do not change the results, so they are
+# hidden from the cfgstr and not passed to the models.
+INFERENCE_PARAM_KEYS = ['inference_batch_size', 'inference_workers']
+
+
+def split_inference_config(config):
+    """
+    Returns:
+        tuple: (model_kw, batch_size, workers) - the config without the
+            harness params, and the harness params
+    """
+    model_kw = {
+        key: config[key]
+        for key in config.keys()
+        if key not in INFERENCE_PARAM_KEYS
+    }
+    batch_size = config['inference_batch_size'] if 'inference_batch_size' in config else None
+    workers = config['inference_workers'] if 'inference_workers' in config else None
+    return model_kw, batch_size, workers
+
+
+def read_chip(read_args):
+    """
+    Decode stage for the read args of get_chip_read_args.
+
+    Returns:
+        ndarray: chipBGR
+    """
+    import vtool_ibeis as vt
+    if read_args[0] == 'path':
+        return vt.imread(read_args[1])
+    else:
+        from ibeis.core_annots import gen_chip_worker
+        gpath, orient, M, new_size, filter_list, warpkw = read_args[1:]
+        return gen_chip_worker(gpath, orient, M, new_size, filter_list, warpkw)[0]
+
+
+def get_chip_read_args(ibs, aid_list, config):
+    """
+    Builds the read_chip args of each annotation in the calling thread.
+
+    Chips already in the depcache for config are read from their files. The
+    other chips are warped from their images by the decode workers exactly as
+    the chips table computes them, but are not stored.
+
+    Args:
+        config (dict): ChipConfig params
+    """
+    from ibeis.core_annots import get_chip_warp_params
+    depc = ibs.depc_annot
+    config_ = depc._ensure_config('chips', config)
+    rowid_list = depc.get_rowids('chips', aid_list, config=config, ensure=False)
+    read_args_list = [None] * len(aid_list)
+
+    stored_idxs = [idx for idx, rowid in enumerate(rowid_list) if rowid is not None]
+    if len(stored_idxs) > 0:
+        stored_rowids = ut.take(rowid_list, stored_idxs)
+        fpath_list = depc.get_native('chips', stored_rowids, 'img',
+                                     read_extern=False)
+        for idx, fpath in zip(stored_idxs, fpath_list):
+            read_args_list[idx] = ('path', fpath)
+
+    dirty_idxs = [idx for idx, rowid in enumerate(rowid_list) if rowid is None]
+    if len(dirty_idxs) > 0:
+        dirty_aids = ut.take(aid_list, dirty_idxs)
+        gid_list = ibs.get_annot_gids(dirty_aids)
+        bbox_list = ibs.get_annot_bboxes(dirty_aids)
+        theta_list = ibs.get_annot_thetas(dirty_aids)
+        M_list, newsize_list, filter_list, warpkw = get_chip_warp_params(
+            dirty_aids, bbox_list, theta_list, config_)
+        gpath_list = ibs.get_image_paths(gid_list)
+        orient_list = ibs.get_image_orientation(gid_list)
+        zipped = zip(dirty_idxs, gpath_list, orient_list, M_list, newsize_list)
+        for idx, gpath, orient, M, new_size in zipped:
+            read_args_list[idx] = ('warp', gpath, orient, M, new_size,
+                                   filter_list, warpkw)
+    return read_args_list
+
+
+def generate_batched_inference(item_list, decode_func, model_func,
+                               batch_size=None, workers=None, verbose=True):
+    """
+    Runs model_func on batches of decoded items.
+
+    Args:
+        item_list (list): inputs of decode_func
+        decode_func (callable): decode_func(item) returns one model input.
+            Runs in a pool of `workers` threads.
+        model_func (callable): model_func(input_list) returns one result per
+            input
+        batch_size (int): number of inputs per model_func call. Defaults to
+            all items in one call.
+        workers (int): number of decode threads. Defaults to
+            preproc_image.get_reader_pool_size()
+
+    Yields:
+        result of each item, in order
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.detect.annot_inference import *  # NOQA
+        >>> def decode_func(item):
+        >>>     return np.full((4, 4, 3), item, dtype=np.uint8)
+        >>> model_func = StubChipModel()
+        >>> result_list = list(generate_batched_inference(
+        >>>     list(range(10)), decode_func, model_func, batch_size=4,
+        >>>     workers=2, verbose=False))
+        >>> print(model_func.batch_size_list)
+        >>> print(result_list[3])
+        [4, 4, 2]
+        (0.011764705882352941, 'negative')
+    """
+    from ibeis.algo.detect import detect_pipeline
+    from ibeis.algo.preproc import preproc_image
+    if len(item_list) == 0:
+        return
+    if batch_size is None:
+        batch_size = len(item_list)
+    if workers is None:
+        workers = preproc_image.get_reader_pool_size()
+
+    def infer_func(batch_items, batch_decoded):
+        return list(model_func(batch_decoded))
+
+    pipe = detect_pipeline.DetectionPipeline(
+        infer_func, decode_func, batch_size=batch_size,
+        decode_workers=workers)
+    for batch_items, batch_results in pipe.run(item_list):
+        for result in batch_results:
+            yield result
+    if verbose:
+        print('[annot_inference] %d items\n%s' % (len(item_list),
+                                                  pipe.stats_str()))
+
+
+def generate_chip_inference(ibs, aid_list, chip_config, model_func,
+                            batch_size=None, workers=None, verbose=True):
+    """
+    Runs model_func on batches of annotation chips.
+
+    Args:
+        chip_config (dict): ChipConfig params of the chips
+        model_func (callable): model_func(chip_list) returns one result per
+            chip
+
+    Yields:
+        result of each annotation, in order
+    """
+    read_args_list = get_chip_read_args(ibs, aid_list, chip_config)
+    return generate_batched_inference(read_args_list, read_chip, model_func,
+                                      batch_size=batch_size, workers=workers,
+                                      verbose=verbose)
+
+
+class StubChipModel(object):
+    """
+    CPU stand-in for an annotation classifier. Scores each chip by its mean
+    intensity, so benchmarks measure the cost of reading the chips.
+    """
+
+    def __init__(model, thresh=0.5):
+        model.thresh = thresh
+        model.batch_size_list = []
+
+    def __call__(model, chip_list):
+        model.batch_size_list.append(len(chip_list))
+        result_list = []
+        for chip in chip_list:
+            score = float(np.mean(chip)) / 255.0
+            result_list.append((score, 'positive' if score > model.thresh else 'negative'))
+        return result_list
+
+
+def benchmark_chip_inference(ibs, aid_list=None, chip_config=None,
+                             batch_size=64, workers=None):
+    r"""
+    Compares the old serial path (chips through the depcache, one model call)
+    with the batched harness using StubChipModel.
+
+    Chips are deleted from the depcache before each run so both paths
+    compute them.
+
+    Returns:
+        dict: seconds per run and the speedup
+
+    CommandLine:
+        python -m ibeis.algo.detect.annot_inference benchmark_chip_inference --db PZ_MTEST
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.detect.annot_inference import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb(defaultdb='PZ_MTEST')
+        >>> result = benchmark_chip_inference(ibs)
+        >>> print(ut.repr4(result, precision=2))
+    """
+    import time
+    depc = ibs.depc_annot
+    if aid_list is None:
+        aid_list = ibs.get_valid_aids()
+    if chip_config is None:
+        chip_config = {'dim_size': (128, 128), 'resize_dim': 'wh'}
+
+    depc.delete_property('chips', aid_list, config=chip_config)
+    start = time.time()
+    chip_list = depc.get_property('chips', aid_list, 'img', config=chip_config)
+    serial_results = StubChipModel()(chip_list)
+    serial_time = time.time() - start
+
+    depc.delete_property('chips', aid_list, config=chip_config)
+    start = time.time()
+    batched_results = list(generate_chip_inference(
+        ibs, aid_list, chip_config, StubChipModel(), batch_size=batch_size,
+        workers=workers))
+    batched_time = time.time() - start
+    assert batched_results == serial_results
+    result = {
+        'num_annots': len(aid_list),
+        'serial_seconds': serial_time,
+        'batched_seconds': batched_time,
+        'speedup': serial_time / batched_time,
+    }
+    return result
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index over the annotation boxes of many images.
+
+The boxes are stored as flat numpy arrays sorted by (image, xtl). A box can
+only overlap a query box of the same image if its xtl lies in
+[query_xtl - max_width, query_xbr], so every query maps to one contiguous
+range of the sorted arrays. The candidate pairs of all queries are expanded
+at once and their overlaps are computed in a single vectorized pass.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import utool as ut
+(print, rrr, profile) = ut.inject2(__name__, '[bbox_index]')
+
+
+def bbox_array(bbox_list):
+    """ Returns an (N, 4) float64 array of (xtl, ytl, width, height) boxes """
+    bbox_arr = np.asarray(bbox_list, dtype=np.float64)
+    return bbox_arr.reshape(-1, 4)
+
+
+def bbox_pair_overlaps(bbox_arr1, bbox_arr2):
+    """
+    Intersection over union of the rows of two (N, 4) box arrays.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.detect.bbox_index import *  # NOQA
+        >>> bbox_arr1 = bbox_array([(0, 0, 10, 10), (0, 0, 10, 10), (0, 0, 0, 0)])
+        >>> bbox_arr2 = bbox_array([(5, 0, 10, 10), (20, 0, 5, 5), (0, 0, 0, 0)])
+        >>> print(bbox_pair_overlaps(bbox_arr1, bbox_arr2).tolist())
+        [0.3333333333333333, 0.0, 0.0]
+    """
+    xtl = np.maximum(bbox_arr1[:, 0], bbox_arr2[:, 0])
+    ytl = np.maximum(bbox_arr1[:, 1], bbox_arr2[:, 1])
+    xbr = np.minimum(bbox_arr1[:, 0] + bbox_arr1[:, 2],
+                     bbox_arr2[:, 0] + bbox_arr2[:, 2])
+    ybr = np.minimum(bbox_arr1[:, 1] + bbox_arr1[:, 3],
+                     bbox_arr2[:, 1] + bbox_arr2[:, 3])
+    intersection = np.maximum(0.0, xbr - xtl) * np.maximum(0.0, ybr - ytl)
+    area1 = bbox_arr1[:, 2] * bbox_arr1[:, 3]
+    area2 = bbox_arr2[:, 2] * bbox_arr2[:, 3]
+    union = area1 + area2 - intersection
+    overlap = np.zeros(len(union), dtype=np.float64)
+    flags = union > 0
+    overlap[flags] = intersection[flags] / union[flags]
+    return overlap
+
+
+class ImageBBoxIndex(object):
+    """
+    Args:
+        gid_list (list): image rowid of each box
+        bbox_list (list): (xtl, ytl, width, height) of each box
+        rowid_list (list): value returned for matched boxes (e.g. aids).
+            Defaults to the position of the box in the input.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.detect.bbox_index import *  # NOQA
+        >>> index = ImageBBoxIndex([1, 1, 2], [(0, 0, 10, 10), (50, 50, 10, 10),
+        >>>                                    (0, 0, 10, 10)], [11, 12, 13])
+        >>> gid_list = [1, 1, 2, 3, 2]
+        >>> bbox_list = [(1, 1, 10, 10), (30, 30, 10, 10), (0, 0, 10, 11),
+        >>>              (0, 0, 10, 10), (2, 0, 10, 10)]
+        >>> print(index.match(gid_list, bbox_list, 0.5).tolist())
+        [11, -1, 13, -1, 13]
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # Compare against a brute force search
+        >>> from ibeis.algo.detect.bbox_index import *  # NOQA
+        >>> rng = np.random.RandomState(0)
+        >>> def random_boxes(num):
+        >>>     xy = rng.randint(0, 200, (num, 2))
+        >>>     wh = rng.randint(1, 80, (num, 2))
+        >>>     return rng.randint(0, 30, num), np.hstack([xy, wh])
+        >>> gids1, bboxes1 = random_boxes(600)
+        >>> gids2, bboxes2 = random_boxes(300)
+        >>> index = ImageBBoxIndex(gids1, bboxes1)
+        >>> matches = index.match(gids2, bboxes2, 0.1)
+        >>> expected = []
+        >>> for gid, bbox in zip(gids2, bboxes2):
+        >>>     overlap = bbox_pair_overlaps(bbox_array([bbox] * len(bboxes1)),
+        >>>                                  bbox_array(bboxes1))
+        >>>     overlap[gids1 != gid] = -1
+        >>>     best = overlap.argmax()
+        >>>     expected.append(best if overlap[best] >= 0.1 else -1)
+        >>> assert matches.tolist() == expected
+        >>> assert (matches >= 0).sum() > 20
+    """
+
+    def __init__(index, gid_list, bbox_list, rowid_list=None):
+        gid_arr = np.asarray(gid_list, dtype=np.int64).ravel()
+        bbox_arr = bbox_array(bbox_list)
+        assert len(gid_arr) == len(bbox_arr)
+        if rowid_list is None:
+            rowid_arr = np.arange(len(gid_arr), dtype=np.int64)
+        else:
+            rowid_arr = np.asarray(rowid_list, dtype=np.int64).ravel()
+            assert len(rowid_arr) == len(gid_arr)
+        sortx = np.lexsort((bbox_arr[:, 0], gid_arr))
+        index.gid_arr = gid_arr[sortx]
+        index.bbox_arr = bbox_arr[sortx]
+        index.rowid_arr = rowid_arr[sortx]
+        # Widest box of each image bounds how far left an overlap can start
+        index.unique_gids, starts = np.unique(index.gid_arr, return_index=True)
+        if len(starts) > 0:
+            index.max_widths = np.maximum.reduceat(index.bbox_arr[:, 2], starts)
+        else:
+            index.max_widths = np.zeros(0, dtype=np.float64)
+        # One sorted key for (image, xtl): images are spaced further apart
+        # than any box coordinate
+        if len(index.bbox_arr) > 0:
+            index._xmin = index.bbox_arr[:, 0].min()
+            index._span = (index.bbox_arr[:, 0].max() - index._xmin +
+                           index.max_widths.max() + 1.0)
+        else:
+            index._xmin, index._span = 0.0, 1.0
+        index.key_arr = index._keys(np.searchsorted(index.unique_gids, index.gid_arr),
+                                    index.bbox_arr[:, 0])
+
+    def __len__(index):
+        return len(index.gid_arr)
+
+    def _keys(index, image_idx, x):
+        x_ = np.clip(x - index._xmin, -0.5, index._span - 0.5)
+        return image_idx * index._span + x_
+
+    def candidate_ranges(index, gid_list, bbox_list):
+        """
+        Returns:
+            tuple: (lo, hi) arrays - the indexed boxes that may overlap query
+                box i are index.bbox_arr[lo[i]:hi[i]]
+        """
+        gid_arr = np.asarray(gid_list, dtype=np.int64).ravel()
+        bbox_arr = bbox_array(bbox_list)
+        num = len(gid_arr)
+        lo = np.zeros(num, dtype=np.int64)
+        hi = np.zeros(num, dtype=np.int64)
+        if len(index) == 0 or num == 0:
+            return lo, hi
+        image_idx = np.searchsorted(index.unique_gids, gid_arr)
+        image_idx_ = np.minimum(image_idx, len(index.unique_gids) - 1)
+        known = index.unique_gids[image_idx_] == gid_arr
+        image_idx = image_idx[known]
+        max_widths = index.max_widths[image_idx]
+        xtl = bbox_arr[known, 0]
+        xbr = xtl + bbox_arr[known, 2]
+        lo[known] = np.searchsorted(
+            index.key_arr, index._keys(image_idx, xtl - max_widths), 'left')
+        hi[known] = np.searchsorted(
+            index.key_arr, index._keys(image_idx, xbr), 'right')
+        hi = np.maximum(lo, hi)
+        return lo, hi
+
+    def match(index, gid_list, bbox_list, thresh):
+        """
+        Finds the indexed box of the same image with the largest overlap for
+        each query box.
+
+        Args:
+            gid_list (list): image rowid of each query box
+            bbox_list (list): (xtl, ytl, width, height) of each query box
+            thresh (float): minimum intersection over union of a match
+
+        Returns:
+            ndarray: rowid of the best matching box, or -1 if no box overlaps
+                by at least thresh. Ties go to the lowest rowid.
+        """
+        bbox_arr = bbox_array(bbox_list)
+        num = len(bbox_arr)
+        match_arr = np.full(num, -1, dtype=np.int64)
+        lo, hi = index.candidate_ranges(gid_list, bbox_arr)
+        counts = hi - lo
+        total = counts.sum()
+        if total == 0:
+            return match_arr
+        # Expand every query into its candidate pairs
+        query_idx = np.repeat(np.arange(num), counts)
+        offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        cand_idx = np.arange(total) - offsets + np.repeat(lo, counts)
+        overlap = bbox_pair_overlaps(bbox_arr[query_idx],
+                                     index.bbox_arr[cand_idx])
+        flags = overlap >= thresh
+        query_idx = query_idx[flags]
+        cand_idx = cand_idx[flags]
+        overlap = overlap[flags]
+        if len(query_idx) == 0:
+            return match_arr
+        # Best candidate of each query: sort by query, -overlap, rowid
+        rowids = index.rowid_arr[cand_idx]
+        sortx = np.lexsort((rowids, -overlap, query_idx))
+        query_idx = query_idx[sortx]
+        first = np.r_[True, query_idx[1:] != query_idx[:-1]]
+        match_arr[query_idx[first]] = rowids[sortx][first]
+        return match_arr
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Staged detection pipeline.
+
+Running a detector over a list of images normally decodes every image,
+runs inference, and only then writes the results, so the disk, the model and
+the database take turns being idle. DetectionPipeline overlaps the three
+stages:
+
+    decode pool  -->  batched inference  -->  batched writer
+    (threads)         (one thread)            (calling thread)
+
+The decode pool prefetches a bounded number of images ahead of inference and
+the inference thread can only run a bounded number of batches ahead of the
+writer, so a slow stage throttles the stages before it instead of filling
+memory. Every stage records how long it was busy and how long it waited.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import collections
+import threading
+import time
+import utool as ut
+from six.moves import queue
+(print, rrr, profile) = ut.inject2(__name__, '[detect_pipeline]')
+
+
+STAGE_NAMES = ['decode', 'infer', 'write']
+
+# Item put on the inference output queue after the last batch
+_DONE = object()
+
+
+def _new_stage_stats():
+    return {
+        'num_items': 0,
+        'num_batches': 0,
+        # Time spent doing the work of the stage
+        'busy_time': 0.0,
+        # Time spent waiting for the previous stage
+        'wait_time': 0.0,
+        # Time spent blocked on the next stage (backpressure)
+        'blocked_time': 0.0,
+    }
+
+
+class DetectionPipeline(object):
+    """
+    Args:
+        infer_func (callable): infer_func(item_list, decoded_list) returns one
+            result per item. Called with at most batch_size items.
+        decode_func (callable): decode_func(item) returns the decoded input of
+            an item. Runs in the decode pool. If None items are passed to
+            infer_func undecoded (decoded_list is item_list).
+        write_func (callable): write_func(item_list, result_list) stores a
+            batch of results. Runs in the calling thread of run_and_write.
+        batch_size (int): number of items per inference call
+        decode_workers (int): number of decode threads
+        prefetch (int): maximum number of items decoded ahead of inference.
+            Defaults to two batches.
+        queue_size (int): maximum number of inferred batches waiting for the
+            writer
+        write_batch_size (int): number of results per write_func call
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.detect.detect_pipeline import *  # NOQA
+        >>> import numpy as np
+        >>> # Stub CPU detector: one box around the bright pixels of an image
+        >>> def decode_func(item):
+        >>>     img = np.zeros((32, 32), dtype=np.uint8)
+        >>>     img[item:item + 4, item:item + 8] = 255
+        >>>     return img
+        >>> def infer_func(item_list, img_list):
+        >>>     assert len(img_list) <= 4
+        >>>     result_list = []
+        >>>     for img in img_list:
+        >>>         ys, xs = np.nonzero(img)
+        >>>         result_list.append((xs.min(), ys.min(), np.ptp(xs) + 1, np.ptp(ys) + 1))
+        >>>     return result_list
+        >>> written = []
+        >>> def write_func(item_list, result_list):
+        >>>     written.append(list(zip(item_list, result_list)))
+        >>> pipe = DetectionPipeline(infer_func, decode_func, write_func,
+        >>>                          batch_size=4, decode_workers=3,
+        >>>                          write_batch_size=8)
+        >>> num_written = pipe.run_and_write(list(range(20)))
+        >>> assert num_written == 20
+        >>> assert [len(batch) for batch in written] == [8, 8, 4]
+        >>> assert ut.flatten(written)[5] == (5, (5, 5, 8, 4))
+        >>> stats = pipe.stats
+        >>> assert stats['decode']['num_items'] == 20
+        >>> assert stats['infer']['num_batches'] == 5
+        >>> assert stats['write']['num_batches'] == 3
+        >>> print(pipe.stats_str())
+    """
+
+    def __init__(pipe, infer_func, decode_func=None, write_func=None,
+                 batch_size=8, decode_workers=2, prefetch=None, queue_size=2,
+                 write_batch_size=256):
+        pipe.infer_func = infer_func
+        pipe.decode_func = decode_func
+        pipe.write_func = write_func
+        pipe.batch_size = max(1, int(batch_size))
+        pipe.decode_workers = max(1, int(decode_workers))
+        if prefetch is None:
+            prefetch = 2 * pipe.batch_size
+        pipe.prefetch = max(pipe.batch_size, int(prefetch))
+        pipe.queue_size = max(1, int(queue_size))
+        pipe.write_batch_size = max(1, int(write_batch_size))
+        pipe._lock = threading.Lock()
+        pipe.reset_stats()
+
+    def reset_stats(pipe):
+        pipe.stats = {name: _new_stage_stats() for name in STAGE_NAMES}
+        pipe.stats['total_time'] = 0.0
+
+    def _add_stats(pipe, stage, **kwargs):
+        with pipe._lock:
+            stage_stats = pipe.stats[stage]
+            for key, value in kwargs.items():
+                stage_stats[key] += value
+
+    def _decode(pipe, item):
+        start = time.time()
+        decoded = pipe.decode_func(item)
+        pipe._add_stats('decode', num_items=1, busy_time=time.time() - start)
+        return decoded
+
+    def _put(pipe, out_queue, value, stop_event):
+        """ Blocking put that gives up when the consumer stopped """
+        while not stop_event.is_set():
+            try:
+                out_queue.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _infer_worker(pipe, item_list, out_queue, stop_event):
+        from concurrent import futures
+        executor = None
+        pending = collections.deque()
+        try:
+            if pipe.decode_func is not None:
+                executor = futures.ThreadPoolExecutor(pipe.decode_workers)
+            item_iter = iter(item_list)
+
+            def _refill():
+                # Keep the decode pool at most prefetch items ahead
+                while len(pending) < pipe.prefetch:
+                    try:
+                        item = next(item_iter)
+                    except StopIteration:
+                        return
+                    if executor is None:
+                        pending.append((item, None))
+                    else:
+                        pending.append((item, executor.submit(pipe._decode, item)))
+
+            _refill()
+            while not stop_event.is_set() and len(pending) > 0:
+                batch = [pending.popleft()
+                         for _ in range(min(pipe.batch_size, len(pending)))]
+                # Decode the next batches while this one is inferred
+                _refill()
+                batch_items = [item for item, future in batch]
+                start = time.time()
+                if executor is None:
+                    batch_decoded = batch_items
+                else:
+                    batch_decoded = [future.result() for item, future in batch]
+                wait_time = time.time() - start
+                start = time.time()
+                batch_results = pipe.infer_func(batch_items, batch_decoded)
+                busy_time = time.time() - start
+                assert len(batch_results) == len(batch_items), (
+                    'infer_func returned %d results for %d items' % (
+                        len(batch_results), len(batch_items)))
+                start = time.time()
+                if not pipe._put(out_queue, (batch_items, batch_results), stop_event):
+                    break
+                pipe._add_stats('infer', num_items=len(batch_items),
+                                num_batches=1, busy_time=busy_time,
+                                wait_time=wait_time,
+                                blocked_time=time.time() - start)
+            pipe._put(out_queue, _DONE, stop_event)
+        except Exception as ex:
+            pipe._put(out_queue, ex, stop_event)
+        finally:
+            if executor is not None:
+                # Drop the prefetched items if the consumer stopped early
+                for item, future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+    def run(pipe, item_list):
+        """
+        Yields:
+            tuple: (item_list, result_list) for each inference batch, in
+                input order
+        """
+        out_queue = queue.Queue(maxsize=pipe.queue_size)
+        stop_event = threading.Event()
+        worker = threading.Thread(
+            target=pipe._infer_worker, args=(item_list, out_queue, stop_event),
+            name='detect_pipeline_infer')
+        worker.daemon = True
+        start_time = time.time()
+        worker.start()
+        try:
+            while True:
+                start = time.time()
+                value = out_queue.get()
+                pipe._add_stats('write', wait_time=time.time() - start)
+                if value is _DONE:
+                    break
+                if isinstance(value, Exception):
+                    raise value
+                yield value
+        finally:
+            stop_event.set()
+            worker.join()
+            with pipe._lock:
+                pipe.stats['total_time'] += time.time() - start_time
+
+    def run_and_write(pipe, item_list):
+        """
+        Runs the pipeline and passes the results to write_func in batches of
+        write_batch_size.
+
+        Returns:
+            int: number of results written
+        """
+        assert pipe.write_func is not None
+        num_written = 0
+        write_items = []
+        write_results = []
+
+        def _flush():
+            start = time.time()
+            pipe.write_func(write_items, write_results)
+            pipe._add_stats('write', num_items=len(write_items), num_batches=1,
+                            busy_time=time.time() - start)
+            return len(write_items)
+
+        for batch_items, batch_results in pipe.run(item_list):
+            write_items.extend(batch_items)
+            write_results.extend(batch_results)
+            if len(write_items) >= pipe.write_batch_size:
+                num_written += _flush()
+                write_items = []
+                write_results = []
+        if len(write_items) > 0:
+            # The last flush runs after the pipeline finished
+            start = time.time()
+            num_written += _flush()
+            with pipe._lock:
+                pipe.stats['total_time'] += time.time() - start
+        return num_written
+
+    def stats_str(pipe):
+        lines = ['total_time = %.3fs' % (pipe.stats['total_time'],)]
+        for name in STAGE_NAMES:
+            stage_stats = pipe.stats[name]
+            lines.append(
+                '%-6s items=%d batches=%d busy=%.3fs wait=%.3fs blocked=%.3fs' % (
+                    name, stage_stats['num_items'], stage_stats['num_batches'],
+                    stage_stats['busy_time'], stage_stats['wait_time'],
+                    stage_stats['blocked_time']))
+        return '\n'.join(lines)
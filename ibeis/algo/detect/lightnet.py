@@ -98,16 +98,17 @@ def _create_network(weight_filepath, class_list, conf_thresh, nms_thresh, networ
     return net
 
 
-def _detect(net, img_path, network_size):
-    """Perform a detection."""
-    # Load image
-    img = cv2.imread(img_path)
-    im_h, im_w = img.shape[:2]
-
+def _preprocess(img, network_size):
+    """Convert a BGR image into a letterboxed network input."""
     img_tf = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     img_tf = ln.data.transform.Letterbox.apply(img_tf, dimension=network_size)
     img_tf = tf.ToTensor()(img_tf)
-    img_tf.unsqueeze_(0)
+    return img_tf
+
+
+def _detect_batch(net, img_tf_list, img_size_list, network_size):
+    """Perform detections on a batch of preprocessed images."""
+    img_tf = torch.stack(img_tf_list)
 
     if torch.cuda.is_available():
         img_tf = img_tf.cuda()
@@ -119,22 +120,55 @@ def _detect(net, img_path, network_size):
     else:
         with torch.no_grad():
             out = net(img_tf)
-    out = ln.data.transform.ReverseLetterbox.apply(out, network_size, (im_w, im_h))
 
-    return img, out
+    # Each image is reverse letterboxed with its own size
+    out_list = [
+        ln.data.transform.ReverseLetterbox.apply([out_], network_size, img_size)[0]
+        for out_, img_size in zip(out, img_size_list)
+    ]
+    return out_list
 
 
-def detect(gpath_list, config_filepath, weight_filepath, class_filepath, sensitivity,
-           verbose=VERBOSE_LN, **kwargs):
-    """Detect image filepaths with lightnet.
+def _detect(net, img_path, network_size):
+    """Perform a detection."""
+    # Load image
+    img = cv2.imread(img_path)
+    im_h, im_w = img.shape[:2]
 
-    Args:
-        gpath_list (list of str): the list of image paths that need proposal candidates
+    img_tf = _preprocess(img, network_size)
+    out = _detect_batch(net, [img_tf], [(im_w, im_h)], network_size)
+
+    return img, out
 
-    Kwargs (optional): refer to the Lightnet documentation for configuration settings
+
+def _parse_output_list(output_list):
+    """Convert the brambox detections of an image to result dicts."""
+    result_list_ = []
+    for output in list(output_list):
+        xtl = int(np.around(float(output.x_top_left)))
+        ytl = int(np.around(float(output.y_top_left)))
+        xbr = int(np.around(float(output.x_top_left + output.width)))
+        ybr = int(np.around(float(output.y_top_left + output.height)))
+        class_ = output.class_label
+        conf = float(output.confidence)
+        result_dict = {
+            'xtl'        : xtl,
+            'ytl'        : ytl,
+            'width'      : xbr - xtl,
+            'height'     : ybr - ytl,
+            'class'      : class_,
+            'confidence' : conf,
+        }
+        result_list_.append(result_dict)
+    return result_list_
+
+
+def load_network(config_filepath, weight_filepath, class_filepath, sensitivity,
+                 verbose=VERBOSE_LN, **kwargs):
+    """Load the lightnet network.
 
     Returns:
-        iter
+        tuple: (network, network_size)
     """
     assert config_filepath is None, 'lightnet does not have a config file'
 
@@ -166,31 +200,55 @@ def detect(gpath_list, config_filepath, weight_filepath, class_filepath, sensiti
     nms_thresh = 1.0  # Turn off NMS
     network = _create_network(weight_filepath, class_list, conf_thresh,
                               nms_thresh, network_size)
+    return network, network_size
+
+
+def decode_image(gpath, network_size):
+    """Load an image and convert it into a network input.
+
+    Returns:
+        tuple: (img_tf, (w, h))
+    """
+    img = cv2.imread(gpath)
+    im_h, im_w = img.shape[:2]
+    return _preprocess(img, network_size), (im_w, im_h)
+
+
+def detect_batch(network, network_size, decoded_list):
+    """Detect a batch of images returned by decode_image.
+
+    Returns:
+        list: result_list for each image
+    """
+    img_tf_list = [img_tf for img_tf, img_size in decoded_list]
+    img_size_list = [img_size for img_tf, img_size in decoded_list]
+    output_list_list = _detect_batch(network, img_tf_list, img_size_list,
+                                     network_size)
+    return [_parse_output_list(output_list) for output_list in output_list_list]
+
+
+def detect(gpath_list, config_filepath, weight_filepath, class_filepath, sensitivity,
+           verbose=VERBOSE_LN, **kwargs):
+    """Detect image filepaths with lightnet.
+
+    Args:
+        gpath_list (list of str): the list of image paths that need proposal candidates
+
+    Kwargs (optional): refer to the Lightnet documentation for configuration settings
+
+    Returns:
+        iter
+    """
+    network, network_size = load_network(config_filepath, weight_filepath,
+                                         class_filepath, sensitivity,
+                                         verbose=verbose)
 
     # Execute detector for each image
     results_list_ = []
     for gpath in tqdm(gpath_list):
         image, output_list = _detect(network, gpath, network_size)
         output_list = output_list[0]
-
-        result_list_ = []
-        for output in list(output_list):
-            xtl = int(np.around(float(output.x_top_left)))
-            ytl = int(np.around(float(output.y_top_left)))
-            xbr = int(np.around(float(output.x_top_left + output.width)))
-            ybr = int(np.around(float(output.y_top_left + output.height)))
-            class_ = output.class_label
-            conf = float(output.confidence)
-            result_dict = {
-                'xtl'        : xtl,
-                'ytl'        : ytl,
-                'width'      : xbr - xtl,
-                'height'     : ybr - ytl,
-                'class'      : class_,
-                'confidence' : conf,
-            }
-            result_list_.append(result_dict)
-        results_list_.append(result_list_)
+        results_list_.append(_parse_output_list(output_list))
 
     if len(results_list_) != len(gpath_list):
         raise ValueError('Lightnet did not return valid data')
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Process-resident registry of pickled scikit-learn classifiers.
+
+Each weight file is unpickled once per process and reused until the file
+changes on disk. Large numpy attributes (support vectors, coefficients) are
+written once to a cache directory and memory-mapped, so processes that load
+the same model share the pages. Models loaded before forking workers are
+inherited by the workers without reloading.
+"""
+from __future__ import absolute_import, division, print_function
+from os.path import exists, join
+import os
+import numpy as np
+import utool as ut
+(print, rrr, profile) = ut.inject2(__name__, '[model_registry]')
+
+
+# Numpy attributes at least this large are memory-mapped
+MMAP_MIN_NBYTES = 2 ** 20
+
+# Mapping from weight filepath to (file signature, loaded model)
+MODEL_REGISTRY = {}
+
+
+def _file_signature(weight_filepath):
+    stat = os.stat(weight_filepath)
+    return (stat.st_size, stat.st_mtime)
+
+
+def _memmap_attributes(obj, cache_dpath, prefix):
+    for attr, value in list(vars(obj).items()):
+        if not isinstance(value, np.ndarray) or value.dtype.hasobject:
+            continue
+        if value.nbytes < MMAP_MIN_NBYTES:
+            continue
+        array_fpath = join(cache_dpath, '%s.%s.npy' % (prefix, attr, ))
+        if not exists(array_fpath):
+            temp_fpath = array_fpath + '.tmp.npy'
+            np.save(temp_fpath, value)
+            os.replace(temp_fpath, array_fpath)
+        # Copy-on-write so estimators that expect writable arrays still work
+        setattr(obj, attr, np.load(array_fpath, mmap_mode='c'))
+
+
+def load_model(weight_filepath, verbose=False):
+    """
+    Returns the (model, scaler) tuple pickled in weight_filepath, loading it
+    only if it is not in the registry or the file changed.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.detect.model_registry import *  # NOQA
+        >>> dpath = ut.ensure_app_resource_dir('ibeis', 'model_registry_test')
+        >>> weight_filepath = join(dpath, 'model.pkl')
+        >>> ut.save_cPkl(weight_filepath, ({'a': 1}, None))
+        >>> model_tup1 = load_model(weight_filepath)
+        >>> model_tup2 = load_model(weight_filepath)
+        >>> assert model_tup1 is model_tup2
+        >>> clear_models()
+        >>> assert load_model(weight_filepath) is not model_tup1
+        >>> ut.delete(weight_filepath)
+    """
+    signature = _file_signature(weight_filepath)
+    entry = MODEL_REGISTRY.get(weight_filepath, None)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+    model_tup = ut.load_cPkl(weight_filepath, verbose=verbose)
+    cache_dpath = ut.ensure_app_resource_dir('ibeis', 'model_mmap')
+    prefix = ut.hashstr27(repr((weight_filepath, signature)))
+    for index, obj in enumerate(model_tup):
+        if hasattr(obj, '__dict__'):
+            _memmap_attributes(obj, cache_dpath, '%s.%d' % (prefix, index, ))
+    MODEL_REGISTRY[weight_filepath] = (signature, model_tup)
+    return model_tup
+
+
+def load_models(weight_filepath_list, verbose=False):
+    return [
+        load_model(weight_filepath, verbose=verbose)
+        for weight_filepath in weight_filepath_list
+    ]
+
+
+def clear_models():
+    MODEL_REGISTRY.clear()
+
+
+def predict_ensemble(weight_filepath_list, vector_array, verbose=False):
+    """
+    Scores a contiguous block of vectors with every model of an ensemble.
+
+    Returns:
+        tuple: (score_sum, positive_votes) where score_sum is the sum of the
+            positive class probabilities over the models (in
+            weight_filepath_list order) and positive_votes counts the models
+            predicting class 1
+    """
+    num_vectors = len(vector_array)
+    score_sum = np.zeros(num_vectors, dtype=np.float64)
+    positive_votes = np.zeros(num_vectors, dtype=np.int64)
+    for weight_filepath in weight_filepath_list:
+        model, scaler = load_model(weight_filepath, verbose=verbose)
+        # Normalize
+        vector_array_ = scaler.transform(vector_array)
+        # Take only the positive probability
+        score_sum += model.predict_proba(vector_array_)[:, 1]
+        class_list = model.predict(vector_array_)
+        positive_votes += np.array([int(class_) == 1 for class_ in class_list])
+    return score_sum, positive_votes
+
+
+def classify_ensemble(vector_list, weight_filepath_list, verbose=False,
+                      force_serial=False):
+    """
+    Averages the scores and takes the majority class of an ensemble.
+
+    The models are loaded into the registry before the vectors are split
+    into contiguous blocks, so forked workers inherit them. Each worker
+    scores its block with every model in one pass.
+
+    Yields:
+        tuple: (score, class) with class 'positive' or 'negative'
+    """
+    import multiprocessing
+    num_weights = len(weight_filepath_list)
+    assert num_weights > 0
+    load_models(weight_filepath_list, verbose=verbose)
+
+    if isinstance(vector_list, np.ndarray):
+        vector_array = vector_list
+    else:
+        # The scalers convert lists of vectors to float64
+        vector_array = np.array(vector_list, dtype=np.float64)
+    num_vectors = len(vector_array)
+    if num_vectors == 0:
+        return
+    num_cpus = multiprocessing.cpu_count()
+    vector_batch = int(np.ceil(float(num_vectors) / num_cpus))
+    args_list = [
+        (weight_filepath_list, vector_array[start: start + vector_batch])
+        for start in range(0, num_vectors, vector_batch)
+    ]
+    print('Processing vectors in parallel using vector_batch = %r' % (vector_batch, ))
+    result_iter = ut.generate2(predict_ensemble, args_list, nTasks=len(args_list),
+                               ordered=True, force_serial=force_serial)
+    for score_sum, positive_votes in result_iter:
+        score_list = score_sum / num_weights
+        # Ties go to negative
+        flag_list = positive_votes > (num_weights - positive_votes)
+        for score_, flag in zip(score_list, flag_list):
+            yield score_, 'positive' if flag else 'negative'
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Tiled non-maximum suppression.
+
+Produces the same kept indices as py_cpu_nms. Instead of recomputing the
+overlap of one box against all remaining boxes per iteration, the boxes are
+sorted once and the overlaps are computed one tile of rows at a time. Only
+the greedy decision inside a tile is sequential; suppression of the boxes
+after the tile is a single vectorized pass.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+
+
+def _tile_overlaps(x1, y1, x2, y2, areas, rows, cols):
+    """ py_cpu_nms overlaps between the boxes in rows and cols """
+    xx1 = np.maximum(x1[rows][:, None], x1[cols][None, :])
+    yy1 = np.maximum(y1[rows][:, None], y1[cols][None, :])
+    xx2 = np.minimum(x2[rows][:, None], x2[cols][None, :])
+    yy2 = np.minimum(y2[rows][:, None], y2[cols][None, :])
+
+    w = np.maximum(0.0, xx2 - xx1 + 1)
+    h = np.maximum(0.0, yy2 - yy1 + 1)
+    inter = w * h
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ovr = inter / (areas[rows][:, None] + areas[cols][None, :] - inter)
+    return ovr
+
+
+def tiled_nms(dets, scores, thresh, tile_size=256):
+    """
+    Args:
+        dets (ndarray): (N, 4+) boxes as x1, y1, x2, y2
+        scores (ndarray): (N,) scores
+        thresh (float): boxes overlapping a kept box by more than thresh are
+            suppressed
+        tile_size (int): number of rows of the overlap matrix computed at
+            once. Memory use is O(tile_size * N).
+
+    Returns:
+        ndarray: kept indices in descending score order
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.detect.nms.tiled_nms import *  # NOQA
+        >>> from ibeis.algo.detect.nms.py_cpu_nms import py_cpu_nms
+        >>> rng = np.random.RandomState(0)
+        >>> xy = rng.randint(0, 100, (500, 2))
+        >>> wh = rng.randint(5, 40, (500, 2))
+        >>> dets = np.hstack([xy, xy + wh]).astype(np.float32)
+        >>> scores = rng.rand(500).astype(np.float32)
+        >>> keep = tiled_nms(dets, scores, 0.3, tile_size=64)
+        >>> assert keep.tolist() == list(py_cpu_nms(dets, scores, 0.3))
+    """
+    order = scores.argsort()[::-1]
+    num = len(order)
+    x1 = dets[order, 0]
+    y1 = dets[order, 1]
+    x2 = dets[order, 2]
+    y2 = dets[order, 3]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+
+    suppressed = np.zeros(num, dtype=np.bool_)
+    keep_flags = np.zeros(num, dtype=np.bool_)
+    for start in range(0, num, tile_size):
+        stop = min(start + tile_size, num)
+        # Boxes that are still candidates, the first num_rows are in the tile
+        cols = start + np.nonzero(~suppressed[start:])[0]
+        num_rows = np.searchsorted(cols, stop)
+        if num_rows == 0:
+            continue
+        rows = cols[:num_rows]
+        ovr = _tile_overlaps(x1, y1, x2, y2, areas, rows, cols)
+        # Matches "keep if ovr <= thresh" in py_cpu_nms (NaN suppresses)
+        suppress = ~(ovr <= thresh)
+        # Greedy pass restricted to the boxes of this tile
+        inner = np.triu(suppress[:, :num_rows], k=1)
+        tile_keep = np.zeros(num_rows, dtype=np.bool_)
+        tile_suppressed = np.zeros(num_rows, dtype=np.bool_)
+        for index in range(num_rows):
+            if tile_suppressed[index]:
+                continue
+            tile_keep[index] = True
+            tile_suppressed |= inner[index]
+        keep_flags[rows[tile_keep]] = True
+        # Boxes after the tile are suppressed by any kept box of the tile
+        if num_rows < len(cols):
+            suppressed[cols[num_rows:]] |= suppress[tile_keep, num_rows:].any(axis=0)
+    return order[keep_flags]
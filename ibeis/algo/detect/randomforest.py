@@ -6,7 +6,6 @@ from __future__ import absolute_import, division, print_function
 from os.path import exists, join
 from ibeis.algo.detect import grabmodels
 import utool as ut
-import vtool_ibeis as vt
 from six.moves import zip, map
 import cv2
 import random
@@ -233,7 +232,7 @@ def detect_gid_list(ibs, gid_list, tree_path_list, downsample=True, **kwargs):
     # Get new gpaths if downsampling
     if downsample:
         gpath_list = ibs.get_image_detectpaths(gid_list)
-        neww_list = [vt.open_image_size(gpath)[0] for gpath in gpath_list]
+        neww_list = [neww for (neww, newh) in ibs.get_image_detectsizes(gid_list)]
         oldw_list = [oldw for (oldw, oldh) in ibs.get_image_sizes(gid_list)]
         downsample_list = [oldw / neww for oldw, neww in zip(oldw_list, neww_list)]
     else:
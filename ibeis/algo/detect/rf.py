@@ -6,6 +6,7 @@ from __future__ import absolute_import, division, print_function
 import utool as ut
 from os import listdir
 from os.path import join, isfile, isdir
+from ibeis.algo.detect import model_registry
 (print, rrr, profile) = ut.inject2(__name__, '[rf]')
 
 
@@ -33,14 +34,13 @@ CONFIG_URL_DICT = {
 
 def classify_helper(weight_filepath, vector_list, index_list=None,
                     verbose=VERBOSE_SVM):
-    ut.embed()
     if index_list is None:
         index_list = list(range(len(vector_list)))
     # Init score and class holders
     score_dict = { index: [] for index in index_list }
     class_dict = { index: [] for index in index_list }
-    # Load models
-    model_tup = ut.load_cPkl(weight_filepath, verbose=verbose)
+    # Load models (cached per process)
+    model_tup = model_registry.load_model(weight_filepath, verbose=verbose)
     model, scaler = model_tup
     # Normalize
     vector_list = scaler.transform(vector_list)
@@ -67,11 +67,6 @@ def classify(vector_list, weight_filepath, verbose=VERBOSE_SVM, **kwargs):
     Returns:
         iter
     """
-    import multiprocessing
-    import numpy as np
-
-    ut.embed()
-
     # Get correct weight if specified with shorthand
     if weight_filepath in CONFIG_URL_DICT:
         weight_url = CONFIG_URL_DICT[weight_filepath]
@@ -93,60 +88,8 @@ def classify(vector_list, weight_filepath, verbose=VERBOSE_SVM, **kwargs):
     num_weights = len(weight_filepath_list)
     assert num_weights > 0
 
-    # Form dictionaries
-    num_vectors = len(vector_list)
-    index_list = list(range(num_vectors))
-
-    # Generate parallelized wrapper
-    OLD = False
-    if is_ensemble and OLD:
-        vectors_list = [ vector_list for _ in range(num_weights) ]
-        args_list = zip(weight_filepath_list, vectors_list)
-        nTasks = num_weights
-        print('Processing ensembles in parallel using %d ensembles' % (num_weights, ))
-    else:
-        num_cpus = multiprocessing.cpu_count()
-        vector_batch = int(np.ceil(float(num_vectors) / num_cpus))
-        vector_rounds = int(np.ceil(float(num_vectors) / vector_batch))
-
-        args_list = []
-        for vector_round in range(vector_rounds):
-            start_index = vector_round * vector_batch
-            stop_index = (vector_round + 1) * vector_batch
-            assert start_index < num_vectors
-            stop_index = min(stop_index, num_vectors)
-            # print('Slicing index range: [%r, %r)' % (start_index, stop_index, ))
-
-            # Slice gids and get feature data
-            index_list_ = list(range(start_index, stop_index))
-            vector_list_ = vector_list[start_index: stop_index]
-            assert len(index_list_) == len(vector_list_)
-            for weight_filepath in weight_filepath_list:
-                args = (weight_filepath, vector_list_, index_list_)
-                args_list.append(args)
-
-        nTasks = len(args_list)
-        print('Processing vectors in parallel using vector_batch = %r' % (vector_batch, ))
-
-    # Perform inference
-    classify_iter = ut.generate2(classify_helper, args_list, nTasks=nTasks,
-                                 ordered=True, force_serial=True)
-
-    # Classify with SVM for each image vector
-    score_dict = { index: [] for index in index_list }
-    class_dict = { index: [] for index in index_list }
-    for score_dict_, class_dict_ in classify_iter:
-        for index in index_list:
-            if index in score_dict_:
-                score_dict[index] += score_dict_[index]
-            if index in class_dict_:
-                class_dict[index] += class_dict_[index]
-
-    # Organize and compute mode and average for class and score
-    for index in index_list:
-        score_list_ = score_dict[index]
-        class_list_ = class_dict[index]
-        score_ = sum(score_list_) / len(score_list_)
-        class_ = max(set(class_list_), key=class_list_.count)
-        class_ = 'positive' if int(class_) == 1 else 'negative'
+    # Perform inference with the ensemble averaged in one pass per block
+    result_iter = model_registry.classify_ensemble(vector_list, weight_filepath_list,
+                                                   verbose=verbose, force_serial=True)
+    for score_, class_ in result_iter:
         yield score_, class_
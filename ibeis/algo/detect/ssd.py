@@ -4,7 +4,6 @@ Interface to SSD object proposals.
 """
 from __future__ import absolute_import, division, print_function
 import utool as ut
-import vtool_ibeis as vt
 from six.moves import zip
 from os.path import abspath, dirname, expanduser, join, exists  # NOQA
 import numpy as np
@@ -139,7 +138,7 @@ def detect_gid_list(ibs, gid_list, downsample=True, verbose=VERBOSE_SS, **kwargs
     # Get new gpaths if downsampling
     if downsample:
         gpath_list = ibs.get_image_detectpaths(gid_list)
-        neww_list = [vt.open_image_size(gpath)[0] for gpath in gpath_list]
+        neww_list = [neww for (neww, newh) in ibs.get_image_detectsizes(gid_list)]
         oldw_list = [oldw for (oldw, oldh) in ibs.get_image_sizes(gid_list)]
         downsample_list = [oldw / neww for oldw, neww in zip(oldw_list, neww_list)]
         orient_list = [1] * len(gid_list)
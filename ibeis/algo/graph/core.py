@@ -19,6 +19,7 @@ from ibeis.algo.graph import mixin_matching
 from ibeis.algo.graph import mixin_groundtruth
 from ibeis.algo.graph import mixin_simulation
 from ibeis.algo.graph import mixin_ibeis
+from ibeis.algo.graph import mixin_checkpoint
 from ibeis.algo.graph import nx_utils as nxu
 import pandas as pd
 from ibeis.algo.graph.state import POSTV, NEGTV, INCMP, UNREV, UNKWN
@@ -1015,6 +1016,8 @@ class AnnotInference(ut.NiceRepr,
                      mixin_groundtruth.Groundtruth,
                      mixin_ibeis.IBEISIO,
                      mixin_ibeis.IBEISGroundtruth,
+                     # checkpoint / resume
+                     mixin_checkpoint.Checkpoint,
                      # _dep_mixins._AnnotInfrDepMixin,
                      ):
     """
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpointing of AnnotInference state.
+
+Rebuilding a review graph from the database replays the entire feedback
+table and recomputes every connected component, redundancy flag and queue
+priority. A checkpoint stores the already computed state so a restarted
+review session can continue where it left off.
+
+The database feedback watermark (number of feedback rows, largest rowid and
+newest modification time) is stored with the checkpoint. On restore, reviews
+appended to the staging table since the checkpoint are replayed. Any other
+change makes the checkpoint stale and the caller must rebuild from the
+database.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from os.path import exists, dirname
+import collections
+import itertools as it
+import os
+import pickle
+import time
+import utool as ut
+print, rrr, profile = ut.inject2(__name__)
+
+
+CHECKPOINT_VERSION = 1
+
+# Attributes that are not part of the inference state. They are either
+# external resources (the controller, learned models), callbacks, or
+# generators that cannot be serialized.
+CHECKPOINT_EXCLUDE_ATTRS = {
+    'ibs', 'logger', 'logs', 'callbacks', '_gen', 'verifiers', 'ranker',
+    'qreq_', 'cm_list', 'vsone_matches', 'review_counter',
+    '_last_checkpoint_time',
+}
+
+
+class Checkpoint(object):
+    """
+    Save and restore AnnotInference state.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.graph.mixin_checkpoint import *  # NOQA
+        >>> from ibeis.algo.graph import demo
+        >>> import ibeis
+        >>> infr = demo.demodata_infr(num_pccs=10, size=4)
+        >>> fpath = ut.unixjoin(ut.ensure_app_resource_dir('ibeis'), 'infr_checkpoint_test.pkl')
+        >>> infr.save_checkpoint(fpath)
+        >>> infr2 = ibeis.AnnotInference.load_checkpoint(None, fpath)
+        >>> assert set(infr2.graph.edges()) == set(infr.graph.edges())
+        >>> assert infr2.pos_redun_nids == infr.pos_redun_nids
+        >>> assert len(infr2.queue) == len(infr.queue)
+        >>> assert infr2.status() == infr.status()
+        >>> infr2.assert_consistency_invariant()
+        >>> ut.delete(fpath)
+    """
+
+    def feedback_watermark(infr, mode='staging'):
+        """
+        Summarizes the feedback table that the inference state is built from.
+
+        Returns:
+            tuple: (mode, num_rows, max_rowid, max_modified_time) or None if
+                there is no database
+        """
+        ibs = infr.ibs
+        if ibs is None:
+            return None
+        if mode == 'staging':
+            db = ibs.staging
+            operation = '''
+                SELECT COUNT(*), MAX(rowid), MAX(review_server_end_time_posix)
+                FROM {tbl}
+                '''.format(tbl=ibs.const.REVIEW_TABLE)
+        elif mode == 'annotmatch':
+            db = ibs.db
+            operation = '''
+                SELECT COUNT(*), MAX(rowid), MAX(annotmatch_posixtime_modified)
+                FROM {tbl}
+                '''.format(tbl=ibs.const.ANNOTMATCH_TABLE)
+        else:
+            raise ValueError('no mode=%r' % (mode,))
+        num_rows, max_rowid, max_modified = db.connection.execute(
+            operation).fetchone()
+        return (mode, num_rows, max_rowid, max_modified)
+
+    def _checkpoint_state(infr):
+        state = {
+            key: val for key, val in infr.__dict__.items()
+            if key not in CHECKPOINT_EXCLUDE_ATTRS
+        }
+        # Store the next value of the counter instead of the iterator
+        next_review = next(infr.review_counter)
+        infr.review_counter = it.count(next_review)
+        state['review_counter'] = next_review
+        return state
+
+    def save_checkpoint(infr, fpath, mode='staging'):
+        """
+        Writes the inference state to a binary checkpoint file.
+
+        Unsynced feedback is written to the staging database first (when
+        autosave is on) so the stored watermark covers it. The file is
+        written to a temporary path and atomically moved into place.
+
+        Args:
+            fpath (str): checkpoint file path
+            mode (str): feedback table used for the watermark
+                ('staging' or 'annotmatch')
+
+        Returns:
+            str: fpath
+        """
+        tt = time.time()
+        if infr.ibs is not None and infr.params['manual.autosave']:
+            if len(infr.internal_feedback) > 0:
+                infr.write_ibeis_staging_feedback()
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'aids': sorted(infr.aids),
+            'watermark': infr.feedback_watermark(mode),
+            'state': infr._checkpoint_state(),
+        }
+        ut.ensuredir(dirname(fpath) or '.')
+        temp_fpath = fpath + '.tmp'
+        with open(temp_fpath, 'wb') as file_:
+            pickle.dump(checkpoint, file_, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_fpath, fpath)
+        infr._last_checkpoint_time = time.time()
+        infr.print('saved checkpoint in %.2fs to %r' % (
+            time.time() - tt, fpath), 1)
+        return fpath
+
+    def checkpoint_if_due(infr, fpath, interval, mode='staging'):
+        """
+        Saves a checkpoint if none was written in the last interval seconds
+
+        Returns:
+            bool: True if a checkpoint was written
+        """
+        last_time = getattr(infr, '_last_checkpoint_time', None)
+        if last_time is not None and time.time() - last_time < interval:
+            return False
+        infr.save_checkpoint(fpath, mode=mode)
+        return True
+
+    def _replay_staging_feedback(infr, stored_watermark):
+        """
+        Applies reviews that were appended to the staging table after the
+        stored watermark was taken.
+
+        Returns:
+            bool: False if the table changed in any other way (rows were
+                deleted), in which case the state cannot be caught up
+        """
+        mode, num_rows, max_rowid, _ = stored_watermark
+        if infr.dirty:
+            return False
+        ibs = infr.ibs
+        operation = 'SELECT rowid FROM {tbl} WHERE rowid > ? ORDER BY rowid'.format(
+            tbl=ibs.const.REVIEW_TABLE)
+        new_review_ids = [row[0] for row in ibs.staging.connection.execute(
+            operation, (max_rowid or 0,))]
+        current_num_rows = infr.feedback_watermark(mode)[1]
+        if num_rows + len(new_review_ids) != current_num_rows:
+            return False
+        infr.print('replaying %d reviews added after the checkpoint' % (
+            len(new_review_ids),), 1)
+        feedback = infr.read_ibeis_staging_feedback(review_ids=new_review_ids)
+        for edge, feedback_items in feedback.items():
+            if edge[0] not in infr.aids_set or edge[1] not in infr.aids_set:
+                continue
+            for feedback_item in feedback_items:
+                feedback_item = feedback_item.copy()
+                feedback_item.pop('num_reviews', None)
+                infr.add_feedback(edge, **feedback_item)
+            # These reviews are already in the database
+            infr.external_feedback[edge].extend(
+                infr.internal_feedback.pop(edge, []))
+        return True
+
+    @classmethod
+    def load_checkpoint(AnnotInference, ibs, fpath, aids=None, mode='staging',
+                        verbose=False):
+        """
+        Restores an inference object from a checkpoint.
+
+        Args:
+            ibs (IBEISController): controller to attach to
+            fpath (str): checkpoint file path
+            aids (list): if specified the checkpoint must contain exactly
+                these annotations
+            mode (str): feedback table used for the watermark
+
+        Returns:
+            AnnotInference: infr or None if the checkpoint does not exist, was
+                written by an incompatible version, or is stale. Reviews that
+                were only appended to the staging table since the checkpoint
+                are replayed instead of treating the checkpoint as stale.
+        """
+        if not exists(fpath):
+            return None
+        tt = time.time()
+        with open(fpath, 'rb') as file_:
+            checkpoint = pickle.load(file_)
+        if checkpoint.get('version', None) != CHECKPOINT_VERSION:
+            print('[infr] checkpoint %r has an incompatible version' % (fpath,))
+            return None
+        if aids is not None and sorted(aids) != checkpoint['aids']:
+            print('[infr] checkpoint %r has different annotations' % (fpath,))
+            return None
+        infr = AnnotInference(ibs, aids=[], autoinit=False, verbose=verbose)
+        stored_watermark = checkpoint['watermark']
+        watermark = infr.feedback_watermark(mode)
+        state = checkpoint['state']
+        state['review_counter'] = it.count(state['review_counter'])
+        infr.__dict__.update(state)
+        infr.logs = collections.deque(maxlen=10000)
+        if watermark != stored_watermark:
+            # Reviews appended to staging after the checkpoint can be replayed
+            if mode != 'staging' or not infr._replay_staging_feedback(stored_watermark):
+                print('[infr] checkpoint %r is stale. watermark=%r, stored=%r' % (
+                    fpath, watermark, stored_watermark))
+                return None
+        infr._last_checkpoint_time = time.time()
+        infr.print('loaded checkpoint in %.2fs from %r' % (
+            time.time() - tt, fpath), 1)
+        return infr
@@ -517,12 +517,14 @@ class IBEISIO(object):
         infr.print('finished making name delta', 3)
         return name_delta_df
 
-    def read_ibeis_staging_feedback(infr, edges=None):
+    def read_ibeis_staging_feedback(infr, edges=None, review_ids=None):
         """
         Reads feedback from review staging table.
 
         Args:
             infr (?):
+            edges (list): only read reviews of these edges
+            review_ids (list): only read these staging review rowids
 
         Returns:
             ?: feedback
@@ -549,7 +551,9 @@ class IBEISIO(object):
         from ibeis.control.manual_review_funcs import hack_create_aidpair_index
         hack_create_aidpair_index(ibs)
 
-        if edges:
+        if review_ids is not None:
+            pass
+        elif edges:
             review_ids = ut.flatten(ibs.get_review_rowids_from_edges(edges))
         else:
             review_ids = ibs.get_review_rowids_between(infr.aids)
@@ -15,6 +15,11 @@ from ibeis.algo.graph.state import POSTV, NEGTV, INCMP, UNREV  # NOQA
 print, rrr, profile = ut.inject2(__name__)
 
 
+# Published verifiers keyed by species. Loaded once per process and shared
+# by all inference objects.
+PUBLISHED_VERIFIERS = {}
+
+
 @six.add_metaclass(ut.ReloadingMetaclass)
 class AnnotInfrMatching(object):
     """
@@ -439,6 +444,9 @@ class InfrLearning(object):
         """
         Downloads, caches, and loads pre-trained verifiers.
         This is the default action.
+
+        Loaded verifiers are kept in PUBLISHED_VERIFIERS and shared (read
+        only) by every inference object in the process.
         """
         from ibeis.algo.verif import deploy
         ibs = infr.ibs
@@ -447,7 +455,10 @@ class InfrLearning(object):
         assert species in infr.task_thresh_dict
         infr.task_thresh = infr.task_thresh_dict[species]
         infr.print('Loading verifiers for species: %r' % (species, ))
-        infr.verifiers = deploy.Deployer().load_published(ibs, species)
+        if species not in PUBLISHED_VERIFIERS:
+            PUBLISHED_VERIFIERS[species] = deploy.Deployer().load_published(
+                ibs, species)
+        infr.verifiers = PUBLISHED_VERIFIERS[species]
 
     def load_latest_classifiers(infr, dpath):
         from ibeis.algo.verif import deploy
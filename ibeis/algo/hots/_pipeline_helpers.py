@@ -168,13 +168,14 @@ def testdata_pre_baselinefilter(defaultdb='testdb1', qaid_list=None, daid_list=N
     return qreq_, nns_list, impossible_daids_list
 
 
-def testdata_pre_sver(defaultdb='testdb1', qaid_list=None, daid_list=None):
+def testdata_pre_sver(defaultdb='testdb1', qaid_list=None, daid_list=None, cfgdict=None):
     """
         >>> from ibeis.algo.hots._pipeline_helpers import *  # NOQA
     """
     # TODO: testdata_pre('sver')
     #from ibeis.algo import Config
-    cfgdict = dict()
+    if cfgdict is None:
+        cfgdict = dict()
     import ibeis
     p = 'default' + ut.get_cfg_lbl(cfgdict)
     qreq_ = ibeis.testdata_qreq_(defaultdb=defaultdb, default_qaids=qaid_list,
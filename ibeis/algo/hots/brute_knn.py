@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Exact nearest neighbors by blocked matrix multiplication.
+
+For a few hundred thousand descriptors, building a FLANN forest costs more
+than the queries, and its approximate neighbors make regression comparisons
+noisy. BruteForceKNN computes the exact squared L2 distances of a block of
+query vectors to all indexed vectors as
+
+    ||q||^2 - 2 * q.d + ||d||^2
+
+with one float32 matrix product (multithreaded by the BLAS numpy links
+against) and keeps the K smallest of each row with argpartition. Blocks are
+sized so the distance matrix stays under `max_block_nbytes`.
+
+For uint8 SIFT descriptors every term of the product is an integer below
+2 ** 24, so the float32 distances are exact.
+
+BruteForceKNN implements the subset of the pyflann.FLANN interface that
+NeighborIndex uses, so it can stand in as `NeighborIndex.flann`.
+
+CommandLine:
+    python -m ibeis.algo.hots.brute_knn benchmark_knn_backends
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import utool as ut
+(print, rrr, profile) = ut.inject2(__name__, '[brute_knn]')
+
+
+# Upper bound on the size of the (queries x indexed vectors) distance block
+MAX_BLOCK_NBYTES = 2 ** 27
+
+
+class BruteForceKNN(object):
+    """
+    Exact K nearest neighbor index with the pyflann.FLANN interface used by
+    NeighborIndex.
+
+    Args:
+        max_block_nbytes (int): memory bound of one distance block
+
+    CommandLine:
+        python -m ibeis.algo.hots.brute_knn BruteForceKNN
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.brute_knn import *  # NOQA
+        >>> rng = np.random.RandomState(0)
+        >>> data = rng.randint(0, 256, (500, 128)).astype(np.uint8)
+        >>> qvecs = rng.randint(0, 256, (37, 128)).astype(np.uint8)
+        >>> brute = BruteForceKNN(max_block_nbytes=4 * 500 * 8)
+        >>> brute.build_index(data)
+        >>> idxs, dists = brute.nn_index(qvecs, 4)
+        >>> diff = qvecs[:, None, :].astype(np.int64) - data[None, :, :]
+        >>> true_dists = (diff ** 2).sum(axis=2)
+        >>> true_idxs = np.argsort(true_dists, axis=1, kind='stable')[:, 0:4]
+        >>> assert idxs.dtype == np.int32 and dists.dtype == np.float32
+        >>> assert np.all(idxs == true_idxs)
+        >>> assert np.all(dists == np.sort(true_dists, axis=1)[:, 0:4])
+        >>> # Removed points are never returned
+        >>> brute.remove_points(true_idxs[:, 0])
+        >>> idxs2, dists2 = brute.nn_index(qvecs, 1)
+        >>> assert idxs2.shape == (37,)
+        >>> assert not np.any(np.isin(idxs2, true_idxs[:, 0]))
+        >>> # Excluded ranges are never returned either
+        >>> idxs3, dists3 = brute.nn_index(qvecs, 4, exclude_ranges=[(0, 250)])
+        >>> keep = np.setdiff1d(np.arange(250, 500), true_idxs[:, 0])
+        >>> diff = qvecs[:, None, :].astype(np.int64) - data[None, keep, :]
+        >>> true_idxs3 = keep[np.argsort((diff ** 2).sum(axis=2), axis=1, kind='stable')[:, 0:4]]
+        >>> assert np.all(idxs3 == true_idxs3)
+    """
+
+    def __init__(brute, max_block_nbytes=None):
+        if max_block_nbytes is None:
+            max_block_nbytes = MAX_BLOCK_NBYTES
+        brute.max_block_nbytes = max_block_nbytes
+        brute._data = None
+        brute._added_data = []
+        brute._removed_ids = []
+        brute._data32 = None
+        brute._sqrd_norms = None
+        brute._dist_dtype = np.float32
+
+    def build_index(brute, pts, **kwargs):
+        """
+        Indexes pts. Extra keyword arguments (FLANN params) are ignored.
+        """
+        pts = np.asarray(pts)
+        if pts.ndim != 2:
+            raise ValueError('pts must be a 2D array')
+        brute._data = pts
+        brute._added_data = []
+        brute._removed_ids = []
+        brute._dist_dtype = np.float64 if pts.dtype == np.float64 else np.float32
+        brute._data32 = np.ascontiguousarray(pts, dtype=brute._dist_dtype)
+        brute._sqrd_norms = np.einsum('ij,ij->i', brute._data32, brute._data32)
+        return {}
+
+    def add_points(brute, pts, rebuild_threshold=2.0):
+        pts = np.asarray(pts)
+        pts32 = np.ascontiguousarray(pts, dtype=brute._dist_dtype)
+        brute._added_data.append(pts)
+        brute._data32 = np.vstack((brute._data32, pts32))
+        brute._sqrd_norms = np.hstack((
+            brute._sqrd_norms, np.einsum('ij,ij->i', pts32, pts32)))
+
+    def remove_points(brute, idxs):
+        """ Removed points are kept in memory but never returned """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        brute._removed_ids.extend(idxs.tolist())
+        brute._sqrd_norms[idxs] = np.inf
+
+    def remove_point(brute, idx):
+        brute.remove_points([idx])
+
+    def get_indexed_data(brute):
+        return brute._data, brute._added_data
+
+    def get_indexed_shape(brute):
+        npts, dim = brute._data32.shape
+        return npts - len(set(brute._removed_ids)), dim
+
+    def save_index(brute, filename):
+        """ Nothing is built, so there is nothing to save """
+        pass
+
+    def load_index(brute, filename, pts):
+        brute.build_index(pts)
+
+    def block_size(brute, num_queries):
+        """ Number of query rows per distance block """
+        num_data = max(len(brute._sqrd_norms), 1)
+        itemsize = np.dtype(brute._dist_dtype).itemsize
+        num_rows = brute.max_block_nbytes // (itemsize * num_data)
+        return int(min(max(num_rows, 1), max(num_queries, 1)))
+
+    def _knn_block(brute, qvecs, K, exclude_ranges=None):
+        q = np.ascontiguousarray(qvecs, dtype=brute._dist_dtype)
+        dists = q.dot(brute._data32.T)
+        dists *= -2
+        dists += np.einsum('ij,ij->i', q, q)[:, None]
+        dists += brute._sqrd_norms[None, :]
+        if exclude_ranges is not None:
+            for start, stop in exclude_ranges:
+                dists[:, start:stop] = np.inf
+        if K == 1:
+            # argmin already breaks ties by index
+            idxs = dists.argmin(axis=1)[:, None]
+            dists = np.take_along_axis(dists, idxs, axis=1)
+            np.maximum(dists, 0, out=dists)
+            return idxs.astype(np.int32), dists
+        elif K < dists.shape[1]:
+            part_idxs = np.argpartition(dists, K - 1, axis=1)[:, 0:K]
+            part_dists = np.take_along_axis(dists, part_idxs, axis=1)
+        else:
+            part_idxs = np.tile(np.arange(dists.shape[1]), (len(dists), 1))
+            part_dists = dists
+        # Order by distance, ties by index
+        sortx = np.lexsort((part_idxs, part_dists), axis=1)
+        idxs = np.take_along_axis(part_idxs, sortx, axis=1)
+        dists = np.take_along_axis(part_dists, sortx, axis=1)
+        np.maximum(dists, 0, out=dists)
+        return idxs.astype(np.int32), dists
+
+    def nn_index(brute, qpts, num_neighbors=1, **kwargs):
+        """
+        Returns the indices and squared L2 distances of the num_neighbors
+        nearest indexed points of each query point. Like FLANN, the result
+        is 1D when num_neighbors is 1.
+
+        Args:
+            qpts (ndarray): (N x D) query vectors
+            num_neighbors (int): number of results
+            cores (int): number of threads working on separate blocks.
+                Each matrix product is multithreaded by BLAS regardless.
+            exclude_ranges (ndarray): (R x 2) [start, stop) ranges of indexed
+                points that are never returned. There must be at least
+                num_neighbors other points.
+
+        Returns:
+            tuple: (idxs, dists)
+        """
+        if brute._data32 is None:
+            raise ValueError('build_index(...) method not called first')
+        K = num_neighbors
+        qpts = np.asarray(qpts)
+        if qpts.ndim == 1:
+            qpts = qpts.reshape(1, -1)
+        num_queries = len(qpts)
+        assert len(brute._data32) >= K, 'more neighbors than there are points'
+        idxs = np.empty((num_queries, K), dtype=np.int32)
+        dists = np.empty((num_queries, K), dtype=brute._dist_dtype)
+        block_size = brute.block_size(num_queries)
+        slices = list(ut.ichunk_slices(num_queries, block_size))
+
+        def _knn_slice(sl_):
+            idxs[sl_], dists[sl_] = brute._knn_block(qpts[sl_], K,
+                                                     exclude_ranges)
+
+        exclude_ranges = kwargs.get('exclude_ranges', None)
+        cores = kwargs.get('cores', None)
+        if cores is not None and cores > 1 and len(slices) > 1:
+            # numpy releases the GIL in the products and partitions
+            import concurrent.futures
+            with concurrent.futures.ThreadPoolExecutor(cores) as executor:
+                list(executor.map(_knn_slice, slices))
+        else:
+            for sl_ in slices:
+                _knn_slice(sl_)
+        if K == 1:
+            return idxs.reshape(num_queries), dists.reshape(num_queries)
+        return idxs, dists
+
+
+def benchmark_knn_backends(num_vecs_list=None, num_queries=1000, K=4,
+                           checks=800, trees=8, seed=0):
+    r"""
+    Times building an index and answering num_queries query vectors with
+    FLANN and with BruteForceKNN over random SIFT-like uint8 descriptors of
+    increasing database size. The neighbor recall of FLANN is measured
+    against the exact neighbors.
+
+    `crossover_queries` is the number of query vectors after which one FLANN
+    build plus its queries becomes cheaper than brute force (inf if brute
+    force queries are faster too).
+
+    Returns:
+        list: one dict per database size
+
+    CommandLine:
+        python -m ibeis.algo.hots.brute_knn benchmark_knn_backends
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.hots.brute_knn import *  # NOQA
+        >>> result_list = benchmark_knn_backends()
+        >>> print(ut.repr4(result_list, precision=4))
+    """
+    import time
+    from vtool_ibeis._pyflann_backend import pyflann
+    if num_vecs_list is None:
+        num_vecs_list = [10000, 30000, 100000, 300000]
+    rng = np.random.RandomState(seed)
+    # SIFT like data: a few clusters plus noise
+    centers = rng.randint(0, 128, (64, 128))
+    def sift_like(num):
+        labels = rng.randint(0, len(centers), num)
+        noise = rng.randint(-24, 25, (num, 128))
+        return np.clip(centers[labels] + noise, 0, 255).astype(np.uint8)
+    qvecs = sift_like(num_queries)
+    result_list = []
+    for num_vecs in num_vecs_list:
+        data = sift_like(num_vecs)
+        timings = {}
+        outputs = {}
+        for backend in ['flann', 'brute']:
+            start = time.time()
+            if backend == 'flann':
+                index = pyflann.FLANN()
+                index.build_index(data, algorithm='kdtree', trees=trees,
+                                  random_seed=42)
+            else:
+                index = BruteForceKNN()
+                index.build_index(data)
+            build_time = time.time() - start
+            start = time.time()
+            outputs[backend] = index.nn_index(qvecs, K, checks=checks,
+                                              cores=0)
+            query_time = time.time() - start
+            timings[backend] = (build_time, query_time)
+        recall = np.mean([
+            len(np.intersect1d(flann_idxs, true_idxs)) / K
+            for flann_idxs, true_idxs in zip(outputs['flann'][0],
+                                             outputs['brute'][0])
+        ])
+        flann_total = sum(timings['flann'])
+        brute_total = sum(timings['brute'])
+        query_diff = timings['brute'][1] - timings['flann'][1]
+        if query_diff > 0:
+            build_diff = timings['flann'][0] - timings['brute'][0]
+            crossover = int(num_queries * build_diff / query_diff)
+        else:
+            crossover = np.inf
+        result = ut.odict([
+            ('num_vecs', num_vecs),
+            ('flann_build_seconds', timings['flann'][0]),
+            ('flann_query_seconds', timings['flann'][1]),
+            ('brute_build_seconds', timings['brute'][0]),
+            ('brute_query_seconds', timings['brute'][1]),
+            ('flann_recall', recall),
+            ('brute_speedup', flann_total / brute_total),
+            ('crossover_queries', crossover),
+        ])
+        result_list.append(result)
+    return result_list
+
+
+if __name__ == '__main__':
+    r"""
+    CommandLine:
+        python -m ibeis.algo.hots.brute_knn
+        python -m ibeis.algo.hots.brute_knn --allexamples
+    """
+    import multiprocessing
+    multiprocessing.freeze_support()  # for win32
+    import xdoctest
+    xdoctest.doctest_module(__file__)
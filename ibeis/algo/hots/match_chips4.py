@@ -5,7 +5,7 @@ Runs functions in pipeline to get query reuslts and does some caching.
 from __future__ import absolute_import, division, print_function, unicode_literals
 import ubelt as ub
 import utool as ut
-from os.path import exists
+from os.path import exists, getsize
 from ibeis.algo.hots import chip_match
 from ibeis.algo.hots import pipeline
 (print, rrr, profile) = ut.inject2(__name__)
@@ -92,8 +92,13 @@ def submit_query_request(qreq_, use_cache=None, use_bigcache=None,
                     qaid2_cm = cacher.load()
                     cm_list = [qaid2_cm[qaid] for qaid in qreq_.qaids]
                 except (IOError, AttributeError):
-                    pass
+                    if qreq_.metrics is not None:
+                        qreq_.metrics.record_cache('bigcache', misses=1)
                 else:
+                    if qreq_.metrics is not None:
+                        qreq_.metrics.record_cache(
+                            'bigcache', hits=1,
+                            bytes_read=getsize(cacher.get_fpath()))
                     return cm_list
         # ------------
         # Execute query request
@@ -104,6 +109,9 @@ def submit_query_request(qreq_, use_cache=None, use_bigcache=None,
         # ------------
         if save_qcache and is_big:
             cacher.save(qaid2_cm)
+            if qreq_.metrics is not None:
+                qreq_.metrics.record_cache(
+                    'bigcache', bytes_written=getsize(cacher.get_fpath()))
 
         cm_list = [qaid2_cm[qaid] for qaid in qreq_.qaids]
     return cm_list
@@ -221,39 +229,8 @@ def execute_query_and_save_L1(qreq_, use_cache, save_qcache, verbose=True,
         if use_supercache:
             print('[mc4] supercache-query is on')
         # Try loading as many cached results as possible
-        qaid2_cm_hit = {}
         external_qaids = qreq_.qaids
-        fpath_list = list(qreq_.get_chipmatch_fpaths(external_qaids, super_qres_cache=use_supercache))
-        exists_flags = [exists(fpath) for fpath in fpath_list]
-        qaids_hit = ut.compress(external_qaids, exists_flags)
-        fpaths_hit = ut.compress(fpath_list, exists_flags)
-        fpath_iter = ut.ProgIter(
-            fpaths_hit, length=len(fpaths_hit), enabled=len(fpaths_hit) > 1,
-            label='loading cache hits', adjust=True, freq=1)
-        try:
-            cm_hit_list = [
-                chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
-                for fpath in fpath_iter
-            ]
-            assert all([qaid == cm.qaid for qaid, cm in zip(qaids_hit, cm_hit_list)]), (
-                'inconsistent qaid and cm.qaid')
-            qaid2_cm_hit = {cm.qaid: cm for cm in cm_hit_list}
-        except chip_match.NeedRecomputeError:
-            print('NeedRecomputeError: Some cached chips need to recompute')
-            fpath_iter = ut.ProgIter(
-                fpaths_hit, length=len(fpaths_hit), enabled=len(fpaths_hit) > 1,
-                label='checking chipmatch cache', adjust=True, freq=1)
-            # Recompute those that fail loading
-            qaid2_cm_hit = {}
-            for fpath in fpath_iter:
-                try:
-                    cm = chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
-                except chip_match.NeedRecomputeError:
-                    pass
-                else:
-                    qaid2_cm_hit[cm.qaid] = cm
-            print('%d / %d cached matches need to be recomputed' % (
-                len(qaids_hit) - len(qaid2_cm_hit), len(qaids_hit)))
+        qaid2_cm_hit = load_cached_chipmatches(qreq_, use_supercache)
         if len(qaid2_cm_hit) == len(external_qaids):
             return qaid2_cm_hit
         else:
@@ -275,12 +252,83 @@ def execute_query_and_save_L1(qreq_, use_cache, save_qcache, verbose=True,
     return qaid2_cm
 
 
+def load_cached_chipmatches(qreq_, use_supercache=False):
+    """
+    Loads the saved chip matches of the external qaids of qreq_.
+
+    Returns:
+        dict: qaid2_cm_hit - the queries with a valid cached result
+    """
+    qaid2_cm_hit = {}
+    external_qaids = qreq_.qaids
+    fpath_list = list(qreq_.get_chipmatch_fpaths(external_qaids, super_qres_cache=use_supercache))
+    exists_flags = [exists(fpath) for fpath in fpath_list]
+    qaids_hit = ut.compress(external_qaids, exists_flags)
+    fpaths_hit = ut.compress(fpath_list, exists_flags)
+    fpath_iter = ut.ProgIter(
+        fpaths_hit, length=len(fpaths_hit), enabled=len(fpaths_hit) > 1,
+        label='loading cache hits', adjust=True, freq=1)
+    try:
+        cm_hit_list = [
+            chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
+            for fpath in fpath_iter
+        ]
+        assert all([qaid == cm.qaid for qaid, cm in zip(qaids_hit, cm_hit_list)]), (
+            'inconsistent qaid and cm.qaid')
+        qaid2_cm_hit = {cm.qaid: cm for cm in cm_hit_list}
+    except chip_match.NeedRecomputeError:
+        print('NeedRecomputeError: Some cached chips need to recompute')
+        fpath_iter = ut.ProgIter(
+            fpaths_hit, length=len(fpaths_hit), enabled=len(fpaths_hit) > 1,
+            label='checking chipmatch cache', adjust=True, freq=1)
+        # Recompute those that fail loading
+        qaid2_cm_hit = {}
+        for fpath in fpath_iter:
+            try:
+                cm = chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
+            except chip_match.NeedRecomputeError:
+                pass
+            else:
+                qaid2_cm_hit[cm.qaid] = cm
+        print('%d / %d cached matches need to be recomputed' % (
+            len(qaids_hit) - len(qaid2_cm_hit), len(qaids_hit)))
+    if qreq_.metrics is not None:
+        qreq_.metrics.record_cache(
+            'chipmatch', hits=len(qaid2_cm_hit),
+            misses=len(external_qaids) - len(qaid2_cm_hit),
+            bytes_read=sum(getsize(fpath) for fpath in fpaths_hit))
+    return qaid2_cm_hit
+
+
 @profile
 def execute_query2(qreq_, verbose, save_qcache, batch_size=None, use_supercache=False):
     """
     Breaks up query request into several subrequests
     to process "more efficiently" and safer as well.
     """
+    qaid2_cm = {}
+    for sub_cm_list in generate_query_chunks(qreq_, verbose, save_qcache,
+                                             batch_size, use_supercache):
+        qaid2_cm.update({cm.qaid: cm for cm in sub_cm_list})
+    return qaid2_cm
+
+
+def generate_query_chunks(qreq_, verbose, save_qcache, batch_size=None,
+                          use_supercache=False, cancel_token=None,
+                          stage_hook=None):
+    """
+    Runs the pipeline on the qaids of qreq_ in chunks of batch_size.
+
+    Args:
+        cancel_token (pipeline.CancelToken): checked before each chunk and
+            each stage of the pipeline
+        stage_hook (callable): receives the stage events of
+            pipeline.pipeline_stage
+
+    Yields:
+        list: sub_cm_list - the chip matches of one chunk, after they are
+            saved to the cache
+    """
     if qreq_.prog_hook is not None:
         preload_hook, query_hook = qreq_.prog_hook.subdivide(spacing=[0, .15, .8])
         preload_hook(0, lbl='preloading')
@@ -288,11 +336,11 @@ def execute_query2(qreq_, verbose, save_qcache, batch_size=None, use_supercache=
     else:
         preload_hook = None
     # Load features / weights for all annotations
-    qreq_.lazy_preload(prog_hook=preload_hook, verbose=verbose and ut.NOT_QUIET)
+    with pipeline.pipeline_stage('preload_all', qreq_, cancel_token, stage_hook):
+        qreq_.lazy_preload(prog_hook=preload_hook, verbose=verbose and ut.NOT_QUIET)
 
     all_qaids = qreq_.qaids
     print('len(missed_qaids) = %r' % (len(all_qaids),))
-    qaid2_cm = {}
     # vsone must have a chunksize of 1
     if batch_size is None:
         if HOTS_BATCH_SIZE is None:
@@ -312,25 +360,125 @@ def execute_query2(qreq_, verbose, save_qcache, batch_size=None, use_supercache=
                                 label='[mc4] query chunk: ',
                                 prog_hook=qreq_.prog_hook)
     for sub_qreq_ in sub_qreq_iter:
+        if cancel_token is not None:
+            cancel_token.check()
         if ut.VERBOSE:
             print('Generating vsmany chunk')
         sub_cm_list = pipeline.request_ibeis_query_L0(qreq_.ibs, sub_qreq_,
-                                                      verbose=verbose)
+                                                      verbose=verbose,
+                                                      cancel_token=cancel_token,
+                                                      stage_hook=stage_hook)
         assert len(sub_qreq_.qaids) == len(sub_cm_list), 'not aligned'
         assert all([qaid == cm.qaid for qaid, cm in
                     zip(sub_qreq_.qaids, sub_cm_list)]), 'not corresonding'
         if save_qcache:
-            fpath_list = list(qreq_.get_chipmatch_fpaths(sub_qreq_.qaids, super_qres_cache=use_supercache))
-            _iter = zip(sub_cm_list, fpath_list)
-            _iter = ut.ProgIter(_iter, length=len(sub_cm_list),
-                                label='saving chip matches', adjust=True, freq=1)
-            for cm, fpath in _iter:
-                cm.save_to_fpath(fpath, verbose=False)
+            # Saving is not interrupted so the cache never holds part of a
+            # chunk
+            with pipeline.pipeline_stage('save', sub_qreq_, None, stage_hook):
+                fpath_list = list(qreq_.get_chipmatch_fpaths(sub_qreq_.qaids, super_qres_cache=use_supercache))
+                _iter = zip(sub_cm_list, fpath_list)
+                _iter = ut.ProgIter(_iter, length=len(sub_cm_list),
+                                    label='saving chip matches', adjust=True, freq=1)
+                for cm, fpath in _iter:
+                    cm.save_to_fpath(fpath, verbose=False)
+                if qreq_.metrics is not None:
+                    qreq_.metrics.record_cache(
+                        'chipmatch', bytes_written=sum(
+                            getsize(fpath) for fpath in fpath_list))
         else:
             if ut.VERBOSE:
                 print('[mc4] not saving vsmany chunk')
-        qaid2_cm.update({cm.qaid: cm for cm in sub_cm_list})
-    return qaid2_cm
+        yield sub_cm_list
+
+
+def stream_query_request(qreq_, use_cache=None, verbose=None,
+                         save_qcache=None, use_supercache=None,
+                         batch_size=None, cancel_token=None, stage_hook=None):
+    """
+    Streaming version of submit_query_request.
+
+    Yields each chip match as soon as its chunk is scored and saved instead
+    of returning all of them at the end. Cached results are yielded first, so
+    the order differs from qreq_.qaids. The big cache is not used because it
+    can only be read or written as a whole.
+
+    Args:
+        cancel_token (pipeline.CancelToken): stops the query before the next
+            chunk or pipeline stage. The generator then raises
+            pipeline.QueryCancelled. Chunks that finished stay in the cache.
+        stage_hook (callable): receives the stage events of
+            pipeline.pipeline_stage
+
+    Yields:
+        ChipMatch: cm
+
+    CommandLine:
+        python -m ibeis.algo.hots.match_chips4 stream_query_request
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.match_chips4 import *  # NOQA
+        >>> from ibeis.algo.hots.tests import bench
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'stream_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = bench.make_synthetic_database(dbdir, 12, num_feats=30,
+        >>>                                     verbose=False)
+        >>> aids = ibs.get_valid_aids()
+        >>> qreq_ = bench.new_bench_query_request(ibs, aids[0:4], aids)
+        >>> event_list = []
+        >>> cm_iter = stream_query_request(qreq_, use_cache=False,
+        >>>                                batch_size=2,
+        >>>                                stage_hook=event_list.append)
+        >>> first_cm = next(cm_iter)
+        >>> assert len(event_list) > 0
+        >>> cm_list = [first_cm] + list(cm_iter)
+        >>> assert [cm.qaid for cm in cm_list] == list(qreq_.qaids)
+        >>> # Cancel after the first chunk
+        >>> token = pipeline.CancelToken()
+        >>> cm_iter = stream_query_request(qreq_, use_cache=False,
+        >>>                                batch_size=2, cancel_token=token)
+        >>> cm = next(cm_iter)
+        >>> token.cancel()
+        >>> import pytest
+        >>> with pytest.raises(pipeline.QueryCancelled):
+        >>>     list(cm_iter)
+    """
+    if verbose is None:
+        verbose = pipeline.VERB_PIPELINE
+    if use_cache is None:
+        use_cache = USE_CACHE
+    if save_qcache is None:
+        save_qcache = SAVE_CACHE
+    if use_supercache is None:
+        use_supercache = USE_SUPERCACHE
+    assert qreq_ is not None, 'query request must be prebuilt'
+    if len(qreq_.daids) == 0 or len(qreq_.qaids) == 0:
+        ut.printex(AssertionError('empty query request'),
+                   'Impossible query request', iswarning=True,
+                   keys=['qreq_.qaids', 'qreq_.daids'])
+        return
+    if cancel_token is not None:
+        cancel_token.check()
+    if use_cache:
+        qaid2_cm_hit = load_cached_chipmatches(qreq_, use_supercache)
+    else:
+        qaid2_cm_hit = {}
+    cachehit_qaids = [qaid for qaid in qreq_.qaids if qaid in qaid2_cm_hit]
+    for qaid in cachehit_qaids:
+        yield qaid2_cm_hit[qaid]
+    if len(cachehit_qaids) == len(qreq_.qaids):
+        return
+    # mask queries that have already been executed
+    qreq_.set_external_qaid_mask(cachehit_qaids)
+    try:
+        chunk_iter = generate_query_chunks(
+            qreq_, verbose, save_qcache, batch_size, use_supercache,
+            cancel_token=cancel_token, stage_hook=stage_hook)
+        for sub_cm_list in chunk_iter:
+            for cm in sub_cm_list:
+                yield cm
+    finally:
+        qreq_.set_external_qaid_mask(None)  # undo state changes
 
 
 if __name__ == '__main__':
@@ -103,6 +103,60 @@ def compute_fmech_score(cm, qreq_=None, hack_single_ori=False):
         >>> cm.show_ranked_matches(qreq_, ori=True)
     """
     #assert qreq_ is not None
+    # The core for each feature match
+    fs_list = cm.get_fsv_prod_list()
+    fcombo_ids = get_chipmatch_fcombo_ids(cm, qreq_, hack_single_ori)
+
+    # Group annotation matches by name
+    # nsum_nid_list, name_groupxs = vt.group_indices(cm.dnid_list)
+    # nsum_nid_list = cm.unique_nids
+    name_groupxs = cm.name_groupxs
+
+    nsum_score_list = compute_nsum_name_scores(fs_list, fcombo_ids,
+                                               name_groupxs)
+    return nsum_score_list
+
+
+def get_chipmatch_fcombo_ids(cm, qreq_=None, hack_single_ori=False):
+    r"""
+    The query feature combo id of each feature match of a ChipMatch. Each
+    combo id gets at most one vote per name in nsum scoring.
+
+    Args:
+        cm (ibeis.ChipMatch):
+        qreq_ (QueryRequest): needed if hack_single_ori is not False
+        hack_single_ori (bool): if True query features with the same
+            keypoint xy-coordinate share a combo id. If None this is
+            decided by query_rotation_heuristic / rotation_invariance.
+
+    Returns:
+        list: fcombo_ids - one array per annotation
+
+    CommandLine:
+        python -m ibeis.algo.hots.name_scoring get_chipmatch_fcombo_ids
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.name_scoring import *  # NOQA
+        >>> cm = testdata_chipmatch()
+        >>> fcombo_ids = get_chipmatch_fcombo_ids(cm)
+        >>> assert all(np.all(ids == fm.T[0]) for ids, fm in zip(fcombo_ids, cm.fm_list))
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.name_scoring import *  # NOQA
+        >>> cfgdict = dict(query_rotation_heuristic=True)
+        >>> ibs, qreq_, cm_list = plh.testdata_pre_sver('testdb1', qaid_list=[2], cfgdict=cfgdict)
+        >>> cm = cm_list[0]
+        >>> fcombo_ids = get_chipmatch_fcombo_ids(cm, qreq_, hack_single_ori=True)
+        >>> kpts1 = ibs.get_annot_kpts(cm.qaid, config2_=qreq_.extern_query_config2)
+        >>> xys1 = vt.get_xys(kpts1).T
+        >>> for ids, fm in zip(fcombo_ids, cm.fm_list):
+        >>>     # equal combo ids mean equal xy-coordinates
+        >>>     same = ids[:, None] == ids[None, :]
+        >>>     samexy = np.all(xys1[fm.T[0]][:, None] == xys1[fm.T[0]][None, :], axis=2)
+        >>>     assert np.all(same == samexy)
+    """
     if hack_single_ori is None:
         try:
             hack_single_ori =  qreq_ is not None and (
@@ -110,12 +164,8 @@ def compute_fmech_score(cm, qreq_=None, hack_single_ori=False):
             )
         except AttributeError:
             hack_single_ori =  True
-    # The core for each feature match
-    #
     # The query feature index for each feature match
-    fm_list = cm.fm_list
-    fs_list = cm.get_fsv_prod_list()
-    fx1_list = [fm.T[0] for fm in fm_list]
+    fx1_list = [fm.T[0] for fm in cm.fm_list]
     if hack_single_ori:
         # Group keypoints with the same xy-coordinate.
         # Combine these feature so each only recieves one vote
@@ -128,12 +178,172 @@ def compute_fmech_score(cm, qreq_=None, hack_single_ori=False):
         # use the feature index itself as a combo id
         # so each feature only recieves one vote
         fcombo_ids = fx1_list
+    return fcombo_ids
 
-    # Group annotation matches by name
-    # nsum_nid_list, name_groupxs = vt.group_indices(cm.dnid_list)
-    # nsum_nid_list = cm.unique_nids
-    name_groupxs = cm.name_groupxs
 
+def flatten_name_matches(fs_list, fcombo_ids, name_groupxs):
+    """
+    Stacks the feature matches of all annotations name by name, so the
+    matches of every name form one contiguous segment.
+
+    Args:
+        fs_list (list): feature match scores of each annotation
+        fcombo_ids (list): query feature (combo) id of each feature match
+        name_groupxs (list): annotation indices of each name
+
+    Returns:
+        tuple: (flat_fs, flat_combo, flat_nidx, annot_order, annot_nfeats) -
+            the scores, combo ids and name index of every match, the
+            annotation indices in stacking order and their number of matches
+    """
+    num_names = len(name_groupxs)
+    if num_names == 0:
+        annot_order = np.zeros(0, dtype=np.int64)
+    else:
+        annot_order = np.hstack(name_groupxs).astype(np.int64)
+    annot_nfeats = np.array([len(fs_list[x]) for x in annot_order],
+                            dtype=np.int64)
+    if annot_nfeats.sum() == 0:
+        flat_fs = np.zeros(0, dtype=np.float64)
+        flat_combo = np.zeros(0, dtype=np.int64)
+    else:
+        flat_fs = np.hstack(ut.take(fs_list, annot_order))
+        flat_combo = np.hstack(ut.take(fcombo_ids, annot_order))
+    name_nannots = [len(groupxs) for groupxs in name_groupxs]
+    annot_nidx = np.repeat(np.arange(num_names), name_nannots)
+    flat_nidx = np.repeat(annot_nidx, annot_nfeats)
+    return flat_fs, flat_combo, flat_nidx, annot_order, annot_nfeats
+
+
+def _name_combo_keys(flat_nidx, flat_combo):
+    """ One int64 sort key for the (name index, combo id) of each match """
+    combo = flat_combo.astype(np.int64)
+    if len(combo) > 0:
+        combo = combo - combo.min()
+        return flat_nidx.astype(np.int64) * (combo.max() + 1) + combo
+    return combo
+
+
+def _segment_starts(*keys):
+    """ Positions where any of the sorted keys changes value """
+    num = len(keys[0])
+    is_start = np.zeros(num, dtype=bool)
+    if num > 0:
+        is_start[0] = True
+        for key in keys:
+            is_start[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(is_start)
+
+
+@profile
+def compute_nsum_name_scores(fs_list, fcombo_ids, name_groupxs):
+    r"""
+    Sums the feature match scores of each name, where every query feature
+    (combo id) only votes once per name with its best match. Ties go to the
+    first match in name order (the per-name loop picked one by an unstable
+    sort, which only changed the summation order of equal scores).
+
+    All matches are processed at once: they are sorted into (name, combo id)
+    segments and the first match with the segment maximum votes.
+
+    Args:
+        fs_list (list): feature match scores of each annotation
+        fcombo_ids (list): query feature (combo) id of each feature match
+        name_groupxs (list): annotation indices of each name
+
+    Returns:
+        ndarray: nsum_score_list - score of each name
+
+    CommandLine:
+        python -m ibeis.algo.hots.name_scoring compute_nsum_name_scores
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.name_scoring import *  # NOQA
+        >>> from ibeis.algo.hots import name_scoring
+        >>> fs_list, fcombo_ids, name_groupxs = testdata_name_matches(300)
+        >>> nsum_score_list = compute_nsum_name_scores(fs_list, fcombo_ids, name_groupxs)
+        >>> expected = name_scoring._compute_nsum_name_scores_loop(fs_list, fcombo_ids, name_groupxs)
+        >>> assert nsum_score_list.dtype == expected.dtype
+        >>> assert np.all(nsum_score_list == expected)
+        >>> # Tied scores (sums of small integers are exact)
+        >>> fs_list = [np.round(fs * 4) for fs in fs_list]
+        >>> nsum_score_list = compute_nsum_name_scores(fs_list, fcombo_ids, name_groupxs)
+        >>> expected = name_scoring._compute_nsum_name_scores_loop(fs_list, fcombo_ids, name_groupxs)
+        >>> assert np.all(nsum_score_list == expected)
+    """
+    num_names = len(name_groupxs)
+    flat_fs, flat_combo, flat_nidx = flatten_name_matches(
+        fs_list, fcombo_ids, name_groupxs)[0:3]
+    nsum_score_list = compute_flat_nsum_scores(flat_fs, flat_combo, flat_nidx,
+                                               num_names)
+    return nsum_score_list
+
+
+def compute_flat_nsum_scores(flat_fs, flat_combo, flat_nidx, num_names,
+                             exact=True):
+    """
+    nsum scores of feature matches that are stacked name by name (see
+    flatten_name_matches).
+
+    Args:
+        flat_fs (ndarray): score of each match
+        flat_combo (ndarray): query feature (combo) id of each match
+        flat_nidx (ndarray): non-decreasing name index of each match
+        num_names (int): number of names
+        exact (bool): if True each name is summed with np.sum, which gives
+            the scores of the per-name loop bit for bit. Otherwise all names
+            are summed at once in float64 with np.add.reduceat, which can
+            differ from them in the last bits.
+
+    Returns:
+        ndarray: nsum_score_list - score of each name
+    """
+    if len(flat_fs) == 0:
+        if not exact:
+            return np.zeros(num_names, dtype=np.float64)
+        # Same dtype as an array of python zeros
+        return np.array([0] * num_names)
+    # Segment the matches by (name, combo id). The sort is stable, so each
+    # segment keeps the name order.
+    segment_keys = _name_combo_keys(flat_nidx, flat_combo)
+    sortx = np.argsort(segment_keys, kind='stable')
+    sorted_fs = flat_fs.take(sortx)
+    starts = _segment_starts(segment_keys.take(sortx))
+    segment_max = np.maximum.reduceat(sorted_fs, starts)
+    segment_sizes = np.diff(np.append(starts, len(sortx)))
+    # The first best match of every segment votes
+    bestx = np.flatnonzero(sorted_fs == np.repeat(segment_max, segment_sizes))
+    best_segment = np.repeat(np.arange(len(starts)), segment_sizes).take(bestx)
+    is_first = np.ones(len(bestx), dtype=bool)
+    is_first[1:] = best_segment[1:] != best_segment[:-1]
+    # Detail: sorting the voting idxs preseveres summation order
+    voting_idxs = np.sort(sortx.take(bestx.compress(is_first)))
+    voting_fs = flat_fs.take(voting_idxs)
+    voting_nidx = flat_nidx.take(voting_idxs)
+    bounds = np.append(_segment_starts(voting_nidx), len(voting_idxs))
+    voting_names = voting_nidx.take(bounds[:-1])
+    if not exact:
+        nsum_score_list = np.zeros(num_names, dtype=np.float64)
+        nsum_score_list[voting_names] = np.add.reduceat(
+            voting_fs.astype(np.float64), bounds[:-1])
+        return nsum_score_list
+    # Sum each name with np.sum (pairwise summation) so the scores equal the
+    # scores of the per-name loop bit for bit.
+    name_sums = [voting_fs[lx:rx].sum() for lx, rx in ut.itertwo(bounds)]
+    if len(voting_names) == num_names:
+        nsum_score_list = np.array(name_sums)
+    else:
+        # Names without matches score 0
+        nsum_score_list = np.zeros(num_names, dtype=np.array(name_sums[0:1] + [0]).dtype)
+        nsum_score_list[voting_names] = name_sums
+    return nsum_score_list
+
+
+def _compute_nsum_name_scores_loop(fs_list, fcombo_ids, name_groupxs):
+    """
+    Per-name reference implementation of compute_nsum_name_scores
+    """
     nsum_score_list = []
     # For all indicies matched to a particular name
     for name_idxs in name_groupxs:
@@ -205,8 +415,70 @@ def get_namescore_nonvoting_feature_flags(fm_list, fs_list, dnid_list, name_grou
     r"""
     DEPRICATE
 
+    Flags the feature matches that vote in name scoring: within a name only
+    the best matches of each query feature (or keypoint location if kpts1
+    is given) vote. All matches are processed at once by sorting them into
+    (name, query feature) segments.
+
     fm_list = [fm[:min(len(fm), 10)] for fm in fm_list]
     fs_list = [fs[:min(len(fs), 10)] for fs in fs_list]
+
+    CommandLine:
+        python -m ibeis.algo.hots.name_scoring get_namescore_nonvoting_feature_flags
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.name_scoring import *  # NOQA
+        >>> from ibeis.algo.hots import name_scoring
+        >>> fs_list, fx1_list, name_groupxs = testdata_name_matches(300, num_qfeats=1000)
+        >>> fs_list = [np.round(fs * 4) for fs in fs_list]
+        >>> fm_list = [np.vstack([fx1, fx1]).T for fx1 in fx1_list]
+        >>> rng = np.random.RandomState(1)
+        >>> kpts1 = rng.randint(0, 20, (1000, 6)).astype(np.float32)
+        >>> for kpts in [None, kpts1]:
+        >>>     flags_list = get_namescore_nonvoting_feature_flags(
+        >>>         fm_list, fs_list, None, name_groupxs, kpts1=kpts)
+        >>>     expected = name_scoring._get_namescore_nonvoting_feature_flags_loop(
+        >>>         fm_list, fs_list, None, name_groupxs, kpts1=kpts)
+        >>>     assert len(flags_list) == len(expected)
+        >>>     assert all(np.all(f1 == f2) and f1.dtype == f2.dtype
+        >>>                for f1, f2 in zip(flags_list, expected))
+    """
+    fx1_list = [fm.T[0] for fm in fm_list]
+    if kpts1 is not None:
+        # Features at the same keypoint location share a vote
+        xys1_ = vt.get_xys(kpts1).T
+        kpts_xyid_list = vt.compute_unique_data_ids(xys1_)
+        fcombo_ids = [kpts_xyid_list.take(fx1) for fx1 in fx1_list]
+    else:
+        fcombo_ids = fx1_list
+    flat_fs, flat_combo, flat_nidx, annot_order, annot_nfeats = flatten_name_matches(
+        fs_list, fcombo_ids, name_groupxs)
+    # Only matches with the best score of their (name, query feature)
+    # segment can vote
+    segment_keys = _name_combo_keys(flat_nidx, flat_combo)
+    sortx = np.argsort(segment_keys, kind='stable')
+    sorted_fs = flat_fs.take(sortx)
+    starts = _segment_starts(segment_keys.take(sortx))
+    flat_isvalid = np.zeros(len(flat_fs), dtype=bool)
+    if len(flat_fs) > 0:
+        segment_max = np.maximum.reduceat(sorted_fs, starts)
+        segment_sizes = np.diff(np.append(starts, len(sorted_fs)))
+        flat_isvalid[sortx] = sorted_fs == np.repeat(segment_max, segment_sizes)
+    # Split the flags back into annotations
+    if len(annot_order) == 0:
+        return []
+    featflag_list = [None] * (annot_order.max() + 1)
+    annot_isvalid_list = np.split(flat_isvalid, np.cumsum(annot_nfeats)[:-1])
+    for annotx, isvalid in zip(annot_order, annot_isvalid_list):
+        featflag_list[annotx] = isvalid
+    return featflag_list
+
+
+def _get_namescore_nonvoting_feature_flags_loop(fm_list, fs_list, dnid_list, name_groupxs, kpts1=None):
+    """
+    Per-name reference implementation of
+    get_namescore_nonvoting_feature_flags
     """
     fx1_list = [fm.T[0] for fm in fm_list]
     # Group annotation matches by name
@@ -362,6 +634,73 @@ def align_name_scores_with_annots(annot_score_list, annot_aid_list, daid2_idx, n
         return score_list
 
 
+def testdata_name_matches(num_names=5000, annots_per_name=3,
+                          matches_per_annot=40, num_qfeats=1000, seed=0):
+    """
+    Random name grouped feature matches for name scoring benchmarks.
+
+    Returns:
+        tuple: (fs_list, fx1_list, name_groupxs)
+    """
+    rng = np.random.RandomState(seed)
+    num_annots = num_names * annots_per_name
+    nmatch_list = rng.randint(0, 2 * matches_per_annot, num_annots)
+    fs_list = [rng.rand(num).astype(np.float32) for num in nmatch_list]
+    fx1_list = [rng.randint(0, num_qfeats, num).astype(np.int32)
+                for num in nmatch_list]
+    dnid_list = rng.randint(0, num_names, num_annots)
+    name_groupxs = vt.group_indices(dnid_list)[1]
+    return fs_list, fx1_list, name_groupxs
+
+
+def benchmark_name_scoring(num_names=5000, annots_per_name=3,
+                           matches_per_annot=40):
+    r"""
+    Times the per-name loops and the flat implementations of nsum name
+    scoring and the nonvoting feature flags on random matches.
+
+    Returns:
+        dict: seconds of each implementation
+
+    CommandLine:
+        python -m ibeis.algo.hots.name_scoring benchmark_name_scoring
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.hots.name_scoring import *  # NOQA
+        >>> result = benchmark_name_scoring()
+        >>> print(ut.repr4(result, precision=3))
+    """
+    import time
+    fs_list, fx1_list, name_groupxs = testdata_name_matches(
+        num_names, annots_per_name, matches_per_annot)
+    fm_list = [np.vstack([fx1, fx1]).T for fx1 in fx1_list]
+    result = {'num_names': num_names,
+              'num_matches': int(sum(map(len, fs_list)))}
+
+    def _time(key, func, *args, **kwargs):
+        start = time.time()
+        output = func(*args, **kwargs)
+        result[key] = time.time() - start
+        return output
+
+    scores1 = _time('nsum_loop_seconds', _compute_nsum_name_scores_loop,
+                    fs_list, fx1_list, name_groupxs)
+    scores2 = _time('nsum_seconds', compute_nsum_name_scores,
+                    fs_list, fx1_list, name_groupxs)
+    assert np.all(scores1 == scores2)
+    flags1 = _time('nonvoting_loop_seconds',
+                   _get_namescore_nonvoting_feature_flags_loop,
+                   fm_list, fs_list, None, name_groupxs)
+    flags2 = _time('nonvoting_seconds', get_namescore_nonvoting_feature_flags,
+                   fm_list, fs_list, None, name_groupxs)
+    assert all(np.all(f1 == f2) for f1, f2 in zip(flags1, flags2))
+    result['nsum_speedup'] = result['nsum_loop_seconds'] / result['nsum_seconds']
+    result['nonvoting_speedup'] = (result['nonvoting_loop_seconds'] /
+                                   result['nonvoting_seconds'])
+    return result
+
+
 if __name__ == '__main__':
     """
     CommandLine:
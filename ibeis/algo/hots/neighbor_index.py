@@ -10,7 +10,7 @@ import numpy as np
 import utool as ut
 import vtool_ibeis as vt
 from vtool_ibeis._pyflann_backend import pyflann as pyflann
-from os.path import basename
+from os.path import basename, exists, getsize, join
 from ibeis.algo.hots import hstypes
 from ibeis.algo.hots import _pipeline_helpers as plh  # NOQA
 (print, rrr, profile) = ut.inject2(__name__)
@@ -19,6 +19,10 @@ USE_HOTSPOTTER_CACHE = not ut.get_argflag('--nocache-hs')
 NOSAVE_FLANN = ut.get_argflag('--nosave-flann')
 NOCACHE_FLANN = ut.get_argflag('--nocache-flann') and USE_HOTSPOTTER_CACHE
 
+# Index params that select the backend instead of configuring FLANN
+KNN_BACKEND_PARAM_KEYS = ['knn_backend', 'brute_max_vecs', 'pq_subvectors',
+                          'pq_nlist', 'pq_nprobe', 'pq_rerank']
+
 
 def get_support_data(qreq_, daid_list):
     """
@@ -51,8 +55,71 @@ def get_support_data(qreq_, daid_list):
         depth_profile = [[(34, 128), (31, 128)], [34, 31], [34, 31]]
         depth_profile = [[(83, 128), (129, 128)], [83, 129], [83, 129]]
         depth_profile = [[(13, 128), (104, 128)], [13, 104], [13, 104]]
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # With --packed-feats the descriptors come back already stacked
+        >>> from ibeis.algo.hots.neighbor_index import *  # NOQA
+        >>> from ibeis.algo.hots.tests import bench
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'support_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = bench.make_synthetic_database(dbdir, 9, num_feats=30,
+        >>>                                     verbose=False)
+        >>> aids = ibs.get_valid_aids()
+        >>> qreq_ = bench.new_bench_query_request(ibs, aids[0:3], aids)
+        >>> idx2_vec, idx2_fgw, fxs_list = get_support_data(qreq_, qreq_.daids)
+        >>> assert isinstance(idx2_vec, np.ndarray) and idx2_vec.ndim == 2
+        >>> assert len(fxs_list) == len(qreq_.daids)
+        >>> assert len(idx2_vec) == sum(map(len, fxs_list))
+        >>> config2_ = qreq_.get_internal_data_config2()
+        >>> vecs_list = ibs.get_annot_vecs(qreq_.daids, config2_=config2_)
+        >>> assert np.all(np.vstack(vecs_list) == idx2_vec)
+        >>> # The stacked arrays are indexed directly
+        >>> nnindexer = NeighborIndex(qreq_.qparams.flann_params, None)
+        >>> nnindexer.init_support(qreq_.daids, idx2_vec, idx2_fgw, fxs_list,
+        >>>                        verbose=False)
+        >>> assert np.shares_memory(nnindexer.idx2_vec, idx2_vec)
+        >>> assert np.all(nnindexer.idx2_ax == np.repeat(
+        >>>     np.arange(len(fxs_list)), list(map(len, fxs_list))))
     """
     config2_ = qreq_.get_internal_data_config2()
+    if getattr(qreq_.ibs, '_packed_feats', False) and len(daid_list) > 0:
+        # Read all descriptors as one stacked array. When nothing is filtered
+        # this is a view of the feature store and init_support indexes it
+        # without copying.
+        from ibeis.algo.preproc import preproc_feat_store
+        idx2_vec, num_rows_list = preproc_feat_store.get_packed_feats(
+            qreq_.ibs, daid_list, 'vecs', config2_=config2_, concat=True)
+        fxs_list = [np.arange(num_rows) for num_rows in num_rows_list]
+        idx2_flag = None
+        if config2_.minscale_thresh is not None or config2_.maxscale_thresh is not None:
+            min_ = -np.inf if config2_.minscale_thresh is None else config2_.minscale_thresh
+            max_ = np.inf if config2_.maxscale_thresh is None else config2_.maxscale_thresh
+            idx2_kpts = preproc_feat_store.get_packed_feats(
+                qreq_.ibs, daid_list, 'kpts', config2_=config2_, concat=True)[0]
+            idx2_scale = vt.get_scales(idx2_kpts)
+            idx2_flag = np.logical_and(idx2_scale >= min_, idx2_scale <= max_)
+        if qreq_.qparams.fg_on:
+            idx2_fgw = preproc_feat_store.get_packed_feats(
+                qreq_.ibs, daid_list, 'fgweights', config2_=config2_,
+                concat=True)[0]
+            if config2_.fgw_thresh is not None and config2_.fgw_thresh > 0:
+                fgw_flag = idx2_fgw > config2_.fgw_thresh
+                if idx2_flag is None:
+                    idx2_flag = fgw_flag
+                else:
+                    idx2_flag = np.logical_and(idx2_flag, fgw_flag)
+        else:
+            idx2_fgw = None
+        if idx2_flag is not None:
+            # Remove data under the thresholds
+            flags_list = np.split(idx2_flag, np.cumsum(num_rows_list)[:-1])
+            fxs_list = vt.zipcompress(fxs_list, flags_list, axis=0)
+            idx2_vec = idx2_vec.compress(idx2_flag, axis=0)
+            if idx2_fgw is not None:
+                idx2_fgw = idx2_fgw.compress(idx2_flag)
+        return idx2_vec, idx2_fgw, fxs_list
+
     vecs_list = qreq_.ibs.get_annot_vecs(daid_list, config2_=config2_)
     # Create corresponding feature indicies
     fxs_list = [np.arange(len(vecs)) for vecs in vecs_list]
@@ -95,8 +162,9 @@ def invert_index(vecs_list, fgws_list, ax_list, fxs_list, verbose=ut.NOT_QUIET):
     Aggregates descriptors of input annotations and returns inverted information
 
     Args:
-        vecs_list (list):
-        fgws_list (list):
+        vecs_list (list): or an (M x D) array of the already stacked
+            descriptors, partitioned by fxs_list
+        fgws_list (list): or an (M x 1) array if vecs_list is stacked
         ax_list (list):
         fxs_list (list):
         verbose (bool):  verbosity flag(default = True)
@@ -144,13 +212,18 @@ def invert_index(vecs_list, fgws_list, ax_list, fxs_list, verbose=ut.NOT_QUIET):
     if ut.VERYVERBOSE:
         print('[nnindex] stacking descriptors from %d annotations' % len(ax_list))
     try:
-        nFeat_list = np.array(list(map(len, vecs_list)))
+        is_stacked = isinstance(vecs_list, np.ndarray)
+        if is_stacked:
+            nFeat_list = np.array(list(map(len, fxs_list)))
+        else:
+            nFeat_list = np.array(list(map(len, vecs_list)))
         # Remove input without any features
         is_valid = nFeat_list > 0
         nFeat_list = nFeat_list.compress(is_valid)
-        vecs_list = ut.compress(vecs_list, is_valid)
-        if fgws_list is not None:
-            fgws_list = ut.compress(fgws_list, is_valid)
+        if not is_stacked:
+            vecs_list = ut.compress(vecs_list, is_valid)
+            if fgws_list is not None:
+                fgws_list = ut.compress(fgws_list, is_valid)
         ax_list = ut.compress(ax_list, is_valid)
         fxs_list = ut.compress(fxs_list, is_valid)
 
@@ -159,11 +232,11 @@ def invert_index(vecs_list, fgws_list, ax_list, fxs_list, verbose=ut.NOT_QUIET):
         nFeats = sum(nFeat_list)
         idx2_ax = np.fromiter(ut.iflatten(axs_list), np.int32, nFeats)
         idx2_fx = np.fromiter(ut.iflatten(fxs_list), np.int32, nFeats)
-        idx2_vec = np.vstack(vecs_list)
+        idx2_vec = vecs_list if is_stacked else np.vstack(vecs_list)
         if fgws_list is None:
             idx2_fgw = None
         else:
-            idx2_fgw = np.hstack(fgws_list)
+            idx2_fgw = fgws_list if is_stacked else np.hstack(fgws_list)
             try:
                 assert len(idx2_fgw) == len(idx2_vec), 'error. weights and vecs do not correspond'
             except Exception as ex:
@@ -201,7 +274,7 @@ class NeighborIndex(object):
         r"""
         initialize an empty neighbor indexer
         """
-        nnindexer.flann    = None  # Approximate search structure
+        nnindexer.flann    = None  # Search structure (FLANN or BruteForceKNN)
         nnindexer.ax2_aid  = None  # (A x 1) Mapping to original annot ids
         nnindexer.idx2_vec = None  # (M x D) Descriptors to index
         nnindexer.idx2_fgw = None  # (M x 1) Descriptor forground weight
@@ -220,6 +293,10 @@ class NeighborIndex(object):
             nprocs = 0
         nnindexer.cores  = flann_params.get('cores', nprocs)
         nnindexer.checks = flann_params.get('checks', 1028)
+        # 'flann', 'brute', 'pq' (compressed), or 'auto' to use brute force
+        # for small databases
+        nnindexer.knn_backend = flann_params.get('knn_backend', 'flann')
+        nnindexer.brute_max_vecs = flann_params.get('brute_max_vecs', 0)
         nnindexer.num_indexed = None
         nnindexer.flann_fpath = None
         nnindexer.max_distance_sqrd = None  # max possible distance^2 for normalization
@@ -234,8 +311,8 @@ class NeighborIndex(object):
         assert indexer.flann is None, 'already initalized'
 
         print('[nnindex] Preparing data for indexing / loading index')
-        # Check input
-        assert len(aid_list) == len(vecs_list), 'invalid input. bad len'
+        # Check input (vecs_list may also be an already stacked array)
+        assert len(aid_list) == len(fxs_list), 'invalid input. bad len'
         assert len(aid_list) > 0, ('len(aid_list) == 0.'
                                         'Cannot invert index without features!')
         # Create indexes into the input aids
@@ -248,7 +325,6 @@ class NeighborIndex(object):
 
         ax2_aid = np.array(aid_list)
 
-        indexer.flann    = pyflann.FLANN()  # Approximate search structure
         indexer.ax2_aid  = ax2_aid   # (A x 1) Mapping to original annot ids
         indexer.idx2_vec = idx2_vec  # (M x D) Descriptors to index
         indexer.idx2_fgw = idx2_fgw  # (M x 1) Descriptor forground weight
@@ -256,6 +332,27 @@ class NeighborIndex(object):
         indexer.idx2_fx  = idx2_fx   # (M x 1) Index into the annot's features
         indexer.aid2_ax  = ut.make_index_lookup(indexer.ax2_aid)
         indexer.num_indexed = indexer.idx2_vec.shape[0]
+        indexer.flann = indexer._new_search_structure()
+        indexer._init_max_distance()
+
+    def _new_search_structure(indexer):
+        knn_backend = indexer.get_knn_backend()
+        if knn_backend == 'brute':
+            from ibeis.algo.hots import brute_knn
+            return brute_knn.BruteForceKNN()  # Exact search structure
+        elif knn_backend == 'pq':
+            from ibeis.algo.hots import pq_knn
+            flann_params = indexer.flann_params
+            return pq_knn.IVFPQIndex(  # Compressed search structure
+                num_subvectors=flann_params.get('pq_subvectors', 16),
+                nlist=flann_params.get('pq_nlist', None),
+                nprobe=flann_params.get('pq_nprobe', 16),
+                rerank=flann_params.get('pq_rerank', 4),
+                random_seed=flann_params['random_seed'])
+        else:
+            return pyflann.FLANN()  # Approximate search structure
+
+    def _init_max_distance(indexer):
         if indexer.idx2_vec.dtype == hstypes.VEC_TYPE:
             # these are sift descriptors
             indexer.max_distance_sqrd = hstypes.VEC_PSEUDO_MAX_DISTANCE_SQRD
@@ -266,6 +363,33 @@ class NeighborIndex(object):
             # changed')
             indexer.max_distance_sqrd = None
 
+    def get_knn_backend(nnindexer):
+        r"""
+        Returns:
+            str: 'flann', 'brute' (exact brute force) or 'pq' (compressed).
+                The 'auto' backend uses brute force for at most
+                brute_max_vecs indexed descriptors and FLANN otherwise.
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.neighbor_index import *  # NOQA
+            >>> flann_params = {'knn_backend': 'auto', 'brute_max_vecs': 100}
+            >>> nnindexer = NeighborIndex(flann_params, None)
+            >>> nnindexer.num_indexed = 100
+            >>> assert nnindexer.get_knn_backend() == 'brute'
+            >>> nnindexer.num_indexed = 101
+            >>> assert nnindexer.get_knn_backend() == 'flann'
+        """
+        knn_backend = nnindexer.knn_backend
+        if knn_backend == 'auto':
+            if nnindexer.num_indexed <= nnindexer.brute_max_vecs:
+                knn_backend = 'brute'
+            else:
+                knn_backend = 'flann'
+        if knn_backend not in ['flann', 'brute', 'pq']:
+            raise ValueError('unknown knn_backend=%r' % (nnindexer.knn_backend,))
+        return knn_backend
+
     def add_ibeis_support(nnindexer, qreq_, new_daid_list,
                           verbose=ut.NOT_QUIET):
         r"""
@@ -356,8 +480,13 @@ class NeighborIndex(object):
         if True:
             nnindexer.ax2_aid[remove_ax_list] = -1
             nnindexer.idx2_fx[remove_idx_list] = -1
+            if not nnindexer.idx2_vec.flags.writeable:
+                # Do not write into a view of the packed feature store
+                nnindexer.idx2_vec = nnindexer.idx2_vec.copy()
             nnindexer.idx2_vec[remove_idx_list] = 0
             if nnindexer.idx2_fgw is not None:
+                if not nnindexer.idx2_fgw.flags.writeable:
+                    nnindexer.idx2_fgw = nnindexer.idx2_fgw.copy()
                 nnindexer.idx2_fgw[remove_idx_list] = np.nan
             nnindexer.aid2_ax = ut.make_index_lookup(nnindexer.ax2_aid)
 
@@ -445,16 +574,28 @@ class NeighborIndex(object):
             print('DONE ADD POINTS')
 
     def ensure_indexer(nnindexer, cachedir, verbose=True, force_rebuild=False,
-                       memtrack=None, prog_hook=None):
+                       memtrack=None, prog_hook=None, metrics=None):
         r"""
         Ensures that you get a neighbor indexer. It either loads a chached
         indexer or rebuilds a new one.
+
+        Args:
+            metrics (QueryMetrics): if given, loading and saving the index
+                file are recorded in its ``indexer_disk`` cache counters
         """
+        # Brute force has no index file
+        on_disk = nnindexer.get_knn_backend() != 'brute'
         if NOCACHE_FLANN or force_rebuild:
             print('...nnindex flann cache is forced off')
             load_success = False
         else:
             load_success = nnindexer.load(cachedir, verbose=verbose)
+        if metrics is not None and on_disk:
+            if load_success:
+                metrics.record_cache('indexer_disk', hits=1,
+                                     bytes_read=nnindexer.get_index_nbytes())
+            else:
+                metrics.record_cache('indexer_disk', misses=1)
         if load_success:
             if not ut.QUIET:
                 nVecs   = nnindexer.num_indexed_vecs()
@@ -471,6 +612,9 @@ class NeighborIndex(object):
                 prog_hook.set_progress(1, 2, 'Building new indexer (may take some time)')
             nnindexer.build_and_save(cachedir, verbose=verbose,
                                      memtrack=memtrack)
+            if metrics is not None and on_disk:
+                metrics.record_cache('indexer_disk',
+                                     bytes_written=nnindexer.get_index_nbytes())
         if prog_hook is not None:
             prog_hook.set_progress(2, 2, 'Finished loading indexer')
 
@@ -485,10 +629,17 @@ class NeighborIndex(object):
         verbose_ = ut.VERYVERBOSE or verbose or (
             not ut.QUIET and num_vecs > notify_num)
         if verbose_:
-            print('[nnindex] ...building kdtree over %d points (this may take a sec).' % num_vecs)
+            knn_backend = nnindexer.get_knn_backend()
+            if knn_backend == 'brute':
+                print('[nnindex] ...preparing brute force search over %d points' % num_vecs)
+            elif knn_backend == 'pq':
+                print('[nnindex] ...training product quantizer over %d points' % num_vecs)
+            else:
+                print('[nnindex] ...building kdtree over %d points (this may take a sec).' % num_vecs)
             tt = ut.tic(msg='Building index')
         idx2_vec = nnindexer.idx2_vec
-        flann_params = nnindexer.flann_params
+        flann_params = ut.delete_dict_keys(nnindexer.flann_params.copy(),
+                                           KNN_BACKEND_PARAM_KEYS)
         if num_vecs == 0:
             print('WARNING: CANNOT BUILD FLANN INDEX OVER 0 POINTS. THIS MAY BE A SIGN OF A DEEPER ISSUE')
         else:
@@ -506,6 +657,9 @@ class NeighborIndex(object):
         r"""
         Caches a flann neighbor indexer to disk (not the data)
         """
+        if nnindexer.get_knn_backend() == 'brute':
+            # There is no search structure to save
+            return False
         if NOSAVE_FLANN:
             if ut.VERYVERBOSE or verbose:
                 print('[nnindex] flann save is deactivated')
@@ -519,11 +673,18 @@ class NeighborIndex(object):
             print('[nnindex] flann.save_index(%r)' %
                   ut.path_ndir_split(flann_fpath, n=5))
         nnindexer.flann.save_index(flann_fpath)
+        if nnindexer.get_knn_backend() == 'pq':
+            # Keep the full vectors memory mapped from disk
+            nnindexer.idx2_vec = nnindexer.flann.get_indexed_data()[0]
 
     def load(nnindexer, cachedir=None, fpath=None, verbose=True):
         r"""
         Loads a cached flann neighbor indexer from disk (not the data)
         """
+        if nnindexer.get_knn_backend() == 'brute':
+            # Brute force needs no cache, so loading is building
+            nnindexer.reindex(verbose=False)
+            return True
         load_success = False
         if fpath is None:
             flann_fpath = nnindexer.get_fpath(cachedir)
@@ -539,8 +700,96 @@ class NeighborIndex(object):
                 ut.printex(ex, '... cannot load nnindex flann', iswarning=True)
             else:
                 load_success = True
+                if nnindexer.get_knn_backend() == 'pq':
+                    # Keep the full vectors memory mapped from disk
+                    nnindexer.idx2_vec = nnindexer.flann.get_indexed_data()[0]
         return load_success
 
+    def get_index_nbytes(nnindexer):
+        """ Size of the saved or loaded index file (0 if there is none) """
+        flann_fpath = nnindexer.flann_fpath
+        if flann_fpath is None or not exists(flann_fpath):
+            return 0
+        return getsize(flann_fpath)
+
+    def get_support_fpath(nnindexer, cachedir):
+        _args2_fpath = ut.util_cache._args2_fpath
+        return _args2_fpath(cachedir, 'pqsupport', nnindexer.cfgstr, '.npz')
+
+    def save_support(nnindexer, cachedir, verbose=True):
+        r"""
+        Caches the inverted index of a saved compressed (pq) index under the
+        request cfgstr. The full vectors are already saved by the pq index, so
+        load_support can restore the indexer without reading descriptors.
+        """
+        if (nnindexer.get_knn_backend() != 'pq' or nnindexer.cfgstr is None or
+                nnindexer.flann_fpath is None or
+                not exists(nnindexer.flann_fpath)):
+            return False
+        support_fpath = nnindexer.get_support_fpath(cachedir)
+        if ut.VERYVERBOSE or verbose:
+            print('[nnindex] save support %r' %
+                  ut.path_ndir_split(support_fpath, n=5))
+        state = dict(flann_fname=basename(nnindexer.flann_fpath),
+                     ax2_aid=nnindexer.ax2_aid, idx2_ax=nnindexer.idx2_ax,
+                     idx2_fx=nnindexer.idx2_fx)
+        if nnindexer.idx2_fgw is not None:
+            state['idx2_fgw'] = nnindexer.idx2_fgw
+        with open(support_fpath, 'wb') as file_:
+            np.savez(file_, **state)
+        return True
+
+    def load_support(nnindexer, cachedir, aid_list, verbose=True):
+        r"""
+        Restores a compressed (pq) indexer cached by save_support. The full
+        vectors are memory mapped from the file saved with the index instead
+        of being read from the depcache.
+
+        Returns:
+            bool: False on a cache miss, in which case use init_support
+        """
+        assert nnindexer.flann is None, 'already initalized'
+        if nnindexer.get_knn_backend() != 'pq' or nnindexer.cfgstr is None:
+            return False
+        support_fpath = nnindexer.get_support_fpath(cachedir)
+        if not exists(support_fpath):
+            return False
+        try:
+            with open(support_fpath, 'rb') as file_:
+                npz = np.load(file_)
+                state = {key: npz[key] for key in npz.files}
+        except (ValueError, KeyError, OSError) as ex:
+            ut.printex(ex, '... cannot load nnindex support', iswarning=True)
+            return False
+        flann_fpath = join(cachedir, str(state['flann_fname']))
+        if not exists(flann_fpath):
+            return False
+        if not np.array_equal(state['ax2_aid'], aid_list):
+            return False
+        flann = nnindexer._new_search_structure()
+        try:
+            flann.load_index(flann_fpath, None)
+        except IOError as ex:
+            ut.printex(ex, '... cannot load nnindex flann', iswarning=True)
+            return False
+        idx2_vec = flann.get_indexed_data()[0]
+        if len(idx2_vec) != len(state['idx2_ax']):
+            return False
+        if ut.VERYVERBOSE or verbose:
+            print('[nnindex] loaded support %r' %
+                  ut.path_ndir_split(support_fpath, n=5))
+        nnindexer.flann = flann
+        nnindexer.flann_fpath = flann_fpath
+        nnindexer.ax2_aid  = state['ax2_aid']
+        nnindexer.idx2_vec = idx2_vec
+        nnindexer.idx2_fgw = state.get('idx2_fgw', None)
+        nnindexer.idx2_ax  = state['idx2_ax']
+        nnindexer.idx2_fx  = state['idx2_fx']
+        nnindexer.aid2_ax  = ut.make_index_lookup(nnindexer.ax2_aid)
+        nnindexer.num_indexed = len(idx2_vec)
+        nnindexer._init_max_distance()
+        return True
+
     def get_prefix(nnindexer):
         return nnindexer.prefix1
 
@@ -570,6 +819,23 @@ class NeighborIndex(object):
             >>> result = ('flann_cfgstr = %s' % (str(flann_cfgstr),))
             >>> print(result)
             flann_cfgstr = _FLANN((algo=kdtree,seed=42,t=8,))_VECS((11260,128)gj5nea@ni0%f3aja)
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> # Only backends other than FLANN are part of the cfgstr
+            >>> from ibeis.algo.hots.neighbor_index import *  # NOQA
+            >>> flann_params = {'algorithm': 'kdtree', 'knn_backend': 'auto',
+            >>>                 'brute_max_vecs': 100}
+            >>> nnindexer = NeighborIndex(flann_params, None)
+            >>> nnindexer.idx2_vec = np.zeros((100, 128), dtype=np.uint8)
+            >>> nnindexer.num_indexed = 100
+            >>> cfgstr1 = nnindexer.get_cfgstr(noquery=True)
+            >>> nnindexer.num_indexed = 101
+            >>> cfgstr2 = nnindexer.get_cfgstr(noquery=True)
+            >>> nnindexer.knn_backend = 'flann'
+            >>> cfgstr3 = nnindexer.get_cfgstr(noquery=True)
+            >>> assert '_KNN(brute)' in cfgstr1
+            >>> assert '_KNN' not in cfgstr2 and cfgstr2 == cfgstr3
         """
         flann_cfgstr_list = []
         use_params_hash = True
@@ -590,6 +856,17 @@ class NeighborIndex(object):
             #flann_valsig_ = str(list(flann_params.values()))
             #flann_valsig = ut.remove_chars(flann_valsig_, ', \'[]')
             flann_cfgstr_list.append('_FLANN(' + flann_valsig_ + ')')
+            knn_backend = nnindexer.get_knn_backend()
+            if knn_backend == 'brute':
+                flann_cfgstr_list.append('_KNN(brute)')
+            elif knn_backend == 'pq':
+                pq_keys = ['pq_subvectors', 'pq_nlist']
+                if not noquery:
+                    pq_keys += ['pq_nprobe', 'pq_rerank']
+                pq_params = ut.dict_subset(nnindexer.flann_params, pq_keys,
+                                           default=None)
+                flann_cfgstr_list.append('_PQ(' + ','.join(
+                    '%s' % (pq_params[key],) for key in pq_keys) + ')')
         if use_data_hash:
             vecs_hashstr = ut.hashstr_arr(nnindexer.idx2_vec, '_VECS')
             flann_cfgstr_list.append(vecs_hashstr)
@@ -745,6 +1022,28 @@ class NeighborIndex(object):
             >>> #indexer.get_nn_axs(qfx2_idx)
             >>> assert np.all(np.diff(qfx2_dist, axis=1) >= 0)
 
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.neighbor_index import *  # NOQA
+            >>> # Brute force and compressed indexes filter in one pass
+            >>> rng = np.random.RandomState(0)
+            >>> vecs_list = [rng.randint(0, 256, (300, 128)).astype(np.uint8)
+            >>>              for _ in range(4)]
+            >>> fxs_list = [np.arange(300)] * 4
+            >>> qfx2_vec = vecs_list[1][0:20]
+            >>> indexer = NeighborIndex({'knn_backend': 'brute'}, None)
+            >>> indexer.init_support([1, 2, 3, 4], vecs_list, None, fxs_list, verbose=False)
+            >>> indexer.reindex(verbose=False)
+            >>> qfx2_idx, qfx2_dist = indexer.requery_knn(qfx2_vec, 3, 0, [2, 3])
+            >>> assert qfx2_idx.shape == (20, 3)
+            >>> assert set(indexer.get_nn_aids(qfx2_idx).ravel()) <= {1, 4}
+            >>> # same as searching the allowed annotations only
+            >>> subindexer = NeighborIndex({'knn_backend': 'brute'}, None)
+            >>> subindexer.init_support([1, 4], vecs_list[0::3], None, fxs_list[0:2], verbose=False)
+            >>> subindexer.reindex(verbose=False)
+            >>> sub_idx, sub_dist = subindexer.knn(qfx2_vec, 3)
+            >>> assert np.all(qfx2_dist == sub_dist)
+            >>> assert np.all(indexer.get_nn_aids(qfx2_idx) == subindexer.get_nn_aids(sub_idx))
         """
         from ibeis.algo.hots import requery_knn
         if K == 0:
@@ -757,6 +1056,16 @@ class NeighborIndex(object):
         else:
             # hack to try and make things a little bit faster
             invalid_axs = np.array(ut.take(indexer.aid2_ax, impossible_aids))
+            exclude_ranges = indexer.get_idx_ranges(invalid_axs)
+            num_excluded = (exclude_ranges[:, 1] - exclude_ranges[:, 0]).sum()
+            num_valid = indexer.num_indexed - num_excluded
+            if num_valid >= K:
+                if indexer.get_knn_backend() in ['brute', 'pq']:
+                    # These backends skip the excluded vectors while searching
+                    return indexer.filtered_knn(qfx2_vec, K, exclude_ranges)
+                else:
+                    return indexer.overfetch_knn(qfx2_vec, K, exclude_ranges)
+            # Fewer than K valid vectors. Requery and recover the best we can.
             # pad += (len(invalid_axs) * 2)
             def get_neighbors(vecs, temp_K):
                 return indexer.flann.nn_index(vecs, temp_K,
@@ -777,6 +1086,116 @@ class NeighborIndex(object):
                 qfx2_dist = qfx2_raw_dist
         return qfx2_idx, qfx2_dist
 
+    def get_idx_ranges(indexer, axs):
+        """
+        Returns:
+            ndarray: (R x 2) [start, stop) ranges of the indexed vectors of
+                the annotations axs
+        """
+        idx2_ax = indexer.idx2_ax
+        axs = np.unique(axs)
+        if np.all(idx2_ax[1:] >= idx2_ax[:-1]):
+            # The vectors of each annotation are stacked together
+            starts = np.searchsorted(idx2_ax, axs, side='left')
+            stops = np.searchsorted(idx2_ax, axs, side='right')
+        else:
+            flags = np.hstack([[False], np.isin(idx2_ax, axs), [False]])
+            changes = np.flatnonzero(flags[1:] != flags[:-1])
+            starts, stops = changes[0::2], changes[1::2]
+        ranges = np.vstack([starts, stops]).T.astype(np.int64)
+        return ranges[ranges[:, 1] > ranges[:, 0]].reshape(-1, 2)
+
+    @profile
+    def filtered_knn(indexer, qfx2_vec, K, exclude_ranges):
+        r"""
+        Like knn, but the indexed vectors in exclude_ranges are never
+        returned. Exactly K valid neighbors come back in one search.
+        Only the 'brute' and 'pq' backends can filter while searching.
+
+        Args:
+            exclude_ranges (ndarray): (R x 2) [start, stop) idx ranges. See
+                get_idx_ranges.
+
+        Returns:
+            tuple: (qfx2_idx, qfx2_dist)
+        """
+        if len(qfx2_vec) == 0:
+            return indexer.empty_neighbors(0, K)
+        (qfx2_idx, qfx2_raw_dist) = indexer.flann.nn_index(
+            qfx2_vec, K, checks=indexer.checks, cores=indexer.cores,
+            exclude_ranges=exclude_ranges)
+        qfx2_idx = qfx2_idx.reshape(len(qfx2_vec), K)
+        qfx2_raw_dist = qfx2_raw_dist.reshape(len(qfx2_vec), K)
+        if indexer.max_distance_sqrd is not None:
+            qfx2_dist = np.divide(qfx2_raw_dist, indexer.max_distance_sqrd)
+        else:
+            qfx2_dist = qfx2_raw_dist
+        return (qfx2_idx, qfx2_dist)
+
+    @profile
+    def overfetch_knn(indexer, qfx2_vec, K, exclude_ranges):
+        r"""
+        Like filtered_knn, but for FLANN, which cannot skip vectors while
+        searching. Searches once for K plus the number of excluded vectors,
+        so at least K valid neighbors are among the candidates, and keeps
+        the first K valid neighbors of each row.
+
+        Args:
+            exclude_ranges (ndarray): (R x 2) [start, stop) idx ranges. See
+                get_idx_ranges.
+
+        Returns:
+            tuple: (qfx2_idx, qfx2_dist)
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.neighbor_index import *  # NOQA
+            >>> # Same neighbors as a FLANN index without the excluded annots
+            >>> rng = np.random.RandomState(0)
+            >>> vecs_list = [rng.randint(0, 256, (300, 128)).astype(np.uint8)
+            >>>              for _ in range(4)]
+            >>> fxs_list = [np.arange(300)] * 4
+            >>> qfx2_vec = vecs_list[1][0:20]
+            >>> flann_params = {'algorithm': 'linear'}
+            >>> indexer = NeighborIndex(flann_params.copy(), None)
+            >>> indexer.init_support([1, 2, 3, 4], vecs_list, None, fxs_list, verbose=False)
+            >>> indexer.reindex(verbose=False)
+            >>> qfx2_idx, qfx2_dist = indexer.requery_knn(qfx2_vec, 3, 0, [2, 3])
+            >>> assert qfx2_idx.shape == (20, 3)
+            >>> subindexer = NeighborIndex(flann_params.copy(), None)
+            >>> subindexer.init_support([1, 4], vecs_list[0::3], None, fxs_list[0:2], verbose=False)
+            >>> subindexer.reindex(verbose=False)
+            >>> sub_idx, sub_dist = subindexer.knn(qfx2_vec, 3)
+            >>> assert np.allclose(qfx2_dist, sub_dist)
+            >>> assert np.all(indexer.get_nn_aids(qfx2_idx) == subindexer.get_nn_aids(sub_idx))
+            >>> assert np.all(indexer.get_nn_featxs(qfx2_idx) == subindexer.get_nn_featxs(sub_idx))
+        """
+        if len(qfx2_vec) == 0:
+            return indexer.empty_neighbors(0, K)
+        num_excluded = int((exclude_ranges[:, 1] - exclude_ranges[:, 0]).sum())
+        temp_K = min(K + num_excluded, indexer.num_indexed)
+        try:
+            (_idx, _raw_dist) = indexer.flann.nn_index(
+                qfx2_vec, temp_K, checks=indexer.checks, cores=indexer.cores)
+        except pyflann.FLANNException as ex:
+            ut.printex(ex, 'probably misread the cached flann_fpath=%r' %
+                       (indexer.flann_fpath,))
+            raise
+        _idx = _idx.reshape(len(qfx2_vec), temp_K)
+        _raw_dist = _raw_dist.reshape(len(qfx2_vec), temp_K)
+        # Mask the candidates in the excluded ranges
+        bounds = exclude_ranges.ravel()
+        invalid = (np.searchsorted(bounds, _idx, side='right') % 2) == 1
+        # Stable sort moves the valid candidates to the front in distance order
+        colxs = np.argsort(invalid, axis=1, kind='stable')[:, 0:K]
+        qfx2_idx = np.take_along_axis(_idx, colxs, axis=1)
+        qfx2_raw_dist = np.take_along_axis(_raw_dist, colxs, axis=1)
+        if indexer.max_distance_sqrd is not None:
+            qfx2_dist = np.divide(qfx2_raw_dist, indexer.max_distance_sqrd)
+        else:
+            qfx2_dist = qfx2_raw_dist
+        return (qfx2_idx, qfx2_dist)
+
     def batch_knn(indexer, vecs, K, chunksize=4096, label='batch knn'):
         """
         Works like `indexer.knn` but the input is split into batches and
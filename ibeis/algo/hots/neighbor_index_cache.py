@@ -1,7 +1,7 @@
 """
 NEEDS CLEANUP
 """
-from os.path import join
+from os.path import getsize, join
 import utool as ut
 from ibeis.algo.hots import _pipeline_helpers as plh  # NOQA
 from ibeis.algo.hots.neighbor_index import NeighborIndex, get_support_data
@@ -396,14 +396,19 @@ def request_memcached_ibeis_nnindexer(qreq_, daid_list, use_memcache=True,
     #if memtrack is not None:
     #    memtrack.report('IN REQUEST MEMCACHE')
     nnindex_cfgstr = build_nnindex_cfgstr(qreq_, daid_list)
+    metrics = getattr(qreq_, 'metrics', None)
     # neighbor memory cache
     if not force_rebuild and use_memcache and NEIGHBOR_CACHE.has_key(nnindex_cfgstr):  # NOQA (has_key is for a lru cache)
+        if metrics is not None:
+            metrics.record_cache('indexer_memcache', hits=1)
         if veryverbose or ut.VERYVERBOSE or ut.VERBOSE:
             print('... nnindex memcache hit: cfgstr=%s' % (nnindex_cfgstr,))
         nnindexer = NEIGHBOR_CACHE[nnindex_cfgstr]
     else:
         if veryverbose or ut.VERYVERBOSE or ut.VERBOSE:
             print('... nnindex memcache miss: cfgstr=%s' % (nnindex_cfgstr,))
+        if metrics is not None:
+            metrics.record_cache('indexer_memcache', misses=1)
         # Write to inverse uuid
         nnindexer = request_diskcached_ibeis_nnindexer(
             qreq_, daid_list, nnindex_cfgstr, verbose,
@@ -455,6 +460,38 @@ def request_diskcached_ibeis_nnindexer(qreq_, daid_list, nnindex_cfgstr=None,
         >>> # verify results
         >>> result = str(nnindexer)
         >>> print(result)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # A cached compressed index does not read the descriptors again
+        >>> from ibeis.algo.hots.neighbor_index_cache import *  # NOQA
+        >>> from ibeis.algo.hots.tests import bench
+        >>> from ibeis.algo.preproc import preproc_feat_store
+        >>> import numpy as np
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'pq_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = bench.make_synthetic_database(dbdir, 9, num_feats=30,
+        >>>                                     verbose=False)
+        >>> aids = ibs.get_valid_aids()
+        >>> cfgdict = {'knn_backend': 'pq', 'pq_nlist': 4, 'pq_subvectors': 8}
+        >>> qreq_ = bench.new_bench_query_request(ibs, aids[0:3], aids, cfgdict)
+        >>> qfx2_vec = ibs.get_annot_vecs(aids[0], config2_=qreq_.extern_query_config2)
+        >>> metrics = qreq_.enable_metrics()
+        >>> nnindexer1 = request_diskcached_ibeis_nnindexer(qreq_, qreq_.daids)
+        >>> qfx2_idx1 = nnindexer1.knn(qfx2_vec, 4)[0]
+        >>> write_info = metrics.drain()['caches']['indexer_disk']
+        >>> assert write_info['misses'] == 1 and write_info['bytes_written'] > 0
+        >>> preproc_feat_store.remove_feat_store(ibs)
+        >>> nnindexer2 = request_diskcached_ibeis_nnindexer(qreq_, qreq_.daids)
+        >>> read_info = metrics.drain()['caches']['indexer_disk']
+        >>> assert read_info['hits'] == 1 and read_info['misses'] == 0
+        >>> assert read_info['bytes_read'] == write_info['bytes_written']
+        >>> assert isinstance(nnindexer2.idx2_vec, np.memmap)
+        >>> assert np.all(nnindexer2.knn(qfx2_vec, 4)[0] == qfx2_idx1)
+        >>> assert np.all(nnindexer2.idx2_ax == nnindexer1.idx2_ax)
+        >>> store = preproc_feat_store.get_feat_store(ibs)
+        >>> assert len(store.lookup('vecs', preproc_feat_store.get_feat_store_keys(
+        >>>     ibs, aids, 'vecs', qreq_.get_internal_data_config2()))) == 0
     """
     if nnindex_cfgstr is None:
         nnindex_cfgstr = build_nnindex_cfgstr(qreq_, daid_list)
@@ -464,22 +501,44 @@ def request_diskcached_ibeis_nnindexer(qreq_, daid_list, nnindex_cfgstr=None,
     flann_params['checks'] = qreq_.qparams.checks
     #if memtrack is not None:
     #    memtrack.report('[PRE SUPPORT]')
-    # Get annot descriptors to index
-    if prog_hook is not None:
-        prog_hook.set_progress(1, 3, 'Loading support data for indexer')
-    print('[nnindex] Loading support data for indexer')
-    vecs_list, fgws_list, fxs_list = get_support_data(qreq_, daid_list)
-    if memtrack is not None:
-        memtrack.report('[AFTER GET SUPPORT DATA]')
-    try:
-        nnindexer = new_neighbor_index(
-            daid_list, vecs_list, fgws_list, fxs_list, flann_params, cachedir,
-            cfgstr=cfgstr, verbose=verbose, force_rebuild=force_rebuild,
-            memtrack=memtrack, prog_hook=prog_hook)
-    except Exception as ex:
-        ut.printex(ex, True, msg_='cannot build inverted index',
-                        key_list=['ibs.get_infostr()'])
-        raise
+    metrics = getattr(qreq_, 'metrics', None)
+    nnindexer = None
+    if flann_params.get('knn_backend') == 'pq' and not force_rebuild:
+        # A cached compressed index memory maps its saved vectors, so the
+        # descriptors do not need to be read from the depcache
+        nnindexer = NeighborIndex(flann_params, cfgstr)
+        load_success = nnindexer.load_support(cachedir, daid_list,
+                                              verbose=verbose)
+        has_fgw = nnindexer.idx2_fgw is not None
+        if not load_success or has_fgw != bool(qreq_.qparams.fg_on):
+            nnindexer = None
+        elif metrics is not None:
+            # A miss is recorded by ensure_indexer below
+            support_fpath = nnindexer.get_support_fpath(cachedir)
+            metrics.record_cache(
+                'indexer_disk', hits=1,
+                bytes_read=nnindexer.get_index_nbytes() + getsize(support_fpath))
+    if nnindexer is None:
+        # Get annot descriptors to index
+        if prog_hook is not None:
+            prog_hook.set_progress(1, 3, 'Loading support data for indexer')
+        print('[nnindex] Loading support data for indexer')
+        vecs_list, fgws_list, fxs_list = get_support_data(qreq_, daid_list)
+        if memtrack is not None:
+            memtrack.report('[AFTER GET SUPPORT DATA]')
+        try:
+            nnindexer = new_neighbor_index(
+                daid_list, vecs_list, fgws_list, fxs_list, flann_params, cachedir,
+                cfgstr=cfgstr, verbose=verbose, force_rebuild=force_rebuild,
+                memtrack=memtrack, prog_hook=prog_hook, metrics=metrics)
+        except Exception as ex:
+            ut.printex(ex, True, msg_='cannot build inverted index',
+                            key_list=['ibs.get_infostr()'])
+            raise
+        if nnindexer.save_support(cachedir, verbose=verbose) and metrics is not None:
+            support_fpath = nnindexer.get_support_fpath(cachedir)
+            metrics.record_cache('indexer_disk',
+                                 bytes_written=getsize(support_fpath))
     # Record these uuids in the disk based uuid map so they can be augmented if
     # needed
     min_reindex_thresh = qreq_.qparams.min_reindex_thresh
@@ -556,7 +615,7 @@ def get_data_cfgstr(ibs, daid_list):
 
 def new_neighbor_index(daid_list, vecs_list, fgws_list, fxs_list, flann_params, cachedir,
                        cfgstr, force_rebuild=False, verbose=True,
-                       memtrack=None, prog_hook=None):
+                       memtrack=None, prog_hook=None, metrics=None):
     r"""
     constructs neighbor index independent of ibeis
 
@@ -568,6 +627,7 @@ def new_neighbor_index(daid_list, vecs_list, fgws_list, fxs_list, flann_params,
         flann_cachedir (None):
         nnindex_cfgstr (str):
         use_memcache (bool):
+        metrics (QueryMetrics): records the index file loads and saves
 
     Returns:
         nnindexer
@@ -603,7 +663,7 @@ def new_neighbor_index(daid_list, vecs_list, fgws_list, fxs_list, flann_params,
     # Load or build the indexing structure
     nnindexer.ensure_indexer(cachedir, verbose=verbose,
                              force_rebuild=force_rebuild, memtrack=memtrack,
-                             prog_hook=prog_hook)
+                             prog_hook=prog_hook, metrics=metrics)
     if memtrack is not None:
         memtrack.report('AFTER LOAD OR BUILD')
     return nnindexer
@@ -43,6 +43,9 @@ TODO:
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 from six.moves import zip, range, map
+import contextlib
+import threading
+import time
 import numpy as np
 import vtool_ibeis as vt
 from ibeis.algo.hots import hstypes
@@ -122,8 +125,108 @@ class Neighbors(ut.NiceRepr):
         return self.__dict__.update(**state)
 
 
+class QueryCancelled(Exception):
+    """ Raised when a query is stopped through its CancelToken """
+
+
+class CancelToken(object):
+    """
+    Cooperative cancellation of a running query.
+
+    The token can be cancelled from any thread. The pipeline checks it
+    before each stage and each chunk, so the stage that is running when the
+    token is cancelled finishes first.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.pipeline import *  # NOQA
+        >>> token = CancelToken()
+        >>> token.check()
+        >>> token.cancel()
+        >>> assert token.cancelled
+        >>> import pytest
+        >>> with pytest.raises(QueryCancelled):
+        >>>     token.check()
+    """
+
+    def __init__(token):
+        token._event = threading.Event()
+
+    def cancel(token):
+        token._event.set()
+
+    @property
+    def cancelled(token):
+        return token._event.is_set()
+
+    def check(token):
+        if token._event.is_set():
+            raise QueryCancelled('query was cancelled')
+
+
+@contextlib.contextmanager
+def pipeline_stage(stage, qreq_, cancel_token=None, stage_hook=None):
+    """
+    Wraps one stage of the pipeline. Checks the cancel token before the stage
+    and reports the stage to stage_hook.
+
+    stage_hook is called with an event dict when the stage starts and when it
+    finishes. A stage that raises (e.g. QueryCancelled) reports 'failed'
+    instead of 'done'::
+
+        {'event': 'start', 'stage': stage, 'num_queries': n}
+        {'event': 'done', 'stage': stage, 'num_queries': n, 'seconds': t}
+
+    If qreq_.metrics is set the wall and CPU time of the stage are recorded
+    there (see query_metrics), also when the stage raises.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.pipeline import *  # NOQA
+        >>> from ibeis.algo.hots import query_metrics
+        >>> qreq_ = ut.DynStruct()
+        >>> qreq_.qaids = [1, 2]
+        >>> qreq_.metrics = query_metrics.QueryMetrics()
+        >>> event_list = []
+        >>> token = CancelToken()
+        >>> import pytest
+        >>> with pytest.raises(QueryCancelled):
+        >>>     with pipeline_stage('nearest_neighbors', qreq_, token, event_list.append):
+        >>>         token.cancel()
+        >>>         token.check()
+        >>> assert [event['event'] for event in event_list] == ['start', 'failed']
+        >>> assert 'nearest_neighbors' in qreq_.metrics.asdict()['stages']
+    """
+    if cancel_token is not None:
+        cancel_token.check()
+    metrics = getattr(qreq_, 'metrics', None)
+    if stage_hook is None and metrics is None:
+        yield
+        return
+    num_queries = len(qreq_.qaids)
+    if stage_hook is not None:
+        stage_hook({'event': 'start', 'stage': stage,
+                    'num_queries': num_queries})
+    start = time.time()
+    cpu_start = time.process_time()
+    event = 'failed'
+    try:
+        yield
+        event = 'done'
+    finally:
+        seconds = time.time() - start
+        if metrics is not None:
+            metrics.record_stage(stage, seconds,
+                                 time.process_time() - cpu_start)
+        if stage_hook is not None:
+            stage_hook({'event': event, 'stage': stage,
+                        'num_queries': num_queries,
+                        'seconds': seconds})
+
+
 #@profile
-def request_ibeis_query_L0(ibs, qreq_, verbose=VERB_PIPELINE):
+def request_ibeis_query_L0(ibs, qreq_, verbose=VERB_PIPELINE,
+                           cancel_token=None, stage_hook=None):
     r""" Driver logic of query pipeline
 
     Note:
@@ -135,6 +238,9 @@ def request_ibeis_query_L0(ibs, qreq_, verbose=VERB_PIPELINE):
             technically this object already lives inside of qreq_.
         qreq_ (ibeis.QueryRequest): hyper-parameters. use
             ``ibs.new_query_request`` to create one
+        cancel_token (CancelToken): checked before each stage
+        stage_hook (callable): called with the events of each stage (see
+            pipeline_stage)
 
     Returns:
         list: cm_list containing ``ibeis.ChipMatch`` objects
@@ -176,55 +282,82 @@ def request_ibeis_query_L0(ibs, qreq_, verbose=VERB_PIPELINE):
     ibs.assert_valid_aids(qreq_.get_internal_qaids(), msg='pipeline qaids')
     ibs.assert_valid_aids(qreq_.get_internal_daids(), msg='pipeline daids')
 
+    def stage(name):
+        return pipeline_stage(name, qreq_, cancel_token, stage_hook)
+
+    metrics = getattr(qreq_, 'metrics', None)
+
     if qreq_.qparams.pipeline_root == 'smk':
         from ibeis.algo.hots.smk import smk_match
         # Alternative to naive bayes matching:
         # Selective match kernel
-        qaid2_scores, qaid2_chipmatch_FILT_ = smk_match.execute_smk_L5(qreq_)
+        with stage('smk'):
+            qaid2_scores, qaid2_chipmatch_FILT_ = smk_match.execute_smk_L5(qreq_)
     elif qreq_.qparams.pipeline_root in ['vsone', 'vsmany']:
         assert qreq_.qparams.pipeline_root != 'vsone', 'pipeline no longer supports vsone'
         if qreq_.prog_hook is not None:
             qreq_.prog_hook.initialize_subhooks(5)
 
         #qreq_.lazy_load(verbose=(verbose and ut.NOT_QUIET))
-        qreq_.lazy_preload(verbose=(verbose and ut.NOT_QUIET))
-        impossible_daids_list, Kpad_list = build_impossible_daids_list(qreq_)
+        with stage('preload'):
+            qreq_.lazy_preload(verbose=(verbose and ut.NOT_QUIET))
+            impossible_daids_list, Kpad_list = build_impossible_daids_list(qreq_)
 
         # Nearest neighbors (nns_list)
         # a nns object is a tuple(ndarray, ndarray) - (qfx2_dx, qfx2_dist)
         # * query descriptors assigned to database descriptors
         # * FLANN used here
-        nns_list = nearest_neighbors(qreq_, Kpad_list, impossible_daids_list,
-                                     verbose=verbose)
+        with stage('nearest_neighbors'):
+            nns_list = nearest_neighbors(qreq_, Kpad_list, impossible_daids_list,
+                                         verbose=verbose)
+        if metrics is not None:
+            metrics.add_items(
+                queries=len(nns_list),
+                query_features=sum(nns.num_query_feats for nns in nns_list),
+                neighbors=sum(nns.neighb_idxs.size for nns in nns_list))
 
         # Remove Impossible Votes
         # a nnfilt object is an ndarray qfx2_valid
         # * marks matches to the same image as invalid
-        nnvalid0_list = baseline_neighbor_filter(qreq_, nns_list,
-                                                 impossible_daids_list,
-                                                 verbose=verbose)
+        with stage('baseline_neighbor_filter'):
+            nnvalid0_list = baseline_neighbor_filter(qreq_, nns_list,
+                                                     impossible_daids_list,
+                                                     verbose=verbose)
+        if metrics is not None:
+            metrics.add_items(valid_neighbors=sum(
+                nnvalid0.sum() for nnvalid0 in nnvalid0_list))
 
         # Nearest neighbors weighting / scoring (filtweights_list)
         # filtweights_list maps qaid to filtweights which is a dict
         # that maps a filter name to that query's weights for that filter
-        weight_ret = weight_neighbors(qreq_, nns_list, nnvalid0_list,
-                                      verbose=verbose)
+        with stage('weight_neighbors'):
+            weight_ret = weight_neighbors(qreq_, nns_list, nnvalid0_list,
+                                          verbose=verbose)
         filtkey_list, filtweights_list, filtvalids_list, filtnormks_list = weight_ret
 
         # Nearest neighbors to chip matches (cm_list)
         # * Initial scoring occurs
         # * vsone un-swapping occurs here
-        cm_list_FILT = build_chipmatches(qreq_, nns_list, nnvalid0_list,
-                                         filtkey_list, filtweights_list, filtvalids_list,
-                                         filtnormks_list, verbose=verbose)
+        with stage('build_chipmatches'):
+            cm_list_FILT = build_chipmatches(qreq_, nns_list, nnvalid0_list,
+                                             filtkey_list, filtweights_list, filtvalids_list,
+                                             filtnormks_list, verbose=verbose)
+        if metrics is not None:
+            metrics.add_items(chipmatch_annots=sum(
+                len(cm.daid_list) for cm in cm_list_FILT))
     else:
         print('invalid pipeline root %r' % (qreq_.qparams.pipeline_root))
 
     # Spatial verification (cm_list) (TODO: cython)
     # * prunes chip results and feature matches
     # TODO: allow for reweighting of feature matches to happen.
-    cm_list_SVER = spatial_verification(qreq_, cm_list_FILT,
-                                        verbose=verbose)
+    with stage('spatial_verification'):
+        cm_list_SVER = spatial_verification(qreq_, cm_list_FILT,
+                                            verbose=verbose)
+    if metrics is not None and cm_list_SVER is not cm_list_FILT:
+        # The annotations kept by spatial verification
+        metrics.add_items(sver_annots=sum(
+            len(cm.daid_list) for cm in cm_list_SVER))
     if cm_list_FILT[0].filtnorm_aids is not None:
         pass
         # assert cm_list_SVER[0].filtnorm_aids is not None
@@ -232,7 +365,8 @@ def request_ibeis_query_L0(ibs, qreq_, verbose=VERB_PIPELINE):
     cm_list = cm_list_SVER
     # Final Scoring
     score_method = qreq_.qparams.score_method
-    scoring.score_chipmatch_list(qreq_, cm_list, score_method)
+    with stage('scoring'):
+        scoring.score_chipmatch_list(qreq_, cm_list, score_method)
 
     if VERB_PIPELINE:
         print('[hs] L___ FINISHED HOTSPOTTER PIPELINE ___')
@@ -1247,11 +1381,14 @@ def _spatial_verification(qreq_, cm_list, verbose=VERB_PIPELINE):
     nNameShortList  = qreq_.qparams.nNameShortlistSVER
     nAnnotPerName   = qreq_.qparams.nAnnotPerNameSVER
 
-    scoring.score_chipmatch_list(qreq_, cm_list, prescore_method)
-    cm_shortlist = scoring.make_chipmatch_shortlists(qreq_, cm_list,
-                                                     nNameShortList,
-                                                     nAnnotPerName,
-                                                     score_method)
+    cm_shortlist = scoring.make_batched_chipmatch_shortlists(
+        qreq_, cm_list, nNameShortList, nAnnotPerName, prescore_method,
+        score_method)
+    metrics = getattr(qreq_, 'metrics', None)
+    if metrics is not None:
+        # Shortlist sizes: the annotations given to spatial verification
+        metrics.add_items(shortlist_annots=sum(
+            len(cm.daid_list) for cm in cm_shortlist))
     prog_hook = None if qreq_.prog_hook is None else qreq_.prog_hook.next_subhook()
     cm_progiter = ut.ProgressIter(cm_shortlist, length=len(cm_shortlist),
                                   prog_hook=prog_hook, lbl=SVER_LVL, **PROGKW)
@@ -0,0 +1,536 @@
+# -*- coding: utf-8 -*-
+"""
+Compressed nearest neighbor index: inverted file + product quantization.
+
+A NeighborIndex over raw uint8 SIFT holds 128 bytes per descriptor in
+idx2_vec plus the FLANN forest. IVFPQIndex instead keeps, per descriptor, an
+int32 id and `num_subvectors` one byte codes (20 bytes with the default 16
+subvectors):
+
+* a coarse k-means quantizer splits the descriptors into `nlist` inverted
+  lists,
+* the residual of each descriptor to its coarse centroid is cut into
+  `num_subvectors` subvectors, and each subvector is replaced by the index of
+  its nearest centroid out of 256 (one codebook per subvector).
+
+A query probes its `nprobe` nearest lists and scores their descriptors with
+asymmetric distances: the distances of the query residual to all 256
+centroids of each codebook are tabulated once per list and summed over the
+codes. With `rerank` > 0, the best K * rerank candidates are re-scored with
+exact distances to the full vectors, which are read from a memory-mapped file
+next to the saved index.
+
+IVFPQIndex implements the subset of the pyflann.FLANN interface that
+NeighborIndex uses, so it can stand in as `NeighborIndex.flann`.
+
+CommandLine:
+    python -m ibeis.algo.hots.pq_knn benchmark_compressed_index
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import utool as ut
+from ibeis.algo.hots import brute_knn
+(print, rrr, profile) = ut.inject2(__name__, '[pq_knn]')
+
+
+# Centroids per product quantizer codebook (codes are uint8)
+NUM_CODES = 256
+
+
+def train_kmeans(data, num_clusters, num_iters=10, rng=None):
+    """
+    Lloyd's k-means. Assignments are exact (BruteForceKNN). Empty clusters
+    are reseeded with random points.
+
+    Args:
+        data (ndarray): (N x D) float32 training vectors
+        num_clusters (int): at most N
+
+    Returns:
+        ndarray: (num_clusters x D) float32 centroids
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.pq_knn import *  # NOQA
+        >>> rng = np.random.RandomState(0)
+        >>> data = np.vstack([rng.randn(50, 2) + [10, 0], rng.randn(50, 2) - [10, 0]])
+        >>> centroids = train_kmeans(data.astype(np.float32), 2, rng=rng)
+        >>> print(np.round(np.sort(centroids[:, 0])).astype(int))
+        [-10  10]
+    """
+    if rng is None:
+        rng = np.random.RandomState(42)
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    num_clusters = min(num_clusters, len(data))
+    centroids = data[rng.choice(len(data), num_clusters, replace=False)].copy()
+    for _ in range(num_iters):
+        assigner = brute_knn.BruteForceKNN()
+        assigner.build_index(centroids)
+        labels = assigner.nn_index(data, 1)[0]
+        counts = np.bincount(labels, minlength=num_clusters)
+        nonempty = counts > 0
+        sortx = np.argsort(labels, kind='stable')
+        starts = np.hstack([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(data[sortx], starts, axis=0, dtype=np.float64)
+        centroids[nonempty] = sums / counts[nonempty][:, None]
+        num_empty = len(nonempty) - nonempty.sum()
+        if num_empty > 0:
+            centroids[~nonempty] = data[rng.choice(len(data), num_empty)]
+    return centroids
+
+
+def nearest_centroids(vecs, centroids):
+    """ Returns the index of the nearest centroid of each vector as int32 """
+    assigner = brute_knn.BruteForceKNN()
+    assigner.build_index(centroids)
+    return assigner.nn_index(vecs, 1)[0]
+
+
+class IVFPQIndex(object):
+    """
+    Inverted file product quantization index with the pyflann.FLANN
+    interface used by NeighborIndex.
+
+    Args:
+        num_subvectors (int): code bytes per descriptor. Must divide the
+            descriptor dimension.
+        nlist (int): number of coarse lists. Defaults to 4 * sqrt(N).
+        nprobe (int): number of lists scored per query vector
+        rerank (int): re-score the best K * rerank candidates with exact
+            distances. 0 returns the asymmetric distances.
+        train_size (int): number of vectors the quantizers are trained on
+        random_seed (int): seed of the training sample and k-means
+
+    CommandLine:
+        python -m ibeis.algo.hots.pq_knn IVFPQIndex
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.pq_knn import *  # NOQA
+        >>> from ibeis.algo.hots.brute_knn import BruteForceKNN
+        >>> rng = np.random.RandomState(0)
+        >>> centers = rng.randint(0, 200, (20, 128))
+        >>> data = np.clip(centers[rng.randint(0, 20, 3000)] +
+        >>>                rng.randint(-20, 21, (3000, 128)), 0, 255).astype(np.uint8)
+        >>> qvecs = data[0:50] + rng.randint(0, 3, (50, 128)).astype(np.uint8)
+        >>> pqindex = IVFPQIndex(num_subvectors=16, nprobe=16, rerank=8)
+        >>> pqindex.build_index(data)
+        >>> assert pqindex.bytes_per_vector() == 20
+        >>> idxs, dists = pqindex.nn_index(qvecs, 4)
+        >>> assert idxs.dtype == np.int32 and dists.dtype == np.float32
+        >>> exact = BruteForceKNN()
+        >>> exact.build_index(data)
+        >>> true_idxs, true_dists = exact.nn_index(qvecs, 4)
+        >>> assert np.all(idxs[:, 0] == np.arange(50))
+        >>> # re-ranked distances are exact
+        >>> flags = idxs == true_idxs
+        >>> assert flags.mean() > .9
+        >>> assert np.all(dists[flags] == true_dists[flags])
+        >>> # removed points are never returned
+        >>> pqindex.remove_points(np.arange(50))
+        >>> idxs2 = pqindex.nn_index(qvecs, 1)[0]
+        >>> assert idxs2.shape == (50,) and idxs2.min() >= 50
+        >>> idxs3 = pqindex.nn_index(qvecs, 4, exclude_ranges=[(50, 1000)])[0]
+        >>> assert idxs3.min() >= 1000
+    """
+
+    def __init__(pqindex, num_subvectors=16, nlist=None, nprobe=16, rerank=4,
+                 train_size=65536, random_seed=42):
+        pqindex.num_subvectors = num_subvectors
+        pqindex.nlist = nlist
+        pqindex.nprobe = nprobe
+        pqindex.rerank = rerank
+        pqindex.train_size = train_size
+        pqindex.random_seed = random_seed
+        pqindex._vecs = None          # (N x D) full vectors (in memory or mmap)
+        pqindex._centroids = None     # (nlist x D) coarse centroids
+        pqindex._codebooks = None     # (M x 256 x D / M) subvector centroids
+        pqindex._codebook_sqrd_norms = None
+        pqindex._list_offsets = None  # (nlist + 1) start of each list
+        pqindex._list_ids = None      # (N) indexed ids sorted by list
+        pqindex._list_codes = None    # (N x M) codes sorted by list
+        pqindex._removed = None       # (N) flags of removed ids
+
+    # ---- construction ----
+
+    def build_index(pqindex, pts, **kwargs):
+        """
+        Trains the quantizers on a sample of pts and encodes pts. Extra
+        keyword arguments (FLANN params) are ignored.
+        """
+        pts = np.asarray(pts)
+        num_pts, dim = pts.shape
+        if dim % pqindex.num_subvectors != 0:
+            raise ValueError('num_subvectors=%d must divide dim=%d' % (
+                pqindex.num_subvectors, dim))
+        rng = np.random.RandomState(pqindex.random_seed)
+        nlist = pqindex.nlist
+        if nlist is None or nlist <= 0:
+            nlist = int(4 * np.sqrt(num_pts))
+        nlist = max(1, min(nlist, num_pts))
+        train_size = min(num_pts, max(pqindex.train_size, 32 * nlist))
+        sample = pts[np.sort(rng.choice(num_pts, train_size, replace=False))]
+        sample = sample.astype(np.float32)
+
+        centroids = train_kmeans(sample, nlist, rng=rng)
+        resid = sample - centroids[nearest_centroids(sample, centroids)]
+        sub_dim = dim // pqindex.num_subvectors
+        codebooks = np.empty((pqindex.num_subvectors, NUM_CODES, sub_dim),
+                             dtype=np.float32)
+        for mx in range(pqindex.num_subvectors):
+            sub = np.ascontiguousarray(resid[:, mx * sub_dim:(mx + 1) * sub_dim])
+            sub_centroids = train_kmeans(sub, NUM_CODES, rng=rng)
+            codebooks[mx, 0:len(sub_centroids)] = sub_centroids
+            # Fewer training vectors than codes: pad with duplicates, which
+            # are never nearer than the first copy
+            codebooks[mx, len(sub_centroids):] = sub_centroids[0]
+        pqindex._vecs = pts
+        pqindex._centroids = centroids
+        pqindex._codebooks = codebooks
+        pqindex._codebook_sqrd_norms = np.einsum('mkd,mkd->mk', codebooks, codebooks)
+        pqindex._removed = np.zeros(0, dtype=bool)
+        pqindex._list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        pqindex._list_ids = np.zeros(0, dtype=np.int32)
+        pqindex._list_codes = np.zeros((0, pqindex.num_subvectors), dtype=np.uint8)
+        pqindex._add_codes(pts, 0)
+        return {}
+
+    def encode(pqindex, pts, chunksize=65536):
+        """
+        Returns:
+            tuple: (list_idxs, codes) - the coarse list and PQ codes of pts
+        """
+        num_pts = len(pts)
+        M = pqindex.num_subvectors
+        sub_dim = pqindex._codebooks.shape[2]
+        list_idxs = np.empty(num_pts, dtype=np.int32)
+        codes = np.empty((num_pts, M), dtype=np.uint8)
+        for sl_ in ut.ichunk_slices(num_pts, chunksize):
+            vecs = np.asarray(pts[sl_], dtype=np.float32)
+            list_idxs[sl_] = nearest_centroids(vecs, pqindex._centroids)
+            resid = vecs - pqindex._centroids[list_idxs[sl_]]
+            for mx in range(M):
+                sub = resid[:, mx * sub_dim:(mx + 1) * sub_dim]
+                codes[sl_, mx] = nearest_centroids(sub, pqindex._codebooks[mx])
+        return list_idxs, codes
+
+    def _add_codes(pqindex, pts, start_id):
+        """ Encodes pts as ids start_id, ... and rebuilds the list arrays """
+        list_idxs, codes = pqindex.encode(pts)
+        nlist = len(pqindex._centroids)
+        old_offsets = pqindex._list_offsets
+        old_list_idxs = np.repeat(np.arange(nlist, dtype=np.int32),
+                                  np.diff(old_offsets))
+        all_list_idxs = np.hstack([old_list_idxs, list_idxs])
+        new_ids = np.arange(start_id, start_id + len(pts), dtype=np.int32)
+        all_ids = np.hstack([pqindex._list_ids, new_ids])
+        all_codes = np.vstack([pqindex._list_codes, codes])
+        sortx = np.argsort(all_list_idxs, kind='stable')
+        counts = np.bincount(all_list_idxs, minlength=nlist)
+        pqindex._list_offsets = np.hstack([[0], np.cumsum(counts)]).astype(np.int64)
+        pqindex._list_ids = all_ids[sortx]
+        pqindex._list_codes = all_codes[sortx]
+        pqindex._removed = np.hstack([pqindex._removed,
+                                      np.zeros(len(pts), dtype=bool)])
+
+    def add_points(pqindex, pts, rebuild_threshold=2.0):
+        """ Encodes pts with the trained quantizers """
+        pts = np.asarray(pts)
+        start_id = len(pqindex._removed)
+        pqindex._vecs = np.vstack([pqindex._vecs, pts])
+        pqindex._add_codes(pts, start_id)
+
+    def remove_points(pqindex, idxs):
+        """ Removed points are kept but never returned """
+        pqindex._removed[np.asarray(idxs, dtype=np.int64)] = True
+
+    def remove_point(pqindex, idx):
+        pqindex.remove_points([idx])
+
+    def get_indexed_data(pqindex):
+        return pqindex._vecs, []
+
+    def get_indexed_shape(pqindex):
+        return ((~pqindex._removed).sum(), pqindex._vecs.shape[1])
+
+    def bytes_per_vector(pqindex):
+        """ Index memory per descriptor, not counting the full vectors """
+        return pqindex._list_codes.shape[1] + pqindex._list_ids.itemsize
+
+    def nbytes(pqindex):
+        """ Index memory, not counting the full vectors """
+        return sum(arr.nbytes for arr in [
+            pqindex._centroids, pqindex._codebooks, pqindex._list_offsets,
+            pqindex._list_ids, pqindex._list_codes, pqindex._removed])
+
+    # ---- persistence ----
+
+    def get_vecs_fpath(pqindex, fpath):
+        return ut.augpath(fpath, '_vecs', newext='.npy')
+
+    def save_index(pqindex, fpath):
+        """
+        Writes the quantizers and codes to fpath and the full vectors to a
+        separate .npy file, which then replaces the vectors in memory.
+        """
+        vecs_fpath = pqindex.get_vecs_fpath(fpath)
+        np.save(vecs_fpath, np.asarray(pqindex._vecs))
+        with open(fpath, 'wb') as file_:
+            np.savez(file_, centroids=pqindex._centroids,
+                     codebooks=pqindex._codebooks,
+                     list_offsets=pqindex._list_offsets,
+                     list_ids=pqindex._list_ids,
+                     list_codes=pqindex._list_codes,
+                     removed=pqindex._removed)
+        pqindex._vecs = np.load(vecs_fpath, mmap_mode='r')
+
+    def load_index(pqindex, fpath, pts):
+        """
+        Loads an index written by save_index. The full vectors are memory
+        mapped from disk, pts is only checked against them.
+        """
+        try:
+            with open(fpath, 'rb') as file_:
+                npz = np.load(file_)
+                state = {key: npz[key] for key in npz.files}
+            vecs = np.load(pqindex.get_vecs_fpath(fpath), mmap_mode='r')
+        except (ValueError, KeyError, OSError) as ex:
+            raise IOError('cannot load IVFPQIndex from %r: %s' % (fpath, ex))
+        if pts is not None and vecs.shape != np.shape(pts):
+            raise IOError('indexed vectors do not match the cached index')
+        pqindex._vecs = vecs
+        pqindex._centroids = state['centroids']
+        pqindex._codebooks = state['codebooks']
+        pqindex._codebook_sqrd_norms = np.einsum(
+            'mkd,mkd->mk', pqindex._codebooks, pqindex._codebooks)
+        pqindex._list_offsets = state['list_offsets']
+        pqindex._list_ids = state['list_ids']
+        pqindex._list_codes = state['list_codes']
+        pqindex._removed = state['removed']
+        pqindex.num_subvectors = pqindex._codebooks.shape[0]
+
+    # ---- search ----
+
+    def _score_lists(pqindex, qvecs, probe_idxs, best_idxs, best_dists,
+                     invalid_flags):
+        """
+        Merges the asymmetric distances of the descriptors in the probed lists
+        into the best candidates of each query vector (inplace).
+
+        Args:
+            probe_idxs (ndarray): (N x P) lists probed by each query vector
+            invalid_flags (ndarray): flags of ids that are never returned
+        """
+        M, _, sub_dim = pqindex._codebooks.shape
+        num_cands = best_idxs.shape[1]
+        offsets = pqindex._list_offsets
+        flat_lists = probe_idxs.ravel()
+        flat_qxs = np.repeat(np.arange(len(probe_idxs)), probe_idxs.shape[1])
+        sortx = np.argsort(flat_lists, kind='stable')
+        flat_lists = flat_lists[sortx]
+        flat_qxs = flat_qxs[sortx]
+        bounds = np.nonzero(np.diff(flat_lists))[0] + 1
+        starts = np.hstack([[0], bounds])
+        stops = np.hstack([bounds, [len(flat_lists)]])
+        for start, stop in zip(starts, stops):
+            list_idx = flat_lists[start]
+            lx1, lx2 = offsets[list_idx], offsets[list_idx + 1]
+            if lx1 == lx2:
+                continue
+            qxs = flat_qxs[start:stop]
+            ids = pqindex._list_ids[lx1:lx2]
+            codes = pqindex._list_codes[lx1:lx2]
+            resid = qvecs[qxs] - pqindex._centroids[list_idx]
+            sub = resid.reshape(len(qxs), M, sub_dim)
+            # (Q x M x 256) distances of the query subvectors to the codes
+            lut = np.einsum('qmd,mkd->qmk', sub, pqindex._codebooks)
+            lut *= -2
+            lut += np.einsum('qmd,qmd->qm', sub, sub)[:, :, None]
+            lut += pqindex._codebook_sqrd_norms[None, :, :]
+            dists = lut[:, 0, :].take(codes[:, 0], axis=1)
+            for mx in range(1, M):
+                dists += lut[:, mx, :].take(codes[:, mx], axis=1)
+            dists[:, invalid_flags[ids]] = np.inf
+            cand_dists = np.hstack([best_dists[qxs], dists])
+            cand_idxs = np.hstack([best_idxs[qxs],
+                                   np.broadcast_to(ids, dists.shape)])
+            if cand_dists.shape[1] > num_cands:
+                partx = np.argpartition(cand_dists, num_cands - 1, axis=1)
+                partx = partx[:, 0:num_cands]
+                cand_dists = np.take_along_axis(cand_dists, partx, axis=1)
+                cand_idxs = np.take_along_axis(cand_idxs, partx, axis=1)
+            best_dists[qxs] = cand_dists
+            best_idxs[qxs] = cand_idxs
+
+    def _exact_dists(pqindex, qvecs, idxs):
+        """ Squared L2 distances of qvecs to the full vectors of idxs """
+        valid = idxs >= 0
+        flat_idxs = idxs[valid]
+        # Read each needed vector from disk once, in file order
+        unique_idxs, inverse = np.unique(flat_idxs, return_inverse=True)
+        uvecs = np.asarray(pqindex._vecs[unique_idxs], dtype=np.float32)
+        diff = uvecs[inverse] - np.repeat(qvecs, valid.sum(axis=1), axis=0)
+        dists = np.full(idxs.shape, np.inf, dtype=np.float32)
+        dists[valid] = np.einsum('ij,ij->i', diff, diff)
+        return dists
+
+    def nn_index(pqindex, qpts, num_neighbors=1, **kwargs):
+        """
+        Returns the indices and (approximate, or exact if rerank > 0) squared
+        L2 distances of the num_neighbors nearest indexed points of each query
+        point. Like FLANN, the result is 1D when num_neighbors is 1.
+
+        Query vectors whose probed lists hold fewer than num_neighbors
+        candidates probe more lists.
+
+        Args:
+            qpts (ndarray): (N x D) query vectors
+            num_neighbors (int): number of results
+            exclude_ranges (ndarray): (R x 2) [start, stop) ranges of indexed
+                points that are never returned
+
+        Returns:
+            tuple: (idxs, dists)
+        """
+        K = num_neighbors
+        qvecs = np.asarray(qpts, dtype=np.float32)
+        if qvecs.ndim == 1:
+            qvecs = qvecs.reshape(1, -1)
+        num_queries = len(qvecs)
+        nlist = len(pqindex._centroids)
+        exclude_ranges = kwargs.get('exclude_ranges', None)
+        if exclude_ranges is None:
+            invalid_flags = pqindex._removed
+        else:
+            invalid_flags = pqindex._removed.copy()
+            for start, stop in exclude_ranges:
+                invalid_flags[start:stop] = True
+        num_valid = len(invalid_flags) - invalid_flags.sum()
+        assert num_valid >= K, 'more neighbors than there are points'
+        num_cands = K * max(pqindex.rerank, 1) if pqindex.rerank else K
+        num_cands = min(num_cands, num_valid)
+        best_idxs = np.full((num_queries, num_cands), -1, dtype=np.int32)
+        best_dists = np.full((num_queries, num_cands), np.inf, dtype=np.float32)
+
+        coarse = brute_knn.BruteForceKNN()
+        coarse.build_index(pqindex._centroids)
+        nprobe = max(pqindex.nprobe, 1)
+        num_probed = 0
+        qxs = np.arange(num_queries)
+        while len(qxs) > 0 and num_probed < nlist:
+            num_probe_ = min(num_probed + nprobe, nlist)
+            probe_idxs = coarse.nn_index(qvecs[qxs], num_probe_)[0]
+            probe_idxs = probe_idxs.reshape(len(qxs), num_probe_)
+            sub_idxs = best_idxs[qxs]
+            sub_dists = best_dists[qxs]
+            pqindex._score_lists(qvecs[qxs], probe_idxs[:, num_probed:],
+                                 sub_idxs, sub_dists, invalid_flags)
+            best_idxs[qxs] = sub_idxs
+            best_dists[qxs] = sub_dists
+            num_probed = num_probe_
+            nprobe *= 2
+            # Removed points have infinite distances
+            num_found = np.isfinite(sub_dists).sum(axis=1)
+            qxs = qxs[num_found < num_cands]
+        best_idxs[~np.isfinite(best_dists)] = -1
+        if pqindex.rerank:
+            best_dists = pqindex._exact_dists(qvecs, best_idxs)
+        # Order by distance, ties by index
+        sortx = np.lexsort((best_idxs, best_dists), axis=1)[:, 0:K]
+        idxs = np.take_along_axis(best_idxs, sortx, axis=1)
+        dists = np.take_along_axis(best_dists, sortx, axis=1)
+        np.maximum(dists, 0, out=dists)
+        if K == 1:
+            return idxs.reshape(num_queries), dists.reshape(num_queries)
+        return idxs, dists
+
+
+def benchmark_compressed_index(num_vecs_list=None, num_queries=1000, K=4,
+                               checks=800, trees=8, seed=0):
+    r"""
+    Compares recall@K and index memory of FLANN and IVFPQIndex (with and
+    without re-ranking) on random SIFT-like uint8 descriptors. Recall is
+    measured against the exact neighbors of BruteForceKNN.
+
+    Memory is per indexed descriptor. FLANN keeps the 128 byte vectors plus
+    its forest; IVFPQIndex keeps codes and ids, the full vectors of the
+    re-ranking step stay on disk.
+
+    Returns:
+        list: one dict per (database size, index)
+
+    CommandLine:
+        python -m ibeis.algo.hots.pq_knn benchmark_compressed_index
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.hots.pq_knn import *  # NOQA
+        >>> result_list = benchmark_compressed_index()
+        >>> print(ut.repr4(result_list, precision=3))
+    """
+    import time
+    from vtool_ibeis._pyflann_backend import pyflann
+    if num_vecs_list is None:
+        num_vecs_list = [20000, 100000, 300000]
+    rng = np.random.RandomState(seed)
+    centers = rng.randint(0, 128, (64, 128))
+    def sift_like(num):
+        labels = rng.randint(0, len(centers), num)
+        noise = rng.randint(-24, 25, (num, 128))
+        return np.clip(centers[labels] + noise, 0, 255).astype(np.uint8)
+    qvecs = sift_like(num_queries)
+    result_list = []
+    for num_vecs in num_vecs_list:
+        data = sift_like(num_vecs)
+        exact = brute_knn.BruteForceKNN()
+        exact.build_index(data)
+        true_idxs = exact.nn_index(qvecs, K)[0]
+
+        def recall(idxs):
+            return np.mean([len(np.intersect1d(a, b)) / K
+                            for a, b in zip(idxs, true_idxs)])
+
+        start = time.time()
+        flann = pyflann.FLANN()
+        flann.build_index(data, algorithm='kdtree', trees=trees,
+                          random_seed=42)
+        build_time = time.time() - start
+        start = time.time()
+        idxs = flann.nn_index(qvecs, K, checks=checks, cores=0)[0]
+        query_time = time.time() - start
+        flann_bytes = flann.used_memory() + flann.used_memory_dataset()
+        result_list.append(ut.odict([
+            ('num_vecs', num_vecs), ('index', 'flann'),
+            ('bytes_per_vector', flann_bytes / num_vecs),
+            ('recall', recall(idxs)),
+            ('build_seconds', build_time), ('query_seconds', query_time),
+        ]))
+
+        start = time.time()
+        pqindex = IVFPQIndex(rerank=0)
+        pqindex.build_index(data)
+        build_time = time.time() - start
+        for rerank in [0, 4]:
+            pqindex.rerank = rerank
+            start = time.time()
+            idxs = pqindex.nn_index(qvecs, K)[0]
+            query_time = time.time() - start
+            result_list.append(ut.odict([
+                ('num_vecs', num_vecs), ('index', 'pq_rerank%d' % (rerank,)),
+                ('bytes_per_vector', pqindex.nbytes() / num_vecs),
+                ('recall', recall(idxs)),
+                ('build_seconds', build_time), ('query_seconds', query_time),
+            ]))
+    return result_list
+
+
+if __name__ == '__main__':
+    r"""
+    CommandLine:
+        python -m ibeis.algo.hots.pq_knn
+        python -m ibeis.algo.hots.pq_knn --allexamples
+    """
+    import multiprocessing
+    multiprocessing.freeze_support()  # for win32
+    import xdoctest
+    xdoctest.doctest_module(__file__)
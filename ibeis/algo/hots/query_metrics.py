@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+Structured instrumentation of the hotspotter pipeline.
+
+A QueryMetrics object collects the wall and CPU time of each pipeline stage,
+item counts (queries, query features, neighbors, shortlist sizes) and the
+hits, misses and bytes of the query caches. Each QueryRequest made while
+metrics are enabled gets its own collector (``qreq_.metrics``), which is
+shared with the chunks made by shallowcopy, so it aggregates the whole
+request. Every record is also added to a process wide collector. Job engine
+workers send the records of each job back with its result, and the web app
+exports its own totals plus those of the workers as JSON
+(``/api/query/metrics/``) and as Prometheus text (``/metrics/query/``).
+
+Metrics are off unless ``--query-metrics`` is given or set_enabled(True) is
+called. set_enabled only affects the calling process, so start the web
+server with ``--query-metrics`` to collect metrics in the job engine. When they are off ``qreq_.metrics`` is None and the pipeline only
+pays for one attribute lookup per stage.
+
+CommandLine:
+    python -m ibeis.algo.hots.query_metrics --allexamples
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import collections
+import json
+import threading
+import utool as ut
+(print, rrr, profile) = ut.inject2(__name__, '[query_metrics]')
+
+
+QUERY_METRICS = ut.get_argflag('--query-metrics')
+
+PROMETHEUS_PREFIX = 'ibeis_query'
+
+CACHE_FIELDS = ('hits', 'misses', 'bytes_read', 'bytes_written')
+
+
+class QueryMetrics(ut.NiceRepr):
+    """
+    Per stage timing, item counts and cache counters of one or more query
+    requests. Safe to update from several threads.
+
+    Args:
+        parent (QueryMetrics): receives a copy of every record, e.g. the
+            process wide collector
+
+    CommandLine:
+        python -m ibeis.algo.hots.query_metrics QueryMetrics
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.query_metrics import *  # NOQA
+        >>> total = QueryMetrics()
+        >>> metrics = QueryMetrics(parent=total)
+        >>> metrics.record_stage('nearest_neighbors', 2.0, 1.5)
+        >>> metrics.record_stage('nearest_neighbors', 1.0, 0.5)
+        >>> metrics.add_items(queries=2, neighbors=40)
+        >>> metrics.record_cache('chipmatch', hits=1, misses=1, bytes_read=10)
+        >>> info = metrics.asdict()
+        >>> assert info['stages']['nearest_neighbors'] == {
+        >>>     'calls': 2, 'wall_seconds': 3.0, 'cpu_seconds': 2.0}
+        >>> assert info['items'] == {'queries': 2, 'neighbors': 40}
+        >>> assert info['caches']['chipmatch']['misses'] == 1
+        >>> assert total.asdict() == info
+        >>> assert json.loads(metrics.to_json()) == info
+        >>> text = metrics.to_prometheus()
+        >>> print(text)
+        >>> assert 'ibeis_query_stage_calls_total{stage="nearest_neighbors"} 2' in text
+        >>> assert 'ibeis_query_cache_hits_total{cache="chipmatch"} 1' in text
+    """
+
+    def __init__(metrics, parent=None):
+        metrics.parent = parent
+        metrics._lock = threading.Lock()
+        metrics.stages = collections.OrderedDict()
+        metrics.items = collections.OrderedDict()
+        metrics.caches = collections.OrderedDict()
+
+    def __getstate__(metrics):
+        """
+        Drops the lock. A collector that fed the process totals feeds the
+        totals of the process that unpickles it.
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.query_metrics import *  # NOQA
+            >>> import pickle
+            >>> metrics = new_query_metrics(enabled=True)
+            >>> metrics.add_items(queries=1)
+            >>> metrics2 = pickle.loads(pickle.dumps(metrics))
+            >>> assert metrics2.parent is get_process_metrics()
+            >>> metrics2.add_items(queries=2)
+            >>> assert metrics2.asdict()['items'] == {'queries': 3}
+        """
+        state = metrics.__dict__.copy()
+        del state['_lock']
+        state['_to_process'] = metrics.parent is PROCESS_METRICS
+        if state['_to_process']:
+            state['parent'] = None
+        return state
+
+    def __setstate__(metrics, state):
+        to_process = state.pop('_to_process', False)
+        metrics.__dict__.update(state)
+        metrics._lock = threading.Lock()
+        if to_process:
+            metrics.parent = PROCESS_METRICS
+
+    def __nice__(metrics):
+        return '(nStages=%d, nItems=%d, nCaches=%d)' % (
+            len(metrics.stages), len(metrics.items), len(metrics.caches))
+
+    def record_stage(metrics, stage, wall_seconds, cpu_seconds, calls=1):
+        """
+        Adds one call (or calls) of a pipeline stage. cpu_seconds is the CPU
+        time of the whole process while the stage ran.
+        """
+        with metrics._lock:
+            if stage not in metrics.stages:
+                metrics.stages[stage] = [0, 0.0, 0.0]
+            totals = metrics.stages[stage]
+            totals[0] += int(calls)
+            totals[1] += wall_seconds
+            totals[2] += cpu_seconds
+        if metrics.parent is not None:
+            metrics.parent.record_stage(stage, wall_seconds, cpu_seconds,
+                                        calls)
+
+    def add_items(metrics, **counts):
+        """ Adds to the named item counters """
+        with metrics._lock:
+            for key, count in counts.items():
+                metrics.items[key] = metrics.items.get(key, 0) + int(count)
+        if metrics.parent is not None:
+            metrics.parent.add_items(**counts)
+
+    def record_cache(metrics, cache, hits=0, misses=0, bytes_read=0,
+                     bytes_written=0):
+        """ Adds to the counters of one cache """
+        with metrics._lock:
+            if cache not in metrics.caches:
+                metrics.caches[cache] = [0, 0, 0, 0]
+            totals = metrics.caches[cache]
+            totals[0] += int(hits)
+            totals[1] += int(misses)
+            totals[2] += int(bytes_read)
+            totals[3] += int(bytes_written)
+        if metrics.parent is not None:
+            metrics.parent.record_cache(cache, hits, misses, bytes_read,
+                                        bytes_written)
+
+    def merge(metrics, info):
+        """
+        Adds the counters of an asdict() result, e.g. one reported by
+        another process.
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.query_metrics import *  # NOQA
+            >>> worker = QueryMetrics()
+            >>> worker.record_stage('scoring', 1.0, 0.5)
+            >>> worker.add_items(queries=3)
+            >>> worker.record_cache('chipmatch', hits=2, bytes_read=5)
+            >>> info = worker.drain()
+            >>> assert worker.asdict() == {'stages': {}, 'items': {}, 'caches': {}}
+            >>> metrics = QueryMetrics()
+            >>> metrics.add_items(queries=1)
+            >>> metrics.merge(json.loads(json.dumps(info)))
+            >>> metrics.merge(info)
+            >>> result = metrics.asdict()
+            >>> assert result['stages']['scoring']['calls'] == 2
+            >>> assert result['items'] == {'queries': 7}
+            >>> assert result['caches']['chipmatch']['bytes_read'] == 10
+        """
+        for stage, totals in info.get('stages', {}).items():
+            metrics.record_stage(stage, totals['wall_seconds'],
+                                 totals['cpu_seconds'], calls=totals['calls'])
+        if info.get('items'):
+            metrics.add_items(**info['items'])
+        for cache, totals in info.get('caches', {}).items():
+            metrics.record_cache(cache, **totals)
+
+    def clear(metrics):
+        with metrics._lock:
+            metrics.stages.clear()
+            metrics.items.clear()
+            metrics.caches.clear()
+
+    def drain(metrics):
+        """
+        Returns:
+            dict: asdict() of the records since the last drain, which are
+                cleared
+        """
+        with metrics._lock:
+            info = metrics._asdict()
+            metrics.stages.clear()
+            metrics.items.clear()
+            metrics.caches.clear()
+        return info
+
+    def asdict(metrics):
+        """
+        Returns:
+            dict: stages, items and caches as plain json types
+        """
+        with metrics._lock:
+            return metrics._asdict()
+
+    def _asdict(metrics):
+        stages = collections.OrderedDict([
+            (stage, {'calls': calls, 'wall_seconds': wall,
+                     'cpu_seconds': cpu})
+            for stage, (calls, wall, cpu) in metrics.stages.items()
+        ])
+        items = collections.OrderedDict(metrics.items)
+        caches = collections.OrderedDict([
+            (cache, dict(zip(CACHE_FIELDS, totals)))
+            for cache, totals in metrics.caches.items()
+        ])
+        return {'stages': stages, 'items': items, 'caches': caches}
+
+    def to_json(metrics, **kwargs):
+        return json.dumps(metrics.asdict(), **kwargs)
+
+    def to_prometheus(metrics, prefix=PROMETHEUS_PREFIX):
+        """
+        Returns:
+            str: the counters in the Prometheus text exposition format
+        """
+        info = metrics.asdict()
+        families = [
+            ('stage_calls_total', 'stage', info['stages'], 'calls',
+             'Number of runs of each pipeline stage.'),
+            ('stage_seconds_total', 'stage', info['stages'], 'wall_seconds',
+             'Wall time spent in each pipeline stage.'),
+            ('stage_cpu_seconds_total', 'stage', info['stages'], 'cpu_seconds',
+             'Process CPU time spent in each pipeline stage.'),
+            ('items_total', 'item', info['items'], None,
+             'Number of items processed by the pipeline.'),
+            ('cache_hits_total', 'cache', info['caches'], 'hits',
+             'Query cache hits.'),
+            ('cache_misses_total', 'cache', info['caches'], 'misses',
+             'Query cache misses.'),
+            ('cache_read_bytes_total', 'cache', info['caches'], 'bytes_read',
+             'Bytes loaded from query caches.'),
+            ('cache_written_bytes_total', 'cache', info['caches'],
+             'bytes_written', 'Bytes written to query caches.'),
+        ]
+        lines = []
+        for suffix, label, values, field, helpstr in families:
+            name = '%s_%s' % (prefix, suffix)
+            lines.append('# HELP %s %s' % (name, helpstr))
+            lines.append('# TYPE %s counter' % (name,))
+            for key, value in values.items():
+                if field is not None:
+                    value = value[field]
+                lines.append('%s{%s="%s"} %s' % (
+                    name, label, _escape_label(key), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(text):
+    return text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+PROCESS_METRICS = QueryMetrics()
+
+
+def get_process_metrics():
+    """
+    Returns:
+        QueryMetrics: the totals of every query request of this process
+            made while metrics were enabled
+    """
+    return PROCESS_METRICS
+
+
+def set_enabled(flag=True):
+    """ Turns metrics on or off for query requests made afterwards """
+    global QUERY_METRICS
+    QUERY_METRICS = flag
+
+
+def new_query_metrics(enabled=None):
+    """
+    Returns:
+        QueryMetrics: a collector for a new query request that feeds the
+            process totals, or None if metrics are disabled
+    """
+    if enabled is None:
+        enabled = QUERY_METRICS
+    if not enabled:
+        return None
+    return QueryMetrics(parent=PROCESS_METRICS)
+
+
+if __name__ == '__main__':
+    """
+    CommandLine:
+        python -m ibeis.algo.hots.query_metrics
+        python -m ibeis.algo.hots.query_metrics --allexamples
+    """
+    import multiprocessing
+    multiprocessing.freeze_support()  # for win32
+    import xdoctest
+    xdoctest.doctest_module(__file__)
@@ -15,6 +15,7 @@ import numpy as np
 from ibeis.algo.hots import neighbor_index_cache
 from ibeis.util import util_decor
 from ibeis.algo.hots import query_params
+from ibeis.algo.hots import query_metrics
 from ibeis.algo.hots import chip_match
 from ibeis.algo.hots import _pipeline_helpers as plh  # NOQA
 (print, rrr, profile) = ut.inject2(__name__)
@@ -319,6 +320,14 @@ class QueryRequest(ut.NiceRepr):
         qreq_.unique_nids = None
         qreq_.aid_to_idx = None
         qreq_.nid_to_groupuuid = None
+        # Memoized get_data_hashid
+        qreq_._data_hashid = None
+        # Database features are ensured once per daid set. Copies made by
+        # shallowcopy and new_query_copy share the flag.
+        qreq_._dannots_preloaded = False
+        # Stage timing, item counts and cache counters (see query_metrics).
+        # None unless metrics are enabled. Shared with shallowcopy chunks.
+        qreq_.metrics = None
 
     @classmethod
     @profile
@@ -346,6 +355,7 @@ class QueryRequest(ut.NiceRepr):
         qreq_.data_config2_ = data_config2_
         qreq_.qresdir = qresdir
         qreq_._indexer_request_params = _indexer_request_params
+        qreq_.metrics = query_metrics.new_query_metrics()
         qreq_.set_external_daids(daid_list)
         qreq_.set_external_qaids(qaid_list)
 
@@ -648,6 +658,8 @@ class QueryRequest(ut.NiceRepr):
 
     def _set_internal_daids(qreq_, daid_list):
         qreq_.internal_daids_mask = None  # Invalidate mask
+        qreq_._data_hashid = None
+        qreq_._dannots_preloaded = False
         qreq_.internal_daids = np.array(daid_list)
         # Use new annotation objects
         config = qreq_.get_internal_data_config2()
@@ -687,12 +699,71 @@ class QueryRequest(ut.NiceRepr):
         _intersect = np.intersect1d(qaids, qreq2_.qaids)
         assert len(_intersect) == len(qaids), 'not a subset'
         qreq2_.set_external_qaids(qaids)
-        # The shallow copy does not bring over output / query data
-        qreq2_.indexer = None
+        # The shallow copy does not bring over output / query data. The
+        # indexer only depends on the daids, so a loaded one is shared.
         #qreq2_.metadata = {}
         qreq2_.hasloaded = False
         return qreq2_
 
+    def new_query_copy(qreq_, qaids):
+        """
+        Creates a copy of qreq with the same database state (daids, names,
+        data hash, loaded indexer and preloaded database annotations) and a
+        new set of query annotations, which do not need to be part of
+        qreq_.qaids. Only the query side is computed.
+
+        Used by QueryService to answer new queries against a warm request.
+
+        CommandLine:
+            python -m ibeis.algo.hots.query_request QueryRequest.new_query_copy
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.query_request import *  # NOQA
+            >>> import ibeis
+            >>> ibs = ibeis.opendb(defaultdb='testdb1')
+            >>> aids = ibs.get_valid_aids()
+            >>> qreq_ = ibs.new_query_request(aids[0:1], aids[2:8])
+            >>> qreq2_ = qreq_.new_query_copy(aids[0:2])
+            >>> qreq3_ = ibs.new_query_request(aids[0:2], aids[2:8])
+            >>> assert qreq2_.get_data_hashid() == qreq3_.get_data_hashid()
+            >>> assert qreq2_.get_query_hashid() == qreq3_.get_query_hashid()
+            >>> assert qreq2_.nid_to_grouphash == qreq3_.nid_to_grouphash
+            >>> assert list(qreq2_.qnids) == list(qreq3_.qnids)
+        """
+        qreq2_ = QueryRequest()
+        qreq2_.__dict__.update(qreq_.__dict__)
+        qaids = [qaids] if not ut.isiterable(qaids) else qaids
+        qreq2_.set_external_qaids(qaids)
+        qreq2_.hasloaded = False
+        qreq2_.prog_hook = None
+        if qreq_.metrics is not None:
+            qreq2_.metrics = query_metrics.QueryMetrics(
+                parent=qreq_.metrics.parent)
+        new_aids = np.setdiff1d(qreq2_.qaids, qreq_.unique_aids)
+        if len(new_aids) == 0:
+            return qreq2_
+        # Add the names of the new annotations to the name state
+        ibs = qreq_.ibs
+        unique_aids = np.union1d(qreq_.unique_aids, new_aids)
+        unique_nids = np.empty(len(unique_aids), dtype=qreq_.unique_nids.dtype)
+        unique_nids[np.searchsorted(unique_aids, qreq_.unique_aids)] = qreq_.unique_nids
+        new_nids = np.array(ibs.get_annot_nids(new_aids))
+        unique_nids[np.searchsorted(unique_aids, new_aids)] = new_nids
+        qreq2_.unique_aids = unique_aids
+        qreq2_.unique_nids = unique_nids
+        qreq2_.aid_to_idx = ut.make_index_lookup(unique_aids)
+        _annots = ibs.annots(unique_aids)
+        qreq2_._unique_annots = _annots.view(_annots.aids)
+        # Only the groups of the new names change
+        flags = np.isin(unique_nids, new_nids)
+        group_annots = qreq2_._unique_annots.view(unique_aids[flags])
+        nid_to_grouphash = qreq_.nid_to_grouphash.copy()
+        nid_to_grouphash.update(qreq2_._make_anygroup_hashes(
+            group_annots, unique_nids[flags]))
+        qreq2_.nid_to_grouphash = nid_to_grouphash
+        return qreq2_
+
     # --- State Modification ---
 
     def set_external_qaid_mask(qreq_, masked_qaid_list):
@@ -724,6 +795,7 @@ class QueryRequest(ut.NiceRepr):
     def set_internal_masked_daids(qreq_, masked_daid_list):
         """ used by the pipeline to execute a subset of the query request
         without modifying important state """
+        qreq_._data_hashid = None
         if masked_daid_list is None or len(masked_daid_list) == 0:
             qreq_.internal_daids_mask = None
         else:
@@ -892,7 +964,11 @@ class QueryRequest(ut.NiceRepr):
             >>> result = ('data_hashid = %s' % (ut.repr2(data_hashid),))
             >>> print(result)
         """
-        data_hashid = qreq_.get_qreq_pcc_hashid(qreq_.daids, prefix='D', with_nids=True)
+        data_hashid = getattr(qreq_, '_data_hashid', None)
+        if data_hashid is None:
+            data_hashid = qreq_.get_qreq_pcc_hashid(qreq_.daids, prefix='D',
+                                                    with_nids=True)
+            qreq_._data_hashid = data_hashid
         return data_hashid
 
     def get_query_hashid(qreq_):
@@ -985,17 +1061,21 @@ class QueryRequest(ut.NiceRepr):
         if prog_hook is not None:
             prog_hook.initialize_subhooks(4)
 
+        with_data = not getattr(qreq_, '_dannots_preloaded', False)
         qreq_.qannots.preload('nids')
-        qreq_.dannots.preload('nids')
+        if with_data:
+            qreq_.dannots.preload('nids')
 
         subhook = None if prog_hook is None else prog_hook.next_subhook()
-        qreq_.ensure_features(verbose=verbose, prog_hook=subhook)
+        qreq_.ensure_features(verbose=verbose, prog_hook=subhook,
+                              with_data=with_data)
 
         subhook = None if prog_hook is None else prog_hook.next_subhook()
         if subhook is not None:
             subhook(0, 1, 'preload featweights')
         if qreq_.qparams.fg_on is True:
-            qreq_.ensure_featweights(verbose=verbose)
+            qreq_.ensure_featweights(verbose=verbose, with_data=with_data)
+        qreq_._dannots_preloaded = True
 
         subhook = None if prog_hook is None else prog_hook.next_subhook()
         if subhook is not None:
@@ -1068,10 +1148,12 @@ class QueryRequest(ut.NiceRepr):
             config2_=qreq_.extern_data_config2, **externgetkw)
 
     @profile
-    def ensure_features(qreq_, verbose=ut.NOT_QUIET, prog_hook=None):
+    def ensure_features(qreq_, verbose=ut.NOT_QUIET, prog_hook=None,
+                        with_data=True):
         r""" ensure features are computed
         Args:
             verbose (bool):  verbosity flag(default = True)
+            with_data (bool): also ensure the database features
 
         CommandLine:
             python -m ibeis.algo.hots.query_request ensure_features
@@ -1100,17 +1182,19 @@ class QueryRequest(ut.NiceRepr):
         qreq_.qannots.preload('kpts', 'vecs')
         if prog_hook is not None:
             prog_hook(2, 3, 'ensure database features')
-        qreq_.dannots.preload('kpts')
+        if with_data:
+            qreq_.dannots.preload('kpts')
         if prog_hook is not None:
             prog_hook(3, 3, 'computed features')
 
     @profile
-    def ensure_featweights(qreq_, verbose=ut.NOT_QUIET):
+    def ensure_featweights(qreq_, verbose=ut.NOT_QUIET, with_data=True):
         """ ensure feature weights are computed """
         if verbose:
             print('[qreq] ensure_featweights')
         qreq_.qannots.preload('fgweights')
-        qreq_.dannots.preload('fgweights')
+        if with_data:
+            qreq_.dannots.preload('fgweights')
 
     @profile
     def load_indexer(qreq_, verbose=ut.NOT_QUIET, force=False, prog_hook=None):
@@ -1162,6 +1246,31 @@ class QueryRequest(ut.NiceRepr):
             fpath = join(dpath, fname)
             yield fpath
 
+    def enable_metrics(qreq_):
+        """
+        Collects the stage timing, item counts and cache counters of this
+        request in qreq_.metrics, even if --query-metrics is not given.
+
+        Returns:
+            query_metrics.QueryMetrics: qreq_.metrics
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.query_request import *  # NOQA
+            >>> import ibeis
+            >>> ibs = ibeis.opendb(defaultdb='testdb1')
+            >>> aids = ibs.get_valid_aids()
+            >>> qreq_ = ibs.new_query_request(aids[0:2], aids[2:8])
+            >>> metrics = qreq_.enable_metrics()
+            >>> cm_list = qreq_.execute(use_cache=False)
+            >>> info = metrics.asdict()
+            >>> assert info['items']['queries'] == 2
+            >>> assert info['stages']['nearest_neighbors']['calls'] >= 1
+        """
+        if qreq_.metrics is None:
+            qreq_.metrics = query_metrics.new_query_metrics(enabled=True)
+        return qreq_.metrics
+
     def execute(qreq_, qaids=None, prog_hook=None, use_cache=None, invalidate_supercache=None):
         r"""
         Runs the hotspotter pipeline and returns chip match objects.
@@ -1197,6 +1306,46 @@ class QueryRequest(ut.NiceRepr):
                 invalidate_supercache=invalidate_supercache)
         return cm_list
 
+    def execute_stream(qreq_, qaids=None, prog_hook=None, use_cache=None,
+                       batch_size=None, cancel_token=None, stage_hook=None):
+        r"""
+        Runs the hotspotter pipeline and yields each chip match as soon as
+        its chunk is scored and cached.
+
+        Cached results come first, then the computed results chunk by chunk.
+        See match_chips4.stream_query_request.
+
+        Args:
+            cancel_token (pipeline.CancelToken): stops the query between
+                chunks and pipeline stages (raises pipeline.QueryCancelled)
+            stage_hook (callable): receives a dict for the start and end of
+                every pipeline stage
+
+        Yields:
+            ChipMatch: cm
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.algo.hots.query_request import *  # NOQA
+            >>> from ibeis.algo.hots.tests import bench
+            >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'stream_synth_test')
+            >>> ut.delete(dbdir)
+            >>> ibs = bench.make_synthetic_database(dbdir, 9, num_feats=30,
+            >>>                                     verbose=False)
+            >>> aids = ibs.get_valid_aids()
+            >>> qreq_ = bench.new_bench_query_request(ibs, aids[0:3], aids)
+            >>> cm_list = list(qreq_.execute_stream(use_cache=False, batch_size=2))
+            >>> assert sorted(cm.qaid for cm in cm_list) == sorted(qreq_.qaids)
+        """
+        from ibeis.algo.hots import match_chips4 as mc4
+        if qaids is not None:
+            qreq_ = qreq_.shallowcopy(qaids=qaids)
+        qreq_.prog_hook = prog_hook
+        return mc4.stream_query_request(
+            qreq_, use_cache=use_cache, verbose=True, save_qcache=use_cache,
+            use_supercache=use_cache, batch_size=batch_size,
+            cancel_token=cancel_token, stage_hook=stage_hook)
+
 
 def cfg_deepcopy_test():
     """
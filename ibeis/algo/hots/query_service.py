@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Warm query requests for repeated identification against a fixed database.
+
+Every ibs.new_query_request resolves the nearest neighbor indexer, hashes all
+database annotations and preloads their keypoints, names and feature weights.
+For one-sighting-at-a-time traffic against a large database that costs more
+than the query itself. A QueryService does the database side once for a
+(daid set, pipeline config) and answers new query annotations with only the
+query side work.
+
+Before each query the service asks SQLite whether anything was written since
+it was built. Only then does it reread the names and visual uuids of its
+database annotations, and it rebuilds itself if a database annotation was
+deleted, renamed or changed.
+
+CommandLine:
+    python -m ibeis.algo.hots.query_service benchmark_query_service --db PZ_MTEST
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import collections
+import numpy as np
+import utool as ut
+(print, rrr, profile) = ut.inject2(__name__, '[query_service]')
+
+
+# Number of warm services kept per controller. Each one holds an indexer.
+MAX_QUERY_SERVICES = 4
+
+USE_QUERY_SERVICE = ut.get_argflag('--warm-query')
+
+
+class QueryService(object):
+    """
+    Long-lived query request for a fixed set of database annotations and
+    pipeline config.
+
+    Args:
+        ibs (ibeis.IBEISController):  image analysis api
+        daid_list (list): database annotations. Only the set matters.
+        cfgdict (dict): pipeline config, as for ibs.new_query_request
+
+    CommandLine:
+        python -m ibeis.algo.hots.query_service QueryService
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.query_service import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb(defaultdb='testdb1')
+        >>> aids = ibs.get_valid_aids()
+        >>> service = QueryService(ibs, aids[2:])
+        >>> cm = service.query(aids[0:1], use_cache=False)[0]
+        >>> qreq_ = ibs.new_query_request(aids[0:1], aids[2:])
+        >>> assert cm == qreq_.execute(use_cache=False)[0]
+        >>> # Renaming a database annotation rebuilds the service
+        >>> assert not service.ensure_current()
+        >>> nid = ibs.get_annot_nids(aids[2])
+        >>> ibs.set_annot_names([aids[2]], ['query_service_test'])
+        >>> assert service.ensure_current()
+        >>> ibs.set_annot_name_rowids([aids[2]], [nid])
+        >>> assert service.ensure_current()
+        >>> assert service.num_builds == 3
+    """
+
+    def __init__(service, ibs, daid_list, cfgdict=None, verbose=False):
+        service.ibs = ibs
+        service.daids = np.unique(np.asarray(daid_list, dtype=np.int64))
+        service.cfgdict = {} if cfgdict is None else cfgdict.copy()
+        service.verbose = verbose
+        service.qreq_ = None
+        service.num_builds = 0
+        service._db_version = None
+        service._data_state = None
+        service.build()
+
+    def __len__(service):
+        return len(service.daids)
+
+    def build(service):
+        """ Loads the database side of the query request """
+        from ibeis.algo.hots import query_request
+        ibs = service.ibs
+        if service.verbose:
+            print('[query_service] building for %d daids' % (len(service.daids),))
+        service._db_version = service._read_db_version()
+        service._data_state = service._read_data_state()
+        qaids = np.empty(0, dtype=np.int64)
+        qreq_ = ibs.new_query_request(qaids, service.daids,
+                                      cfgdict=service.cfgdict,
+                                      verbose=False)
+        if not isinstance(qreq_, query_request.QueryRequest):
+            raise NotImplementedError(
+                'QueryService only supports the vsmany pipeline')
+        qreq_.lazy_preload(verbose=False)
+        qreq_.load_indexer(verbose=False)
+        qreq_.get_data_hashid()
+        species = qreq_.unique_species
+        if isinstance(species, (list, tuple)):
+            species = set(species)
+        service.species = species
+        service.qreq_ = qreq_
+        service.num_builds += 1
+
+    def _read_db_version(service):
+        """
+        Changes whenever the database is written, by this connection or any
+        other one.
+        """
+        connection = service.ibs.db.connection
+        data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+        return (connection.total_changes, data_version)
+
+    def _read_data_state(service):
+        ibs = service.ibs
+        nids = list(ibs.get_annot_nids(service.daids))
+        visual_uuids = list(ibs.get_annot_visual_uuids(service.daids))
+        return (nids, visual_uuids)
+
+    def ensure_current(service):
+        """
+        Rebuilds the service if any of its database annotations was deleted,
+        renamed or changed since it was built.
+
+        Returns:
+            bool: True if the service was rebuilt
+        """
+        db_version = service._read_db_version()
+        if db_version == service._db_version:
+            return False
+        data_state = service._read_data_state()
+        service._db_version = db_version
+        if data_state == service._data_state:
+            return False
+        if service.verbose:
+            print('[query_service] database changed, rebuilding')
+        service.build()
+        return True
+
+    def new_query_request(service, qaid_list):
+        """
+        Returns:
+            QueryRequest: a request for qaid_list that shares the warm
+                database state, or a new request if the species of the
+                queries change the pipeline config
+        """
+        service.ensure_current()
+        ibs = service.ibs
+        species = service.species
+        if isinstance(species, set):
+            # The feature weight hack depends on the species of the queries
+            query_species = set(ibs.get_database_species(qaid_list))
+            if not query_species.issubset(species):
+                return ibs.new_query_request(qaid_list, service.daids,
+                                             cfgdict=service.cfgdict,
+                                             verbose=False)
+        return service.qreq_.new_query_copy(qaid_list)
+
+    def query(service, qaid_list, use_cache=None, prog_hook=None):
+        """
+        Returns:
+            list: cm_list - one ChipMatch per query annotation
+        """
+        qreq_ = service.new_query_request(qaid_list)
+        return qreq_.execute(prog_hook=prog_hook, use_cache=use_cache)
+
+    def query_stream(service, qaid_list, use_cache=None, prog_hook=None,
+                     batch_size=None, cancel_token=None, stage_hook=None):
+        """
+        Yields:
+            ChipMatch: cm - see QueryRequest.execute_stream
+        """
+        qreq_ = service.new_query_request(qaid_list)
+        return qreq_.execute_stream(prog_hook=prog_hook, use_cache=use_cache,
+                                    batch_size=batch_size,
+                                    cancel_token=cancel_token,
+                                    stage_hook=stage_hook)
+
+
+def get_query_service(ibs, daid_list, cfgdict=None):
+    """
+    Returns the warm QueryService of a (daid set, pipeline config), building
+    it on first use. The last MAX_QUERY_SERVICES services are kept on the
+    controller.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.query_service import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb(defaultdb='testdb1')
+        >>> aids = ibs.get_valid_aids()
+        >>> service1 = get_query_service(ibs, aids[2:])
+        >>> service2 = get_query_service(ibs, aids[2:][::-1])
+        >>> service3 = get_query_service(ibs, aids[2:], {'K': 3})
+        >>> assert service1 is service2
+        >>> assert service1 is not service3
+    """
+    daids = np.unique(np.asarray(daid_list, dtype=np.int64))
+    cfgdict = {} if cfgdict is None else cfgdict
+    key = (ut.hash_data(daids), ut.repr2(cfgdict, sorted_=True))
+    if ibs._query_services is None:
+        ibs._query_services = collections.OrderedDict()
+    services = ibs._query_services
+    service = services.pop(key, None)
+    if service is None:
+        service = QueryService(ibs, daids, cfgdict)
+    services[key] = service
+    while len(services) > MAX_QUERY_SERVICES:
+        services.popitem(last=False)
+    return service
+
+
+def benchmark_query_service(ibs, qaid_list=None, daid_list=None,
+                            cfgdict=None):
+    r"""
+    Compares single annotation queries through a new query request per call
+    with the same queries through a warm QueryService. The chip match cache
+    is off for both.
+
+    Returns:
+        dict: seconds per query of each path and the speedup
+
+    CommandLine:
+        python -m ibeis.algo.hots.query_service benchmark_query_service --db PZ_MTEST
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.hots.query_service import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb(defaultdb='PZ_MTEST')
+        >>> result = benchmark_query_service(ibs)
+        >>> print(ut.repr4(result, precision=4))
+    """
+    import time
+    if daid_list is None:
+        daid_list = ibs.get_valid_aids()
+    if qaid_list is None:
+        qaid_list = daid_list[0:10]
+    # Build the indexer and features once so both paths start warm on disk
+    ibs.new_query_request(qaid_list, daid_list, cfgdict=cfgdict,
+                          verbose=False).execute(use_cache=False)
+
+    start = time.time()
+    cold_cms = [
+        ibs.new_query_request([qaid], daid_list, cfgdict=cfgdict,
+                              verbose=False).execute(use_cache=False)[0]
+        for qaid in qaid_list
+    ]
+    cold_time = (time.time() - start) / len(qaid_list)
+
+    start = time.time()
+    service = QueryService(ibs, daid_list, cfgdict)
+    build_time = time.time() - start
+    start = time.time()
+    warm_cms = [service.query([qaid], use_cache=False)[0]
+                for qaid in qaid_list]
+    warm_time = (time.time() - start) / len(qaid_list)
+    assert all(cm1 == cm2 for cm1, cm2 in zip(cold_cms, warm_cms))
+    result = {
+        'num_queries': len(qaid_list),
+        'num_daids': len(daid_list),
+        'build_seconds': build_time,
+        'cold_seconds_per_query': cold_time,
+        'warm_seconds_per_query': warm_time,
+        'speedup': cold_time / warm_time,
+    }
+    return result
+
+
+if __name__ == '__main__':
+    """
+    CommandLine:
+        python -m ibeis.algo.hots.query_service
+        python -m ibeis.algo.hots.query_service --allexamples
+    """
+    import multiprocessing
+    multiprocessing.freeze_support()  # for win32
+    import xdoctest
+    xdoctest.doctest_module(__file__)
@@ -159,6 +159,343 @@ def make_chipmatch_shortlists(qreq_, cm_list, nNameShortList, nAnnotPerName, sco
     return cm_shortlist
 
 
+def _segment_sums(values, sizes):
+    """ Sums of consecutive segments of values with the given sizes """
+    sums = np.zeros(len(sizes), dtype=np.float64)
+    nonempty = sizes > 0
+    if len(values) > 0:
+        starts = np.cumsum(sizes) - sizes
+        sums[nonempty] = np.add.reduceat(values, starts[nonempty])
+    return sums
+
+
+def _segment_ranks(sorted_keys):
+    """ Position of each item within its run of equal sorted keys """
+    num = len(sorted_keys)
+    is_start = np.ones(num, dtype=bool)
+    if num > 0:
+        is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    start_pos = np.maximum.accumulate(np.where(is_start, np.arange(num), 0))
+    return np.arange(num) - start_pos
+
+
+@profile
+def shortlist_take_idxs(fs_list_list, fx1_list_list, dnid_list_list,
+                        nNameShortList, nAnnotPerName, prescore_method='nsum',
+                        score_method='nsum'):
+    r"""
+    Computes the pre-verification shortlists of many queries at once.
+
+    The feature matches of all queries are concatenated. Annotation (csum)
+    and name (nsum or maxcsum) scores are segment reductions over the flat
+    arrays, and the top names of each query and top annotations of each
+    name are selected with segmented lexsorts. Sums are taken in float64, so
+    annotations or names whose float32 scores tie up to rounding may be
+    ordered differently than by the per-ChipMatch scores. Exact ties go to
+    the larger name rowid / annotation index like the per-ChipMatch
+    shortlists.
+
+    Args:
+        fs_list_list (list): feature match scores of each annotation of each
+            query (ChipMatch.get_fsv_prod_list)
+        fx1_list_list (list): query feature (combo) id of each feature match
+            (name_scoring.get_chipmatch_fcombo_ids)
+        dnid_list_list (list): name rowid of each annotation of each query
+        nNameShortList (int): number of names per query
+        nAnnotPerName (int): number of annotations per name
+        prescore_method (str): name score used to rank names. 'nsum' or
+            'csum' (best annotation csum).
+        score_method (str): 'nsum' shortlists names and their annotations.
+            'csum' shortlists the nNameShortList * nAnnotPerName best
+            annotations.
+
+    Returns:
+        list: take_idxs_list - annotation indices of each query in shortlist
+            order (for ChipMatch.take_annots)
+
+    CommandLine:
+        python -m ibeis.algo.hots.scoring shortlist_take_idxs
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.scoring import *  # NOQA
+        >>> fs_list_list = [
+        >>>     [np.array([1., 1.]), np.array([3.]), np.array([1., 1.]), np.array([.5])],
+        >>>     [np.array([2.]), np.array([], dtype=np.float64)],
+        >>> ]
+        >>> fx1_list_list = [
+        >>>     [np.array([0, 1]), np.array([0]), np.array([0, 0]), np.array([4])],
+        >>>     [np.array([0]), np.array([], dtype=np.int32)],
+        >>> ]
+        >>> dnid_list_list = [np.array([21, 22, 21, 23]), np.array([21, 22])]
+        >>> take_idxs_list = shortlist_take_idxs(
+        >>>     fs_list_list, fx1_list_list, dnid_list_list, 2, 1)
+        >>> print([idxs.tolist() for idxs in take_idxs_list])
+        >>> take_idxs_list = shortlist_take_idxs(
+        >>>     fs_list_list, fx1_list_list, dnid_list_list, 2, 1, 'csum', 'csum')
+        >>> print([idxs.tolist() for idxs in take_idxs_list])
+        [[1, 2], [0, 1]]
+        [[1, 2], [0, 1]]
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # Compare against the per-ChipMatch shortlists
+        >>> from ibeis.algo.hots.scoring import *  # NOQA
+        >>> cm_list = testdata_shortlist_chipmatches(num_queries=4, num_names=300)
+        >>> for score_method in ['nsum', 'csum']:
+        >>>     take_idxs_list = shortlist_take_idxs(
+        >>>         [cm.get_fsv_prod_list() for cm in cm_list],
+        >>>         [[fm.T[0] for fm in cm.fm_list] for cm in cm_list],
+        >>>         [cm.dnid_list for cm in cm_list], 40, 3, 'nsum', score_method)
+        >>>     expected = _shortlist_take_idxs_loop(cm_list, 40, 3, 'nsum', score_method)
+        >>>     assert all(np.all(idxs1 == idxs2) for idxs1, idxs2 in zip(take_idxs_list, expected))
+    """
+    from ibeis.algo.hots import name_scoring
+    num_queries = len(fs_list_list)
+    annot_nums = np.array([len(fs_list) for fs_list in fs_list_list], dtype=np.int64)
+    num_annots = int(annot_nums.sum())
+    if num_annots == 0:
+        return [np.zeros(0, dtype=np.int64) for _ in range(num_queries)]
+    annot_qx = np.repeat(np.arange(num_queries), annot_nums)
+    annot_local = np.arange(num_annots) - np.repeat(np.cumsum(annot_nums) - annot_nums, annot_nums)
+    fs_list = ut.flatten(fs_list_list)
+    annot_nfeats = np.array([len(fs) for fs in fs_list], dtype=np.int64)
+    num_matches = int(annot_nfeats.sum())
+    if num_matches > 0:
+        flat_fs = np.hstack(fs_list).astype(np.float64)
+    else:
+        flat_fs = np.zeros(0, dtype=np.float64)
+    # csum score of every annotation
+    annot_scores = _segment_sums(flat_fs, annot_nfeats)
+
+    # Number the (query, name) pairs. Within a query names are ordered by
+    # rowid like ChipMatch.unique_nids.
+    annot_nids = np.hstack(dnid_list_list).astype(np.int64)
+    annot_sortx = np.lexsort((annot_nids, annot_qx))
+    sorted_qx = annot_qx.take(annot_sortx)
+    sorted_nids = annot_nids.take(annot_sortx)
+    is_name_start = np.ones(num_annots, dtype=bool)
+    is_name_start[1:] = ((sorted_qx[1:] != sorted_qx[:-1]) |
+                         (sorted_nids[1:] != sorted_nids[:-1]))
+    name_starts = np.flatnonzero(is_name_start)
+    num_names = len(name_starts)
+    annot_nx = np.empty(num_annots, dtype=np.int64)
+    annot_nx[annot_sortx] = np.cumsum(is_name_start) - 1
+    name_qx = sorted_qx.take(name_starts)
+
+    if prescore_method == 'nsum':
+        # Stack the feature matches name by name
+        sorted_nfeats = annot_nfeats.take(annot_sortx)
+        match_starts = np.cumsum(annot_nfeats) - annot_nfeats
+        sorted_starts = np.cumsum(sorted_nfeats) - sorted_nfeats
+        match_order = np.arange(num_matches) + np.repeat(
+            match_starts.take(annot_sortx) - sorted_starts, sorted_nfeats)
+        if num_matches > 0:
+            flat_fx1 = np.hstack(ut.flatten(fx1_list_list)).astype(np.int64)
+        else:
+            flat_fx1 = np.zeros(0, dtype=np.int64)
+        name_scores = name_scoring.compute_flat_nsum_scores(
+            flat_fs.take(match_order), flat_fx1.take(match_order),
+            np.repeat(annot_nx.take(annot_sortx), sorted_nfeats), num_names,
+            exact=False)
+    elif prescore_method == 'csum':
+        name_scores = np.maximum.reduceat(annot_scores.take(annot_sortx),
+                                          name_starts)
+    else:
+        raise NotImplementedError('[hs] unknown scoring method:' + prescore_method)
+
+    if score_method == 'nsum':
+        # Rank names within each query by score (ties to the larger rowid)
+        name_sortx = np.lexsort((-np.arange(num_names), -name_scores, name_qx))
+        name_rank = np.empty(num_names, dtype=np.int64)
+        name_rank[name_sortx] = _segment_ranks(name_qx.take(name_sortx))
+        annot_name_rank = name_rank.take(annot_nx)
+        candx = np.flatnonzero(annot_name_rank < nNameShortList)
+        # Rank annotations within each shortlisted name
+        cand_sortx = np.lexsort((-candx, -annot_scores.take(candx),
+                                 annot_name_rank.take(candx),
+                                 annot_qx.take(candx)))
+        sorted_candx = candx.take(cand_sortx)
+        annot_rank = _segment_ranks(annot_nx.take(sorted_candx))
+        selx = sorted_candx.compress(annot_rank < nAnnotPerName)
+    elif score_method == 'csum':
+        num_shortlist = nNameShortList * nAnnotPerName
+        sortx = np.lexsort((-np.arange(num_annots), -annot_scores, annot_qx))
+        annot_rank = _segment_ranks(annot_qx.take(sortx))
+        selx = sortx.compress(annot_rank < num_shortlist)
+    else:
+        raise AssertionError(score_method)
+    # selx is grouped by query
+    sel_nums = np.bincount(annot_qx.take(selx), minlength=num_queries)
+    take_idxs_list = np.split(annot_local.take(selx), np.cumsum(sel_nums)[:-1])
+    return take_idxs_list
+
+
+def make_batched_chipmatch_shortlists(qreq_, cm_list, nNameShortList,
+                                      nAnnotPerName, prescore_method='nsum',
+                                      score_method='nsum',
+                                      hack_single_ori=False):
+    """
+    Makes shortlists for reranking without scoring each ChipMatch.
+
+    Replaces score_chipmatch_list followed by make_chipmatch_shortlists
+    before spatial verification. The input ChipMatches get their qnid and
+    dnid_list but no scores. The nsum feature combo ids come from
+    name_scoring.get_chipmatch_fcombo_ids with the same hack_single_ori as
+    ChipMatch.evaluate_nsum_name_score (compute_fmech_score's default).
+
+    CommandLine:
+        python -m ibeis.algo.hots.scoring make_batched_chipmatch_shortlists
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.scoring import *  # NOQA
+        >>> ibs, qreq_, cm_list = plh.testdata_pre_sver('testdb1', qaid_list=[2, 3])
+        >>> cm_shortlist = make_batched_chipmatch_shortlists(qreq_, cm_list, 5, 6)
+        >>> score_chipmatch_list(qreq_, cm_list, 'nsum')
+        >>> expected = make_chipmatch_shortlists(qreq_, cm_list, 5, 6)
+        >>> for cm1, cm2 in zip(cm_shortlist, expected):
+        >>>     assert np.all(cm1.daid_list == cm2.daid_list)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # The rotation heuristic gives the same shortlists as scoring
+        >>> from ibeis.algo.hots.scoring import *  # NOQA
+        >>> cfgdict = dict(query_rotation_heuristic=True)
+        >>> ibs, qreq_, cm_list = plh.testdata_pre_sver('testdb1', qaid_list=[2, 3], cfgdict=cfgdict)
+        >>> assert qreq_.qparams.query_rotation_heuristic
+        >>> cm_shortlist = make_batched_chipmatch_shortlists(qreq_, cm_list, 5, 6)
+        >>> score_chipmatch_list(qreq_, cm_list, 'nsum')
+        >>> expected = make_chipmatch_shortlists(qreq_, cm_list, 5, 6)
+        >>> for cm1, cm2 in zip(cm_shortlist, expected):
+        >>>     assert np.all(cm1.daid_list == cm2.daid_list)
+    """
+    from ibeis.algo.hots import hstypes
+    from ibeis.algo.hots import name_scoring
+    print('[scoring] Making batched shortlist nNameShortList=%r, nAnnotPerName=%r' % (nNameShortList, nAnnotPerName))
+    annot_nums = [len(cm.daid_list) for cm in cm_list]
+    if sum(annot_nums) > 0:
+        all_daids = np.hstack([cm.daid_list for cm in cm_list])
+        all_dnids = np.array(qreq_.get_qreq_annot_nids(all_daids),
+                             dtype=hstypes.INDEX_TYPE)
+    else:
+        all_dnids = np.zeros(0, dtype=hstypes.INDEX_TYPE)
+    dnid_list_list = np.split(all_dnids, np.cumsum(annot_nums)[:-1])
+    qnid_list = qreq_.get_qreq_annot_nids([cm.qaid for cm in cm_list])
+    for cm, qnid, dnid_list in zip(cm_list, qnid_list, dnid_list_list):
+        cm.qnid = qnid
+        cm.dnid_list = dnid_list
+    take_idxs_list = shortlist_take_idxs(
+        [cm.get_fsv_prod_list() for cm in cm_list],
+        [name_scoring.get_chipmatch_fcombo_ids(cm, qreq_, hack_single_ori)
+         for cm in cm_list],
+        dnid_list_list, nNameShortList, nAnnotPerName,
+        prescore_method=prescore_method, score_method=score_method)
+    cm_shortlist = [cm.take_annots(take_idxs, keepscores=False)
+                    for cm, take_idxs in zip(cm_list, take_idxs_list)]
+    return cm_shortlist
+
+
+def _shortlist_take_idxs_loop(cm_list, nNameShortList, nAnnotPerName,
+                              prescore_method='nsum', score_method='nsum'):
+    """
+    Per-ChipMatch reference for shortlist_take_idxs. The ChipMatches must
+    have a dnid_list.
+    """
+    from ibeis.algo.hots import name_scoring
+    take_idxs_list = []
+    for cm in cm_list:
+        cm._update_unique_nid_index()
+        cm.evaluate_csum_annot_score()
+        if prescore_method == 'nsum':
+            cm.algo_name_scores['nsum'] = name_scoring.compute_fmech_score(cm)
+        else:
+            cm.evaluate_maxcsum_name_score(None)
+        cm.set_cannonical_name_score(cm.algo_annot_scores['csum'],
+                                     cm.algo_name_scores[prescore_method.replace('csum', 'maxcsum')])
+        if score_method == 'nsum':
+            top_aids = cm.get_name_shortlist_aids(nNameShortList, nAnnotPerName)
+        else:
+            top_aids = cm.get_annot_shortlist_aids(nNameShortList * nAnnotPerName)
+        take_idxs_list.append(np.array(ut.dict_take(cm.daid2_idx, top_aids),
+                                       dtype=np.int64))
+    return take_idxs_list
+
+
+def testdata_shortlist_chipmatches(num_queries=8, num_names=5000,
+                                   annots_per_name=3, num_qfeats=1000, K=4,
+                                   seed=0):
+    """
+    Random pre-verification ChipMatches with name rowids. Every query
+    feature has K matches to random database annotations, and the
+    ChipMatches hold the annotations with at least one match.
+    """
+    from ibeis.algo.hots import chip_match
+    from ibeis.algo.hots import hstypes
+    rng = np.random.RandomState(seed)
+    num_annots = num_names * annots_per_name
+    annot_nids = rng.randint(1, num_names + 1, num_annots)
+    cm_list = []
+    for qx in range(num_queries):
+        num_matches = num_qfeats * K
+        match_annotx = rng.randint(0, num_annots, num_matches)
+        fm = np.vstack([np.repeat(np.arange(num_qfeats), K),
+                        rng.randint(0, 1000, num_matches)]).T
+        fsv = rng.rand(num_matches, 1)
+        annotxs, groupxs = vt.group_indices(match_annotx)
+        cm = chip_match.ChipMatch(
+            qaid=qx + 1, daid_list=annotxs + 1000,
+            fm_list=[fm.take(xs, axis=0).astype(hstypes.FM_DTYPE)
+                     for xs in groupxs],
+            fsv_list=[fsv.take(xs, axis=0).astype(hstypes.FS_DTYPE)
+                      for xs in groupxs],
+            dnid_list=annot_nids.take(annotxs), fsv_col_lbls=['count'])
+        cm_list.append(cm)
+    return cm_list
+
+
+def benchmark_shortlists(num_queries=8, num_names=5000, nNameShortList=40,
+                         nAnnotPerName=3):
+    r"""
+    Times per-ChipMatch scoring plus shortlisting against the batched
+    shortlists on random ChipMatches.
+
+    Returns:
+        dict: seconds of each implementation
+
+    CommandLine:
+        python -m ibeis.algo.hots.scoring benchmark_shortlists
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.hots.scoring import *  # NOQA
+        >>> result = benchmark_shortlists()
+        >>> print(ut.repr4(result, precision=3))
+    """
+    import time
+    cm_list = testdata_shortlist_chipmatches(num_queries, num_names)
+    start = time.time()
+    expected = _shortlist_take_idxs_loop(cm_list, nNameShortList, nAnnotPerName)
+    loop_time = time.time() - start
+    start = time.time()
+    take_idxs_list = shortlist_take_idxs(
+        [cm.get_fsv_prod_list() for cm in cm_list],
+        [[fm.T[0] for fm in cm.fm_list] for cm in cm_list],
+        [cm.dnid_list for cm in cm_list], nNameShortList, nAnnotPerName)
+    batched_time = time.time() - start
+    num_same = sum(np.all(idxs1 == idxs2)
+                   for idxs1, idxs2 in zip(take_idxs_list, expected))
+    result = {
+        'num_queries': num_queries,
+        'num_annots': int(sum(len(cm.daid_list) for cm in cm_list)),
+        'loop_seconds': loop_time,
+        'batched_seconds': batched_time,
+        'speedup': loop_time / batched_time,
+        'num_same_shortlists': int(num_same),
+    }
+    return result
+
+
 if __name__ == '__main__':
     """
     CommandLine:
@@ -1,4 +1,40 @@
+"""
+Benchmarks of the identification pipeline.
+
+run_benchmark_suite builds synthetic databases (images, names, annotations
+and random or clustered SIFT-like features) of configurable sizes and times
+each stage of a query: index build and load, nearest neighbors, weighting,
+chip match building, spatial verification, scoring, the chip match cache and
+the SMK kernel. The results are written as json together with the versions
+and hardware they were measured on, and compare_benchmarks reports the
+stages of two result files that got slower than a threshold.
+
+The synthetic features are written to the packed feature store, so the
+pipeline reads them like computed features and no chips are described.
+
+CommandLine:
+    python -m ibeis.algo.hots.tests.bench run_benchmark_suite --scales=1000,10000 --out=bench_new.json
+    python -m ibeis.algo.hots.tests.bench compare_benchmarks --old=bench_old.json --new=bench_new.json --threshold=.1
+"""
 import utool as ut
+import numpy as np
+
+# Version of the result file format
+BENCH_FORMAT_VERSION = 1
+
+# Each synthetic annotation covers its own square noise image
+SYNTH_IMAGE_SIZE = 32
+
+# Default pipeline config of the benchmark. The square annotations have
+# chips of dim_size x dim_size pixels, which hold the synthetic keypoints.
+BENCH_CFGDICT = {'dim_size': 64}
+
+# Pipeline stages reported by the query metrics (see query_metrics)
+QUERY_STAGES = [
+    'preload_all', 'preload', 'nearest_neighbors',
+    'baseline_neighbor_filter', 'weight_neighbors', 'build_chipmatches',
+    'spatial_verification', 'scoring', 'save',
+]
 
 
 def benchmark_knn():
@@ -28,6 +64,681 @@ def benchmark_knn():
                                   verbose=verbose)
 
 
+def sift_like(vecs):
+    """
+    Casts float vectors to SIFT descriptors: non-negative, L2 norm 512 and
+    clipped to uint8.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> vecs = sift_like(np.random.RandomState(0).randn(10, 128))
+        >>> assert vecs.dtype == np.uint8 and vecs.shape == (10, 128)
+        >>> norms = np.linalg.norm(vecs.astype(np.float32), axis=1)
+        >>> assert np.all(norms > 400) and np.all(norms <= 513)
+    """
+    vecs = np.maximum(vecs, 0).astype(np.float32)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    vecs *= 512.0 / norms
+    return np.clip(np.round(vecs), 0, 255).astype(np.uint8)
+
+
+def make_synthetic_features(num_annots_list, num_feats=100, mode='clustered',
+                            num_words=1000, chip_size=64, outlier_frac=.3,
+                            seed=0):
+    r"""
+    Makes the features of the annotations of one name.
+
+    In 'clustered' mode every name has num_feats parts. Each part is a
+    descriptor near one of num_words shared cluster centers and a keypoint
+    in the chip. Each annotation sees the parts under a random similarity
+    transform with keypoint and descriptor noise, and outlier_frac of its
+    features are replaced by random ones. In 'random' mode all descriptors
+    and keypoints are random, so no two annotations match.
+
+    Args:
+        num_annots_list (list): number of annotations of each name
+        seed (int): the same seed gives the same features
+
+    Returns:
+        list: one (kpts, vecs, fgweights) tuple per annotation, grouped by
+            name in the order of num_annots_list
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> feats_list = make_synthetic_features([2, 1], num_feats=50)
+        >>> assert len(feats_list) == 3
+        >>> kpts, vecs, fgws = feats_list[0]
+        >>> assert kpts.shape == (50, 6) and vecs.shape == (50, 128)
+        >>> assert fgws.shape == (50,)
+        >>> # Annotations of the same name share most of their descriptors
+        >>> def num_close(vecs1, vecs2):
+        >>>     dists = np.linalg.norm(vecs1.astype(float) - vecs2, axis=1)
+        >>>     return (dists < 150).sum()
+        >>> assert num_close(feats_list[0][1], feats_list[1][1]) > 25
+        >>> assert num_close(feats_list[0][1], feats_list[2][1]) < 5
+        >>> feats_list2 = make_synthetic_features([2, 1], num_feats=50)
+        >>> assert np.all(feats_list2[2][0] == feats_list[2][0])
+    """
+    rng = np.random.RandomState(seed)
+    centers = rng.exponential(1.0, size=(num_words, 128)).astype(np.float32)
+    feats_list = []
+    for num_annots in num_annots_list:
+        if mode == 'clustered':
+            wxs = rng.randint(0, num_words, size=num_feats)
+            part_vecs = centers[wxs] + rng.randn(num_feats, 128) * .25
+        elif mode == 'random':
+            part_vecs = None
+        else:
+            raise ValueError('unknown mode=%r' % (mode,))
+        part_xys = rng.rand(num_feats, 2) * chip_size
+        part_scales = rng.uniform(2.0, 6.0, size=num_feats)
+        for _ in range(num_annots):
+            if part_vecs is None:
+                vecs = rng.exponential(1.0, size=(num_feats, 128))
+                xys = rng.rand(num_feats, 2) * chip_size
+                scales = rng.uniform(2.0, 6.0, size=num_feats)
+            else:
+                vecs = part_vecs + rng.randn(num_feats, 128) * .15
+                # Similarity transform about the chip center
+                scale = rng.uniform(.9, 1.1)
+                theta = rng.uniform(-.1, .1)
+                rot = np.array([[np.cos(theta), -np.sin(theta)],
+                                [np.sin(theta), np.cos(theta)]]) * scale
+                center = chip_size / 2.0
+                shift = rng.randn(2) * 2.0
+                xys = (part_xys - center).dot(rot.T) + center + shift
+                xys += rng.randn(num_feats, 2) * .5
+                scales = part_scales * scale
+                outlier_flags = rng.rand(num_feats) < outlier_frac
+                num_outliers = outlier_flags.sum()
+                vecs[outlier_flags] = rng.exponential(
+                    1.0, size=(num_outliers, 128))
+                xys[outlier_flags] = rng.rand(num_outliers, 2) * chip_size
+            kpts = np.zeros((num_feats, 6), dtype=np.float32)
+            kpts[:, 0:2] = np.clip(xys, 0, chip_size - 1)
+            kpts[:, 2] = scales
+            kpts[:, 4] = scales
+            fgws = rng.uniform(.5, 1.0, size=num_feats).astype(np.float32)
+            feats_list.append((kpts, sift_like(vecs), fgws))
+    return feats_list
+
+
+def make_synthetic_database(dbdir, num_annots, annots_per_name=3,
+                            num_feats=100, mode='clustered', num_words=1000,
+                            seed=0, verbose=True):
+    r"""
+    Creates an ibeis database of num_annots synthetic annotations in
+    groups of annots_per_name names.
+
+    Every annotation covers a small noise image of its own, because
+    annotations in the same image cannot match. The features are made on
+    demand by ensure_synthetic_features from the parameters stored in the
+    database directory.
+
+    Returns:
+        ibeis.IBEISController: ibs - with packed features enabled
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'bench_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = make_synthetic_database(dbdir, 10, num_feats=20,
+        >>>                               verbose=False)
+        >>> aids = ibs.get_valid_aids()
+        >>> assert len(aids) == 10 and len(set(ibs.get_annot_nids(aids))) == 4
+        >>> qreq_ = new_bench_query_request(ibs, aids[0:2], aids)
+        >>> vecs = ibs.get_annot_vecs(aids[0:1], config2_=qreq_.extern_data_config2)[0]
+        >>> assert vecs.shape == (20, 128)
+    """
+    import ibeis
+    import vtool_ibeis as vt
+    from os.path import exists, join
+    if exists(join(dbdir, '_ibsdb')):
+        raise IOError('database already exists: %r' % (dbdir,))
+    ibs = ibeis.opendb(dbdir=dbdir, allow_newdir=True)
+    rng = np.random.RandomState(seed)
+    imgdir = ut.ensuredir(join(dbdir, 'synthetic_images'))
+    size = SYNTH_IMAGE_SIZE
+    gpath_list = []
+    for ax in range(num_annots):
+        img = rng.randint(0, 255, size=(size, size, 3)).astype(np.uint8)
+        gpath = join(imgdir, 'synth_%06d.png' % (ax,))
+        vt.imwrite(gpath, img)
+        gpath_list.append(gpath)
+    gid_list = ibs.add_images(gpath_list, auto_localize=False)
+    name_list = ['synth_%06d' % (ax // annots_per_name,)
+                 for ax in range(num_annots)]
+    ibs.add_annots(gid_list, bbox_list=[(0, 0, size, size)] * num_annots,
+                   name_list=name_list)
+    params = {
+        'num_annots': num_annots,
+        'annots_per_name': annots_per_name,
+        'num_feats': num_feats,
+        'mode': mode,
+        'num_words': num_words,
+        'seed': seed,
+    }
+    ut.save_json(join(dbdir, 'synthetic_params.json'), params)
+    if verbose:
+        print('[bench] made %d synthetic annots' % (num_annots,))
+    ibs._packed_feats = True
+    return ibs
+
+
+def ensure_synthetic_features(ibs, aid_list, config2_list, chip_size=None):
+    """
+    Writes the synthetic features of aid_list to the packed feature store
+    for each config that does not have them yet.
+
+    Features are made for whole names, so they only depend on the database
+    parameters and not on which annotations are requested.
+    """
+    from ibeis.algo.preproc import preproc_feat_store
+    from os.path import join
+    params = ut.load_json(join(ibs.get_dbdir(), 'synthetic_params.json'))
+    if chip_size is None:
+        chip_size = BENCH_CFGDICT['dim_size']
+    ibs._packed_feats = True
+    store = preproc_feat_store.get_feat_store(ibs)
+    aid_list = np.unique(aid_list)
+    colnames = ['kpts', 'vecs', 'fgweights']
+    missing_aids = set()
+    keys_list = []
+    for config2_ in config2_list:
+        keys_dict = {
+            colname: preproc_feat_store.get_feat_store_keys(
+                ibs, aid_list, colname, config2_)
+            for colname in colnames
+        }
+        keys_list.append(keys_dict)
+        for colname in colnames:
+            entry_dict = store.lookup(colname, keys_dict[colname])
+            missing_aids.update(
+                aid for aid, key in zip(aid_list, keys_dict[colname])
+                if key not in entry_dict)
+    if len(missing_aids) == 0:
+        return
+    # The features of a name are made by one seeded generator, so every
+    # annotation of a missing name is made
+    all_aids = np.array(sorted(ibs.get_valid_aids()))
+    all_nids = np.array(ibs.get_annot_nids(all_aids))
+    missing_nids = set(ibs.get_annot_nids(sorted(missing_aids)))
+    aid_to_feats = {}
+    for nid in sorted(missing_nids):
+        name_aids = all_aids[all_nids == nid]
+        feats_list = make_synthetic_features(
+            [len(name_aids)], num_feats=params['num_feats'],
+            mode=params['mode'], num_words=params['num_words'],
+            chip_size=chip_size, seed=(params['seed'], int(nid)))
+        aid_to_feats.update(zip(name_aids.tolist(), feats_list))
+    for keys_dict in keys_list:
+        for colx, colname in enumerate(colnames):
+            key_to_aid = {key: aid for key, aid in
+                          zip(keys_dict[colname], aid_list.tolist())
+                          if aid in aid_to_feats}
+            entry_dict = store.lookup(colname, list(key_to_aid.keys()))
+            new_keys = [key for key in key_to_aid if key not in entry_dict]
+            store.add(colname, new_keys,
+                      [aid_to_feats[key_to_aid[key]][colx]
+                       for key in new_keys])
+
+
+def new_bench_query_request(ibs, qaid_list, daid_list, cfgdict=None):
+    """
+    Returns a query request whose synthetic features are in the packed
+    feature store
+    """
+    cfgdict_ = BENCH_CFGDICT.copy()
+    if cfgdict is not None:
+        cfgdict_.update(cfgdict)
+    qreq_ = ibs.new_query_request(qaid_list, daid_list, cfgdict=cfgdict_,
+                                  verbose=False)
+    config2_list = [qreq_.extern_query_config2, qreq_.extern_data_config2]
+    ensure_synthetic_features(ibs, np.union1d(qaid_list, daid_list),
+                              config2_list, chip_size=cfgdict_['dim_size'])
+    return qreq_
+
+
+def benchmark_smk_kernel(vecs_list, nid_list, num_queries=10,
+                         num_words=1000, alpha=3.0, thresh=0.0, seed=0):
+    r"""
+    Times the aggregated selective match kernel on stacked descriptors:
+    vocabulary training, word assignment, aggregated residuals and scoring
+    each query against the database annotations that share a word with it.
+
+    The SMK pipeline of ibeis.algo.smk reads its vocabulary and inverted
+    index from the depcache, which describes the chips, so the benchmark
+    runs the smk_funcs kernels directly on the synthetic descriptors.
+
+    Returns:
+        dict: seconds of each step and the fraction of queries whose best
+            database annotation has the same name
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> feats_list = make_synthetic_features([3] * 10, num_feats=50)
+        >>> vecs_list = [vecs for kpts, vecs, fgws in feats_list]
+        >>> nid_list = np.repeat(np.arange(10), 3)
+        >>> result = benchmark_smk_kernel(vecs_list, nid_list, num_words=64)
+        >>> assert result['name_accuracy'] > .8
+    """
+    import time
+    from ibeis.algo.hots import brute_knn
+    from ibeis.algo.hots import pq_knn
+    from ibeis.algo.smk import smk_funcs
+    rng = np.random.RandomState(seed)
+    nid_list = np.asarray(nid_list)
+    num_annots = len(vecs_list)
+    flat_vecs = np.vstack(vecs_list).astype(np.float32)
+    flat_offsets = np.array([0] + ut.cumsum(list(map(len, vecs_list))))
+    result = {'smk_num_words': num_words}
+
+    start = time.time()
+    sample = flat_vecs[rng.choice(len(flat_vecs),
+                                  min(len(flat_vecs), 100 * num_words),
+                                  replace=False)]
+    words = pq_knn.train_kmeans(sample, num_words, rng=rng)
+    result['smk_vocab'] = time.time() - start
+
+    start = time.time()
+    vocab = brute_knn.BruteForceKNN()
+    vocab.build_index(words)
+    flat_wxs = vocab.nn_index(flat_vecs, 1)[0].astype(np.int32)[:, None]
+    result['smk_assign'] = time.time() - start
+
+    start = time.time()
+    with ut.Indenter('[smk] '):
+        all_agg_vecs, all_error_flags, agg_offsets = (
+            smk_funcs.compute_stacked_agg_rvecs(words, flat_wxs, flat_vecs,
+                                                flat_offsets))
+    wxs_list = [np.unique(flat_wxs[l:r, 0])
+                for l, r in ut.itertwo(flat_offsets)]
+    ndocs_per_word = np.bincount(np.hstack(wxs_list), minlength=num_words)
+    wx_to_weight = smk_funcs.inv_doc_freq(num_annots, ndocs_per_word)
+    phis_list = [all_agg_vecs[l:r] for l, r in ut.itertwo(agg_offsets)]
+    flags_list = [all_error_flags[l:r][:, None]
+                  for l, r in ut.itertwo(agg_offsets)]
+    gamma_list = [
+        smk_funcs.gamma_agg(phis, flags, wx_to_weight[wxs], alpha, thresh)
+        for phis, flags, wxs in zip(phis_list, flags_list, wxs_list)
+    ]
+    wx_to_axs = ut.group_items(
+        np.repeat(np.arange(num_annots), list(map(len, wxs_list))),
+        np.hstack(wxs_list))
+    result['smk_inverted_index'] = time.time() - start
+
+    start = time.time()
+    qxs = rng.choice(num_annots, min(num_queries, num_annots), replace=False)
+    num_correct = 0
+    for qx in qxs:
+        hit_axs = set(ut.flatten(ut.take(wx_to_axs, wxs_list[qx])))
+        hit_axs.discard(qx)
+        best_ax, best_score = None, -np.inf
+        for ax in hit_axs:
+            _, qidx, didx = np.intersect1d(wxs_list[qx], wxs_list[ax],
+                                           assume_unique=True,
+                                           return_indices=True)
+            scores = smk_funcs.match_scores_agg(
+                phis_list[qx][qidx], phis_list[ax][didx],
+                flags_list[qx][qidx], flags_list[ax][didx], alpha, thresh)
+            weights = wx_to_weight[wxs_list[qx][qidx]]
+            score = (scores * weights).sum() * gamma_list[qx] * gamma_list[ax]
+            if score > best_score:
+                best_ax, best_score = ax, score
+        num_correct += (best_ax is not None and
+                        nid_list[best_ax] == nid_list[qx])
+    result['smk_query'] = time.time() - start
+    result['name_accuracy'] = float(num_correct) / len(qxs)
+    return result
+
+
+def get_environment_metadata():
+    """
+    Returns:
+        dict: versions, hardware and time of the benchmark run
+    """
+    import os
+    import platform
+    import multiprocessing
+    import subprocess
+    import sys
+    import ibeis
+    from os.path import dirname
+    meta = {
+        'timestamp': ut.get_timestamp(),
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'python': sys.version.split()[0],
+        'ibeis': ibeis.__version__,
+        'numpy': np.__version__,
+    }
+    for modname in ['cv2', 'vtool_ibeis', 'utool', 'dtool_ibeis']:
+        try:
+            module = __import__(modname)
+        except ImportError:
+            meta[modname] = None
+        else:
+            meta[modname] = getattr(module, '__version__', 'unknown')
+    from vtool_ibeis._pyflann_backend import pyflann
+    meta['pyflann'] = None if pyflann is None else pyflann.__name__
+    try:
+        meta['git_hash'] = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=dirname(ibeis.__file__),
+            stderr=subprocess.DEVNULL).decode('utf8').strip()
+    except Exception:
+        meta['git_hash'] = None
+    try:
+        meta['memory_bytes'] = (os.sysconf('SC_PAGE_SIZE') *
+                                os.sysconf('SC_PHYS_PAGES'))
+    except (ValueError, OSError, AttributeError):
+        meta['memory_bytes'] = None
+    return meta
+
+
+def benchmark_synthetic_scale(ibs, num_queries=100, cfgdict=None,
+                              with_smk=True, smk_num_words=1000,
+                              smk_num_queries=10, warmup=True, seed=0):
+    r"""
+    Times each stage of the identification pipeline on one synthetic
+    database. If warmup is True the queries run once before they are timed.
+    SMK scores its queries against every annotation that shares a word in a
+    python loop, so it runs only smk_num_queries queries.
+
+    Returns:
+        dict: seconds of each stage, item counts and cache counters
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'bench_synth_scale')
+        >>> ut.delete(dbdir)
+        >>> ibs = make_synthetic_database(dbdir, 60, num_feats=40,
+        >>>                               verbose=False)
+        >>> result = benchmark_synthetic_scale(ibs, num_queries=6,
+        >>>                                    smk_num_words=32)
+        >>> assert result['num_queries'] == 6
+        >>> assert set(QUERY_STAGES) <= set(result['seconds'])
+        >>> assert result['caches']['chipmatch']['hits'] == 6
+        >>> assert result['name_accuracy'] > .8
+    """
+    import time
+    from ibeis.algo.hots import match_chips4 as mc4
+    from ibeis.algo.hots import neighbor_index_cache
+    rng = np.random.RandomState(seed)
+    daid_list = np.array(sorted(ibs.get_valid_aids()))
+    qaid_list = np.sort(rng.choice(daid_list, min(num_queries, len(daid_list)),
+                                   replace=False))
+    seconds = {}
+
+    start = time.time()
+    qreq_ = new_bench_query_request(ibs, qaid_list, daid_list, cfgdict)
+    seconds['synthetic_features'] = time.time() - start
+
+    # Reading the database features is part of the index build
+    start = time.time()
+    indexer = neighbor_index_cache.request_memcached_ibeis_nnindexer(
+        qreq_, qreq_.get_internal_daids(), use_memcache=False,
+        force_rebuild=True, verbose=False)
+    seconds['index_build'] = time.time() - start
+    start = time.time()
+    indexer = neighbor_index_cache.request_memcached_ibeis_nnindexer(
+        qreq_, qreq_.get_internal_daids(), use_memcache=False,
+        verbose=False)
+    seconds['index_load'] = time.time() - start
+    qreq_.indexer = indexer
+
+    if warmup:
+        # The first run computes the chips of the shortlisted annotations
+        # that spatial verification reads the sizes of
+        mc4.execute_query_and_save_L1(qreq_, use_cache=False,
+                                      save_qcache=False, verbose=False)
+    # Compute and save the chip matches, then read them back
+    metrics = qreq_.enable_metrics()
+    mc4.execute_query_and_save_L1(qreq_, use_cache=False, save_qcache=True,
+                                  verbose=False)
+    info = metrics.asdict()
+    for stage, stage_info in info['stages'].items():
+        seconds[stage] = stage_info['wall_seconds']
+    start = time.time()
+    qaid2_cm = mc4.execute_query_and_save_L1(qreq_, use_cache=True,
+                                             save_qcache=False, verbose=False)
+    seconds['cache_load'] = time.time() - start
+    info = metrics.asdict()
+    cm_list = ut.take(qaid2_cm, qreq_.qaids)
+    qnids = ibs.get_annot_nids(qreq_.qaids)
+    top_nids = [cm.get_top_nids(1)[0] if len(cm.unique_nids) > 0 else None
+                for cm in cm_list]
+    result = {
+        'num_annots': len(daid_list),
+        'num_names': len(set(ibs.get_annot_nids(daid_list))),
+        'num_queries': len(qaid_list),
+        'num_indexed_vecs': int(indexer.num_indexed_vecs()),
+        'knn_backend': indexer.get_knn_backend(),
+        'seconds': seconds,
+        'items': info['items'],
+        'caches': info['caches'],
+        'name_accuracy': float(np.mean(np.equal(top_nids, qnids))),
+    }
+    if with_smk:
+        daids = qreq_.get_internal_daids()
+        vecs_list = ibs.get_annot_vecs(daids,
+                                       config2_=qreq_.extern_data_config2)
+        smk_result = benchmark_smk_kernel(
+            vecs_list, ibs.get_annot_nids(daids), num_queries=smk_num_queries,
+            num_words=smk_num_words, seed=seed)
+        for key in ['smk_vocab', 'smk_assign', 'smk_inverted_index',
+                    'smk_query']:
+            seconds[key] = smk_result.pop(key)
+        result['smk'] = smk_result
+    return result
+
+
+def run_benchmark_suite(scales=None, num_feats=100, mode='clustered',
+                        annots_per_name=3, num_queries=100, cfgdict=None,
+                        with_smk=True, out_fpath=None, workdir=None,
+                        seed=0, verbose=True):
+    r"""
+    Builds a synthetic database for each scale and benchmarks the pipeline
+    on it. Databases of the same parameters are reused from workdir.
+
+    Args:
+        scales (list): numbers of annotations (default [1000])
+        out_fpath (str): writes the results here as json if given
+
+    Returns:
+        dict: bench - environment metadata, parameters and one result per
+            scale
+
+    CommandLine:
+        python -m ibeis.algo.hots.tests.bench run_benchmark_suite --scales=1000,10000,100000 --out=bench.json
+        python -m ibeis.algo.hots.tests.bench run_benchmark_suite --scales=1000 --mode=random --num-feats=300
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> scales = ut.get_argval('--scales', type_=list, default=[1000])
+        >>> bench = run_benchmark_suite(
+        >>>     scales=[int(s) for s in scales],
+        >>>     num_feats=ut.get_argval('--num-feats', type_=int, default=100),
+        >>>     mode=ut.get_argval('--mode', type_=str, default='clustered'),
+        >>>     num_queries=ut.get_argval('--num-queries', type_=int, default=100),
+        >>>     out_fpath=ut.get_argval('--out', type_=str, default=None))
+        >>> print(ut.repr4(bench['results'], precision=3))
+    """
+    from os.path import exists, join
+    import ibeis
+    if scales is None:
+        scales = [1000]
+    if workdir is None:
+        workdir = ut.ensure_app_resource_dir('ibeis', 'bench_synthetic')
+    params = {
+        'scales': list(scales),
+        'num_feats': num_feats,
+        'mode': mode,
+        'annots_per_name': annots_per_name,
+        'num_queries': num_queries,
+        'cfgdict': cfgdict,
+        'with_smk': with_smk,
+        'seed': seed,
+    }
+    bench = {
+        'version': BENCH_FORMAT_VERSION,
+        'meta': get_environment_metadata(),
+        'params': params,
+        'results': [],
+    }
+    for num_annots in scales:
+        dbname = 'synth_%s_%d_%d_%d_%d' % (mode, num_annots, annots_per_name,
+                                           num_feats, seed)
+        dbdir = join(workdir, dbname)
+        if exists(join(dbdir, 'synthetic_params.json')):
+            ibs = ibeis.opendb(dbdir=dbdir)
+            make_db_seconds = None
+        else:
+            ut.delete(dbdir)
+            with ut.Timer(verbose=False) as timer:
+                ibs = make_synthetic_database(
+                    dbdir, num_annots, annots_per_name=annots_per_name,
+                    num_feats=num_feats, mode=mode, seed=seed,
+                    verbose=verbose)
+            make_db_seconds = timer.ellapsed
+        result = benchmark_synthetic_scale(
+            ibs, num_queries=num_queries, cfgdict=cfgdict,
+            with_smk=with_smk, seed=seed)
+        result['make_db_seconds'] = make_db_seconds
+        if verbose:
+            print('[bench] num_annots=%d seconds=%s' % (
+                num_annots, ut.repr4(result['seconds'], precision=4)))
+        bench['results'].append(result)
+    if out_fpath is not None:
+        ut.save_json(out_fpath, bench, pretty=True)
+        if verbose:
+            print('[bench] wrote %s' % (out_fpath,))
+    return bench
+
+
+def compare_benchmarks(old_bench, new_bench, threshold=.1, min_seconds=.01):
+    r"""
+    Compares the stage timings of two run_benchmark_suite results of the
+    same scales.
+
+    Args:
+        old_bench (dict or str): baseline results or a path to them
+        new_bench (dict or str): new results or a path to them
+        threshold (float): relative slowdown that counts as a regression
+        min_seconds (float): differences smaller than this are noise
+
+    Returns:
+        dict: report - one row per (scale, stage) and the rows that are
+            regressions or improvements
+
+    CommandLine:
+        python -m ibeis.algo.hots.tests.bench compare_benchmarks --old=bench_old.json --new=bench_new.json --threshold=.1
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> old_bench = {'results': [{'num_annots': 1000, 'num_queries': 10,
+        >>>     'seconds': {'nearest_neighbors': 1.0, 'scoring': 0.5,
+        >>>                 'spatial_verification': 2.0, 'save': .001}}]}
+        >>> new_bench = {'results': [{'num_annots': 1000, 'num_queries': 10,
+        >>>     'seconds': {'nearest_neighbors': 1.5, 'scoring': 0.3,
+        >>>                 'spatial_verification': 2.1, 'save': .005}}]}
+        >>> report = compare_benchmarks(old_bench, new_bench, threshold=.1)
+        >>> print(format_comparison(report))
+        >>> assert [row['stage'] for row in report['regressions']] == ['nearest_neighbors']
+        >>> assert [row['stage'] for row in report['improvements']] == ['scoring']
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.hots.tests.bench import *  # NOQA
+        >>> report = compare_benchmarks(
+        >>>     ut.get_argval('--old', type_=str),
+        >>>     ut.get_argval('--new', type_=str),
+        >>>     threshold=ut.get_argval('--threshold', type_=float, default=.1))
+        >>> print(format_comparison(report))
+        >>> assert len(report['regressions']) == 0, 'performance regressed'
+    """
+    if isinstance(old_bench, str):
+        old_bench = ut.load_json(old_bench)
+    if isinstance(new_bench, str):
+        new_bench = ut.load_json(new_bench)
+
+    def _key(result):
+        return (result['num_annots'], result['num_queries'])
+
+    old_results = {_key(result): result for result in old_bench['results']}
+    rows = []
+    missing = []
+    for new_result in new_bench['results']:
+        key = _key(new_result)
+        if key not in old_results:
+            missing.append(key)
+            continue
+        old_seconds = old_results[key]['seconds']
+        new_seconds = new_result['seconds']
+        for stage in sorted(set(old_seconds) & set(new_seconds)):
+            old, new = old_seconds[stage], new_seconds[stage]
+            if old is None or new is None:
+                continue
+            ratio = new / old if old > 0 else np.inf
+            if abs(new - old) < min_seconds:
+                status = 'same'
+            elif ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio < 1 / (1 + threshold):
+                status = 'improvement'
+            else:
+                status = 'same'
+            rows.append({
+                'num_annots': key[0], 'num_queries': key[1], 'stage': stage,
+                'old_seconds': old, 'new_seconds': new, 'ratio': ratio,
+                'status': status,
+            })
+    # Timings of databases made with other parameters are not comparable
+    old_params = old_bench.get('params', {})
+    new_params = new_bench.get('params', {})
+    params_differ = sorted(
+        key for key in set(old_params) | set(new_params)
+        if key != 'scales' and old_params.get(key) != new_params.get(key))
+    report = {
+        'threshold': threshold,
+        'params_differ': params_differ,
+        'rows': rows,
+        'regressions': [row for row in rows if row['status'] == 'regression'],
+        'improvements': [row for row in rows if row['status'] == 'improvement'],
+        'missing': missing,
+    }
+    return report
+
+
+def format_comparison(report):
+    """ Returns the rows of a compare_benchmarks report as a text table """
+    lines = ['%10s %28s %10s %10s %7s  %s' % (
+        'annots', 'stage', 'old', 'new', 'ratio', 'status')]
+    for row in report['rows']:
+        lines.append('%10d %28s %10.4f %10.4f %7.2f  %s' % (
+            row['num_annots'], row['stage'], row['old_seconds'],
+            row['new_seconds'], row['ratio'], row['status']))
+    lines.append('%d regressions (threshold %.0f%%), %d improvements' % (
+        len(report['regressions']), 100 * report['threshold'],
+        len(report['improvements'])))
+    for key in report['missing']:
+        lines.append('no baseline for num_annots=%d num_queries=%d' % key)
+    if report['params_differ']:
+        lines.append('warning: the runs differ in %s' % (
+            ', '.join(report['params_differ']),))
+    return '\n'.join(lines)
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+Packed storage for annotation features.
+
+The feat and featweight depcache tables keep keypoints, descriptors and
+weights as serialized numpy blobs in SQLite, so reading the features of many
+annotations decodes one blob per row. The packed store keeps a second copy
+of these arrays in append-only shard files, one group of shards per column,
+dtype and row shape, with a small SQLite index of
+
+    entry_key, colname -> shard, byte offset, number of rows
+
+Reads are zero-copy views into memory-mapped shards, and the arrays of
+annotations that were written together lie next to each other, so bulk
+readers get them back as a single contiguous range.
+
+Entries are keyed on the annotation visual uuid and the depcache config
+trail of the column (see get_feat_store_keys). The same key always refers to
+the same data, and stale entries are never returned when depcache rowids
+are reused. Shards are append-only. Replaced and deleted entries leave
+unused bytes behind until the store directory is removed.
+"""
+from __future__ import absolute_import, division, print_function
+from os.path import basename, exists, getsize, join
+import numpy as np
+import utool as ut
+(print, rrr, profile) = ut.inject2(__name__, '[feat_store]')
+
+
+FEAT_STORE_DNAME = 'featstore'
+FEAT_STORE_DB_FNAME = 'featstore.sqlite'
+FEAT_STORE_TABLE = 'packed_feats'
+
+# A new shard is started once the current one is this large
+SHARD_MAX_NBYTES = 2 ** 30
+
+# Packed column -> (depcache tablename, depcache colname)
+PACKED_COLUMNS = {
+    'kpts': ('feat', 'kpts'),
+    'vecs': ('feat', 'vecs'),
+    'fgweights': ('featweight', 'fwg'),
+}
+
+
+def get_shard_group(colname, dtype, row_shape):
+    """
+    Every shard holds rows of one column, dtype and row shape, so entries are
+    aligned and adjacent entries can be read as one array.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_feat_store import *  # NOQA
+        >>> print(get_shard_group('vecs', np.uint8, (128,)))
+        >>> print(get_shard_group('fgweights', np.float32, ()))
+        vecs.u1x128
+        fgweights.f4
+    """
+    dtype = np.dtype(dtype)
+    parts = [dtype.str.lstrip('<>|=')] + [str(dim) for dim in row_shape]
+    return '%s.%s' % (colname, 'x'.join(parts))
+
+
+class PackedFeatureStore(object):
+    """
+    Args:
+        dpath (str): directory of the shards and the index
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_feat_store import *  # NOQA
+        >>> dpath = ut.ensure_app_resource_dir('ibeis', 'feat_store_test')
+        >>> ut.delete(dpath)
+        >>> store = PackedFeatureStore(dpath)
+        >>> rng = np.random.RandomState(0)
+        >>> vecs_list = [rng.randint(0, 255, (num, 128)).astype(np.uint8)
+        >>>              for num in [3, 0, 5]]
+        >>> store.add('vecs', ['a', 'b', 'c'], vecs_list)
+        >>> stored_list = store.get('vecs', ['c', 'x', 'a'])
+        >>> assert stored_list[1] is None
+        >>> assert np.all(stored_list[0] == vecs_list[2])
+        >>> assert not stored_list[0].flags.writeable
+        >>> # Entries written together come back as one range
+        >>> stacked, num_list = store.get_concat('vecs', ['a', 'b', 'c'])
+        >>> assert num_list == [3, 0, 5] and stacked.base is not None
+        >>> assert np.all(stacked == np.vstack(vecs_list))
+        >>> # Out of order reads are copied
+        >>> stacked, num_list = store.get_concat('vecs', ['c', 'a'])
+        >>> assert np.all(stacked == np.vstack(vecs_list[::-1]))
+        >>> # Replacing an entry appends the new data
+        >>> store.add('vecs', ['a'], [vecs_list[2]])
+        >>> assert np.all(store.get('vecs', ['a'])[0] == vecs_list[2])
+        >>> store.delete('vecs', ['a'])
+        >>> assert store.get('vecs', ['a', 'c'])[0] is None
+        >>> store.close()
+        >>> ut.delete(dpath)
+    """
+
+    def __init__(store, dpath, shard_max_nbytes=SHARD_MAX_NBYTES):
+        import dtool_ibeis as dt
+        store.dpath = ut.ensuredir(dpath)
+        store.shard_max_nbytes = shard_max_nbytes
+        store.db = dt.SQLDatabaseController(
+            fpath=join(store.dpath, FEAT_STORE_DB_FNAME))
+        if not store.db.has_table(FEAT_STORE_TABLE):
+            store.db.add_table(FEAT_STORE_TABLE, (
+                ('entry_rowid',      'INTEGER PRIMARY KEY'),
+                ('entry_key',        'TEXT NOT NULL'),
+                ('colname',          'TEXT NOT NULL'),
+                ('shard_fname',      'TEXT NOT NULL'),
+                ('byte_offset',      'INTEGER NOT NULL'),
+                ('num_rows',         'INTEGER NOT NULL'),
+                ('dtype',            'TEXT NOT NULL'),
+                ('row_shape',        'TEXT NOT NULL'),
+            ), superkeys=[('entry_key', 'colname')],
+                docstr='Location of packed feature arrays in the shard files')
+        # Shard fname -> read-only memory map of the shard
+        store._mmap_dict = {}
+
+    def close(store):
+        store._mmap_dict.clear()
+        store.db.close()
+
+    def _cursor(store):
+        from ibeis.control import _sql_helpers
+        return _sql_helpers._get_cursor(store.db)
+
+    def _current_shard(store, group, nbytes):
+        """ Returns the fname of the shard the next nbytes are appended to """
+        fname_list = sorted(basename(fpath) for fpath in ut.glob(
+            store.dpath, '%s.*.bin' % (group, )))
+        if len(fname_list) > 0:
+            fname = fname_list[-1]
+            size = getsize(join(store.dpath, fname))
+            if size == 0 or size + nbytes <= store.shard_max_nbytes:
+                return fname
+            index = int(fname.split('.')[-2]) + 1
+        else:
+            index = 0
+        return '%s.%04d.bin' % (group, index)
+
+    def add(store, colname, key_list, array_list):
+        """
+        Appends arrays to the shards. The arrays of one call are written next
+        to each other in input order. Existing entries are replaced.
+        """
+        assert len(key_list) == len(array_list)
+        array_list = [np.ascontiguousarray(array) for array in array_list]
+        grouped = ut.group_items(
+            list(zip(key_list, array_list)),
+            [get_shard_group(colname, array.dtype, array.shape[1:])
+             for array in array_list])
+        row_list = []
+        for group, item_list in grouped.items():
+            nbytes = sum(array.nbytes for key, array in item_list)
+            shard_fname = store._current_shard(group, nbytes)
+            shard_fpath = join(store.dpath, shard_fname)
+            with open(shard_fpath, 'ab') as file_:
+                file_.seek(0, 2)
+                byte_offset = file_.tell()
+                for key, array in item_list:
+                    file_.write(array.tobytes())
+                    row_list.append((
+                        key, colname, shard_fname, byte_offset, len(array),
+                        array.dtype.str,
+                        ','.join(str(dim) for dim in array.shape[1:])))
+                    byte_offset += array.nbytes
+        connection, cur = store._cursor()
+        operation = '''
+            INSERT OR REPLACE INTO {tbl}
+            (entry_key, colname, shard_fname, byte_offset, num_rows, dtype,
+             row_shape)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            '''.format(tbl=FEAT_STORE_TABLE)
+        with connection:
+            cur.executemany(operation, row_list)
+
+    def lookup(store, colname, key_list):
+        """
+        Returns:
+            dict: entry key -> (shard_fname, byte_offset, num_rows, dtype,
+                row_shape) for the stored keys
+        """
+        from ibeis.control import _sql_helpers
+        _, cur = store._cursor()
+        entry_dict = {}
+        max_vars = _sql_helpers.SQLITE_MAX_VARS - 1
+        for chunk in ut.ichunks(list(set(key_list)), max_vars):
+            operation = '''
+                SELECT entry_key, shard_fname, byte_offset, num_rows, dtype,
+                       row_shape
+                FROM {tbl} WHERE colname = ? AND entry_key IN ({erotemes})
+                '''.format(tbl=FEAT_STORE_TABLE,
+                           erotemes=', '.join(['?'] * len(chunk)))
+            cur.execute(operation, [colname] + list(chunk))
+            for row in cur.fetchall():
+                key, shard_fname, byte_offset, num_rows, dtype, row_shape = row
+                row_shape = tuple(int(dim) for dim in row_shape.split(',') if dim)
+                entry_dict[key] = (shard_fname, byte_offset, num_rows,
+                                   np.dtype(dtype), row_shape)
+        return entry_dict
+
+    def _shard_mmap(store, shard_fname, stop):
+        mmap = store._mmap_dict.get(shard_fname, None)
+        if mmap is None or len(mmap) < stop:
+            # The shard grew since it was mapped
+            shard_fpath = join(store.dpath, shard_fname)
+            mmap = np.memmap(shard_fpath, dtype=np.uint8, mode='r')
+            store._mmap_dict[shard_fname] = mmap
+        return mmap
+
+    def _view(store, shard_fname, byte_offset, num_rows, dtype, row_shape):
+        row_nbytes = dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))
+        stop = byte_offset + num_rows * row_nbytes
+        if num_rows == 0:
+            return np.empty((0, ) + row_shape, dtype=dtype)
+        mmap = store._shard_mmap(shard_fname, stop)
+        flat = mmap[byte_offset:stop].view(np.ndarray)
+        return flat.view(dtype).reshape((num_rows, ) + row_shape)
+
+    def get(store, colname, key_list):
+        """
+        Returns:
+            list: read-only array views into the shards, None for missing keys
+        """
+        entry_dict = store.lookup(colname, key_list)
+        array_list = [
+            None if key not in entry_dict else store._view(*entry_dict[key])
+            for key in key_list
+        ]
+        return array_list
+
+    def get_concat(store, colname, key_list):
+        """
+        Returns the arrays of all keys stacked in one array. If the entries
+        are adjacent in one shard (e.g. written by the same add call) this is
+        a view of the range, otherwise the arrays are copied once.
+
+        Returns:
+            tuple: (stacked, num_rows_list) or (None, None) if a key is
+                missing
+        """
+        entry_dict = store.lookup(colname, key_list)
+        if any(key not in entry_dict for key in key_list):
+            return None, None
+        entry_list = [entry_dict[key] for key in key_list]
+        num_rows_list = [entry[2] for entry in entry_list]
+        if len(entry_list) == 0:
+            return None, num_rows_list
+        shard_fname, byte_offset, _, dtype, row_shape = entry_list[0]
+        row_nbytes = dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))
+        is_range = True
+        expected_offset = byte_offset
+        for entry in entry_list:
+            if (entry[0] != shard_fname or entry[1] != expected_offset or
+                    entry[3] != dtype or entry[4] != row_shape):
+                is_range = False
+                break
+            expected_offset += entry[2] * row_nbytes
+        if is_range:
+            stacked = store._view(shard_fname, byte_offset, sum(num_rows_list),
+                                  dtype, row_shape)
+        else:
+            stacked = np.concatenate([store._view(*entry) for entry in entry_list])
+        return stacked, num_rows_list
+
+    def delete(store, colname, key_list):
+        """ Removes the index entries of the keys """
+        from ibeis.control import _sql_helpers
+        connection, cur = store._cursor()
+        max_vars = _sql_helpers.SQLITE_MAX_VARS - 1
+        with connection:
+            for chunk in ut.ichunks(list(set(key_list)), max_vars):
+                operation = '''
+                    DELETE FROM {tbl}
+                    WHERE colname = ? AND entry_key IN ({erotemes})
+                    '''.format(tbl=FEAT_STORE_TABLE,
+                               erotemes=', '.join(['?'] * len(chunk)))
+                cur.execute(operation, [colname] + list(chunk))
+
+
+def get_feat_store(ibs):
+    """ Returns the packed feature store in the cache directory of ibs """
+    store = getattr(ibs, '_feat_store', None)
+    if store is None:
+        dpath = join(ibs.get_cachedir(), FEAT_STORE_DNAME)
+        store = PackedFeatureStore(dpath)
+        ibs._feat_store = store
+    return store
+
+
+def get_feat_store_keys(ibs, aid_list, colname, config2_=None):
+    r"""
+    Returns the store keys of a packed column of the annotations.
+
+    The key hashes the annotation visual uuid (image, verts and theta) and
+    the depcache config trail of the column (chip, feature, ... configs).
+    Feature weights also depend on the species through the probchip.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_feat_store import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> aid_list = ibs.get_valid_aids()[0:2]
+        >>> key_list1 = get_feat_store_keys(ibs, aid_list, 'vecs')
+        >>> key_list2 = get_feat_store_keys(ibs, aid_list, 'vecs', {'dim_size': 450})
+        >>> key_list3 = get_feat_store_keys(ibs, aid_list, 'kpts')
+        >>> assert len(set(key_list1 + key_list2 + key_list3)) == 6
+    """
+    tablename, depc_colname = PACKED_COLUMNS[colname]
+    trail = ibs.depc_annot.get_config_trail_str(tablename, config2_)
+    visual_uuid_list = ibs.get_annot_visual_uuids(aid_list)
+    if tablename == 'featweight':
+        extra_list = ibs.get_annot_species_texts(aid_list)
+    else:
+        extra_list = [None] * len(aid_list)
+    key_list = [
+        ut.hashstr27(repr((str(visual_uuid), colname, trail, extra)))
+        for visual_uuid, extra in zip(visual_uuid_list, extra_list)
+    ]
+    return key_list
+
+
+def get_packed_feats(ibs, aid_list, colname, config2_=None, concat=False):
+    r"""
+    Reads a packed column of the annotations, adding missing entries to the
+    store from the depcache first (which computes them if needed).
+
+    Args:
+        colname (str): 'kpts', 'vecs' or 'fgweights'
+        concat (bool): if True return (stacked, num_rows_list) instead of one
+            array per annotation
+
+    Returns:
+        list: read-only array views (or a tuple if concat is True)
+    """
+    store = get_feat_store(ibs)
+    key_list = get_feat_store_keys(ibs, aid_list, colname, config2_)
+    entry_dict = store.lookup(colname, key_list)
+    miss_idxs = [idx for idx, key in enumerate(key_list) if key not in entry_dict]
+    if len(miss_idxs) > 0:
+        tablename, depc_colname = PACKED_COLUMNS[colname]
+        miss_aids = ut.take(aid_list, miss_idxs)
+        miss_keys = ut.take(key_list, miss_idxs)
+        array_list = ibs.depc_annot.get(tablename, miss_aids, depc_colname,
+                                        config=config2_)
+        # Duplicate aids share an entry
+        unique_idxs = ut.unique_indices(miss_keys)
+        store.add(colname, ut.take(miss_keys, unique_idxs),
+                  ut.take(array_list, unique_idxs))
+    if concat:
+        return store.get_concat(colname, key_list)
+    return store.get(colname, key_list)
+
+
+def benchmark_packed_feats(ibs, aid_list=None, config2_=None):
+    r"""
+    Compares reading kpts and vecs from the depcache and the packed store.
+
+    Returns:
+        dict: seconds per reader
+
+    CommandLine:
+        python -m ibeis.algo.preproc.preproc_feat_store benchmark_packed_feats --db PZ_MTEST
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_feat_store import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb(defaultdb='PZ_MTEST')
+        >>> result = benchmark_packed_feats(ibs)
+        >>> print(ut.repr4(result, precision=3))
+    """
+    import time
+    if aid_list is None:
+        aid_list = ibs.get_valid_aids()
+    depc = ibs.depc_annot
+    # Compute and pack everything before timing
+    for colname in ['kpts', 'vecs']:
+        get_packed_feats(ibs, aid_list, colname, config2_)
+    result = {'num_annots': len(aid_list)}
+    start = time.time()
+    for colname in ['kpts', 'vecs']:
+        depc.get('feat', aid_list, colname, config=config2_)
+    result['depcache_seconds'] = time.time() - start
+    start = time.time()
+    for colname in ['kpts', 'vecs']:
+        for array in get_packed_feats(ibs, aid_list, colname, config2_):
+            # Touch the pages
+            array.sum()
+    result['packed_seconds'] = time.time() - start
+    start = time.time()
+    for colname in ['kpts', 'vecs']:
+        get_packed_feats(ibs, aid_list, colname, config2_, concat=True)[0].sum()
+    result['packed_concat_seconds'] = time.time() - start
+    return result
+
+
+def remove_feat_store(ibs):
+    """ Deletes the packed feature store of ibs """
+    store = getattr(ibs, '_feat_store', None)
+    if store is not None:
+        store.close()
+        ibs._feat_store = None
+    dpath = join(ibs.get_cachedir(), FEAT_STORE_DNAME)
+    if exists(dpath):
+        ut.delete(dpath)
+
+
+if __name__ == '__main__':
+    """
+    CommandLine:
+        python -m ibeis.algo.preproc.preproc_feat_store --allexamples
+    """
+    import multiprocessing
+    multiprocessing.freeze_support()  # for win32
+    import xdoctest
+    xdoctest.doctest_module(__file__)
@@ -141,6 +141,186 @@ def parse_imageinfo(gpath):
     return param_tup
 
 
+def parse_imageinfo_indexed(index, gpath):
+    """ Worker function: keeps track of the input index for unordered pools """
+    return index, parse_imageinfo(gpath)
+
+
+# Number of concurrent image readers per storage type. Spinning disks
+# thrash when many processes seek at once, so they get a small pool.
+READER_POOL_SIZES = {
+    'hdd': 2,
+    'ssd': None,  # one reader per cpu
+}
+
+
+def get_reader_pool_size(storage=None):
+    r"""
+    Args:
+        storage (str): 'hdd' or 'ssd'. Defaults to the --ingest-storage flag
+            (or 'ssd' when it is not given)
+
+    Returns:
+        int: nprocs - number of parallel image readers
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_image import *  # NOQA
+        >>> print(get_reader_pool_size('hdd'))
+        >>> assert get_reader_pool_size('ssd') == ut.num_cpus()
+        2
+    """
+    if storage is None:
+        storage = ut.get_argval('--ingest-storage', type_=str, default='ssd')
+    nprocs = READER_POOL_SIZES[storage]
+    if nprocs is None:
+        nprocs = ut.num_cpus()
+    return nprocs
+
+
+# Orientations that swap the width and height of the image
+TRANSPOSED_ORIENTS = {6, 8}
+
+# EXIF orientations (undefined and normal) that do not rotate the image
+UNROTATED_ORIENTS = {0, 1}
+
+
+def imread_reduced(gpath, orient=False, dsize_func=None):
+    r"""
+    Reads an image that is going to be resized.
+
+    JPEG files are decoded with DCT-domain downscaling (PIL draft mode) by
+    the largest factor of 1/2, 1/4 or 1/8 that keeps the decoded image at
+    least as large as the target size. Other files and remote paths are read
+    at full resolution with vt.imread.
+
+    Args:
+        gpath (str): image path
+        orient (int or bool): orientation, as passed to vt.imread
+        dsize_func (callable): maps the full resolution (w, h) of the image
+            after orientation to the (w, h) it will be resized to. If None
+            the image is read at full resolution.
+
+    Returns:
+        tuple: (img, img_size) where img_size is the full resolution (w, h)
+            after orientation
+
+    CommandLine:
+        python -m ibeis.algo.preproc.preproc_image imread_reduced
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_image import *  # NOQA
+        >>> import vtool_ibeis as vt
+        >>> import numpy as np
+        >>> from os.path import join
+        >>> dpath = ut.ensure_app_resource_dir('ibeis', 'imread_reduced_test')
+        >>> gpath = join(dpath, 'synthetic.jpg')
+        >>> rng = np.random.RandomState(0)
+        >>> vt.imwrite(gpath, (rng.rand(900, 1200, 3) * 255).astype(np.uint8))
+        >>> img, img_size = imread_reduced(gpath, 0, lambda size: (250, 180))
+        >>> img_full, img_size_full = imread_reduced(gpath, 0)
+        >>> result = (img_size, img.shape, img_size_full, img_full.shape)
+        >>> print(result)
+        ((1200, 900), (225, 300, 3), (1200, 900), (900, 1200, 3))
+    """
+    import vtool_ibeis as vt
+    from PIL import Image
+    is_remote = gpath.startswith(('http://', 'https://', 's3://'))
+    if (dsize_func is not None and not is_remote and
+            get_standard_ext(gpath) == '.jpg'):
+        with Image.open(gpath) as pil_img:
+            pil_orient = None
+            if pil_img.format == 'JPEG':
+                exif_dict = vtexif.get_exif_dict(pil_img)
+                exif_orient = vtexif.get_orientation(exif_dict, on_error='warn')
+                if orient in ['auto', 'on', True]:
+                    pil_orient = exif_orient
+                elif exif_orient in UNROTATED_ORIENTS:
+                    # Otherwise vt.imread decodes with opencv, which applies
+                    # the EXIF rotation in addition to the given orientation
+                    pil_orient = orient
+            if pil_orient is not None:
+                raw_w, raw_h = pil_img.size
+                if pil_orient in TRANSPOSED_ORIENTS:
+                    img_size = (raw_h, raw_w)
+                else:
+                    img_size = (raw_w, raw_h)
+                dsize_w, dsize_h = dsize_func(img_size)
+                if pil_orient in TRANSPOSED_ORIENTS:
+                    dsize_w, dsize_h = dsize_h, dsize_w
+                pil_img.draft('RGB', (int(dsize_w), int(dsize_h)))
+                # Same conversion and orientation fix as vt.imread
+                img = vt.image._fix_orient_pil_img(pil_img, orient=pil_orient)
+                return img, img_size
+    img = vt.imread(gpath, orient=orient)
+    img_size = (img.shape[1], img.shape[0])
+    return img, img_size
+
+
+def benchmark_reduced_decode(num_images=8, image_size=(6000, 4000),
+                             thumbsize=800, quality=90):
+    r"""
+    Measures the thumbnail throughput of full and reduced JPEG decoding on
+    synthetic images.
+
+    Args:
+        num_images (int): number of synthetic JPEGs
+        image_size (tuple): (w, h) of the synthetic JPEGs
+        thumbsize (int): maximum thumbnail dimension
+        quality (int): JPEG quality
+
+    Returns:
+        dict: images per second for each decode mode and the speedup
+
+    CommandLine:
+        python -m ibeis.algo.preproc.preproc_image benchmark_reduced_decode
+        python -m ibeis.algo.preproc.preproc_image benchmark_reduced_decode --num-images=32
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_image import *  # NOQA
+        >>> num_images = ut.get_argval('--num-images', type_=int, default=8)
+        >>> result = benchmark_reduced_decode(num_images=num_images)
+        >>> print(ut.repr4(result, precision=2))
+    """
+    import time
+    import cv2
+    import numpy as np
+    import vtool_ibeis as vt
+    from os.path import join
+    dpath = ut.ensure_app_resource_dir('ibeis', 'benchmark_reduced_decode')
+    rng = np.random.RandomState(0)
+    width, height = image_size
+    gpath_list = []
+    for index in range(num_images):
+        gpath = join(dpath, 'synthetic_%dx%d_%03d.jpg' % (width, height, index))
+        if not os.path.exists(gpath):
+            # Smooth noise compresses like a natural image
+            small = (rng.rand(height // 16, width // 16, 3) * 255).astype(np.uint8)
+            img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+            cv2.imwrite(gpath, img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        gpath_list.append(gpath)
+
+    def dsize_func(img_size):
+        max_dsize = (thumbsize, thumbsize)
+        return vt.resized_clamped_thumb_dims(img_size, max_dsize)[0]
+
+    result = {}
+    for mode in ['full', 'reduced']:
+        start = time.time()
+        for gpath in gpath_list:
+            img, img_size = imread_reduced(
+                gpath, orient=0,
+                dsize_func=None if mode == 'full' else dsize_func)
+            vt.resize(img, dsize_func(img_size))
+        duration = time.time() - start
+        result['%s_images_per_second' % (mode, )] = num_images / duration
+    result['speedup'] = (result['reduced_images_per_second'] /
+                         result['full_images_per_second'])
+    return result
+
+
 def on_delete(ibs, featweight_rowid_list, qreq_=None):
     print('Warning: Not Implemented')
 
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction of localization chips and masks.
+
+The chips of a localization are extracted one image at a time. Each worker
+decodes its image from disk, so images are decoded in parallel by a bounded
+pool of readers (see preproc_image.get_reader_pool_size) instead of being
+decoded serially in the parent process. Images without boxes are never
+decoded.
+
+When every box of an image covers at least k times the target chip size, a
+JPEG can be decoded directly at 1/k of its resolution (DCT scaling), which is
+several times faster than a full decode. This changes the chip pixels
+slightly, so it is opt-in.
+
+Extracted chips can be kept in a chip store in the cache directory, keyed on
+the image, box, rotation, chip size and extraction mode, so different
+classifier configurations over the same localizations reuse the same crops.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from os.path import join
+import numpy as np
+import utool as ut
+import vtool_ibeis as vt
+(print, rrr, profile) = ut.inject2(__name__)
+
+
+CHIP_STORE_DB_FNAME = 'localization_chip_store.sqlite3'
+CHIP_STORE_TABLE = 'localization_chips'
+
+def get_reduced_decode_dsize(img_size, region_size_list, target_size):
+    r"""
+    Args:
+        img_size (tuple): full resolution (w, h) of the image
+        region_size_list (list): (w, h) of every image region that is resized
+            to target_size
+        target_size (tuple): (w, h) of the chips
+
+    Returns:
+        tuple: dsize - the smallest (w, h) the image can be decoded at such
+            that every region is still at least target_size
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_localization_chip import *  # NOQA
+        >>> size_list = [(600, 500), (300, 1000)]
+        >>> dsize1 = get_reduced_decode_dsize((2000, 1500), size_list, (128, 128))
+        >>> dsize2 = get_reduced_decode_dsize((2000, 1500), size_list, (512, 512))
+        >>> dsize3 = get_reduced_decode_dsize((2000, 1500), [], (128, 128))
+        >>> result = (dsize1, dsize2, dsize3)
+        >>> print(result)
+        ((854, 640), (2000, 1500), (2000, 1500))
+    """
+    if len(region_size_list) == 0:
+        return tuple(img_size)
+    region_size_arr = np.array(region_size_list, dtype=np.float64)
+    min_ratio = min(
+        (region_size_arr[:, 0] / target_size[0]).min(),
+        (region_size_arr[:, 1] / target_size[1]).min(),
+    )
+    min_ratio = max(min_ratio, 1.0)
+    width, height = img_size
+    return (int(np.ceil(width / min_ratio)), int(np.ceil(height / min_ratio)))
+
+
+def read_localization_image(gpath, orient, region_size_list, target_size,
+                            decode_reduce=False):
+    """
+    Returns:
+        tuple: (img, scale) where scale is the (x, y) factor from original
+            image coordinates to img coordinates
+    """
+    from ibeis.algo.preproc import preproc_image
+    if decode_reduce:
+        def dsize_func(img_size):
+            return get_reduced_decode_dsize(img_size, region_size_list,
+                                            target_size)
+        img, img_size = preproc_image.imread_reduced(gpath, orient=orient,
+                                                     dsize_func=dsize_func)
+        width, height = img_size
+        scale = (img.shape[1] / width, img.shape[0] / height)
+        return img, scale
+    img = vt.imread(gpath, orient=orient)
+    return img, (1.0, 1.0)
+
+
+def _scale_bbox_list(bbox_list, scale):
+    if scale == (1.0, 1.0):
+        return bbox_list
+    sx, sy = scale
+    return [
+        (x * sx, y * sy, w * sx, h * sy)
+        for (x, y, w, h) in bbox_list
+    ]
+
+
+def extract_localization_chips_worker(gid, gpath, orient, image_size,
+                                      bbox_list, theta_list, target_size,
+                                      masking=False, decode_reduce=False):
+    """
+    Worker function: decodes one image and extracts all of its chips
+
+    Returns:
+        tuple: (gid, chip_list)
+    """
+    from ibeis.core_images import (get_localization_chips_worker,
+                                   get_localization_masks_worker)
+    if len(bbox_list) == 0:
+        return gid, []
+    if masking:
+        # Masks resize the whole image to the target size
+        region_size_list = [image_size]
+        worker_func = get_localization_masks_worker
+    else:
+        region_size_list = [bbox[2:4] for bbox in bbox_list]
+        worker_func = get_localization_chips_worker
+    img, scale = read_localization_image(gpath, orient, region_size_list,
+                                         target_size,
+                                         decode_reduce=decode_reduce)
+    bbox_list = _scale_bbox_list(bbox_list, scale)
+    _, chip_list = worker_func(gid, img, bbox_list, theta_list, target_size)
+    return gid, chip_list
+
+
+def get_chip_store_db(ibs):
+    """
+    Returns the sqlite database of previously extracted localization chips
+    """
+    import dtool_ibeis as dt
+    fpath = join(ibs.get_cachedir(), CHIP_STORE_DB_FNAME)
+    db = dt.SQLDatabaseController(fpath=fpath)
+    if not db.has_table(CHIP_STORE_TABLE):
+        db.add_table(CHIP_STORE_TABLE, (
+            ('chip_rowid',       'INTEGER PRIMARY KEY'),
+            ('chip_key',         'TEXT NOT NULL'),
+            ('image_rowid',      'INTEGER'),
+            ('chip_shape',       'TEXT'),
+            ('chip_data',        'BLOB'),
+        ), superkeys=[('chip_key',)],
+            docstr='Localization chips keyed on image, box, theta and size')
+    return db
+
+
+def get_chip_store_keys(image_uuid, bbox_list, theta_list, target_size,
+                        masking=False, decode_reduce=False):
+    r"""
+    Returns:
+        list: chip_key_list - one key per box
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_localization_chip import *  # NOQA
+        >>> import uuid
+        >>> image_uuid = uuid.UUID(int=0)
+        >>> bbox_list = np.array([[0, 0, 10, 10], [1, 1, 10, 10]], dtype=np.float32)
+        >>> key_list1 = get_chip_store_keys(image_uuid, bbox_list, [0.0, 0.0], (128, 128))
+        >>> key_list2 = get_chip_store_keys(image_uuid, bbox_list.tolist(), [0, 0], [128, 128])
+        >>> key_list3 = get_chip_store_keys(image_uuid, bbox_list, [0.0, 0.0], (64, 64))
+        >>> assert key_list1 == key_list2
+        >>> assert len(set(key_list1 + key_list3)) == 4
+    """
+    # Normalize the types so the same box always has the same key
+    mode = (tuple(int(val) for val in target_size), bool(masking),
+            bool(decode_reduce))
+    chip_key_list = [
+        ut.hashstr27(repr((
+            str(image_uuid),
+            tuple(float(val) for val in bbox),
+            float(theta),
+            mode,
+        )))
+        for bbox, theta in zip(bbox_list, theta_list)
+    ]
+    return chip_key_list
+
+
+def read_chip_store(db, chip_key_list):
+    """ Returns a dict from chip key to chip for the stored keys """
+    from ibeis.control import _sql_helpers
+    _, cur = _sql_helpers._get_cursor(db)
+    chip_dict = {}
+    for chunk in ut.ichunks(chip_key_list, _sql_helpers.SQLITE_MAX_VARS):
+        operation = '''
+            SELECT chip_key, chip_shape, chip_data
+            FROM {tbl} WHERE chip_key IN ({erotemes})
+            '''.format(tbl=CHIP_STORE_TABLE,
+                       erotemes=', '.join(['?'] * len(chunk)))
+        cur.execute(operation, chunk)
+        for chip_key, chip_shape, chip_data in cur.fetchall():
+            shape = tuple(int(val) for val in chip_shape.split(','))
+            chip = np.frombuffer(bytearray(chip_data), dtype=np.uint8)
+            chip_dict[chip_key] = chip.reshape(shape)
+    return chip_dict
+
+
+def write_chip_store(db, chip_rows):
+    """
+    Args:
+        chip_rows (list): tuples of (chip_key, gid, chip)
+    """
+    from ibeis.control import _sql_helpers
+    if len(chip_rows) == 0:
+        return
+    connection, cur = _sql_helpers._get_cursor(db)
+    operation = '''
+        INSERT OR REPLACE INTO {tbl}
+        (chip_key, image_rowid, chip_shape, chip_data)
+        VALUES (?, ?, ?, ?)
+        '''.format(tbl=CHIP_STORE_TABLE)
+    params_iter = (
+        (chip_key, gid, ','.join(map(str, chip.shape)),
+         np.ascontiguousarray(chip, dtype=np.uint8).tobytes())
+        for chip_key, gid, chip in chip_rows
+    )
+    with connection:
+        cur.executemany(operation, params_iter)
+
+
+def extract_localization_chips(ibs, gid_list, bboxes_list, thetas_list,
+                               target_size, masking=False,
+                               decode_reduce=False, use_store=False,
+                               nprocs=None):
+    r"""
+    Extracts the localization chips (or masks) of many images.
+
+    Args:
+        ibs (IBEISController):
+        gid_list (list): image rowid of each localization
+        bboxes_list (list): boxes of each localization
+        thetas_list (list): box rotations of each localization
+        target_size (tuple): (w, h) of the chips
+        masking (bool): extract masks (whole image with the box filled)
+            instead of chips
+        decode_reduce (bool): decode JPEGs at reduced resolution when the
+            boxes are large enough
+        use_store (bool): reuse and save chips in the chip store
+        nprocs (int): number of parallel image readers. Defaults to
+            preproc_image.get_reader_pool_size()
+
+    Returns:
+        list: chips_list - list of chips for each localization
+
+    CommandLine:
+        python -m ibeis.algo.preproc.preproc_localization_chip extract_localization_chips
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.preproc.preproc_localization_chip import *  # NOQA
+        >>> from ibeis.core_images import get_localization_chips_worker
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()[0:3]
+        >>> bboxes_list = [np.array([[10, 20, 150, 100], [0, 0, 60, 60]], dtype=np.float32)] * 3
+        >>> thetas_list = [np.array([0.0, 0.3], dtype=np.float32)] * 3
+        >>> chips_list = extract_localization_chips(
+        >>>     ibs, gid_list, bboxes_list, thetas_list, (32, 32), use_store=True)
+        >>> stored_list = extract_localization_chips(
+        >>>     ibs, gid_list, bboxes_list, thetas_list, (32, 32), use_store=True)
+        >>> img = ibs.get_images(gid_list[0])
+        >>> _, chip_list = get_localization_chips_worker(
+        >>>     gid_list[0], img, bboxes_list[0], thetas_list[0], (32, 32))
+        >>> assert all(np.all(chip1 == chip2) for chip1, chip2 in zip(chip_list, chips_list[0]))
+        >>> assert all(np.all(chip1 == chip2) for chip1, chip2 in zip(chip_list, stored_list[0]))
+    """
+    from ibeis.algo.preproc import preproc_image
+    target_size = tuple(target_size)
+    chips_list = [[None] * len(bbox_list) for bbox_list in bboxes_list]
+
+    key_list_list = None
+    if use_store:
+        db = get_chip_store_db(ibs)
+        image_uuid_list = ibs.get_image_uuids(gid_list)
+        key_list_list = [
+            get_chip_store_keys(image_uuid, bbox_list, theta_list, target_size,
+                                masking=masking, decode_reduce=decode_reduce)
+            for image_uuid, bbox_list, theta_list in
+            zip(image_uuid_list, bboxes_list, thetas_list)
+        ]
+        chip_dict = read_chip_store(db, ut.flatten(key_list_list))
+        for chip_list, key_list in zip(chips_list, key_list_list):
+            for index, chip_key in enumerate(key_list):
+                chip_list[index] = chip_dict.get(chip_key, None)
+
+    # Only images with a missing chip are decoded
+    index_list = [
+        index for index, chip_list in enumerate(chips_list)
+        if any(chip is None for chip in chip_list)
+    ]
+    if len(index_list) > 0:
+        gid_list_ = ut.take(gid_list, index_list)
+        gpath_list = ibs.get_image_paths(gid_list_)
+        orient_list = ibs.get_image_orientation(gid_list_)
+        size_list = ibs.get_image_sizes(gid_list_)
+        if nprocs is None:
+            nprocs = preproc_image.get_reader_pool_size()
+        args_list = [
+            (gid, gpath, orient, image_size, bboxes_list[index],
+             thetas_list[index], target_size, masking, decode_reduce)
+            for index, gid, gpath, orient, image_size in
+            zip(index_list, gid_list_, gpath_list, orient_list, size_list)
+        ]
+        result_iter = ut.generate2(extract_localization_chips_worker,
+                                   args_list, nTasks=len(args_list),
+                                   ordered=True, nprocs=nprocs,
+                                   force_serial=ibs.force_serial)
+        chip_rows = []
+        for index, (gid, chip_list) in zip(index_list, result_iter):
+            chips_list[index] = chip_list
+            if key_list_list is not None:
+                chip_rows.extend(
+                    (chip_key, gid, chip)
+                    for chip_key, chip in zip(key_list_list[index], chip_list)
+                )
+        if use_store:
+            write_chip_store(db, chip_rows)
+    return chips_list
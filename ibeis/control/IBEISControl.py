@@ -62,6 +62,7 @@ AUTOLOAD_PLUGIN_MODNAMES = [
     'ibeis.other.detectfuncs',
     'ibeis.other.detectcore',
     'ibeis.other.detecttrain',
+    'ibeis.other.integrity',
     'ibeis.init.filter_annots',
     'ibeis.control.manual_featweight_funcs',
     'ibeis.control._autogen_party_funcs',
@@ -311,6 +312,14 @@ class IBEISController(BASE_CLASS):
         # by default use serial because warpAffine is weird with multiproc
         ibs._parallel_chips = False
 
+        # Serve kpts, vecs and fgweights from memory mapped shards
+        # (see preproc_feat_store)
+        ibs._packed_feats = ut.get_argflag('--packed-feats')
+        ibs._feat_store = None
+
+        # Warm query requests of query_chips (see query_service)
+        ibs._query_services = None
+
         ibs.containerized = ut.get_argflag('--containerized')
         if ibs.containerized:
             print('[ibs.__init__] CONTAINERIZED: True\n')
@@ -399,6 +408,31 @@ class IBEISController(BASE_CLASS):
             total_size_str + ut.indentjoin(table_size_str_list, '\n  * '))
         return cachestats_str
 
+    @register_api('/api/core/cache/stats/', methods=['GET'], __api_plural_check__=False)
+    def get_table_cache_stats(ibs):
+        """
+        Returns the size, hit, miss, and eviction counters of each cached
+        (table, column) getter.
+
+        Getters are cached unless the process is started with
+        ``--noapi-cache`` (see accessor_decors.API_CACHE), in which case
+        nothing is cached and this returns an empty dict.
+
+        RESTful:
+            Method: GET
+            URL:    /api/core/cache/stats/
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from ibeis.control.IBEISControl import *  # NOQA
+            >>> import ibeis
+            >>> ibs = ibeis.opendb('testdb1')
+            >>> ibs.get_species_texts(ibs.get_valid_species_rowids())
+            >>> stats = ibs.get_table_cache_stats()
+            >>> assert isinstance(stats, dict)
+        """
+        return ibs.table_cache.stats()
+
     def print_cachestats_str(ibs):
         cachestats_str = ibs.get_cachestats_str()
         print('IBEIS Controller Cache Stats:')
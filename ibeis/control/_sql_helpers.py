@@ -87,6 +87,317 @@ def fix_metadata_consistency(db):
         db.set_metadata_val(key, val)
 
 
+# ======================
+# Bulk Request Functions
+# ======================
+
+
+# SQLite compiles with SQLITE_MAX_VARIABLE_NUMBER=999 on older builds
+SQLITE_MAX_VARS = 900
+
+
+def _get_cursor(db):
+    """
+    Returns a (connection, cursor) pair that is valid in the calling thread
+    """
+    import sqlite3 as lite
+    connection = db.connection
+    try:
+        cur = connection.cursor()
+    except lite.ProgrammingError:
+        # Get connection for new thread
+        connection = db.thread_connection()
+        cur = connection.cursor()
+    return connection, cur
+
+
+def get_rowids_where_in(db, tblname, colname, value_list,
+                        chunksize=SQLITE_MAX_VARS):
+    r"""
+    Resolves a column of superkey values to rowids with one ``IN`` statement
+    per chunk instead of one ``SELECT`` per value.
+
+    Args:
+        db (SQLDatabaseController):
+        tblname (str): table to search
+        colname (str): unique column to match values against
+        value_list (list): values to lookup (None values are allowed)
+        chunksize (int): maximum number of bound variables per statement
+
+    Returns:
+        list: rowid_list - the rowid of each value or None if it does not exist
+
+    CommandLine:
+        python -m ibeis.control._sql_helpers get_rowids_where_in
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control._sql_helpers import *  # NOQA
+        >>> import dtool_ibeis as dt
+        >>> db = dt.SQLDatabaseController(sqldb_fname=':memory:')
+        >>> db.add_table('dummy', (
+        >>>     ('dummy_rowid', 'INTEGER PRIMARY KEY'),
+        >>>     ('dummy_key',   'TEXT'),
+        >>> ), superkeys=[('dummy_key',)], docstr='')
+        >>> rowids = bulk_add(db, 'dummy', ('dummy_key',), [('a',), ('b',)])
+        >>> result = get_rowids_where_in(db, 'dummy', 'dummy_key',
+        >>>                              ['b', None, 'c', 'a', 'b'], chunksize=2)
+        >>> print(result)
+        [2, None, None, 1, 2]
+    """
+    value_list = list(value_list)
+    unique_values = [val for val in ut.unique(value_list) if val is not None]
+    _, cur = _get_cursor(db)
+    value_to_rowid = {}
+    for chunk in ut.ichunks(unique_values, chunksize):
+        operation = 'SELECT {colname}, rowid FROM {tblname} WHERE {colname} IN ({erotemes})'.format(
+            colname=colname, tblname=tblname,
+            erotemes=', '.join(['?'] * len(chunk)))
+        cur.execute(operation, chunk)
+        value_to_rowid.update(cur.fetchall())
+    rowid_list = [value_to_rowid.get(val, None) for val in value_list]
+    return rowid_list
+
+
+def bulk_add(db, tblname, colnames, params_list, superkey_colname=None,
+             superkey_paramx=0):
+    r"""
+    Bulk version of :func:`SQLDatabaseController.add_cleanly`.
+
+    Existing rows are resolved with :func:`get_rowids_where_in` and all new
+    rows are written with a single ``cursor.executemany`` call inside one
+    transaction. Either every new row is written or none are.
+
+    Args:
+        db (SQLDatabaseController):
+        tblname (str): table name to add into
+        colnames (tuple): columns whose values are specified in params_list
+        params_list (list): list of tuples (or None) where each tuple
+            corresponds to a row
+        superkey_colname (str): unique column used to detect existing rows.
+            Defaults to ``colnames[superkey_paramx]``
+        superkey_paramx (int): index of the superkey in each tuple
+
+    Returns:
+        list: rowid_list - newly added or previously added rowids. None
+            inputs produce None outputs.
+
+    CommandLine:
+        python -m ibeis.control._sql_helpers bulk_add
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control._sql_helpers import *  # NOQA
+        >>> import dtool_ibeis as dt
+        >>> db = dt.SQLDatabaseController(sqldb_fname=':memory:')
+        >>> db.add_table('dummy', (
+        >>>     ('dummy_rowid', 'INTEGER PRIMARY KEY'),
+        >>>     ('dummy_key',   'TEXT'),
+        >>>     ('dummy_val',   'INTEGER'),
+        >>> ), superkeys=[('dummy_key',)], docstr='')
+        >>> colnames = ('dummy_key', 'dummy_val')
+        >>> rowids1 = bulk_add(db, 'dummy', colnames, [('a', 1), ('b', 2)])
+        >>> rowids2 = bulk_add(db, 'dummy', colnames,
+        >>>                    [('c', 3), None, ('a', 4), ('c', 3)])
+        >>> result = ut.repr2((rowids1, rowids2))
+        >>> print(result)
+        ([1, 2], [3, None, 1, 3])
+    """
+    if superkey_colname is None:
+        superkey_colname = colnames[superkey_paramx]
+    params_list = list(params_list)
+    superkey_list = [None if params is None else params[superkey_paramx]
+                     for params in params_list]
+    rowid_list_ = get_rowids_where_in(db, tblname, superkey_colname,
+                                      superkey_list)
+    # Only add valid, unique rows that do not exist yet
+    isunique_list = ut.flag_unique_items(superkey_list)
+    needsadd_list = [
+        params is not None and isunique and rowid is None
+        for params, isunique, rowid in zip(params_list, isunique_list, rowid_list_)
+    ]
+    if not any(needsadd_list):
+        return rowid_list_
+    dirty_params = ut.compress(params_list, needsadd_list)
+    if VERBOSE_SQL:
+        print('[sql] bulk adding %r/%r new %s' % (len(dirty_params),
+                                                  len(params_list), tblname))
+    operation = ut.codeblock(
+        '''
+        INSERT INTO {tblname}(
+        rowid,
+        {params}
+        ) VALUES (NULL, {erotemes})
+        '''
+    ).format(tblname=tblname, params=',\n'.join(colnames),
+             erotemes=', '.join(['?'] * len(colnames)))
+    connection, cur = _get_cursor(db)
+    # The connection context manager commits on success and rolls back the
+    # entire batch on failure
+    with connection:
+        cur.executemany(operation, dirty_params)
+    rowid_list = get_rowids_where_in(db, tblname, superkey_colname,
+                                     superkey_list)
+    assert len(rowid_list) == len(params_list), 'failed sanity check'
+    return rowid_list
+
+
+def stream_rows_as_array(db, from_clause, rowid_expr, field_list, rowid_list,
+                         chunksize=SQLITE_MAX_VARS):
+    r"""
+    Selects numeric columns for a set of rowids and streams the cursor
+    directly into a typed numpy structured array.
+
+    The rowids are bound as a single JSON parameter so each call issues one
+    SQL statement regardless of the number of rowids. If the sqlite build
+    lacks JSON1 support, this falls back to chunked ``IN`` statements.
+
+    Args:
+        db (SQLDatabaseController):
+        from_clause (str): table name, optionally with aliases and joins
+        rowid_expr (str): expression selecting the rowid to match on
+        field_list (list): tuples of (fieldname, sql_expr, dtype). The sql
+            expressions must never evaluate to NULL (use COALESCE).
+        rowid_list (ndarray): rowids to select
+
+    Returns:
+        ndarray: structured array with a ``rowid`` field followed by one field
+            per item in field_list. Rows are in arbitrary order and missing
+            rowids are omitted.
+
+    CommandLine:
+        python -m ibeis.control._sql_helpers stream_rows_as_array
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control._sql_helpers import *  # NOQA
+        >>> import dtool_ibeis as dt
+        >>> import numpy as np
+        >>> db = dt.SQLDatabaseController(sqldb_fname=':memory:')
+        >>> db.add_table('dummy', (
+        >>>     ('dummy_rowid', 'INTEGER PRIMARY KEY'),
+        >>>     ('dummy_key',   'TEXT'),
+        >>>     ('dummy_val',   'REAL'),
+        >>> ), superkeys=[('dummy_key',)], docstr='')
+        >>> bulk_add(db, 'dummy', ('dummy_key', 'dummy_val'),
+        >>>          [('a', 1.5), ('b', None), ('c', 3.0)])
+        >>> field_list = [('val', 'COALESCE(dummy_val, -1)', np.float64)]
+        >>> arr = stream_rows_as_array(db, 'dummy', 'rowid', field_list,
+        >>>                            np.array([3, 2, 9]))
+        >>> arr.sort(order='rowid')
+        >>> print(arr.tolist())
+        [(2, -1.0), (3, 3.0)]
+    """
+    import json
+    import sqlite3 as lite
+    import numpy as np
+    dtype = np.dtype([('rowid', np.int64)] + [
+        (name, dtype_) for name, _, dtype_ in field_list])
+    select = ', '.join([rowid_expr] + [expr for _, expr, _ in field_list])
+    rowids = np.unique(np.asarray(rowid_list, dtype=np.int64))
+    _, cur = _get_cursor(db)
+    operation_fmt = 'SELECT {select} FROM {from_clause} WHERE {rowid_expr} IN ({where})'
+    try:
+        operation = operation_fmt.format(
+            select=select, from_clause=from_clause, rowid_expr=rowid_expr,
+            where='SELECT value FROM json_each(?)')
+        cur.execute(operation, (json.dumps(rowids.tolist()),))
+        arr = np.fromiter(cur, dtype=dtype)
+    except lite.OperationalError:
+        # No JSON1 extension
+        part_list = []
+        for chunk in ut.ichunks(rowids.tolist(), chunksize):
+            operation = operation_fmt.format(
+                select=select, from_clause=from_clause, rowid_expr=rowid_expr,
+                where=', '.join(['?'] * len(chunk)))
+            cur.execute(operation, chunk)
+            part_list.append(np.fromiter(cur, dtype=dtype))
+        arr = np.hstack(part_list) if part_list else np.empty(0, dtype=dtype)
+    return arr
+
+
+# SQLite has no NaN literal. 9e999 overflows to +inf, which is streamed as a
+# placeholder for NULL in columns whose fill value is nan.
+_SQL_NAN_PLACEHOLDER = '9e999'
+
+
+def _coalesce_column_expr(expr, fill):
+    """
+    Wraps a column expression so it never evaluates to NULL (np.fromiter
+    cannot convert None). NULL values become the fill value of the column.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control._sql_helpers import *  # NOQA
+        >>> from ibeis.control._sql_helpers import _coalesce_column_expr
+        >>> print(_coalesce_column_expr('i.image_width', -1))
+        COALESCE(i.image_width, -1)
+        >>> print(_coalesce_column_expr('a.annot_theta', float('nan')))
+        COALESCE(a.annot_theta, 9e999)
+    """
+    import numpy as np
+    fill = np.asarray(fill).item()
+    if isinstance(fill, float) and np.isnan(fill):
+        fill_sql = _SQL_NAN_PLACEHOLDER
+    else:
+        fill_sql = repr(int(fill) if isinstance(fill, bool) else fill)
+    return 'COALESCE(%s, %s)' % (expr, fill_sql)
+
+
+def get_column_arrays(db, from_clause, rowid_expr, column_specs, colnames,
+                      rowid_list):
+    r"""
+    Columnar getter backend. Fetches several named columns for a list of
+    rowids with one statement and returns them as numpy arrays aligned with
+    the input order (duplicates allowed).
+
+    Args:
+        db (SQLDatabaseController):
+        from_clause (str): table name, optionally with aliases and joins
+        rowid_expr (str): expression selecting the rowid to match on
+        column_specs (dict): maps a column name to a tuple of
+            (sql_expr_list, dtype, fill) where fill is used for missing rows
+            and for NULL values (e.g. from a LEFT JOIN without a match).
+            Columns with more than one expression return 2D arrays.
+        colnames (list): names of the columns to fetch
+        rowid_list (list): rowids
+
+    Returns:
+        tuple: (column_dict, exists_flags) - where column_dict maps each
+            colname to an ndarray and exists_flags marks rowids that exist
+    """
+    import numpy as np
+    rowids = np.asarray(rowid_list, dtype=np.int64).ravel()
+    unique_rowids, inverse = np.unique(rowids, return_inverse=True)
+    field_list = []
+    for colname in colnames:
+        expr_list, dtype, fill = column_specs[colname]
+        for count, expr in enumerate(expr_list):
+            expr = _coalesce_column_expr(expr, fill)
+            field_list.append(('%s_%d' % (colname, count), expr, dtype))
+    arr = stream_rows_as_array(db, from_clause, rowid_expr, field_list,
+                               unique_rowids)
+    # Scatter the streamed rows back to their unique positions
+    unique_pos = np.searchsorted(unique_rowids, arr['rowid'])
+    column_dict = ut.odict()
+    for colname in colnames:
+        expr_list, dtype, fill = column_specs[colname]
+        shape = (len(unique_rowids), len(expr_list))
+        unique_vals = np.full(shape, fill, dtype=dtype)
+        for count in range(len(expr_list)):
+            vals = arr['%s_%d' % (colname, count)]
+            if np.issubdtype(dtype, np.floating) and np.isnan(fill):
+                vals = np.where(np.isposinf(vals), np.nan, vals)
+            unique_vals[unique_pos, count] = vals
+        if len(expr_list) == 1:
+            unique_vals = unique_vals[:, 0]
+        column_dict[colname] = unique_vals[inverse]
+    unique_exists = np.zeros(len(unique_rowids), dtype=bool)
+    unique_exists[unique_pos] = True
+    exists_flags = unique_exists[inverse]
+    return column_dict, exists_flags
+
+
 # =========================
 # Database Backup Functions
 # =========================
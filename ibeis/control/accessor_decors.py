@@ -1,5 +1,6 @@
 import utool as ut
 import ubelt as ub
+import numpy as np
 import builtins
 from ibeis.util import util_decor
 from utool._internal.meta_util_six import get_funcname
@@ -12,7 +13,9 @@ VERB_CONTROL = ut.get_argflag(('--verb-control'))
 
 DEV_CACHE = False
 DEBUG_API_CACHE = False
-API_CACHE = False
+# Cached getters and invalidators are wrapped unless --noapi-cache is given.
+# The caches are bounded (see TABLE_CACHE_MAXSIZE)
+API_CACHE = not ut.get_argflag('--noapi-cache')
 ASSERT_API_CACHE = False
 
 
@@ -44,10 +47,366 @@ def default_decorator(input_):
 # DECORATORS::ADDER
 
 
+# Default bounds for each (table, column, config) cache. Use None for unbounded
+TABLE_CACHE_MAXSIZE = ut.get_argval('--table-cache-maxsize', type_=int, default=200000)
+TABLE_CACHE_MAXBYTES = ut.get_argval('--table-cache-maxbytes', type_=int, default=None)
+
+# Approximate bytes of bookkeeping per cached rowid (the slots of the key,
+# value, tick and size arrays and the value's object header) counted
+# against the byte budget of a ColumnCache
+ENTRY_OVERHEAD_NBYTES = 64
+
+# Registry of per-column cache options specified through cache_getter.
+# Maps (tblname, colname) to keyword arguments of ColumnCache
+COLUMN_CACHE_CONFIGS = {}
+
+
+def _estimate_nbytes(val):
+    """ cheap size estimate used for the byte budget of a ColumnCache """
+    import sys
+    nbytes = getattr(val, 'nbytes', None)
+    if nbytes is None:
+        nbytes = sys.getsizeof(val)
+        if isinstance(val, (list, tuple)):
+            nbytes += sum(sys.getsizeof(v) for v in val)
+    return nbytes
+
+
+class ColumnCache(ub.NiceRepr):
+    r"""
+    Bounded rowid -> value cache for a single (table, column, config).
+
+    The cached rowids are kept in a sorted int64 array with the values,
+    last access ticks and (estimated) sizes in aligned arrays, so a bulk
+    lookup is one ``np.searchsorted`` and memory only grows with the number
+    of cached rowids. Recency is updated for all hits of a call at once.
+    When the cache exceeds ``maxsize`` entries or ``max_bytes`` (estimated)
+    bytes, the least recently used entries are evicted. None values are
+    never cached, so a row that reads as None is looked up again on the
+    next call. Value sizes (plus a fixed per-entry overhead) are only
+    estimated, and reported in ``stats``, when a byte budget is given.
+
+    Args:
+        maxsize (int): maximum number of cached rowids (None for unbounded)
+        max_bytes (int): approximate byte budget (None for unbounded)
+
+    CommandLine:
+        python -m ibeis.control.accessor_decors ColumnCache
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control.accessor_decors import *  # NOQA
+        >>> cache_ = ColumnCache(maxsize=3)
+        >>> cache_.update([1, 2, 3, 5], ['a', 'b', (1, 2), None])
+        >>> vals, ismiss = cache_.take(np.array([3, 1, 7, 5]))
+        >>> cache_.update([4], ['d'])  # evicts 2, the least recently used
+        >>> vals2, ismiss2 = cache_.take([1, 2, None, 4])
+        >>> print(vals, ismiss.tolist())
+        >>> print(vals2, ismiss2.tolist())
+        >>> print(ut.repr2(cache_.stats(), nl=0))
+        [(1, 2), 'a', None, None] [False, False, True, True]
+        ['a', None, None, 'd'] [False, True, True, False]
+        {'size': 3, 'nbytes': 0, 'hits': 4, 'misses': 4, 'evictions': 1}
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # Huge rowids and the per-entry overhead stay within the budget
+        >>> from ibeis.control.accessor_decors import *  # NOQA
+        >>> cache_ = ColumnCache(maxsize=2, max_bytes=4 * ENTRY_OVERHEAD_NBYTES)
+        >>> cache_.update([2 ** 40, 10 ** 6, 7], [1, 2, 3])
+        >>> assert sorted(cache_.keys()) == [7, 10 ** 6]
+        >>> cache_.update([8, 9], [np.zeros(1000), 5])
+        >>> assert cache_.keys() == [9]
+        >>> assert cache_.stats()['nbytes'] <= cache_.max_bytes
+        >>> # Overwrites and deletes keep the arrays aligned
+        >>> cache_ = ColumnCache()
+        >>> cache_.update(np.arange(10, 0, -1), list('abcdefghij'))
+        >>> cache_.update([3, 11], ['X', 'Y'])
+        >>> cache_.delete([1, 2, 12])
+        >>> assert cache_.items()[0:3] == [(3, 'X'), (4, 'g'), (5, 'f')]
+        >>> assert cache_.take([11, 1])[0] == ['Y', None]
+    """
+
+    def __init__(self, maxsize=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tick = 0
+        self._nbytes_total = 0
+        self._set_entries(np.zeros(0, dtype=np.int64),
+                          np.empty(0, dtype=object),
+                          np.zeros(0, dtype=np.int64),
+                          np.zeros(0, dtype=np.int64))
+
+    def __nice__(self):
+        return 'size=%r, maxsize=%r, hits=%r, misses=%r' % (
+            len(self._keys), self.maxsize, self.hits, self.misses)
+
+    def _set_entries(self, keys, vals, stamps, nbytes):
+        # Sorted rowids and the aligned values, access ticks and sizes
+        self._keys = keys
+        self._vals = vals
+        self._stamps = stamps
+        self._nbytes = nbytes
+
+    @staticmethod
+    def _as_keys(rowid_list):
+        """
+        Returns the rowids as int64 and a flag for every rowid that can be
+        cached (non-negative integers)
+        """
+        if not isinstance(rowid_list, np.ndarray):
+            try:
+                keys = np.fromiter(rowid_list, dtype=np.int64,
+                                   count=len(rowid_list))
+            except (ValueError, TypeError):
+                # Not all rowids are integers (e.g. None)
+                rowid_list = np.array(rowid_list, dtype=object)
+            else:
+                return keys, keys >= 0
+        rowid_list = rowid_list.ravel()
+        if rowid_list.dtype.kind in 'iu':
+            keys = rowid_list.astype(np.int64, copy=False)
+            return keys, keys >= 0
+        flags = np.array([isinstance(rowid, (int, np.integer)) and rowid >= 0
+                          for rowid in rowid_list], dtype=bool)
+        keys = np.full(len(rowid_list), -1, dtype=np.int64)
+        if flags.any():
+            keys[flags] = rowid_list[flags].astype(np.int64)
+        return keys, flags
+
+    def _find(self, keys):
+        """ positions of keys in self._keys and flags of the keys found """
+        num_cached = len(self._keys)
+        if num_cached and self._keys[-1] - self._keys[0] == num_cached - 1:
+            # The cached rowids are a contiguous range
+            pos = keys - self._keys[0]
+            found = (pos >= 0) & (pos < num_cached)
+            np.clip(pos, 0, num_cached, out=pos)
+            return pos, found
+        if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+            # Searching sorted keys is much more cache friendly
+            order = keys.argsort()
+            pos = np.empty(len(keys), dtype=np.intp)
+            pos[order] = np.searchsorted(self._keys, keys[order])
+        else:
+            pos = np.searchsorted(self._keys, keys)
+        found = pos < len(self._keys)
+        found[found] = self._keys[pos[found]] == keys[found]
+        return pos, found
+
+    def take(self, rowid_list):
+        """
+        Bulk lookup.
+
+        Returns:
+            tuple: (vals_list, ismiss) where vals_list has None at every miss
+                and ismiss is a boolean array.
+        """
+        keys, flags = self._as_keys(rowid_list)
+        pos, ishit = self._find(keys)
+        ishit &= flags
+        num_hits = int(ishit.sum())
+        self.hits += num_hits
+        self.misses += len(keys) - num_hits
+        self._tick += 1
+        if num_hits == len(keys):
+            self._stamps[pos] = self._tick
+            return self._vals[pos].tolist(), ~ishit
+        hit_pos = pos[ishit]
+        self._stamps[hit_pos] = self._tick
+        vals = np.empty(len(keys), dtype=object)
+        vals[ishit] = self._vals[hit_pos]
+        return vals.tolist(), ~ishit
+
+    def update(self, rowid_list, val_list):
+        """
+        Bulk write. None values and rowids that are not non-negative integers
+        are skipped. Evicts least recently used entries if over budget.
+        """
+        keys, flags = self._as_keys(rowid_list)
+        # Fill item by item so tuple and array values are not broadcast
+        vals = np.empty(len(keys), dtype=object)
+        for index, val in enumerate(val_list):
+            vals[index] = val
+        flags &= np.array([val is not None for val in vals], dtype=bool)
+        keys = keys[flags]
+        vals = vals[flags]
+        if len(keys) == 0:
+            return
+        # The last write of a repeated rowid wins. Entries written together
+        # are ordered by their position for eviction.
+        num = len(keys)
+        keys, first = np.unique(keys[::-1], return_index=True)
+        vals = vals[::-1][first]
+        stamps = self._tick + num - first
+        self._tick += num
+        if self.max_bytes is not None:
+            nbytes = np.array([ENTRY_OVERHEAD_NBYTES + _estimate_nbytes(val)
+                               for val in vals], dtype=np.int64)
+        else:
+            nbytes = np.zeros(len(keys), dtype=np.int64)
+        # Overwrite cached rowids in place
+        pos, found = self._find(keys)
+        if found.any():
+            old_pos = pos[found]
+            self._vals[old_pos] = vals[found]
+            self._stamps[old_pos] = stamps[found]
+            self._nbytes_total += int(nbytes[found].sum() -
+                                      self._nbytes[old_pos].sum())
+            self._nbytes[old_pos] = nbytes[found]
+        # Merge new rowids into the sorted arrays
+        isnew = ~found
+        if isnew.any():
+            new_pos = pos[isnew]
+            self._set_entries(
+                np.insert(self._keys, new_pos, keys[isnew]),
+                np.insert(self._vals, new_pos, vals[isnew]),
+                np.insert(self._stamps, new_pos, stamps[isnew]),
+                np.insert(self._nbytes, new_pos, nbytes[isnew]))
+            self._nbytes_total += int(nbytes[isnew].sum())
+        self._evict()
+
+    def _remove(self, remove_flags):
+        keep = ~remove_flags
+        self._nbytes_total -= int(self._nbytes[remove_flags].sum())
+        self._set_entries(self._keys[keep], self._vals[keep],
+                          self._stamps[keep], self._nbytes[keep])
+
+    def _evict(self):
+        size = len(self._keys)
+        num_over = 0
+        if self.maxsize is not None and size > self.maxsize:
+            num_over = size - self.maxsize
+        if self.max_bytes is not None and self._nbytes_total > self.max_bytes:
+            lru_pos = self._stamps.argsort(kind='stable')
+            freed = np.cumsum(self._nbytes[lru_pos])
+            num_bytes_over = self._nbytes_total - self.max_bytes
+            num_over = max(num_over, int(np.searchsorted(freed, num_bytes_over) + 1))
+        if num_over <= 0:
+            return
+        num_over = min(num_over, size)
+        remove_flags = np.zeros(size, dtype=bool)
+        if num_over == size:
+            remove_flags[:] = True
+        else:
+            # Ties in the access tick are broken by position (rowid)
+            order = np.lexsort((np.arange(size), self._stamps))
+            remove_flags[order[:num_over]] = True
+        self._remove(remove_flags)
+        self.evictions += num_over
+
+    def delete(self, rowid_list):
+        if not ut.isiterable(rowid_list):
+            rowid_list = [rowid_list]
+        keys, flags = self._as_keys(rowid_list)
+        pos, found = self._find(keys[flags])
+        if found.any():
+            remove_flags = np.zeros(len(self._keys), dtype=bool)
+            remove_flags[pos[found]] = True
+            self._remove(remove_flags)
+
+    def clear(self):
+        self._nbytes_total = 0
+        self._set_entries(self._keys[:0], self._vals[:0], self._stamps[:0],
+                          self._nbytes[:0])
+
+    def stats(self):
+        return ut.odict([
+            ('size', len(self._keys)),
+            ('nbytes', self._nbytes_total),
+            ('hits', self.hits),
+            ('misses', self.misses),
+            ('evictions', self.evictions),
+        ])
+
+    # Dictionary compatibility
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, rowid):
+        return not self.take([rowid])[1][0]
+
+    def __setitem__(self, rowid, val):
+        self.update([rowid], [val])
+
+    def get(self, rowid, default=None):
+        vals, ismiss = self.take([rowid])
+        return default if ismiss[0] else vals[0]
+
+    def keys(self):
+        return self._keys.tolist()
+
+    def values(self):
+        return self._vals.tolist()
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+
+class _ConfigCaches(dict):
+    """ kwargs_hash -> ColumnCache """
+    def __init__(self, **cachekw):
+        super(_ConfigCaches, self).__init__()
+        self.cachekw = cachekw
+
+    def __missing__(self, kwargs_hash):
+        cache_ = self[kwargs_hash] = ColumnCache(**self.cachekw)
+        return cache_
+
+
+class _ColumnCaches(dict):
+    """ colname -> kwargs_hash -> ColumnCache """
+    def __init__(self, tblname, defaultkw):
+        super(_ColumnCaches, self).__init__()
+        self.tblname = tblname
+        self.defaultkw = defaultkw
+
+    def __missing__(self, colname):
+        cachekw = self.defaultkw.copy()
+        cachekw.update(COLUMN_CACHE_CONFIGS.get((self.tblname, colname), {}))
+        colcache = self[colname] = _ConfigCaches(**cachekw)
+        return colcache
+
+
+class TableCache(dict):
+    r"""
+    tblname -> colname -> kwargs_hash -> ColumnCache
+
+    Drop-in replacement for the old nested defaultdict table cache where each
+    leaf is bounded and keeps hit / miss / eviction counters.
+    """
+    def __init__(self, maxsize=TABLE_CACHE_MAXSIZE, max_bytes=TABLE_CACHE_MAXBYTES):
+        super(TableCache, self).__init__()
+        self.defaultkw = dict(maxsize=maxsize, max_bytes=max_bytes)
+
+    def __missing__(self, tblname):
+        colscache = self[tblname] = _ColumnCaches(tblname, self.defaultkw)
+        return colscache
+
+    def stats(self):
+        """
+        Returns:
+            dict: nested tblname -> colname -> counters (summed over configs)
+        """
+        stats = ut.odict()
+        for tblname, colscache in self.items():
+            for colname, kwargs_cache_ in colscache.items():
+                counters = ut.odict()
+                for cache_ in kwargs_cache_.values():
+                    for key, val in cache_.stats().items():
+                        counters[key] = counters.get(key, 0) + val
+                stats.setdefault(tblname, ut.odict())[colname] = counters
+        return stats
+
+
 def init_tablecache():
     r"""
     Returns:
-       defaultdict: tablecache
+       TableCache: tablecache
 
     CommandLine:
         python -m ibeis.control.accessor_decors init_tablecache
@@ -57,14 +416,16 @@ def init_tablecache():
         >>> from ibeis.control.accessor_decors import *  # NOQA
         >>> result = init_tablecache()
         >>> print(result)
+        {}
     """
     # 4 levels of dictionaries
     # tablename, colname, kwargs, and then rowids
-    tablecache = ub.ddict(lambda: ub.ddict(lambda: ub.ddict(dict)))
+    tablecache = TableCache()
     return tablecache
 
 
-def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
+def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False,
+                 maxsize=ub.NoParam, max_bytes=ub.NoParam):
     """
     Creates a getter cacher
     the class must have a table_cache property
@@ -73,6 +434,8 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
     Args:
         tblname (str):
         colname (str):
+        maxsize (int): overrides the number of rowids cached for this column
+        max_bytes (int): overrides the byte budget of this column
 
     Returns:
         function: closure_getter_cacher
@@ -141,6 +504,14 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
         %timeit wrp_getter_cacher(ibs, rowid_list)
     """
     assert colname is not None, 'must specify a single colname'
+    cachekw = {}
+    if maxsize is not ub.NoParam:
+        cachekw['maxsize'] = maxsize
+    if max_bytes is not ub.NoParam:
+        cachekw['max_bytes'] = max_bytes
+    if cachekw:
+        COLUMN_CACHE_CONFIGS[(tblname, colname)] = cachekw
+
     def closure_getter_cacher(getter_func):
         if not API_CACHE and not force:
             # Turn of API Cache
@@ -157,7 +528,7 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
             cached_rowid_list = ut.filterfalse_items(rowid_list, ismiss_list)
             cache_ = ibs.table_cache[tblname][colname][kwargs_hash]
             # Load cached values for each rowid
-            cache_vals_list = ut.dict_take_list(cache_, cached_rowid_list, None)
+            cache_vals_list = cache_.take(cached_rowid_list)[0]
             db_vals_list = getter_func(ibs, cached_rowid_list, **kwargs)
             # Assert everything is valid
             msg_fmt = ub.codeblock(
@@ -187,22 +558,24 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
                 raise
 
         def handle_cache_misses(ibs, getter_func, rowid_list, ismiss_list, vals_list, cache_, kwargs):
-            miss_indices = ut.list_where(ismiss_list)
-            miss_rowids  = ut.compress(rowid_list, ismiss_list)
+            miss_indices = np.flatnonzero(ismiss_list)
+            miss_rowids  = ut.take(rowid_list, miss_indices)
             # call wrapped function
             miss_vals = getter_func(ibs, miss_rowids, **kwargs)
             # overwrite missed output
             for index, val in zip(miss_indices, miss_vals):
                 vals_list[index] = val  # Output write
             # cache save
-            for rowid, val in zip(miss_rowids, miss_vals):
-                cache_[rowid] = val     # Cache write
+            cache_.update(miss_rowids, miss_vals)  # Cache write
 
         def wrp_getter_cacher(ibs, rowid_list, **kwargs):
             """
             Wrapper function that caches rowid values in a dictionary
             """
             kwargs.pop('debug', False)
+            if not isinstance(rowid_list, (list, np.ndarray)):
+                # Uncached getters accept any iterable (e.g. a set)
+                rowid_list = list(rowid_list)
             kwargs_hash = (
                 None if cfgkeys is None else
                 ut.get_dict_hashid([kwargs.get(key, None) for key in cfgkeys])
@@ -210,12 +583,11 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
             # There are 3 levels of caches
             # All caches for this table, caches for the this column, and caches for this kwargs configuration
             cache_ = ibs.table_cache[tblname][colname][kwargs_hash]
-            # Load cached values for each rowid
-            vals_list = [cache_.get(rowid, None) for rowid in rowid_list]
-            # Mark rowids with cache misses
-            ismiss_list = [val is None for val in vals_list]
-            # END HACK
-            if any(ismiss_list):
+            # Load cached values and mark cache misses for all rowids at once
+            vals_list, ismiss_list = cache_.take(rowid_list)
+            if debug:
+                debug_cache_hits(ismiss_list, rowid_list)
+            if ismiss_list.any():
                 handle_cache_misses(ibs, getter_func, rowid_list, ismiss_list, vals_list, cache_, kwargs)
             return vals_list
         wrp_getter_cacher = util_decor.preserve_sig(wrp_getter_cacher, getter_func)
@@ -256,33 +628,33 @@ def cache_invalidator(tblname, colnames=None, rowidx=None, force=False):
                 print('kwargs = %r' % (kwargs,))
                 print('colscache_ = ' + ut.repr2(colscache_, truncate=1))
 
-            # Clear the cache of any specified colname
-            # when the invalidator is called
-            if rowidx is None:
-                for colname in colnames_:
-                    kwargs_cache_ = colscache_[colname]
-                    # We dont know the rowsids so clear everything
-                    for cache_ in kwargs_cache_.values():
-                        cache_.clear()
-            else:
-                rowid_list = args[rowidx]
-                for colname in colnames_:
-                    kwargs_cache_ = colscache_[colname]
-                    # We know the rowids to delete
-                    # iterate over all getter kwargs values
-                    for cache_ in kwargs_cache_.values():
-                        ut.delete_dict_keys(cache_, rowid_list)
-
-            # Preform set/delete action
-            if DEBUG_API_CACHE:
-                print('After:')
-                print('colscache_ = ' + ut.repr2(colscache_, truncate=1))
-                print('L__________')
-
-            writer_result = writer_func(self, *args, **kwargs)
-
-            if DEBUG_API_CACHE:
-                indenter.stop()
+            # Preform set/delete action. The cache is cleared afterwards
+            # because the writer may call cached getters itself (e.g. to
+            # notify wildbook), which would cache the old values again.
+            try:
+                writer_result = writer_func(self, *args, **kwargs)
+            finally:
+                # Clear the cache of any specified colname
+                if rowidx is None:
+                    for colname in colnames_:
+                        kwargs_cache_ = colscache_[colname]
+                        # We dont know the rowsids so clear everything
+                        for cache_ in kwargs_cache_.values():
+                            cache_.clear()
+                else:
+                    rowid_list = args[rowidx]
+                    for colname in colnames_:
+                        kwargs_cache_ = colscache_[colname]
+                        # We know the rowids to delete
+                        # iterate over all getter kwargs values
+                        for cache_ in kwargs_cache_.values():
+                            cache_.delete(rowid_list)
+
+                if DEBUG_API_CACHE:
+                    print('After:')
+                    print('colscache_ = ' + ut.repr2(colscache_, truncate=1))
+                    print('L__________')
+                    indenter.stop()
             return writer_result
         wrp_cache_invalidator = util_decor.preserve_sig(wrp_cache_invalidator, writer_func)
         return wrp_cache_invalidator
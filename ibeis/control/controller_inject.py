@@ -133,6 +133,7 @@ def get_flask_app(templates_auto_reload=True):
         GLOBAL_APP.QUERY_OBJECT_JOBID = None
         GLOBAL_APP.QUERY_OBJECT_FEEDBACK_BUFFER = []
         GLOBAL_APP.GRAPH_CLIENT_DICT = {}
+        GLOBAL_APP.GRAPH_HOST_POOL = None
 
         if HAS_FLASK_CORS:
             GLOBAL_CORS = CORS(GLOBAL_APP, resources={r"/api/*": {"origins": "*"}})  # NOQA
@@ -2660,6 +2660,115 @@ def get_annot_image_gps2(ibs, aid_list):
     return gps_list
 
 
+# Columns available to :func:`get_annot_columns`. Each entry maps a name to
+# (sql_expr_list, dtype, fill) over the annotations table aliased as ``a``.
+# Image columns (see IMAGE_ARRAY_COLUMNS) are joined in as ``i``.
+ANNOT_ARRAY_COLUMNS = ut.odict([
+    ('gid', (['a.image_rowid'], np.int64, -1)),
+    ('nid', (['COALESCE(a.name_rowid, 0)'], np.int64, 0)),
+    ('species_rowid', (['COALESCE(a.species_rowid, 0)'], np.int64, 0)),
+    ('bbox', (['a.annot_xtl', 'a.annot_ytl', 'a.annot_width',
+               'a.annot_height'], np.int64, -1)),
+    ('theta', (['a.annot_theta'], np.float64, np.nan)),
+    ('quality', (['COALESCE(a.annot_quality, -1)'], np.int64, -1)),
+    ('exemplar', (['COALESCE(a.annot_exemplar_flag, 0)'], np.bool_, False)),
+])
+
+
+@register_ibs_method
+def get_annot_columns(ibs, aid_list, colnames):
+    r"""
+    Columnar version of the annotation getters. All requested columns
+    (including columns of the parent images) are fetched with a single SQL
+    statement and streamed into typed numpy arrays aligned with aid_list.
+
+    This avoids building intermediate python lists of tuples when a
+    vectorized computation only needs a few columns for many annotations.
+
+    Args:
+        aid_list (list): annotation rowids (duplicates allowed)
+        colnames (list): names from ANNOT_ARRAY_COLUMNS
+            ('gid', 'nid', 'species_rowid', 'bbox', 'theta', 'quality',
+            'exemplar') or IMAGE_ARRAY_COLUMNS ('unixtime', 'gps', 'size',
+            'orientation')
+
+    Returns:
+        dict: column_dict - maps each colname to an ndarray. nid follows
+            get_annot_name_rowids(distinguish_unknowns=True) and gives -aid
+            for unknown names. unixtime and gps have nan for missing values
+            (like get_annot_image_unixtimes_asfloat and get_annot_image_gps2).
+            bbox and gps are 2D arrays.
+
+    CommandLine:
+        python -m ibeis.control.manual_annot_funcs --test-get_annot_columns
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control.manual_annot_funcs import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> aid_list = ibs.get_valid_aids()[::-1]
+        >>> aid_list = aid_list + aid_list[0:2]
+        >>> colnames = ['bbox', 'gps', 'unixtime', 'nid', 'gid']
+        >>> column_dict = ibs.get_annot_columns(aid_list, colnames)
+        >>> assert list(column_dict.keys()) == colnames
+        >>> assert column_dict['bbox'].tolist() == list(map(list, ibs.get_annot_bboxes(aid_list)))
+        >>> assert column_dict['nid'].tolist() == ibs.get_annot_name_rowids(aid_list)
+        >>> assert column_dict['gid'].tolist() == ibs.get_annot_gids(aid_list)
+        >>> assert np.allclose(column_dict['unixtime'],
+        >>>                    ibs.get_annot_image_unixtimes_asfloat(aid_list),
+        >>>                    equal_nan=True)
+        >>> assert np.allclose(column_dict['gps'],
+        >>>                    ibs.get_annot_image_gps2(aid_list), equal_nan=True)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # Images without GPS (NULL or -1) and annots without an image row
+        >>> from ibeis.control.manual_annot_funcs import *  # NOQA
+        >>> from ibeis.algo.hots.tests import bench
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'columns_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = bench.make_synthetic_database(dbdir, 3, num_feats=10,
+        >>>                                     verbose=False)
+        >>> aid_list = ibs.get_valid_aids()
+        >>> gid_list = ibs.get_annot_gids(aid_list)
+        >>> ibs.set_image_gps(gid_list[0:1], [(-1, -1)])
+        >>> ibs.db.cur.execute(
+        >>>     'UPDATE images SET image_gps_lat=NULL, image_gps_lon=NULL, '
+        >>>     'image_time_posix=NULL, image_width=NULL WHERE rowid=?',
+        >>>     (gid_list[1],))
+        >>> ibs.db.cur.execute(
+        >>>     'UPDATE annotations SET image_rowid=?, annot_theta=NULL '
+        >>>     'WHERE rowid=?', (max(gid_list) + 100, aid_list[2]))
+        >>> colnames = ['gps', 'unixtime', 'size', 'theta', 'gid']
+        >>> column_dict = ibs.get_annot_columns(aid_list, colnames)
+        >>> assert np.all(np.isnan(column_dict['gps']))
+        >>> assert np.all(np.isnan(column_dict['unixtime']))
+        >>> assert column_dict['size'][1:].tolist() == [[-1, 32], [-1, -1]]
+        >>> assert np.isnan(column_dict['theta'][2])
+        >>> assert column_dict['gid'][2] == max(gid_list) + 100
+    """
+    from ibeis.control import _sql_helpers
+    from ibeis.control import manual_image_funcs
+    image_colnames = [colname for colname in colnames
+                      if colname not in ANNOT_ARRAY_COLUMNS]
+    column_specs = ANNOT_ARRAY_COLUMNS.copy()
+    from_clause = const.ANNOTATION_TABLE + ' AS a'
+    if len(image_colnames) > 0:
+        column_specs.update(manual_image_funcs.IMAGE_ARRAY_COLUMNS)
+        from_clause += ' LEFT JOIN {tbl} AS i ON a.image_rowid = i.rowid'.format(
+            tbl=const.IMAGE_TABLE)
+    column_dict, exists_flags = _sql_helpers.get_column_arrays(
+        ibs.db, from_clause, 'a.rowid', column_specs, colnames, aid_list)
+    column_dict = manual_image_funcs._fix_image_column_arrays(column_dict)
+    if 'nid' in column_dict:
+        # Distinguish unknown names the same way get_annot_name_rowids does
+        nid_arr = column_dict['nid']
+        isunknown = nid_arr == const.UNKNOWN_LBLANNOT_ROWID
+        nid_arr[isunknown] = -np.asarray(aid_list, dtype=np.int64)[isunknown]
+    return column_dict
+
+
 @register_ibs_method
 @accessor_decors.getter_1to1
 @register_api('/api/annot/image/file/path/', methods=['GET'])
@@ -56,6 +56,13 @@ def delete_annot_feats(ibs, aid_list, config2_=None):
     """
     if ut.VERBOSE:
         print('[ibs] deleting %d annots leaf nodes' % len(aid_list))
+    if getattr(ibs, '_packed_feats', False):
+        from ibeis.algo.preproc import preproc_feat_store
+        store = preproc_feat_store.get_feat_store(ibs)
+        for colname in ['kpts', 'vecs', 'fgweights']:
+            key_list = preproc_feat_store.get_feat_store_keys(
+                ibs, aid_list, colname, config2_)
+            store.delete(colname, key_list)
     return ibs.depc_annot.delete_property('feat', aid_list, config=config2_)
 
 
@@ -149,6 +156,10 @@ def get_annot_kpts(ibs, aid_list, ensure=True, eager=True, nInput=None,
         >>> ibeis.viz.interact.interact_chip.ishow_chip(ibs, aid_list[0], config2_=qreq2_.extern_query_config2, ori=True, fnum=2)
         >>> ut.show_if_requested()
     """
+    if getattr(ibs, '_packed_feats', False) and ensure and eager:
+        from ibeis.algo.preproc import preproc_feat_store
+        return preproc_feat_store.get_packed_feats(ibs, aid_list, 'kpts',
+                                                   config2_)
     return ibs.depc_annot.get('feat', aid_list, 'kpts', config=config2_,
                                ensure=ensure, eager=eager)
 
@@ -161,6 +172,10 @@ def get_annot_vecs(ibs, aid_list, ensure=True, eager=True, nInput=None,
     Returns:
         vecs_list (list): annotation descriptor vectors
     """
+    if getattr(ibs, '_packed_feats', False) and ensure and eager:
+        from ibeis.algo.preproc import preproc_feat_store
+        return preproc_feat_store.get_packed_feats(ibs, aid_list, 'vecs',
+                                                   config2_)
     return ibs.depc_annot.get('feat', aid_list, 'vecs', config=config2_,
                                ensure=ensure, eager=eager)
 
@@ -196,6 +211,27 @@ def get_annot_num_feats(ibs, aid_list, ensure=True, eager=True, nInput=None,
         >>> ut.assert_inbounds(nFeats_list[1],  900,  922)
         >>> ut.assert_inbounds(nFeats_list[2], 1300, 1343)
 
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # With packed features the counts come from the packed keypoints
+        >>> from ibeis.control.manual_feat_funcs import *  # NOQA
+        >>> from ibeis.algo.preproc import preproc_feat_store
+        >>> import ibeis
+        >>> import numpy as np
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> ibs._packed_feats = True
+        >>> aid_list = ibs.get_valid_aids()[0:2]
+        >>> store = preproc_feat_store.get_feat_store(ibs)
+        >>> key_list = preproc_feat_store.get_feat_store_keys(ibs, aid_list[0:1], 'kpts')
+        >>> store.delete('kpts', key_list)
+        >>> store.add('kpts', key_list, [np.zeros((7, 6), dtype=np.float32)])
+        >>> nFeats_list = get_annot_num_feats(ibs, aid_list)
+        >>> kpts_list = ibs.get_annot_kpts(aid_list)
+        >>> store.delete('kpts', key_list)
+        >>> ibs._packed_feats = False
+        >>> assert nFeats_list[0] == 7
+        >>> assert nFeats_list == [len(kpts) for kpts in kpts_list]
+
     Ignore:
         depc = ibs.depc_annot
         tablename = 'feat'
@@ -204,6 +240,12 @@ def get_annot_num_feats(ibs, aid_list, ensure=True, eager=True, nInput=None,
         config = config2_
 
     """
+    if getattr(ibs, '_packed_feats', False) and ensure and eager:
+        # Count the packed keypoints so the counts agree with get_annot_kpts
+        from ibeis.algo.preproc import preproc_feat_store
+        kpts_list = preproc_feat_store.get_packed_feats(ibs, aid_list, 'kpts',
+                                                        config2_)
+        return [len(kpts) for kpts in kpts_list]
     return ibs.depc_annot.get('feat', aid_list, 'num_feats', config=config2_,
                               ensure=ensure, eager=eager, _debug=_debug)
 
@@ -35,6 +35,10 @@ def get_annot_fgweights(ibs, aid_list, config2_=None, ensure=True):
         >>> print('Calculated percent = %0.04f' % (percent_, ))
         >>> assert percent_ > .4 and percent_ < .6, 'should be around .54'
     """
+    if getattr(ibs, '_packed_feats', False) and ensure:
+        from ibeis.algo.preproc import preproc_feat_store
+        return preproc_feat_store.get_packed_feats(ibs, aid_list, 'fgweights',
+                                                   config2_)
     fgws_list = ibs.depc_annot.get('featweight', aid_list, 'fwg',
                                    config=config2_)
     return fgws_list
@@ -19,7 +19,9 @@ from ibeis import constants as const
 from ibeis.control import accessor_decors, controller_inject
 from ibeis.control.controller_inject import make_ibs_register_decorator
 from ibeis.util import util_decor
-from os.path import join, exists, isabs
+from os.path import join, exists, abspath
+import os
+import uuid
 import numpy as np
 import utool as ut
 import vtool_ibeis as vt
@@ -33,6 +35,9 @@ print, rrr, profile = ut.inject2(__name__)
 
 DEBUG_THUMB = False
 
+# Decode detection images at reduced resolution (ThumbnailConfig.decode_reduce)
+DETECT_DECODE_REDUCE = ut.get_argflag('--detect-decode-reduce')
+
 CLASS_INJECT_KEY, register_ibs_method = make_ibs_register_decorator(__name__)
 
 
@@ -389,7 +394,289 @@ def add_images(ibs, gpath_list, params_list=None, as_annots=False,
 
 
 @register_ibs_method
-def localize_images(ibs, gid_list_=None):
+@accessor_decors.adder
+@accessor_decors.cache_invalidator(const.IMAGESET_TABLE, ['percent_imgs_reviewed_str'])
+def add_images_bulk(ibs, gpath_list, params_list, auto_localize=True,
+                    location_for_names=None, max_workers=8):
+    r"""
+    Bulk version of :func:`add_images` for large batches where the image
+    metadata is already known (e.g. pushed from Wildbook).
+
+    Existing uuids are resolved with a single ``IN`` query per chunk, all new
+    rows are inserted with one ``executemany`` in a single transaction, and
+    localization runs over a bounded pool of ``max_workers`` threads.
+
+    Args:
+        gpath_list (list): list of image paths / uris to add
+        params_list (list): metadata tuples ordered as ``IMAGE_COLNAMES``
+        auto_localize (bool): copy / download the images into the ibeis
+            image cache (default = True)
+        location_for_names (str): defaults to ibs.cfg
+        max_workers (int): maximum number of concurrent localizations
+
+    Returns:
+        gid_list (list of rowids): gids are image rowids
+
+    CommandLine:
+        python -m ibeis.control.manual_image_funcs add_images_bulk
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control.manual_image_funcs import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()[0:2]
+        >>> gpath_list = ibs.get_image_paths(gid_list)
+        >>> params_list = ibs._compute_image_uuids(gpath_list)
+        >>> gid_list2 = ibs.add_images_bulk(gpath_list, params_list,
+        >>>                                 auto_localize=False)
+        >>> assert gid_list2 == gid_list
+    """
+    from ibeis.control import _sql_helpers
+    print('[ibs] add_images_bulk')
+    print('[ibs] len(gpath_list) = %d' % len(gpath_list))
+    if location_for_names is None:
+        location_for_names = ibs.cfg.other_cfg.location_for_names
+    colnames = IMAGE_COLNAMES
+    if LooseVersion(ibs.db.get_db_version()) >= LooseVersion('1.3.4'):
+        colnames = IMAGE_COLNAMES + ('image_original_path', 'image_location_code')
+        params_list = [tuple(params) + (gpath, location_for_names)
+                       if params is not None else None
+                       for params, gpath in zip(params_list, gpath_list)]
+    with ut.Timer('[ibs] bulk insert %d images' % (len(params_list),)):
+        gid_list = _sql_helpers.bulk_add(
+            ibs.db, const.IMAGE_TABLE, colnames, params_list,
+            superkey_colname='image_uuid',
+            superkey_paramx=colnames.index('image_uuid'))
+    if auto_localize:
+        with ut.Timer('[ibs] bulk localize'):
+            ibs.localize_images(ut.filter_Nones(gid_list),
+                                max_workers=max_workers)
+    return gid_list
+
+
+IMAGE_MANIFEST_DB_FNAME = 'image_manifest.sqlite3'
+IMAGE_MANIFEST_TABLE = 'image_manifest'
+
+
+@register_ibs_method
+def get_image_manifest_db(ibs):
+    """
+    Returns the sqlite database mapping (path, size, mtime, inode) of
+    previously ingested files to their image uuid
+    """
+    import dtool_ibeis as dt
+    fpath = join(ibs.get_cachedir(), IMAGE_MANIFEST_DB_FNAME)
+    db = dt.SQLDatabaseController(fpath=fpath)
+    if not db.has_table(IMAGE_MANIFEST_TABLE):
+        db.add_table(IMAGE_MANIFEST_TABLE, (
+            ('manifest_rowid',   'INTEGER PRIMARY KEY'),
+            ('manifest_path',    'TEXT NOT NULL'),
+            ('manifest_size',    'INTEGER'),
+            ('manifest_mtime',   'REAL'),
+            ('manifest_inode',   'INTEGER'),
+            ('image_uuid',       'TEXT'),
+        ), superkeys=[('manifest_path',)],
+            docstr='Identity of each ingested source file')
+    return db
+
+
+def _stat_ingest_path(gpath):
+    """ Returns (size, mtime, inode) or None if the file does not exist """
+    try:
+        st = os.stat(gpath)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime, st.st_ino
+
+
+def _read_image_manifest(db, gpath_list):
+    """ Returns a dict from path to (size, mtime, inode, image_uuid) """
+    from ibeis.control import _sql_helpers
+    _, cur = _sql_helpers._get_cursor(db)
+    manifest = {}
+    for chunk in ut.ichunks(gpath_list, _sql_helpers.SQLITE_MAX_VARS):
+        operation = '''
+            SELECT manifest_path, manifest_size, manifest_mtime,
+                   manifest_inode, image_uuid
+            FROM {tbl} WHERE manifest_path IN ({erotemes})
+            '''.format(tbl=IMAGE_MANIFEST_TABLE,
+                       erotemes=', '.join(['?'] * len(chunk)))
+        cur.execute(operation, chunk)
+        for row in cur.fetchall():
+            manifest[row[0]] = row[1:]
+    return manifest
+
+
+def _write_image_manifest(db, manifest_rows):
+    """
+    Args:
+        manifest_rows (list): tuples of (path, size, mtime, inode, image_uuid)
+    """
+    from ibeis.control import _sql_helpers
+    if len(manifest_rows) == 0:
+        return
+    connection, cur = _sql_helpers._get_cursor(db)
+    operation = '''
+        INSERT OR REPLACE INTO {tbl}
+        (manifest_path, manifest_size, manifest_mtime, manifest_inode,
+         image_uuid)
+        VALUES (?, ?, ?, ?, ?)
+        '''.format(tbl=IMAGE_MANIFEST_TABLE)
+    with connection:
+        cur.executemany(operation, manifest_rows)
+
+
+@register_ibs_method
+@accessor_decors.adder
+def ingest_images(ibs, gpath_list, batch_size=1000, storage=None,
+                  nprocs=None, auto_localize=None, location_for_names=None):
+    r"""
+    Import pipeline for large directories that are re-imported often.
+
+    Each file is identified by (path, size, mtime, inode). Files whose
+    identity matches the manifest of a previous import and whose image is
+    still in the database are returned without being opened. The remaining
+    files are parsed (hash + EXIF) by a bounded pool of readers and committed
+    to the database in transactions of ``batch_size`` images.
+
+    Args:
+        gpath_list (list): local image paths
+        batch_size (int): number of images per database transaction
+        storage (str): 'hdd' or 'ssd', selects the reader pool size (see
+            preproc_image.get_reader_pool_size)
+        nprocs (int): overrides the reader pool size
+        auto_localize (bool): if None uses the default specified in ibs.cfg
+        location_for_names (str): defaults to ibs.cfg
+
+    Returns:
+        gid_list (list of rowids): None where a file could not be read
+
+    CommandLine:
+        python -m ibeis.control.manual_image_funcs ingest_images
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control.manual_image_funcs import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()[0:3]
+        >>> gpath_list = ibs.get_image_paths(gid_list) + ['doesnotexist.jpg']
+        >>> gid_list1 = ibs.ingest_images(gpath_list, auto_localize=False)
+        >>> gid_list2 = ibs.ingest_images(gpath_list, auto_localize=False)
+        >>> assert gid_list1 == gid_list2 == gid_list + [None]
+    """
+    from ibeis.algo.preproc import preproc_image
+    from ibeis.control import _sql_helpers
+    from ibeis.other import ibsfuncs
+    if auto_localize is None:
+        auto_localize = ibs.cfg.other_cfg.auto_localize
+    if nprocs is None:
+        nprocs = preproc_image.get_reader_pool_size(storage)
+    tt = ut.tic()
+    gpath_list = [abspath(gpath)
+                  for gpath in ibsfuncs.ensure_unix_gpaths(gpath_list)]
+    num_images = len(gpath_list)
+    print('[ibs] ingest_images len(gpath_list) = %d' % (num_images,))
+    stat_list = [_stat_ingest_path(gpath) for gpath in gpath_list]
+    gid_list = [None] * num_images
+
+    # Fast path: unchanged files that are still in the database
+    manifest_db = ibs.get_image_manifest_db()
+    manifest = _read_image_manifest(manifest_db, gpath_list)
+    known_idxs = [
+        idx for idx, (gpath, stat) in enumerate(zip(gpath_list, stat_list))
+        if stat is not None and manifest.get(gpath, (None,) * 4)[0:3] == stat
+    ]
+    known_uuids = [uuid.UUID(manifest[gpath_list[idx]][3])
+                   for idx in known_idxs]
+    known_gids = _sql_helpers.get_rowids_where_in(
+        ibs.db, const.IMAGE_TABLE, 'image_uuid', known_uuids)
+    for idx, gid in zip(known_idxs, known_gids):
+        gid_list[idx] = gid
+    todo_idxs = [idx for idx, (gid, stat) in enumerate(zip(gid_list, stat_list))
+                 if gid is None and stat is not None]
+    num_skipped = num_images - len(todo_idxs)
+    print('[ibs] ingest skipping %d unchanged or missing files' % (num_skipped,))
+
+    # Slow path: hash and parse the rest in parallel and commit in batches
+    num_added = 0
+    if len(todo_idxs) > 0:
+        args_gen = [(idx, gpath_list[idx]) for idx in todo_idxs]
+        result_gen = ut.generate2(
+            preproc_image.parse_imageinfo_indexed, args_gen,
+            nTasks=len(args_gen), ordered=False, nprocs=nprocs,
+            force_serial=ibs.force_serial or nprocs == 1)
+        for batch in ut.ichunks(result_gen, batch_size):
+            batch = [(idx, params) for idx, params in batch if params is not None]
+            if len(batch) == 0:
+                continue
+            batch_idxs = ut.take_column(batch, 0)
+            batch_params = ut.take_column(batch, 1)
+            batch_gpaths = ut.take(gpath_list, batch_idxs)
+            batch_gids = ibs.add_images_bulk(
+                batch_gpaths, batch_params, auto_localize=auto_localize,
+                location_for_names=location_for_names)
+            manifest_rows = [
+                (gpath_list[idx],) + stat_list[idx] + (str(params[0]),)
+                for idx, params in batch
+            ]
+            _write_image_manifest(manifest_db, manifest_rows)
+            for idx, gid in zip(batch_idxs, batch_gids):
+                gid_list[idx] = gid
+            num_added += len(batch)
+
+    ellapsed = ut.toc(tt)
+    rate = num_images / ellapsed if ellapsed > 0 else float('inf')
+    print('[ibs] ingested %d images (%d parsed, %d skipped) in %.2fs '
+          '(%.1f images/sec)' % (num_images, num_added, num_skipped,
+                                 ellapsed, rate))
+    return gid_list
+
+
+URL_PROTOS = ['https://', 'http://']
+S3_PROTOS = ['s3://']
+VALID_PROTOS = S3_PROTOS + URL_PROTOS
+
+
+def _isproto(uri, valid_protos):
+    return any(uri.startswith(proto) for proto in valid_protos)
+
+
+def _localize_uri(uri, loc_gpath):
+    """
+    Copies or downloads a single image uri to its localized path.
+    Worker function for :func:`localize_images`.
+    """
+    import urllib
+    urlsplit = urllib.parse.urlsplit
+    print('Localizing %r -> %r' % (uri, loc_gpath, ))
+    if _isproto(uri, VALID_PROTOS):
+        if _isproto(uri, S3_PROTOS):
+            print('\tAWS S3 Fetch')
+            s3_dict = ut.s3_str_decode_to_dict(uri)
+            ut.grab_s3_contents(loc_gpath, **s3_dict)
+        elif _isproto(uri, URL_PROTOS):
+            print('\tURL Download')
+            # Ensure that the Unicode string is properly encoded for web requests
+            uri_ = urlsplit(uri)
+            uri_path = six.moves.urllib.parse.quote(uri_.path.encode('utf8'))
+            uri_ = uri_._replace(path=uri_path)
+            uri = uri_.geturl()
+            six.moves.urllib.request.urlretrieve(uri, filename=loc_gpath)
+        else:
+            raise ValueError('Sanity check failed')
+    else:
+        if not exists(loc_gpath):
+            print('\tIO Copy')
+            # Copy images to local directory
+            ut.copy_list([uri], [loc_gpath])
+        else:
+            print('\tSkipping (already localized)')
+
+
+@register_ibs_method
+def localize_images(ibs, gid_list_=None, max_workers=None):
     r"""
     Moves the images into the ibeis image cache.
     Images are renamed to img_uuid.ext
@@ -397,6 +684,8 @@ def localize_images(ibs, gid_list_=None):
     Args:
         ibs (IBEISController):  ibeis controller object
         gid_list_ (list):
+        max_workers (int): if greater than one, uris are copied / downloaded
+            concurrently by at most this many threads (default = None)
 
     CommandLine:
         python -m ibeis.control.manual_image_funcs localize_images
@@ -424,13 +713,34 @@ def localize_images(ibs, gid_list_=None):
 
         testdb1/_ibsdb/images/f498fa6f-6b24-b4fa-7932-2612144fedd5.jpg
 
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # Concurrent download from a local file server
+        >>> from ibeis.control.manual_image_funcs import *  # NOQA
+        >>> import ibeis
+        >>> import functools, threading, uuid
+        >>> from os.path import dirname, basename
+        >>> from six.moves import BaseHTTPServer, SimpleHTTPServer
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gpath_list = [ut.grab_test_imgpath(key) for key in ['carl.jpg', 'lena.png']]
+        >>> handler = functools.partial(SimpleHTTPServer.SimpleHTTPRequestHandler,
+        >>>                             directory=dirname(gpath_list[0]))
+        >>> server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), handler)
+        >>> threading.Thread(target=server.serve_forever, daemon=True).start()
+        >>> url_fmt = 'http://127.0.0.1:%d/%%s' % (server.server_address[1],)
+        >>> uri_list = [url_fmt % (basename(gpath),) for gpath in gpath_list]
+        >>> params_list = [(uuid.uuid4(), uri, uri, basename(uri), '.jpg', 1, 1,
+        >>>                 -1, -1.0, -1.0, 0, '') for uri in uri_list]
+        >>> gid_list = ibs.add_images_bulk(uri_list, params_list, auto_localize=False)
+        >>> ibs.localize_images(gid_list, max_workers=2)
+        >>> server.shutdown()
+        >>> assert all(map(exists, ibs.get_image_paths(gid_list)))
+        >>> ibs.delete_images(gid_list)
+
     Ignore:
         ibs.vd()
 
     """
-    #from os.path import isabs
-    import urllib
-    urlsplit = urllib.parse.urlsplit
     if gid_list_ is None:
         print('WARNING: you are localizing all gids')
         gid_list_  = ibs.get_valid_gids()
@@ -440,16 +750,6 @@ def localize_images(ibs, gid_list_=None):
     #gpath_list = ibs.get_image_paths(gid_list)
     uri_list = ibs.get_image_uris(gid_list)
 
-    url_protos = ['https://', 'http://']
-    s3_proto = ['s3://']
-    valid_protos = s3_proto + url_protos
-
-    def isproto(uri, valid_protos):
-        return any(uri.startswith(proto) for proto in valid_protos)
-
-    def islocal(uri):
-        return not (isabs(uri) and isproto(uri, valid_protos))
-
     guuid_list = ibs.get_image_uuids(gid_list)
     gext_list  = ibs.get_image_exts(gid_list)
     # Build list of image names based on uuid in the ibeis imgdir
@@ -457,31 +757,18 @@ def localize_images(ibs, gid_list_=None):
     loc_gname_list = [guuid + ext for (guuid, ext) in zip(guuid_strs, gext_list)]
     loc_gpath_list = [join(ibs.imgdir, gname) for gname in loc_gname_list]
     # Copy any s3/http images first
-    for uri, loc_gpath in zip(uri_list, loc_gpath_list):
-        print('Localizing %r -> %r' % (uri, loc_gpath, ))
-        if isproto(uri, valid_protos):
-            if isproto(uri, s3_proto):
-                print('\tAWS S3 Fetch')
-                s3_dict = ut.s3_str_decode_to_dict(uri)
-                ut.grab_s3_contents(loc_gpath, **s3_dict)
-            elif isproto(uri, url_protos):
-                print('\tURL Download')
-                # Ensure that the Unicode string is properly encoded for web requests
-                uri_ = urlsplit(uri)
-                uri_path = six.moves.urllib.parse.quote(uri_.path.encode('utf8'))
-                uri_ = uri_._replace(path=uri_path)
-                uri = uri_.geturl()
-                six.moves.urllib.request.urlretrieve(uri, filename=loc_gpath)
-            else:
-                raise ValueError('Sanity check failed')
-        else:
-            if not exists(loc_gpath):
-                print('\tIO Copy')
-                # Copy images to local directory
-                uri if islocal(uri) else join(ibs.imgdir, uri)
-                ut.copy_list([uri], [loc_gpath])
-            else:
-                print('\tSkipping (already localized)')
+    if max_workers is None or max_workers <= 1 or len(uri_list) <= 1:
+        for uri, loc_gpath in zip(uri_list, loc_gpath_list):
+            _localize_uri(uri, loc_gpath)
+    else:
+        # Downloads are IO bound, so a bounded thread pool is sufficient
+        from concurrent import futures
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_list = [executor.submit(_localize_uri, uri, loc_gpath)
+                           for uri, loc_gpath in zip(uri_list, loc_gpath_list)]
+            # Reraise the first failure (if any) after all tasks finish
+            for future in future_list:
+                future.result()
     # Update database uris
     ibs.set_image_uris(gid_list, loc_gname_list)
     assert all(map(exists, loc_gpath_list)), 'not all images copied'
@@ -1294,10 +1581,7 @@ def get_image_detectpaths(ibs, gid_list):
     """
     import dtool_ibeis
     depc = ibs.depc_image
-    config = {
-        'thumbsize': ibs.cfg.detect_cfg.detectimg_sqrt_area,
-        'force_serial': True,
-    }
+    config = _get_detectpath_config(ibs)
     try:
         thumbpath_list = depc.get('thumbnails', gid_list, 'img', config=config,
                                    read_extern=False)
@@ -1309,6 +1593,47 @@ def get_image_detectpaths(ibs, gid_list):
     return thumbpath_list
 
 
+def _get_detectpath_config(ibs):
+    config = {
+        'thumbsize': ibs.cfg.detect_cfg.detectimg_sqrt_area,
+        'force_serial': True,
+    }
+    if DETECT_DECODE_REDUCE:
+        config['decode_reduce'] = True
+    return config
+
+
+@register_ibs_method
+@accessor_decors.getter_1to1
+def get_image_detectsizes(ibs, gid_list):
+    r"""
+    Returns:
+        list_ (list): the (width, height) of the images returned by
+            get_image_detectpaths. The sizes are stored with the thumbnails
+            so the resized files are not reopened to read them.
+
+    CommandLine:
+        python -m ibeis.control.manual_image_funcs get_image_detectsizes
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control.manual_image_funcs import *  # NOQA
+        >>> import ibeis
+        >>> import vtool_ibeis as vt
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()[0:3]
+        >>> size_list = ibs.get_image_detectsizes(gid_list)
+        >>> gpath_list = ibs.get_image_detectpaths(gid_list)
+        >>> assert size_list == [vt.open_image_size(gpath) for gpath in gpath_list]
+    """
+    depc = ibs.depc_image
+    config = _get_detectpath_config(ibs)
+    size_list = depc.get('thumbnails', gid_list, ('width', 'height'),
+                         config=config)
+    size_list = [None if size is None else tuple(size) for size in size_list]
+    return size_list
+
+
 @register_ibs_method
 @accessor_decors.getter_1to1
 @register_api('/api/image/file/name/', methods=['GET'])
@@ -1529,6 +1854,76 @@ def get_image_gps2(ibs, gid_list):
     return gps_list
 
 
+# Columns available to :func:`get_image_columns`. Each entry maps a name to
+# (sql_expr_list, dtype, fill) over the images table aliased as ``i``.
+# NULL values and missing rows become the fill value. Missing values use the
+# same -1 sentinels as the list getters and are converted to nan by
+# :func:`_fix_image_column_arrays`.
+IMAGE_ARRAY_COLUMNS = ut.odict([
+    ('unixtime', (['COALESCE(i.image_time_posix, -1) + '
+                   'COALESCE(i.image_timedelta_posix, 0)'], np.float64, np.nan)),
+    ('gps', (['COALESCE(i.image_gps_lat, -1)',
+              'COALESCE(i.image_gps_lon, -1)'], np.float64, np.nan)),
+    ('size', (['i.image_width', 'i.image_height'], np.int64, -1)),
+    ('orientation', (['COALESCE(i.image_orientation, 0)'], np.int64, -1)),
+])
+
+
+def _fix_image_column_arrays(column_dict):
+    """ Replaces the -1 sentinels stored in SQL with nan """
+    if 'unixtime' in column_dict:
+        # Matches get_image_unixtime_asfloat (timedelta is added to -1 too)
+        unixtime_arr = column_dict['unixtime']
+        unixtime_arr[unixtime_arr == -1] = np.nan
+    if 'gps' in column_dict:
+        gps_arr = column_dict['gps']
+        gps_arr[gps_arr == -1] = np.nan
+    return column_dict
+
+
+@register_ibs_method
+def get_image_columns(ibs, gid_list, colnames):
+    r"""
+    Columnar version of the image getters. Fetches every requested column
+    with a single SQL statement and returns typed numpy arrays aligned with
+    gid_list.
+
+    Args:
+        gid_list (list): image rowids (duplicates allowed)
+        colnames (list): subset of IMAGE_ARRAY_COLUMNS
+            ('unixtime', 'gps', 'size', 'orientation')
+
+    Returns:
+        dict: column_dict - maps each colname to an ndarray. unixtime and gps
+            are float arrays with nan for missing values (like
+            get_image_unixtime_asfloat and get_image_gps2); size is an Nx2
+            int array. Rows for invalid gids are filled with nan or -1.
+
+    CommandLine:
+        python -m ibeis.control.manual_image_funcs --test-get_image_columns
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.control.manual_image_funcs import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()[::-1]
+        >>> gid_list = gid_list + gid_list[0:1]
+        >>> column_dict = ibs.get_image_columns(gid_list, ['unixtime', 'gps', 'size'])
+        >>> unixtimes = ibs.get_image_unixtime_asfloat(gid_list)
+        >>> gps_list = ibs.get_image_gps2(gid_list)
+        >>> assert np.allclose(column_dict['unixtime'], unixtimes, equal_nan=True)
+        >>> assert np.allclose(column_dict['gps'], gps_list, equal_nan=True)
+        >>> assert column_dict['size'].tolist() == list(map(list, ibs.get_image_sizes(gid_list)))
+    """
+    from ibeis.control import _sql_helpers
+    column_dict, exists_flags = _sql_helpers.get_column_arrays(
+        ibs.db, const.IMAGE_TABLE + ' AS i', 'i.rowid', IMAGE_ARRAY_COLUMNS,
+        colnames, gid_list)
+    column_dict = _fix_image_column_arrays(column_dict)
+    return column_dict
+
+
 @register_ibs_method
 @accessor_decors.getter_1to1
 @register_api('/api/image/lat/', methods=['GET'])
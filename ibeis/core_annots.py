@@ -348,7 +348,13 @@ def compute_chip(depc, aid_list, config=None):
     print('Done Preprocessing Chips')
 
 
-def gen_chip_configure_and_compute(ibs, gid_list, rowid_list, bbox_list, theta_list, config):
+def get_chip_warp_params(rowid_list, bbox_list, theta_list, config):
+    """
+    Returns:
+        tuple: (M_list, newsize_list, filter_list, warpkw) - the image to chip
+            transforms, chip sizes, intensity filters and cv2.warpAffine
+            keywords of a ChipConfig
+    """
     #ext = config['ext']
     pad = config['pad']
     dim_size = config['dim_size']
@@ -434,9 +440,14 @@ def gen_chip_configure_and_compute(ibs, gid_list, rowid_list, bbox_list, theta_l
                 'clipLimit': config['adapteq_limit'],
             })
         )
-    ipreproc = image_filters.IntensityPreproc()
-
     warpkw = dict(flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_CONSTANT)
+    return M_list, newsize_list, filter_list, warpkw
+
+
+def gen_chip_configure_and_compute(ibs, gid_list, rowid_list, bbox_list, theta_list, config):
+    M_list, newsize_list, filter_list, warpkw = get_chip_warp_params(
+        rowid_list, bbox_list, theta_list, config)
+    ipreproc = image_filters.IntensityPreproc()
 
     _parallel_chips = getattr(ibs, '_parallel_chips', True)
 
@@ -1650,6 +1661,8 @@ if testmode:
 class ClassifierConfig(dtool_ibeis.Config):
     _param_info_list = [
         ut.ParamInfo('classifier_weight_filepath', None),
+        ut.ParamInfo('inference_batch_size', None, hideif=lambda cfg: True),
+        ut.ParamInfo('inference_workers', None, hideif=lambda cfg: True),
     ]
     _sub_config_list = [
         ChipConfig
@@ -1691,18 +1704,24 @@ def compute_classifications(depc, aid_list, config=None):
         >>> results = depc.get_property('classifier', gid_list, None)
         >>> print(results)
     """
+    from ibeis.algo.detect import annot_inference
     print('[ibs] Process Image Classifications')
     print('config = %r' % (config,))
     # Get controller
     ibs = depc.controller
-    depc = ibs.depc_annot
+    model_kw, batch_size, workers = annot_inference.split_inference_config(config)
     config = {
         # 'dim_size' : (128, 128),
         'dim_size': (192, 192),
         'resize_dim': 'wh',
     }
-    chip_list = depc.get_property('chips', aid_list, 'img', config=config)
-    result_list = ibs.generate_thumbnail_class_list(chip_list, **config)
+
+    def model_func(chip_list):
+        return ibs.generate_thumbnail_class_list(chip_list, **config)
+
+    result_list = annot_inference.generate_chip_inference(
+        ibs, aid_list, config, model_func, batch_size=batch_size,
+        workers=workers)
     # yield detections
     for result in result_list:
         yield result
@@ -1711,6 +1730,8 @@ def compute_classifications(depc, aid_list, config=None):
 class LabelerConfig(dtool_ibeis.Config):
     _param_info_list = [
         ut.ParamInfo('labeler_weight_filepath', None),
+        ut.ParamInfo('inference_batch_size', None, hideif=lambda cfg: True),
+        ut.ParamInfo('inference_workers', None, hideif=lambda cfg: True),
     ]
     _sub_config_list = [
         ChipConfig
@@ -1753,17 +1774,23 @@ def compute_labels_annotations(depc, aid_list, config=None):
         >>> results = depc.get_property('labeler', aid_list, None)
         >>> print(results)
     """
+    from ibeis.algo.detect import annot_inference
     print('[ibs] Process Annotation Labels')
     print('config = %r' % (config,))
     # Get controller
     ibs = depc.controller
-    depc = ibs.depc_annot
+    model_kw, batch_size, workers = annot_inference.split_inference_config(config)
     config_ = {
         'dim_size': (128, 128),
         'resize_dim': 'wh',
     }
-    chip_list = depc.get_property('chips', aid_list, 'img', config=config_)
-    result_list = ibs.generate_chip_label_list(chip_list, **config)
+
+    def model_func(chip_list):
+        return ibs.generate_chip_label_list(chip_list, **model_kw)
+
+    result_list = annot_inference.generate_chip_inference(
+        ibs, aid_list, config_, model_func, batch_size=batch_size,
+        workers=workers)
     # yield detections
     for result in result_list:
         yield result
@@ -1772,6 +1799,8 @@ def compute_labels_annotations(depc, aid_list, config=None):
 class AoIConfig(dtool_ibeis.Config):
     _param_info_list = [
         ut.ParamInfo('aoi_two_weight_filepath', None),
+        ut.ParamInfo('inference_batch_size', None, hideif=lambda cfg: True),
+        ut.ParamInfo('inference_workers', None, hideif=lambda cfg: True),
     ]
 
 
@@ -1810,20 +1839,37 @@ def compute_aoi2(depc, aid_list, config=None):
         >>> results = depc.get_property('aoi_two', aid_list, None)
         >>> print(results)
     """
+    from ibeis.algo.detect import annot_inference
     print('[ibs] Process Annotation AoI2s')
     print('config = %r' % (config,))
     # Get controller
     ibs = depc.controller
     depc = ibs.depc_image
+    model_kw, batch_size, workers = annot_inference.split_inference_config(config)
     config_ = {
         'draw_annots' : False,
         'thumbsize'   : (192, 192),
     }
     gid_list = ibs.get_annot_gids(aid_list)
-    thumbnail_list = depc.get_property('thumbnails', gid_list, 'img', config=config_)
+    # Ensure the thumbnails, the decode workers read their files
+    thumbpath_list = depc.get('thumbnails', gid_list, 'img', config=config_,
+                              read_extern=False)
     bbox_list = ibs.get_annot_bboxes(aid_list)
     size_list = ibs.get_image_sizes(gid_list)
-    result_list = ibs.generate_thumbnail_aoi2_list(thumbnail_list, bbox_list, size_list, **config)
+    item_list = list(zip(thumbpath_list, bbox_list, size_list))
+
+    def decode_func(item):
+        thumbpath, bbox, size = item
+        return vt.imread(thumbpath), bbox, size
+
+    def model_func(decoded_list):
+        thumbnail_list, bbox_list_, size_list_ = zip(*decoded_list)
+        return ibs.generate_thumbnail_aoi2_list(
+            list(thumbnail_list), list(bbox_list_), list(size_list_), **model_kw)
+
+    result_list = annot_inference.generate_batched_inference(
+        item_list, decode_func, model_func, batch_size=batch_size,
+        workers=workers)
     # yield detections
     for result in result_list:
         yield result
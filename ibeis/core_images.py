@@ -32,6 +32,7 @@ Needed Tables:
 
 """
 import dtool_ibeis
+import threading
 import utool as ut
 import numpy as np
 import vtool_ibeis as vt
@@ -42,6 +43,10 @@ from ibeis.control.controller_inject import register_preprocs
 
 register_preproc = register_preprocs['image']
 
+# localizations_original rows computed outside of the depcache, by gid (see
+# detectcore.write_localizations_original)
+PRECOMPUTED_LOCALIZATIONS = threading.local()
+
 
 class ThumbnailConfig(dtool_ibeis.Config):
     _param_info_list = [
@@ -49,6 +54,10 @@ class ThumbnailConfig(dtool_ibeis.Config):
         ut.ParamInfo('thumbsize', None, type_=None, hideif=None),
         ut.ParamInfo('ext', '.png', hideif='.png'),
         ut.ParamInfo('force_serial', False, hideif=False),
+        # Let the JPEG decoder downscale images that are much larger than
+        # the thumbnail. The pixels differ slightly from a full decode, so
+        # this is opt-in and part of the cfgstr when enabled.
+        ut.ParamInfo('decode_reduce', False, hideif=False),
     ]
 
 
@@ -99,6 +108,7 @@ def compute_thumbnails(depc, gid_list, config=None):
         cfg = ibs.cfg.other_cfg
         thumbsize = cfg.thumb_size if draw_annots else cfg.thumb_bare_size
     thumbsize_list = [thumbsize] * len(gid_list)
+    decode_reduce_list = [config['decode_reduce']] * len(gid_list)
     gpath_list = ibs.get_image_paths(gid_list)
     orient_list = ibs.get_image_orientation(gid_list)
     aids_list = ibs.get_image_aids(gid_list)
@@ -113,7 +123,7 @@ def compute_thumbnails(depc, gid_list, config=None):
 
     # Execute all tasks in parallel
     args_list = list(zip(thumbsize_list, gpath_list, orient_list, bboxes_list,
-                         thetas_list, interests_list))
+                         thetas_list, interests_list, decode_reduce_list))
 
     genkw = {
         'ordered': True,
@@ -128,11 +138,9 @@ def compute_thumbnails(depc, gid_list, config=None):
         yield val
 
 
-def draw_thumb_helper(thumbsize, gpath, orient, bbox_list, theta_list, interest_list):
-    # time consuming
-    img = vt.imread(gpath, orient=orient)
-    (gh, gw) = img.shape[0:2]
-    img_size = (gw, gh)
+def get_thumb_dims(img_size, thumbsize):
+    """ Returns the thumbnail (dsize, sx, sy) of an image of size (w, h) """
+    (gw, gh) = img_size
     if isinstance(thumbsize, int):
         max_dsize = (thumbsize, thumbsize)
         dsize, sx, sy = vt.resized_clamped_thumb_dims(img_size, max_dsize)
@@ -141,6 +149,23 @@ def draw_thumb_helper(thumbsize, gpath, orient, bbox_list, theta_list, interest_
         dsize, sx, sy = thumbsize, tw / gw, th / gh
     else:
         raise ValueError('Incompatible thumbsize')
+    return dsize, sx, sy
+
+
+def draw_thumb_helper(thumbsize, gpath, orient, bbox_list, theta_list,
+                      interest_list, decode_reduce=False):
+    from ibeis.algo.preproc import preproc_image
+    # time consuming
+    if decode_reduce:
+        def dsize_func(img_size):
+            return get_thumb_dims(img_size, thumbsize)[0]
+        img, img_size = preproc_image.imread_reduced(gpath, orient=orient,
+                                                     dsize_func=dsize_func)
+    else:
+        img = vt.imread(gpath, orient=orient)
+        (gh, gw) = img.shape[0:2]
+        img_size = (gw, gh)
+    dsize, sx, sy = get_thumb_dims(img_size, thumbsize)
     new_verts_list = list(vt.scaled_verts_from_bbox_gen(bbox_list, theta_list, sx, sy))
     # -----------------
     # Actual computation
@@ -564,21 +589,73 @@ def compute_localizations_original(depc, gid_list, config=None):
         >>> detects = depc.get_property('localizations_original', gid_list, 'bboxes', config=config)
         >>> print(detects)
     """
-    def _package_to_numpy(key_list, result_list, score):
-        temp = [
-            [
-                key[0] if isinstance(key, tuple) else result[key]
-                for key in key_list
-            ]
-            for result in result_list
+    print('[ibs] Preprocess Localizations')
+    print('config = %r' % (config,))
+    # Get controller
+    ibs = depc.controller
+    ibs.assert_valid_gids(gid_list)
+    precomputed = getattr(PRECOMPUTED_LOCALIZATIONS, 'gid_to_result', None)
+    if precomputed is not None:
+        for gid in gid_list:
+            yield precomputed[gid]
+        return
+    for result in detect_localizations_original(ibs, gid_list, config):
+        yield result
+
+
+# Detector result keys of a localization, tuples are constant values
+LOCALIZATION_BASE_KEYS = [
+    'xtl', 'ytl', 'width', 'height',
+    (0.0, ),  # Theta, temporary for all detectors
+    'confidence', 'class',
+]
+
+
+def package_localizations_original(detect, base_key_list=LOCALIZATION_BASE_KEYS):
+    """
+    Converts the (gid, gpath, result_list) output of a detector into a
+    localizations_original row. Rows that are already packaged are returned
+    unchanged.
+    """
+    if len(detect) != 3:
+        return detect
+    gid, gpath, result_list = detect
+    score = 0.0
+    temp = [
+        [
+            key[0] if isinstance(key, tuple) else result[key]
+            for key in base_key_list
         ]
-        return (
-            score,
-            np.array([ _[0:4] for _ in temp ]),
-            np.array([ _[4]   for _ in temp ]),
-            np.array([ _[5]   for _ in temp ]),
-            np.array([ _[6]   for _ in temp ]),
-        )
+        for result in result_list
+    ]
+    return (
+        score,
+        np.array([ _[0:4] for _ in temp ]),
+        np.array([ _[4]   for _ in temp ]),
+        np.array([ _[5]   for _ in temp ]),
+        np.array([ _[6]   for _ in temp ]),
+    )
+
+
+def rectify_lightnet_config(config):
+    """ Lightnet takes the weights from config_filepath (in place) """
+    if 'config_filepath' in config:
+        if 'weight_filepath' in config:
+            args = (config['weight_filepath'], config['config_filepath'], )
+            print('Overwriting weight_filepath %r with %r' % args)
+        config['weight_filepath'] = config['config_filepath']
+    config['config_filepath'] = None
+    return config
+
+
+def detect_localizations_original(ibs, gid_list, config):
+    """
+    Runs the detector selected by config['algo'] on gid_list.
+
+    Yields:
+        tuple: (score, bboxes, thetas, confs, classes) for each image
+    """
+    depc = ibs.depc_image
 
     def _combined(gid_list, config_dict_list):
         # Combined list of algorithm configs
@@ -603,19 +680,11 @@ def compute_localizations_original(depc, gid_list, config=None):
                 accum_list.append(accum_value)
             yield tuple(accum_list)
 
-    print('[ibs] Preprocess Localizations')
-    print('config = %r' % (config,))
-    # Get controller
-    ibs = depc.controller
-    ibs.assert_valid_gids(gid_list)
-
     config = dict(config)
     config['sensitivity'] = 0.0
 
     # Normal computations
-    base_key_list = ['xtl', 'ytl', 'width', 'height', 'theta', 'confidence', 'class']
-    # Temporary for all detectors
-    base_key_list[4] = (0.0, )  # Theta
+    base_key_list = list(LOCALIZATION_BASE_KEYS)
 
     ######################################################################################
     if config['algo'] in ['pydarknet', 'yolo', 'cnn']:
@@ -626,12 +695,7 @@ def compute_localizations_original(depc, gid_list, config=None):
     elif config['algo'] in ['lightnet']:
         from ibeis.algo.detect import lightnet
         print('[ibs] detecting using Lightnet CNN YOLO v2')
-        if 'config_filepath' in config:
-            if 'weight_filepath' in config:
-                args = (config['weight_filepath'], config['config_filepath'], )
-                print('Overwriting weight_filepath %r with %r' % args)
-            config['weight_filepath'] = config['config_filepath']
-        config['config_filepath'] = None
+        rectify_lightnet_config(config)
         detect_gen = lightnet.detect_gid_list(ibs, gid_list, **config)
     elif config['algo'] in ['azure']:
         from ibeis.algo.detect import azure
@@ -696,13 +760,7 @@ def compute_localizations_original(depc, gid_list, config=None):
 
     # yield detections
     for detect in detect_gen:
-        if len(detect) == 3:
-            gid, gpath, result_list = detect
-            score = 0.0
-            result = _package_to_numpy(base_key_list, result_list, score)
-        else:
-            result = detect
-        yield result
+        yield package_localizations_original(detect, base_key_list)
 
 
 class LocalizerConfig(dtool_ibeis.Config):
@@ -760,68 +818,43 @@ def compute_localizations(depc, loc_orig_id_list, config=None):
     print('[ibs] Preprocess Localizations')
     print('config = %r' % (config,))
 
-    VERBOSE = False
-
-    for detect in zip(depc.get_native('localizations_original', loc_orig_id_list, None)):
-        score, bboxes, thetas, confs, classes = detect[0]
-
-        # Apply Threshold
-        if config['sensitivity'] > 0.0:
-            count_old = len(bboxes)
-            if count_old > 0:
-                keep_list = np.array([
-                    index
-                    for index, conf in enumerate(confs)
-                    if conf >= config['sensitivity']
-                ])
-
-                if len(keep_list) == 0:
-                    bboxes  = np.array([])
-                    thetas  = np.array([])
-                    confs   = np.array([])
-                    classes = np.array([])
-                else:
-                    bboxes  = bboxes[keep_list]
-                    thetas  = thetas[keep_list]
-                    confs   = confs[keep_list]
-                    classes = classes[keep_list]
-
-                count_new = len(bboxes)
-                if VERBOSE:
-                    print('Filtered with sensitivity = %0.02f (%d -> %d)' % (config['nms_thresh'], count_old, count_new, ))
-
-        # Apply NMS
-        if config['nms']:
-            from ibeis.other import detectcore
-            count_old = len(bboxes)
-            if count_old > 0:
-                coord_list = []
-                confs_list = []
-                for (xtl, ytl, width, height) in bboxes:
-                    xbr = xtl + width
-                    ybr = ytl + height
-                    coord_list.append([xtl, ytl, xbr, ybr])
-                coord_list = np.vstack(coord_list)
-                confs_list = np.array(confs)
-
-                nms_thresh = 1.0 - config['nms_thresh']
-                keep_indices_list = detectcore.nms(coord_list, confs_list, nms_thresh)
-                keep_list = np.array(keep_indices_list)
-
-                if len(keep_list) == 0:
-                    bboxes  = np.array([])
-                    thetas  = np.array([])
-                    confs   = np.array([])
-                    classes = np.array([])
-                else:
-                    bboxes  = bboxes[keep_list]
-                    thetas  = thetas[keep_list]
-                    confs   = confs[keep_list]
-                    classes = classes[keep_list]
+    from ibeis.other import detectcore
 
-                count_new = len(bboxes)
-                if VERBOSE:
-                    print('Filtered with nms_thresh = %0.02f (%d -> %d)' % (nms_thresh, count_old, count_new, ))
+    detect_list = [
+        detect[0]
+        for detect in zip(depc.get_native('localizations_original', loc_orig_id_list, None))
+    ]
+
+    # Post-process the whole chunk at once as flat arrays
+    length_list = [len(detect[1]) for detect in detect_list]
+    offset_list = np.cumsum([0] + length_list)
+    nonempty_list = [detect for detect in detect_list if len(detect[1]) > 0]
+    if len(nonempty_list) > 0:
+        flat_bboxes = np.vstack([detect[1] for detect in nonempty_list])
+        flat_confs = np.hstack([detect[3] for detect in nonempty_list])
+    else:
+        flat_bboxes = np.zeros((0, 4))
+        flat_confs = np.zeros((0,))
+
+    apply_filter = config['sensitivity'] > 0.0 or config['nms']
+    nms_thresh = 1.0 - config['nms_thresh'] if config['nms'] else None
+    keep_list_list = detectcore.batch_postprocess_localizations(
+        flat_bboxes, flat_confs, offset_list,
+        sensitivity=config['sensitivity'], nms_thresh=nms_thresh)
+
+    for detect, keep_list in zip(detect_list, keep_list_list):
+        score, bboxes, thetas, confs, classes = detect
+        if apply_filter and len(bboxes) > 0:
+            if len(keep_list) == 0:
+                bboxes  = np.array([])
+                thetas  = np.array([])
+                confs   = np.array([])
+                classes = np.array([])
+            else:
+                bboxes  = bboxes[keep_list]
+                thetas  = thetas[keep_list]
+                confs   = confs[keep_list]
+                classes = classes[keep_list]
 
         yield (score, bboxes, thetas, confs, classes, )
 
@@ -1078,6 +1111,10 @@ class Chip2Config(dtool_ibeis.Config):
     _param_info_list = [
         ut.ParamInfo('localization_chip_target_size', (128, 128)),
         ut.ParamInfo('localization_chip_masking', False),
+        # Decode JPEGs at reduced resolution when the boxes are large enough
+        ut.ParamInfo('localization_chip_decode_reduce', False, hideif=False),
+        # Reuse chips from the chip store, does not change the chips
+        ut.ParamInfo('localization_chip_store', False, hideif=lambda cfg: True),
     ]
     _sub_config_list = [
         ThumbnailConfig
@@ -1123,6 +1160,7 @@ def compute_localizations_chips(depc, loc_id_list, config=None):
         >>> results = depc.get_property('localizations_chips', gid_list, None, config=config)
         >>> print(results)
     """
+    from ibeis.algo.preproc import preproc_localization_chip
     print('[ibs] Process Localization Chips')
     print('config = %r' % (config,))
     # Get controller
@@ -1130,7 +1168,6 @@ def compute_localizations_chips(depc, loc_id_list, config=None):
 
     masking = config['localization_chip_masking']
     target_size = config['localization_chip_target_size']
-    target_size_list = [target_size] * len(loc_id_list)
 
     gid_list_ = depc.get_ancestor_rowids('localizations', loc_id_list, 'images')
     assert len(gid_list_) == len(loc_id_list)
@@ -1142,24 +1179,20 @@ def compute_localizations_chips(depc, loc_id_list, config=None):
     avg = sum(len_list) / len(len_list)
     args = (len(loc_id_list), min(len_list), avg, max(len_list), sum(len_list), )
 
-    # Create image iterator
-    img_list = (ibs.get_images(gid) for gid in gid_list_)
-
     if masking:
         print('Extracting %d localization masks (min: %d, avg: %0.02f, max: %d, total: %d)' % args)
-        worker_func = get_localization_masks_worker
     else:
         print('Extracting %d localization chips (min: %d, avg: %0.02f, max: %d, total: %d)' % args)
-        worker_func = get_localization_chips_worker
 
-    arg_iter = zip(gid_list_, img_list, bboxes_list, thetas_list, target_size_list)
-    result_list = ut.util_parallel.generate2(worker_func, arg_iter,
-                                             ordered=True,
-                                             nTasks=len(gid_list_),
-                                             force_serial=True)
+    # Images are decoded in parallel, one task per image
+    chips_list = preproc_localization_chip.extract_localization_chips(
+        ibs, gid_list_, bboxes_list, thetas_list, target_size,
+        masking=masking,
+        decode_reduce=config['localization_chip_decode_reduce'],
+        use_store=config['localization_chip_store'])
 
     # Return the results
-    for gid, chip_list in result_list:
+    for chip_list in chips_list:
         ret_tuple = (
             chip_list,
         )
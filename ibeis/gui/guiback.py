@@ -2992,7 +2992,14 @@ class MainWindowBackend(GUIBACK_BASE):
 
     @blocking_slot()
     def run_integrity_checks(back):
-        back.ibs.run_integrity_checks()
+        """ Help -> Run Integrity Checks """
+        from ibeis.other import integrity
+        report = back.ibs.run_integrity_checks()
+        if not report['passed']:
+            gt.msgbox(title='Integrity Checks Failed',
+                      msg=integrity.format_integrity_failures(report),
+                      detailed_msg=ut.repr3(report))
+        return report
 
     #--------------------------------------------------------------------------
     # File Slots
@@ -32,8 +32,272 @@ CLASS_INJECT_KEY, register_ibs_method = (
 
 def nms(dets, scores, thresh, use_cpu=True):
     # Interface into Faster R-CNN's Python native NMS algorithm by Girshick et al.
-    from ibeis.algo.detect.nms.py_cpu_nms import py_cpu_nms
-    return py_cpu_nms(dets, scores, thresh)
+    # The tiled version keeps the same boxes as py_cpu_nms
+    from ibeis.algo.detect.nms.tiled_nms import tiled_nms
+    return tiled_nms(dets, scores, thresh)
+
+
+def batch_postprocess_localizations(bboxes, confs, offset_list, sensitivity=0.0,
+                                    nms_thresh=None, classes=None):
+    """
+    Sensitivity thresholding and NMS for the raw detections of many images.
+
+    Args:
+        bboxes (ndarray): (N, 4) xtl, ytl, width, height of all images stacked
+        confs (ndarray): (N,) confidences
+        offset_list (ndarray): (M + 1,) start of each image's detections
+        sensitivity (float): if positive, drop detections with a smaller
+            confidence
+        nms_thresh (float): overlap above which a box is suppressed, or None
+            to skip NMS
+        classes (ndarray): if given, NMS only suppresses boxes of the same
+            class. Otherwise all boxes of an image compete.
+
+    Returns:
+        list: the kept indices into each image's detections, in the order the
+            boxes should be output (descending confidence after NMS)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.other.detectcore import *  # NOQA
+        >>> from ibeis.algo.detect.nms.py_cpu_nms import py_cpu_nms
+        >>> rng = np.random.RandomState(0)
+        >>> length_list = [0, 30, 200, 1]
+        >>> offset_list = np.cumsum([0] + length_list)
+        >>> bboxes = np.hstack([rng.randint(0, 100, (231, 2)),
+        >>>                     rng.randint(5, 40, (231, 2))]).astype(np.float32)
+        >>> confs = rng.rand(231).astype(np.float32)
+        >>> keep_list = batch_postprocess_localizations(
+        >>>     bboxes, confs, offset_list, sensitivity=0.2, nms_thresh=0.8)
+        >>> for start, stop, keep in zip(offset_list, offset_list[1:], keep_list):
+        >>>     index = np.nonzero(confs[start:stop] >= 0.2)[0]
+        >>>     coords = bboxes[start:stop][index].copy()
+        >>>     coords[:, 2:] += coords[:, :2]
+        >>>     expected = index[py_cpu_nms(coords, confs[start:stop][index], 0.8)]
+        >>>     assert keep.tolist() == expected.tolist()
+    """
+    from ibeis.algo.detect.nms.tiled_nms import tiled_nms
+    offset_list = np.asarray(offset_list)
+    length_list = np.diff(offset_list)
+    image_index = np.repeat(np.arange(len(length_list)), length_list)
+
+    if sensitivity > 0.0:
+        index_list = np.nonzero(confs >= sensitivity)[0]
+    else:
+        index_list = np.arange(len(confs))
+
+    group_list = image_index[index_list]
+    if nms_thresh is not None and classes is not None:
+        class_codes = np.unique(classes[index_list], return_inverse=True)[1]
+        group_list = group_list * (class_codes.max() + 1) + class_codes
+    # Contiguous groups, each in its original detection order
+    sortx = np.argsort(group_list, kind='stable')
+    index_list = index_list[sortx]
+    group_list = group_list[sortx]
+    split_list = np.nonzero(np.diff(group_list))[0] + 1
+    group_index_list = np.split(index_list, split_list)
+
+    if nms_thresh is not None and len(index_list) > 0:
+        coords = np.hstack((bboxes[:, 0:2], bboxes[:, 0:2] + bboxes[:, 2:4]))
+        group_index_list = [
+            group_index[tiled_nms(coords[group_index], confs[group_index], nms_thresh)]
+            for group_index in group_index_list
+        ]
+
+    keep_list = [[] for _ in range(len(length_list))]
+    for group_index in group_index_list:
+        if len(group_index) > 0:
+            keep_list[image_index[group_index[0]]].append(group_index)
+    keep_list = [
+        np.hstack(keep) - offset if len(keep) > 0 else np.array([], dtype=np.int64)
+        for keep, offset in zip(keep_list, offset_list)
+    ]
+    return keep_list
+
+
+def _prefetch_image_file(gpath, blocksize=2 ** 20):
+    """ Reads a file so the detector finds it in the page cache """
+    with open(gpath, 'rb') as file_:
+        while file_.read(blocksize):
+            pass
+    return gpath
+
+
+def get_localizer_gpaths(ibs, gid_list, config):
+    """
+    Returns the image files that the detector selected by config reads: the
+    original images for YOLO v1 and Lightnet, and the detect-sized
+    thumbnails (get_image_detectpaths) for the detectors that downsample.
+    """
+    if config['algo'] in ['pydarknet', 'yolo', 'cnn', 'lightnet']:
+        return ibs.get_image_paths(gid_list)
+    return ibs.get_image_detectpaths(gid_list)
+
+
+def get_localizer_stages(ibs, config):
+    """
+    Returns the decode and inference stages of a DetectionPipeline that
+    compute localizations_original rows for (gid, gpath) items, where gpath
+    is the file the detector reads (see get_localizer_gpaths).
+
+    Lightnet decodes and letterboxes images in the decode pool and runs the
+    network on whole batches. The other detectors load images themselves, so
+    the decode pool only reads the files ahead of them and the inference
+    stage runs the detector on each batch of images.
+
+    Returns:
+        tuple: (decode_func, infer_func)
+    """
+    from ibeis import core_images
+    config = dict(config)
+    config['sensitivity'] = 0.0
+    if config['algo'] in ['lightnet']:
+        from ibeis.algo.detect import lightnet
+        core_images.rectify_lightnet_config(config)
+        network, network_size = lightnet.load_network(**config)
+
+        def decode_func(item):
+            gid, gpath = item
+            return lightnet.decode_image(gpath, network_size)
+
+        def infer_func(item_list, decoded_list):
+            result_list_list = lightnet.detect_batch(network, network_size,
+                                                     decoded_list)
+            return [
+                core_images.package_localizations_original((gid, gpath, result_list))
+                for (gid, gpath), result_list in zip(item_list, result_list_list)
+            ]
+    else:
+        def decode_func(item):
+            gid, gpath = item
+            return _prefetch_image_file(gpath)
+
+        def infer_func(item_list, decoded_list):
+            gid_list = [gid for gid, gpath in item_list]
+            return list(core_images.detect_localizations_original(ibs, gid_list,
+                                                                  config))
+    return decode_func, infer_func
+
+
+def write_localizations_original(ibs, gid_list, result_list, config):
+    """
+    Adds computed localizations_original rows through the depcache. The
+    table's preproc function returns the given results instead of running
+    the detector, so the rows are stored like any other computed rows.
+
+    Returns:
+        list: localizations_original rowids
+    """
+    from ibeis import core_images
+    precomputed = core_images.PRECOMPUTED_LOCALIZATIONS
+    precomputed.gid_to_result = dict(zip(gid_list, result_list))
+    try:
+        rowid_list = ibs.depc_image.get_rowids('localizations_original',
+                                               gid_list, config=config)
+    finally:
+        precomputed.gid_to_result = None
+    return rowid_list
+
+
+@register_ibs_method
+def compute_localizations_original_pipelined(ibs, gid_list, config=None,
+                                             batch_size=8, decode_workers=None,
+                                             queue_size=2, write_batch_size=256,
+                                             stages=None, verbose=True):
+    r"""
+    Computes the localizations_original rows of gid_list with a staged
+    pipeline that overlaps image decoding, batched detector inference and
+    batched depcache writes. Images that already have rows for config are
+    skipped.
+
+    Args:
+        gid_list (list): image rowids
+        config (dict): LocalizerOriginalConfig params
+        batch_size (int): number of images per inference call
+        decode_workers (int): number of decode threads. Defaults to
+            preproc_image.get_reader_pool_size()
+        queue_size (int): number of inferred batches that may wait for the
+            writer
+        write_batch_size (int): number of rows per depcache transaction
+        stages (tuple): (decode_func, infer_func) overriding the detector
+            selected by config (see get_localizer_stages)
+
+    Returns:
+        tuple: (rowid_list, stats) - localizations_original rowids and the
+            per-stage counters of the pipeline (empty if every image already
+            had rows)
+
+    CommandLine:
+        python -m ibeis.other.detectcore compute_localizations_original_pipelined
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.other.detectcore import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()
+        >>> # Stub CPU detector: one box covering the center of the image
+        >>> def decode_func(item):
+        >>>     return vt.imread(item[1]).shape[0:2]
+        >>> def infer_func(item_list, decoded_list):
+        >>>     return [
+        >>>         (0.0, np.array([[w // 4, h // 4, w // 2, h // 2]]),
+        >>>          np.array([0.0]), np.array([0.5]), np.array(['zebra']))
+        >>>         for h, w in decoded_list
+        >>>     ]
+        >>> config = {'algo': 'yolo', 'config_filepath': 'stub-detector'}
+        >>> ibs.depc_image.delete_property('localizations_original', gid_list, config=config)
+        >>> rowid_list, stats = ibs.compute_localizations_original_pipelined(
+        >>>     gid_list, config, batch_size=4, write_batch_size=5,
+        >>>     stages=(decode_func, infer_func))
+        >>> assert stats['write']['num_items'] == len(gid_list)
+        >>> bboxes_list = ibs.depc_image.get('localizations_original', gid_list, 'bboxes', config=config)
+        >>> w, h = ibs.get_image_sizes(gid_list[0])
+        >>> assert bboxes_list[0].tolist() == [[w // 4, h // 4, w // 2, h // 2]]
+        >>> # Nothing left to compute
+        >>> rowid_list2, stats2 = ibs.compute_localizations_original_pipelined(
+        >>>     gid_list, config, stages=(decode_func, infer_func))
+        >>> assert rowid_list2 == rowid_list and stats2 == {}
+        >>> ibs.depc_image.delete_property('localizations_original', gid_list, config=config)
+    """
+    from ibeis.algo.detect import detect_pipeline
+    from ibeis.algo.preproc import preproc_image
+    depc = ibs.depc_image
+    tablename = 'localizations_original'
+    config_ = depc._ensure_config(tablename, config)
+
+    # Only compute the images without rows
+    rowid_list = depc.get_rowids(tablename, gid_list, config=config,
+                                 ensure=False)
+    dirty_gid_list = ut.unique([
+        gid for gid, rowid in zip(gid_list, rowid_list) if rowid is None
+    ])
+    if len(dirty_gid_list) > 0:
+        if stages is None:
+            stages = get_localizer_stages(ibs, config_)
+        decode_func, infer_func = stages
+        if decode_workers is None:
+            decode_workers = preproc_image.get_reader_pool_size()
+
+        def write_func(item_list, result_list):
+            gid_list_ = [gid for gid, gpath in item_list]
+            write_localizations_original(ibs, gid_list_, result_list, config)
+
+        pipe = detect_pipeline.DetectionPipeline(
+            infer_func, decode_func, write_func, batch_size=batch_size,
+            decode_workers=decode_workers, queue_size=queue_size,
+            write_batch_size=write_batch_size)
+        gpath_list = get_localizer_gpaths(ibs, dirty_gid_list, config_)
+        item_list = list(zip(dirty_gid_list, gpath_list))
+        pipe.run_and_write(item_list)
+        stats = pipe.stats
+        if verbose:
+            print('[detectcore] pipelined %d localizations\n%s' % (
+                len(dirty_gid_list), pipe.stats_str()))
+        rowid_list = depc.get_rowids(tablename, gid_list, config=config)
+    else:
+        stats = {}
+    return rowid_list, stats
 
 
 @register_ibs_method
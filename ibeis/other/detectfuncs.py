@@ -102,53 +102,53 @@ def simple_code(label):
 
 
 def general_precision_recall_algo(ibs, label_list, confidence_list, category='positive', samples=SAMPLES, **kwargs):
-    def errors(zipped, conf, category):
-        tp, tn, fp, fn = 0.0, 0.0, 0.0, 0.0
-        for index, (label, confidence) in enumerate(zipped):
-            if label == category:
-                if conf <= confidence:
-                    tp += 1
-                else:
-                    fn += 1
-            else:
-                if conf <= confidence:
-                    fp += 1
-                else:
-                    tn += 1
-        return tp, tn, fp, fn
-
-    zipped = list(zip(label_list, confidence_list))
-    conf_list = [ _ / float(samples) for _ in range(0, int(samples) + 1) ]
-    conf_dict = {}
-    for conf in conf_list:
-        conf_dict[conf] = errors(zipped, conf, category)
+    """
+    Precision, recall, TPR and FPR at samples + 1 evenly spaced confidence
+    thresholds.
 
-    conf_list_ = [-1.0, -1.0]
-    pr_list = [1.0, 0.0]
-    re_list = [0.0, 1.0]
-    tpr_list = [0.0, 1.0]
-    fpr_list = [0.0, 1.0]
-    # conf_list_ = []
-    # pr_list = []
-    # re_list = []
-    # tpr_list = []
-    # fpr_list = []
-    for conf in sorted(conf_dict.keys(), reverse=True):
-        error_list = conf_dict[conf]
-        tp, tn, fp, fn = error_list
-        try:
-            pr = tp / (tp + fp)
-            re = tp / (tp + fn)
-            tpr = tp / (tp + fn)
-            fpr = fp / (fp + tn)
-            conf_list_.append(conf)
-            pr_list.append(pr)
-            re_list.append(re)
-            tpr_list.append(tpr)
-            fpr_list.append(fpr)
-        except ZeroDivisionError:
-            print('Zero division error (%r) - tp: %r tn: %r fp: %r fn: %r' % (conf, tp, tn, fp, fn, ))
+    The confidences of each class are sorted once and the counts at every
+    threshold are found with a binary search instead of rescanning the data
+    per threshold.
+    """
+    flag_list = np.array([label == category for label in label_list], dtype=np.bool_)
+    confidence_list = np.asarray(confidence_list).reshape(-1)
+    if confidence_list.dtype.kind != 'f':
+        confidence_list = confidence_list.astype(np.float64)
+    pos_confs = np.sort(confidence_list[flag_list])
+    neg_confs = np.sort(confidence_list[~flag_list])
 
+    conf_list = [ _ / float(samples) for _ in range(0, int(samples) + 1) ]
+    conf_list = sorted(set(conf_list), reverse=True)
+    conf_arr = np.array(conf_list, dtype=np.float64)
+    # A sample counts as predicted positive when conf <= confidence. The
+    # thresholds are compared in the precision of the confidences, like the
+    # scalar comparisons against numpy confidences
+    conf_arr_ = conf_arr.astype(confidence_list.dtype)
+    fn_arr = np.searchsorted(pos_confs, conf_arr_, side='left').astype(np.float64)
+    tn_arr = np.searchsorted(neg_confs, conf_arr_, side='left').astype(np.float64)
+    tp_arr = len(pos_confs) - fn_arr
+    fp_arr = len(neg_confs) - tn_arr
+
+    valid_list = ((tp_arr + fp_arr) > 0) & ((tp_arr + fn_arr) > 0) & ((fp_arr + tn_arr) > 0)
+    invalid_list = ~valid_list
+    for conf, tp, tn, fp, fn in zip(conf_arr[invalid_list].tolist(),
+                                    tp_arr[invalid_list].tolist(),
+                                    tn_arr[invalid_list].tolist(),
+                                    fp_arr[invalid_list].tolist(),
+                                    fn_arr[invalid_list].tolist()):
+        print('Zero division error (%r) - tp: %r tn: %r fp: %r fn: %r' % (conf, tp, tn, fp, fn, ))
+
+    tp_arr, tn_arr = tp_arr[valid_list], tn_arr[valid_list]
+    fp_arr, fn_arr = fp_arr[valid_list], fn_arr[valid_list]
+    pr_arr = tp_arr / (tp_arr + fp_arr)
+    re_arr = tp_arr / (tp_arr + fn_arr)
+    fpr_arr = fp_arr / (fp_arr + tn_arr)
+
+    conf_list_ = [-1.0, -1.0] + conf_arr[valid_list].tolist()
+    pr_list = [1.0, 0.0] + pr_arr.tolist()
+    re_list = [0.0, 1.0] + re_arr.tolist()
+    tpr_list = [0.0, 1.0] + re_arr.tolist()
+    fpr_list = [0.0, 1.0] + fpr_arr.tolist()
     return conf_list_, pr_list, re_list, tpr_list, fpr_list
 
 
@@ -371,14 +371,61 @@ def general_intersection_over_union(bbox1, bbox2):
     return intersection / union
 
 
-def general_overlap(gt_list, pred_list):
-    overlap = np.zeros((len(gt_list), len(pred_list)), dtype=np.float32)
-    for i, gt in enumerate(gt_list):
-        for j, pred in enumerate(pred_list):
-            overlap[i, j] = general_intersection_over_union(gt, pred)
+BOX_ARRAY_KEYS = ['xtl', 'ytl', 'xbr', 'ybr', 'width', 'height']
+
+
+def general_box_array(bbox_list):
+    """
+    Stacks box dicts into an (N, 6) float64 array with the columns of
+    BOX_ARRAY_KEYS
+    """
+    box_arr = np.array([
+        [bbox[key] for key in BOX_ARRAY_KEYS]
+        for bbox in bbox_list
+    ], dtype=np.float64)
+    return box_arr.reshape(len(bbox_list), len(BOX_ARRAY_KEYS))
+
+
+def general_overlap_array(box_arr1, box_arr2):
+    """
+    Vectorized general_intersection_over_union between all rows of two
+    general_box_array arrays
+
+    Returns:
+        ndarray: (len(box_arr1), len(box_arr2)) float64 IoU matrix
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.other.detectfuncs import *  # NOQA
+        >>> bbox_list = [
+        >>>     {'xtl': 0.0, 'ytl': 0.0, 'xbr': 0.5, 'ybr': 0.5, 'width': 0.5, 'height': 0.5},
+        >>>     {'xtl': 0.25, 'ytl': 0.1, 'xbr': 0.75, 'ybr': 0.4, 'width': 0.5, 'height': 0.3},
+        >>>     {'xtl': 0.6, 'ytl': 0.6, 'xbr': 0.9, 'ybr': 1.0, 'width': 0.3, 'height': 0.4},
+        >>> ]
+        >>> box_arr = general_box_array(bbox_list)
+        >>> overlap = general_overlap_array(box_arr, box_arr)
+        >>> expected = [[general_intersection_over_union(bbox1, bbox2)
+        >>>              for bbox2 in bbox_list] for bbox1 in bbox_list]
+        >>> assert np.all(overlap == np.array(expected))
+    """
+    xtl1, ytl1, xbr1, ybr1, w1, h1 = [col[:, None] for col in box_arr1.T]
+    xtl2, ytl2, xbr2, ybr2, w2, h2 = [col[None, :] for col in box_arr2.T]
+    intersection_w = np.minimum(xbr1, xbr2) - np.maximum(xtl1, xtl2)
+    intersection_h = np.minimum(ybr1, ybr2) - np.maximum(ytl1, ytl2)
+    flags = (intersection_w > 0) & (intersection_h > 0)
+    intersection = intersection_w * intersection_h
+    union = (w1 * h1) + (w2 * h2) - intersection
+    overlap = np.zeros(flags.shape, dtype=np.float64)
+    overlap[flags] = intersection[flags] / union[flags]
     return overlap
 
 
+def general_overlap(gt_list, pred_list):
+    overlap = general_overlap_array(general_box_array(gt_list),
+                                    general_box_array(pred_list))
+    return overlap.astype(np.float32)
+
+
 def general_tp_fp_fn(gt_list, pred_list, min_overlap, **kwargs):
         overlap = general_overlap(gt_list, pred_list)
         num_gt, num_pred = overlap.shape
@@ -677,8 +724,14 @@ def localizer_parse_pred(ibs, test_gid_list=None, species_mapping={}, **kwargs):
     return pred_dict
 
 
-def localizer_precision_recall_algo(ibs, samples=SAMPLES, test_gid_list=None,
-                                    **kwargs):
+def localizer_gather(ibs, test_gid_list=None, **kwargs):
+    """
+    Parses the ground-truth and the predictions of a localizer config, keeping
+    only the classes in species_set (if given)
+
+    Returns:
+        tuple: (test_uuid_list, gt_dict, pred_dict)
+    """
     if test_gid_list is None:
         test_gid_list = general_get_imageset_gids(ibs, 'TEST_SET', **kwargs)
 
@@ -707,9 +760,10 @@ def localizer_precision_recall_algo(ibs, samples=SAMPLES, test_gid_list=None,
                     if val.get('class', None) in species_set_
                 ]
 
-    values = localizer_tp_fp(test_uuid_list, gt_dict, pred_dict, **kwargs)
-    conf_list, tp_list, fp_list, total = values
+    return test_uuid_list, gt_dict, pred_dict
+
 
+def localizer_precision_recall_curve(conf_list, tp_list, fp_list, total):
     conf_list_ = [-1.0, -1.0]
     pr_list = [1.0, 0.0]
     re_list = [0.0, 1.0]
@@ -726,6 +780,45 @@ def localizer_precision_recall_algo(ibs, samples=SAMPLES, test_gid_list=None,
     return conf_list_, pr_list, re_list
 
 
+def localizer_precision_recall_algo(ibs, samples=SAMPLES, test_gid_list=None,
+                                    **kwargs):
+    test_uuid_list, gt_dict, pred_dict = localizer_gather(
+        ibs, test_gid_list=test_gid_list, **kwargs)
+    values = localizer_tp_fp(test_uuid_list, gt_dict, pred_dict, **kwargs)
+    return localizer_precision_recall_curve(*values)
+
+
+def localizer_precision_recall_algo_batch(ibs, config_list, min_overlap=0.5,
+                                          nprocs=None, **kwargs):
+    """
+    Precision-recall curves for several localizer configs.
+
+    Predictions are gathered from the depcache one config at a time, packed
+    into arrays, and the assignments of all configs are computed in parallel.
+
+    Returns:
+        list: (conf_list, pr_list, re_list) for each config
+    """
+    packed_args = []
+    for config in config_list:
+        config = dict(kwargs, **config)
+        config['min_overlap'] = min_overlap
+        test_uuid_list, gt_dict, pred_dict = localizer_gather(ibs, **config)
+        packed_list = localizer_pack(test_uuid_list, gt_dict, pred_dict, **config)
+        packed_args.append((packed_list, min_overlap))
+
+    if len(packed_args) == 0:
+        return []
+    values_gen = ut.generate2(_localizer_tp_fp_worker, packed_args,
+                              nTasks=len(packed_args), ordered=True,
+                              nprocs=nprocs, verbose=False)
+    curve_list = [
+        localizer_precision_recall_curve(*values)
+        for values in values_gen
+    ]
+    return curve_list
+
+
 def localizer_assign(gt_list, pred, min_overlap):
     best_overlap = min_overlap
     best_index = None
@@ -770,9 +863,66 @@ def localizer_assignments(pred_list, gt_list, gt_list_=[], min_overlap=0.5):
     return match_list
 
 
-def localizer_tp_fp(uuid_list, gt_dict, pred_dict, min_overlap=0.5, **kwargs):
-    total = 0.0
+def localizer_assignments_array(gt_box_arr, gt_class_arr, gt_ignore_arr,
+                                pred_box_arr, pred_class_arr, pred_conf_arr,
+                                min_overlap=0.5):
+    """
+    Array version of localizer_assignments for a single image.
+
+    Predictions are visited from the highest to the lowest confidence and
+    greedily take the unassigned ground-truth of the same class with the
+    largest IoU >= min_overlap. Predictions that only match an ignored
+    ground-truth are dropped.
+
+    Args:
+        gt_box_arr (ndarray): (G, 6) general_box_array of the ground-truth
+        gt_class_arr (ndarray): (G,) integer class codes
+        gt_ignore_arr (ndarray): (G,) flags for ground-truth that is ignored
+        pred_box_arr (ndarray): (P, 6) general_box_array of the predictions
+        pred_class_arr (ndarray): (P,) integer class codes
+        pred_conf_arr (ndarray): (P,) confidences
+
+    Returns:
+        tuple: (conf_arr, flag_arr) of the counted predictions sorted by
+            descending confidence. flag_arr is True for true positives.
+    """
+    order = np.argsort(-pred_conf_arr, kind='stable')
+    num_gt = len(gt_box_arr)
+    if num_gt == 0:
+        return pred_conf_arr[order], np.zeros(len(order), dtype=np.bool_)
+
+    overlap = general_overlap_array(pred_box_arr[order], gt_box_arr)
+    class_mask = pred_class_arr[order][:, None] == gt_class_arr[None, :]
+    candidate = class_mask & (overlap >= min_overlap)
+    ignore_hit = (candidate & gt_ignore_arr[None, :]).any(axis=1)
+    candidate &= ~gt_ignore_arr[None, :]
+
+    flag_arr = np.zeros(len(order), dtype=np.bool_)
+    keep_arr = ~ignore_hit
+    available = np.ones(num_gt, dtype=np.bool_)
+    # Only predictions with a possible match need the sequential greedy pass
+    for index in np.nonzero(candidate.any(axis=1))[0]:
+        flags = candidate[index] & available
+        if not flags.any():
+            continue
+        scores = np.where(flags, overlap[index], -np.inf)
+        # Ties go to the last ground-truth, as in localizer_assign
+        gt_index = num_gt - 1 - np.argmax(scores[::-1])
+        available[gt_index] = False
+        flag_arr[index] = True
+        keep_arr[index] = True
+    return pred_conf_arr[order][keep_arr], flag_arr[keep_arr]
+
 
+def localizer_pack(uuid_list, gt_dict, pred_dict, **kwargs):
+    """
+    Converts the ground-truth and prediction dicts of each image into the
+    arrays used by localizer_assignments_array. Class names are replaced by
+    integer codes that are shared by all images.
+
+    Returns:
+        list: a tuple of localizer_assignments_array arguments per image
+    """
     interest_species_set = set([])
     species_set = kwargs.get('species_set', None)
     if species_set is not None:
@@ -781,93 +931,90 @@ def localizer_tp_fp(uuid_list, gt_dict, pred_dict, min_overlap=0.5, **kwargs):
                 species = species.lstrip('!')
                 interest_species_set.add(species)
 
-    match_list = []
+    class_code_dict = {}
+
+    def _class_codes(item_list):
+        return np.array([
+            class_code_dict.setdefault(item['class'], len(class_code_dict))
+            for item in item_list
+        ], dtype=np.int64)
+
+    packed_list = []
     for image_uuid in uuid_list:
-        gt_list = []
-        gt_list_ = []
+        gt_list = gt_dict[image_uuid]
         pred_list = pred_dict[image_uuid]
+        gt_ignore_arr = np.array([
+            gt['class'] in interest_species_set and not gt['interest']
+            for gt in gt_list
+        ], dtype=np.bool_)
+        pred_conf_arr = np.array([
+            pred['confidence']
+            for pred in pred_list
+        ], dtype=np.float64)
+        packed = (
+            general_box_array(gt_list), _class_codes(gt_list), gt_ignore_arr,
+            general_box_array(pred_list), _class_codes(pred_list), pred_conf_arr,
+        )
+        packed_list.append(packed)
+    return packed_list
 
-        for gt in gt_dict[image_uuid]:
-            species = gt['class']
-            interest = gt['interest']
-            if species in interest_species_set and not interest:
-                gt_list_.append(gt)
-            else:
-                gt_list.append(gt)
-
-        total += len(gt_list)
 
-        # Match predictions
-        match_list_ = localizer_assignments(pred_list, gt_list, gt_list_, min_overlap)
-        for match_ in match_list_:
-            match_list.append(match_)
+def localizer_tp_fp_packed(packed_list, min_overlap=0.5):
+    total = 0.0
+    conf_arr_list = []
+    flag_arr_list = []
+    for packed in packed_list:
+        gt_ignore_arr = packed[2]
+        total += len(gt_ignore_arr) - gt_ignore_arr.sum()
+        conf_arr, flag_arr = localizer_assignments_array(
+            *packed, min_overlap=min_overlap)
+        conf_arr_list.append(conf_arr)
+        flag_arr_list.append(flag_arr)
+
+    if len(conf_arr_list) == 0:
+        return [], [], [], total
 
     # sort matches by confidence from high to low
-    match_list = sorted(match_list, key=lambda match: match[0], reverse=True)
+    conf_arr = np.hstack(conf_arr_list)
+    flag_arr = np.hstack(flag_arr_list)
+    order = np.argsort(-conf_arr, kind='stable')
+    conf_arr = conf_arr[order]
+    flag_arr = flag_arr[order]
 
-    conf_list = []
-    tp_list = []
-    fp_list = []
+    tp_arr = np.cumsum(flag_arr)
+    fp_arr = np.cumsum(~flag_arr)
+    return conf_arr.tolist(), tp_arr.tolist(), fp_arr.tolist(), float(total)
 
-    tp_counter = 0
-    fp_counter = 0
-    for conf, flag, index, overlap in match_list:
-        if flag:
-            tp_counter += 1
-        else:
-            fp_counter += 1
-        conf_list.append(conf)
-        tp_list.append(tp_counter)
-        fp_list.append(fp_counter)
 
-    # print('\t tps  [:10]     : %r' % (tp_list[:10], ))
-    # print('\t fps  [:10]     : %r' % (fp_list[:10], ))
-    # print('\t con  [:10]     : %r' % (conf_list[:10], ))
-    # print('\t tps [-10:]     : %r' % (tp_list[-10:], ))
-    # print('\t fps [-10:]     : %r' % (fp_list[-10:], ))
-    # print('\t con [-10:]     : %r' % (conf_list[-10:], ))
-    # print('\t num_annotations: %r' % (total, ))
+def _localizer_tp_fp_worker(packed_list, min_overlap):
+    return localizer_tp_fp_packed(packed_list, min_overlap=min_overlap)
+
+
+def localizer_tp_fp(uuid_list, gt_dict, pred_dict, min_overlap=0.5, **kwargs):
+    """
+    Cumulative true and false positive counts of the predictions sorted by
+    descending confidence
 
-    return conf_list, tp_list, fp_list, total
+    Returns:
+        tuple: (conf_list, tp_list, fp_list, total)
+    """
+    packed_list = localizer_pack(uuid_list, gt_dict, pred_dict, **kwargs)
+    return localizer_tp_fp_packed(packed_list, min_overlap=min_overlap)
 
 
-def localizer_precision_recall_algo_plot(ibs, **kwargs):
+def localizer_precision_recall_algo_plot(ibs, curve=None, **kwargs):
     label = kwargs['label']
     print('Processing Precision-Recall for: %r' % (label, ))
-    conf_list, pr_list, re_list = localizer_precision_recall_algo(ibs, **kwargs)
+    if curve is None:
+        curve = localizer_precision_recall_algo(ibs, **kwargs)
+    conf_list, pr_list, re_list = curve
     return general_area_best_conf(conf_list, re_list, pr_list, **kwargs)
 
 
 def localizer_confusion_matrix_algo_plot(ibs, label=None, target_conf=None,
                                          test_gid_list=None, **kwargs):
-    if test_gid_list is None:
-        test_gid_list = general_get_imageset_gids(ibs, 'TEST_SET', **kwargs)
-
-    test_uuid_list = ibs.get_image_uuids(test_gid_list)
-
-    print('\tGather Ground-Truth')
-    gt_dict = general_parse_gt(ibs, test_gid_list=test_gid_list, **kwargs)
-
-    print('\tGather Predictions')
-    pred_dict = localizer_parse_pred(ibs, test_gid_list=test_gid_list, **kwargs)
-
-    species_set = kwargs.get('species_set', None)
-    if species_set is not None:
-        # filter out any prefix ! to denote interest only
-        species_set_ = set([ species.lstrip('!') for species in species_set ])
-
-        dict_list = [
-            (gt_dict, 'Ground-Truth'),
-            (pred_dict, 'Predictions'),
-        ]
-        for dict_, dict_tag in dict_list:
-            for image_uuid in dict_:
-                dict_[image_uuid] = [
-                    val
-                    for val in dict_[image_uuid]
-                    if val.get('class', None) in species_set_
-                ]
-
+    test_uuid_list, gt_dict, pred_dict = localizer_gather(
+        ibs, test_gid_list=test_gid_list, **kwargs)
     values = localizer_tp_fp(test_uuid_list, gt_dict, pred_dict, **kwargs)
     conf_list, tp_list, fp_list, total = values
 
@@ -1193,7 +1340,8 @@ def localizer_precision_recall(ibs, test_gid_list=None, **kwargs):
 @register_ibs_method
 def localizer_precision_recall_algo_display(ibs, config_list, config_tag='', min_overlap=0.5, figsize=(30, 9),
                                             target_recall=0.8, BEST_INDEX=None, offset_color=0,
-                                            write_images=False, plot_point=True, **kwargs):
+                                            write_images=False, plot_point=True, nprocs=None,
+                                            **kwargs):
     import matplotlib.pyplot as plt
     import plottool_ibeis as pt
 
@@ -1214,11 +1362,15 @@ def localizer_precision_recall_algo_display(ibs, config_list, config_tag='', min
     color_list = pt.distinct_colors(len(config_list) - len(color_list_), randomize=False)
     color_list = color_list_ + color_list
 
+    curve_list = localizer_precision_recall_algo_batch(ibs, config_list,
+                                                       min_overlap=min_overlap,
+                                                       nprocs=nprocs)
     ret_list = [
-        localizer_precision_recall_algo_plot(ibs, color=color, min_overlap=min_overlap,
+        localizer_precision_recall_algo_plot(ibs, curve=curve, color=color,
+                                             min_overlap=min_overlap,
                                              plot_point=plot_point,
                                              target_recall=target_recall, **config)
-        for color, config in zip(color_list, config_list)
+        for curve, color, config in zip(curve_list, color_list, config_list)
     ]
 
     area_list = [ ret[0] for ret in ret_list ]
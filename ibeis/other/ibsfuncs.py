@@ -557,13 +557,15 @@ def check_image_consistency(ibs, gid_list=None):
     #check_image_uuid_consistency(ibs, gid_list)
 
 
-def check_image_uuid_consistency(ibs, gid_list):
+def check_image_uuid_consistency(ibs, gid_list, incremental=False):
     """
     Checks to make sure image uuids are computed detemenistically
     by recomputing all guuids and checking that they are equal to
     what is already there.
 
-    VERY SLOW
+    VERY SLOW. Images are hashed in parallel. If incremental is True images
+    that have not changed since their last successful check are skipped (see
+    ibeis.other.integrity.verify_images).
 
     CommandLine:
         python -m ibeis.other.ibsfuncs check_image_uuid_consistency --db=PZ_Master0
@@ -587,24 +589,17 @@ def check_image_uuid_consistency(ibs, gid_list):
         >>> ibeis.other.ibsfuncs.check_image_uuid_consistency(ibs, gid_list)
     """
     print('checking image uuid consistency')
-    import ibeis.algo.preproc.preproc_image as preproc_image
-    images = ibs.images(gid_list)
-    for gx in ut.ProgIter(range(len(images)), label='check uuids'):
-        image = images[gx]
-        uuid = image.uuids
-        gpath = image.paths
-        param_tup = preproc_image.parse_imageinfo(gpath)
-        guuid_computed = param_tup[0]
-        assert uuid == guuid_computed, 'image={} has a bad uuid'.format(gpath)
+    report = ibs.verify_images(gid_list, incremental=incremental, decode=False)
+    _assert_image_report(report)
 
 
-def check_image_corruption(ibs, gid_list):
+def check_image_corruption(ibs, gid_list, incremental=False):
     """
-    Checks to make sure image uuids are computed detemenistically
-    by recomputing all guuids and checking that they are equal to
-    what is already there.
+    Fully decodes every image and checks that image uuids are computed
+    detemenistically by recomputing all guuids and checking that they are
+    equal to what is already there.
 
-    VERY SLOW
+    VERY SLOW. Images are decoded in parallel.
 
     CommandLine:
         python -m ibeis.other.ibsfuncs check_image_uuid_consistency --db=PZ_Master0
@@ -627,19 +622,19 @@ def check_image_corruption(ibs, gid_list):
         >>> gid_list = list(images)
         >>> ibeis.other.ibsfuncs.check_image_uuid_consistency(ibs, gid_list)
     """
-    print('checking image uuid consistency')
-    import ibeis.algo.preproc.preproc_image as preproc_image
-    import imghdr
-    images = ibs.images(gid_list)
+    print('checking image corruption')
+    report = ibs.verify_images(gid_list, incremental=incremental, decode=True)
+    _assert_image_report(report)
 
-    for gx in ut.ProgIter(range(len(images)), label='check uuids'):
-        image = images[gx]
-        uuid = image.uuid
-        gpath = image.paths
-        print(imghdr.what(gpath))
-        param_tup = preproc_image.parse_imageinfo(gpath)
-        guuid_computed = param_tup[0]
-        assert uuid == guuid_computed, 'image={} has a bad uuid'.format(gpath)
+
+def _assert_image_report(report):
+    """ Raises if an image verification report contains failures """
+    failures = report['failures']
+    if len(failures) > 0:
+        for failure in failures[0:10]:
+            print('image={gpath} {status}: {message}'.format(**failure))
+        raise AssertionError('%d images failed verification: %s' % (
+            len(failures), ut.repr2(report['status_hist'])))
 
 
 @register_ibs_method
@@ -839,22 +834,20 @@ def check_exif_data(ibs, gid_list):
 
 
 @register_ibs_method
-def run_integrity_checks(ibs, embed=False):
-    """ Function to run all database consistency checks """
-    print('[ibsfuncs] Checking consistency')
-    gid_list = ibs.get_valid_gids()
-    aid_list = ibs.get_valid_aids()
-    nid_list = ibs.get_valid_nids()
-    check_annot_size(ibs)
-    check_image_consistency(ibs, gid_list)
-    check_annot_consistency(ibs, aid_list)
-    check_name_consistency(ibs, nid_list)
-    check_annotmatch_consistency(ibs)
-    # Very slow check
-    check_image_uuid_consistency(ibs, gid_list)
+def run_integrity_checks(ibs, embed=False, **kwargs):
+    """
+    Function to run all database consistency checks
+
+    Failures are collected into a report instead of raised. See
+    ibeis.other.integrity.run_integrity_engine for the keyword arguments.
+
+    Returns:
+        dict: report
+    """
+    report = ibs.run_integrity_engine(**kwargs)
     if embed:
         ut.embed()
-    print('[ibsfuncs] Finshed consistency check')
+    return report
 
 
 @register_ibs_method
@@ -3726,15 +3719,10 @@ def get_annotpair_speeds(ibs, aid_pairs, unique_aids=None):
     idxs1 = ut.take(aid_to_idx, aids1)
     idxs2 = ut.take(aid_to_idx, aids2)
     #idx_list = [ut.take(aid_to_idx, aids) for aids in aids_list]
-    # Lookup values in SQL only once
-    unique_unixtimes = ibs.get_annot_image_unixtimes_asfloat(unique_aids)
-    unique_gps = ibs.get_annot_image_gps(unique_aids)
-    unique_gps = np.array([
-        (np.nan if lat == -1 else lat, np.nan if lon == -1 else lon)
-        for (lat, lon) in unique_gps])
-    unique_gps = vt.atleast_nd(unique_gps, 2)
-    if len(unique_gps) == 0:
-        unique_gps.shape = (0, 2)
+    # Lookup values in SQL only once (as columnar arrays with nan for -1)
+    column_dict = ibs.get_annot_columns(unique_aids, ['unixtime', 'gps'])
+    unique_unixtimes = column_dict['unixtime']
+    unique_gps = column_dict['gps']
     # Find differences in time and space
     hour_dists = ut.unixtime_hourdiff(unique_unixtimes[idxs1], unique_unixtimes[idxs2])
     km_dists = vt.haversine(unique_gps[idxs1].T, unique_gps[idxs2].T)
@@ -4157,8 +4145,11 @@ def filter_annots_using_minimum_timedelta(ibs, aid_list, min_timedelta):
     import vtool_ibeis as vt
     #min_timedelta = 60 * 60 * 24
     #min_timedelta = 60 * 10
-    grouped_aids = ibs.group_annots_by_name(aid_list)[0]
-    unixtimes_list = ibs.unflat_map(ibs.get_annot_image_unixtimes_asfloat, grouped_aids)
+    # Names and times come from one columnar query
+    column_dict = ibs.get_annot_columns(aid_list, ['nid', 'unixtime'])
+    groupxs_list = vt.group_indices(column_dict['nid'])[1]
+    grouped_aids = vt.apply_grouping(np.array(aid_list), groupxs_list)
+    unixtimes_list = vt.apply_grouping(column_dict['unixtime'], groupxs_list)
     # Find the maximum size subset such that all timedeltas are less than a given value
     r"""
     Given a set of annotations V (all of the same name).
@@ -4991,8 +4982,18 @@ def get_annotconfig_stats(ibs, qaids, daids, verbose=False, combined=False,
         warnings.filterwarnings('ignore', r'Mean of empty slice')
         warnings.filterwarnings('ignore', r'Degrees of freedom <= 0 for slice.')
 
+        # Names and image times of every annot come from one columnar query
+        qaid_arr = np.array(qaids, dtype=np.int64)
+        daid_arr = np.array(daids, dtype=np.int64)
+        column_dict = ibs.get_annot_columns(
+            np.hstack([qaid_arr, daid_arr]), ['nid', 'unixtime'])
+        qnid_arr = column_dict['nid'][:len(qaid_arr)]
+        dnid_arr = column_dict['nid'][len(qaid_arr):]
+        aid_to_unixtime = dict(zip(np.hstack([qaid_arr, daid_arr]).tolist(),
+                                   column_dict['unixtime'].tolist()))
+
         # The aids that should be matched by a query
-        grouped_qaids = ibs.group_annots_by_name(qaids)[0]
+        grouped_qaids = vt.apply_grouping(qaid_arr, vt.group_indices(qnid_arr)[1])
         grouped_groundtruth_list = ibs.get_annot_groundtruth(
             ut.get_list_column(grouped_qaids, 0), daid_list=daids)
         # groundtruth_daids = ut.unique(ut.flatten(grouped_groundtruth_list))
@@ -5023,7 +5024,7 @@ def get_annotconfig_stats(ibs, qaids, daids, verbose=False, combined=False,
         # Compare timedelta differences
         gt_hourdelta_list = compare_nested_props(
             ibs, grouped_qaids, grouped_groundtruth_list,
-            ibs.get_annot_image_unixtimes_asfloat, ut.unixtime_hourdiff)
+            functools.partial(ut.dict_take, aid_to_unixtime), ut.unixtime_hourdiff)
 
         def super_flatten(arr_list):
             import utool as ut
@@ -5061,8 +5062,8 @@ def get_annotconfig_stats(ibs, qaids, daids, verbose=False, combined=False,
         # Intersections between qaids and daids
         common_aids = np.intersect1d(daids, qaids)
 
-        qnids = ut.unique(ibs.get_annot_name_rowids(qaids))
-        dnids = ut.unique(ibs.get_annot_name_rowids(daids))
+        qnids = np.unique(qnid_arr)
+        dnids = np.unique(dnid_arr)
         common_nids = np.intersect1d(qnids, dnids)
 
         annotconfig_stats_strs_list1 = []
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental database integrity checks.
+
+Image verification (re-hashing every file to recompute its uuid and
+optionally fully decoding it) is fanned out over a process pool. The outcome
+of each check is recorded as a per-image watermark (file size, mtime and the
+last verified hash) in a small sqlite database inside the cache directory so
+subsequent runs only re-verify files that changed on disk.
+
+Failures are collected into a structured report instead of asserting on the
+first problem.
+
+CommandLine:
+    python -m ibeis.other.integrity run_integrity_engine --db PZ_MTEST
+    python -m ibeis.other.integrity verify_images --db PZ_MTEST
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from os.path import join
+import os
+import time
+import utool as ut
+from ibeis.control import controller_inject
+(print, rrr, profile) = ut.inject2(__name__, '[integrity]')
+
+
+CLASS_INJECT_KEY, register_ibs_method = (
+    controller_inject.make_ibs_register_decorator(__name__))
+
+
+WATERMARK_DB_FNAME = 'integrity_watermarks.sqlite3'
+WATERMARK_TABLE = 'image_watermarks'
+
+# Results are written back to the watermark database in batches of this size
+# so an interrupted run keeps most of its progress.
+WATERMARK_FLUSH_SIZE = 1000
+
+IMAGE_STATUS_OK = 'ok'
+IMAGE_STATUS_MISSING = 'missing'
+IMAGE_STATUS_UNREADABLE = 'unreadable'
+IMAGE_STATUS_CORRUPT = 'corrupt'
+IMAGE_STATUS_UUID_MISMATCH = 'uuid_mismatch'
+
+
+def _stat_image(gpath):
+    """ Returns (size, mtime) or None if the file does not exist """
+    try:
+        st = os.stat(gpath)
+    except (OSError, TypeError):
+        return None
+    return st.st_size, st.st_mtime
+
+
+def verify_image_worker(gpath, image_uuid_str, decode):
+    r"""
+    Worker function: recomputes the file uuid of an image and optionally
+    decodes every pixel.
+
+    Args:
+        gpath (str): local image path
+        image_uuid_str (str): uuid stored in the database
+        decode (bool): if True the full image is decoded to detect truncated
+            or corrupted files
+
+    Returns:
+        tuple: (status, size, mtime, hash_str, message)
+
+    CommandLine:
+        python -m ibeis.other.integrity verify_image_worker
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.other.integrity import *  # NOQA
+        >>> import uuid
+        >>> gpath = ut.grab_test_imgpath('carl.jpg')
+        >>> hash_str = str(ut.get_file_uuid(gpath))
+        >>> print(verify_image_worker(gpath, hash_str, True)[0])
+        >>> print(verify_image_worker(gpath, str(uuid.uuid4()), False)[0])
+        >>> print(verify_image_worker(gpath + '.nope', hash_str, False)[0])
+        ok
+        uuid_mismatch
+        missing
+    """
+    from PIL import Image
+    stat = _stat_image(gpath)
+    if stat is None:
+        return (IMAGE_STATUS_MISSING, None, None, None,
+                'image file does not exist')
+    size, mtime = stat
+    try:
+        hash_str = str(ut.get_file_uuid(gpath))
+    except (IOError, OSError) as ex:
+        return (IMAGE_STATUS_UNREADABLE, size, mtime, None, str(ex))
+    if decode:
+        try:
+            with Image.open(gpath, 'r') as pil_img:
+                pil_img.load()
+        except Exception as ex:
+            return (IMAGE_STATUS_CORRUPT, size, mtime, hash_str,
+                    '%s: %s' % (type(ex).__name__, ex))
+    if hash_str != image_uuid_str:
+        return (IMAGE_STATUS_UUID_MISMATCH, size, mtime, hash_str,
+                'stored uuid=%s, file uuid=%s' % (image_uuid_str, hash_str))
+    return (IMAGE_STATUS_OK, size, mtime, hash_str, '')
+
+
+@register_ibs_method
+def get_integrity_watermark_db(ibs):
+    """
+    Returns the sqlite database holding the image verification watermarks
+    """
+    import dtool_ibeis as dt
+    fpath = join(ibs.get_cachedir(), WATERMARK_DB_FNAME)
+    db = dt.SQLDatabaseController(fpath=fpath)
+    if not db.has_table(WATERMARK_TABLE):
+        db.add_table(WATERMARK_TABLE, (
+            ('watermark_rowid',     'INTEGER PRIMARY KEY'),
+            ('image_uuid',          'TEXT NOT NULL'),
+            ('watermark_size',      'INTEGER'),
+            ('watermark_mtime',     'REAL'),
+            ('watermark_hash',      'TEXT'),
+            ('watermark_decoded',   'INTEGER DEFAULT 0'),
+            ('watermark_time',      'REAL'),
+        ), superkeys=[('image_uuid',)],
+            docstr='Last successful verification of each image file')
+    return db
+
+
+def _read_watermarks(db, image_uuid_str_list):
+    """ Returns a dict from image uuid string to (size, mtime, hash, decoded) """
+    from ibeis.control import _sql_helpers
+    _, cur = _sql_helpers._get_cursor(db)
+    watermarks = {}
+    chunksize = _sql_helpers.SQLITE_MAX_VARS
+    for chunk in ut.ichunks(image_uuid_str_list, chunksize):
+        operation = '''
+            SELECT image_uuid, watermark_size, watermark_mtime,
+                   watermark_hash, watermark_decoded
+            FROM {tbl} WHERE image_uuid IN ({erotemes})
+            '''.format(tbl=WATERMARK_TABLE,
+                       erotemes=', '.join(['?'] * len(chunk)))
+        cur.execute(operation, chunk)
+        for row in cur.fetchall():
+            watermarks[row[0]] = row[1:]
+    return watermarks
+
+
+def _write_watermarks(db, watermark_rows):
+    """
+    Args:
+        watermark_rows (list): tuples of
+            (image_uuid, size, mtime, hash, decoded, verified_time)
+    """
+    from ibeis.control import _sql_helpers
+    if len(watermark_rows) == 0:
+        return
+    connection, cur = _sql_helpers._get_cursor(db)
+    operation = '''
+        INSERT OR REPLACE INTO {tbl}
+        (image_uuid, watermark_size, watermark_mtime, watermark_hash,
+         watermark_decoded, watermark_time)
+        VALUES (?, ?, ?, ?, ?, ?)
+        '''.format(tbl=WATERMARK_TABLE)
+    with connection:
+        cur.executemany(operation, watermark_rows)
+
+
+def _is_watermark_current(watermark, stat, image_uuid_str, decode):
+    if watermark is None or stat is None:
+        return False
+    size, mtime, hash_str, decoded = watermark
+    return (size == stat[0] and mtime == stat[1] and
+            hash_str == image_uuid_str and (decoded or not decode))
+
+
+@register_ibs_method
+def clear_integrity_watermarks(ibs):
+    """ Forces the next incremental verification to re-check every image """
+    db = ibs.get_integrity_watermark_db()
+    try:
+        db.executeone('DELETE FROM {tbl}'.format(tbl=WATERMARK_TABLE), [])
+    finally:
+        db.close()
+
+
+@register_ibs_method
+def verify_images(ibs, gid_list=None, incremental=True, decode=False,
+                  nprocs=None, verbose=True):
+    r"""
+    Verifies image files against the database by recomputing each file uuid
+    in a process pool. Images whose size and mtime match the watermark of a
+    previous successful verification are skipped when incremental is True.
+
+    Args:
+        ibs (IBEISController):  ibeis controller object
+        gid_list (list): images to check (default = all valid images)
+        incremental (bool): skip images whose watermark is current
+        decode (bool): fully decode each image to detect corrupt files
+        nprocs (int): number of worker processes (default = ut.num_cpus)
+
+    Returns:
+        dict: report - counts plus a list of failure dicts with keys gid,
+            image_uuid, gpath, status and message
+
+    CommandLine:
+        python -m ibeis.other.integrity verify_images --db PZ_MTEST
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.other.integrity import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb(defaultdb='testdb1')
+        >>> ibs.clear_integrity_watermarks()
+        >>> report1 = ibs.verify_images(decode=True)
+        >>> report2 = ibs.verify_images(decode=True)
+        >>> assert report1['num_failed'] == 0, ut.repr3(report1['failures'])
+        >>> assert report1['num_verified'] == report1['num_images']
+        >>> assert report2['num_skipped'] == report2['num_images']
+    """
+    if gid_list is None:
+        gid_list = ibs.get_valid_gids()
+    gpath_list = ibs.get_image_paths(gid_list)
+    image_uuid_str_list = [str(image_uuid) for image_uuid in
+                           ibs.get_image_uuids(gid_list)]
+    stat_list = [_stat_image(gpath) for gpath in
+                 ut.ProgIter(gpath_list, lbl='stat images', enabled=verbose)]
+
+    if incremental:
+        db = ibs.get_integrity_watermark_db()
+        try:
+            watermarks = _read_watermarks(db, image_uuid_str_list)
+        finally:
+            db.close()
+        isdirty_list = [
+            not _is_watermark_current(watermarks.get(image_uuid_str), stat,
+                                      image_uuid_str, decode)
+            for image_uuid_str, stat in zip(image_uuid_str_list, stat_list)
+        ]
+    else:
+        isdirty_list = [True] * len(gid_list)
+    dirty_idxs = ut.where(isdirty_list)
+
+    failures = []
+
+    def _record_failure(idx, status, message):
+        failures.append(ut.odict([
+            ('gid', gid_list[idx]),
+            ('image_uuid', image_uuid_str_list[idx]),
+            ('gpath', gpath_list[idx]),
+            ('status', status),
+            ('message', message),
+        ]))
+
+    # Missing files do not need to go to a worker
+    todo_idxs = []
+    for idx in dirty_idxs:
+        if stat_list[idx] is None:
+            _record_failure(idx, IMAGE_STATUS_MISSING, 'image file does not exist')
+        else:
+            todo_idxs.append(idx)
+
+    if verbose:
+        print('[integrity] verifying %d / %d images (%d skipped)' % (
+            len(dirty_idxs), len(gid_list), len(gid_list) - len(dirty_idxs)))
+
+    args_gen = [(idx, gpath_list[idx], image_uuid_str_list[idx], decode)
+                for idx in todo_idxs]
+    force_serial = ibs.force_serial or nprocs == 1
+    if len(args_gen) == 0:
+        result_gen = []
+    else:
+        result_gen = ut.generate2(
+            _indexed_verify_image_worker, args_gen, nTasks=len(args_gen),
+            ordered=False, nprocs=nprocs, force_serial=force_serial,
+            verbose=verbose)
+
+    watermark_rows = []
+    num_ok = 0
+    db = ibs.get_integrity_watermark_db()
+    try:
+        for idx, (status, size, mtime, hash_str, message) in result_gen:
+            if status == IMAGE_STATUS_OK:
+                num_ok += 1
+                watermark_rows.append((image_uuid_str_list[idx], size, mtime,
+                                       hash_str, int(decode), time.time()))
+                if len(watermark_rows) >= WATERMARK_FLUSH_SIZE:
+                    _write_watermarks(db, watermark_rows)
+                    watermark_rows = []
+            else:
+                _record_failure(idx, status, message)
+        _write_watermarks(db, watermark_rows)
+    finally:
+        db.close()
+
+    failures = sorted(failures, key=lambda failure: failure['gid'])
+    report = ut.odict([
+        ('num_images', len(gid_list)),
+        ('num_skipped', len(gid_list) - len(dirty_idxs)),
+        ('num_verified', num_ok),
+        ('num_failed', len(failures)),
+        ('status_hist', dict(ut.dict_hist(ut.take_column(failures, 'status')))),
+        ('failures', failures),
+    ])
+    return report
+
+
+def _indexed_verify_image_worker(idx, gpath, image_uuid_str, decode):
+    """ Keeps track of the input index when results arrive out of order """
+    return idx, verify_image_worker(gpath, image_uuid_str, decode)
+
+
+def _run_check(check_name, func, *args):
+    """ Runs one consistency check and records instead of raising """
+    tt = time.time()
+    try:
+        result = func(*args)
+    except Exception as ex:
+        ut.printex(ex, 'integrity check %s failed' % (check_name,), iswarning=True)
+        passed = False
+        error = '%s: %s' % (type(ex).__name__, ex)
+        result = None
+    else:
+        passed = True
+        error = None
+    return ut.odict([
+        ('passed', passed),
+        ('duration', time.time() - tt),
+        ('error', error),
+        ('result', result),
+    ])
+
+
+@register_ibs_method
+def run_integrity_engine(ibs, check_images=True, incremental=True,
+                         decode=False, nprocs=None):
+    r"""
+    Runs every database consistency check, followed by a parallel
+    (optionally incremental) verification of the image files.
+
+    Args:
+        ibs (IBEISController):  ibeis controller object
+        check_images (bool): verify image files against their uuids
+        incremental (bool): only re-verify images that changed on disk
+        decode (bool): fully decode images to detect corruption
+        nprocs (int): number of worker processes
+
+    Returns:
+        dict: report - overall pass flag, per-check results and the image
+            verification report
+
+    CommandLine:
+        python -m ibeis.other.integrity run_integrity_engine --db PZ_MTEST
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.other.integrity import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb(defaultdb='testdb1')
+        >>> report = ibs.run_integrity_engine()
+        >>> print(ut.repr2(list(report['checks'].keys())))
+        >>> assert report['passed'], ut.repr3(report)
+        ['annot_size', 'image', 'annot', 'name', 'annotmatch']
+    """
+    from ibeis.other import ibsfuncs
+    print('[integrity] Checking consistency')
+    gid_list = ibs.get_valid_gids()
+    aid_list = ibs.get_valid_aids()
+    nid_list = ibs.get_valid_nids()
+    checks = ut.odict()
+    checks['annot_size'] = _run_check('annot_size', ibsfuncs.check_annot_size, ibs)
+    checks['image'] = _run_check('image', ibsfuncs.check_image_consistency, ibs, gid_list)
+    checks['annot'] = _run_check('annot', ibsfuncs.check_annot_consistency, ibs, aid_list)
+    checks['name'] = _run_check('name', ibsfuncs.check_name_consistency, ibs, nid_list)
+    checks['annotmatch'] = _run_check('annotmatch', ibsfuncs.check_annotmatch_consistency, ibs)
+    # Invalid annotmatch rowids are returned instead of raised
+    if checks['annotmatch']['passed'] and len(checks['annotmatch']['result']) > 0:
+        checks['annotmatch']['passed'] = False
+        checks['annotmatch']['error'] = 'found %d invalid annotmatch rowids' % (
+            len(checks['annotmatch']['result']),)
+    passed = all(check['passed'] for check in checks.values())
+    image_report = None
+    if check_images:
+        image_report = ibs.verify_images(gid_list, incremental=incremental,
+                                         decode=decode, nprocs=nprocs)
+        passed = passed and image_report['num_failed'] == 0
+    report = ut.odict([
+        ('passed', passed),
+        ('checks', checks),
+        ('images', image_report),
+    ])
+    print('[integrity] Finished consistency check. passed=%r' % (passed,))
+    return report
+
+
+def format_integrity_failures(report):
+    """
+    Returns a short description of the failed checks and images of a
+    run_integrity_engine report (empty if everything passed)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.other.integrity import *  # NOQA
+        >>> report = {'passed': False, 'checks': {
+        >>>     'annot': {'passed': True, 'error': None},
+        >>>     'name': {'passed': False, 'error': 'AssertionError: bad nid'}},
+        >>>     'images': {'num_failed': 1, 'failures': [
+        >>>         {'gid': 3, 'status': 'missing', 'message': 'gone'}]}}
+        >>> print(format_integrity_failures(report))
+        check name failed: AssertionError: bad nid
+        1 image(s) failed verification
+          gid=3 missing: gone
+    """
+    lines = []
+    for check_name, check in report['checks'].items():
+        if not check['passed']:
+            lines.append('check %s failed: %s' % (check_name, check['error']))
+    image_report = report.get('images', None)
+    if image_report is not None and image_report['num_failed'] > 0:
+        lines.append('%d image(s) failed verification' % (
+            image_report['num_failed'],))
+        for failure in image_report['failures']:
+            lines.append('  gid=%r %s: %s' % (
+                failure['gid'], failure['status'], failure['message']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    """
+    CommandLine:
+        python -m ibeis.other.integrity
+        python -m ibeis.other.integrity --allexamples
+    """
+    import multiprocessing
+    multiprocessing.freeze_support()  # for win32
+    import xdoctest
+    xdoctest.doctest_module(__file__)
@@ -4,6 +4,7 @@ from __future__ import absolute_import, division, print_function
 from ibeis.control import accessor_decors, controller_inject
 from ibeis import constants as const
 import utool as ut
+import numpy as np
 import simplejson as json
 from os.path import join, dirname, abspath
 from flask import url_for, request, current_app
@@ -699,103 +700,207 @@ def detect_cnn_lightnet(ibs, gid_list, commit=True, testing=False, model_tag=Non
 
 
 @register_ibs_method
-def commit_localization_results(ibs, gid_list, results_list, viewpoints_list=None, note=None,
-                                update_json_log=True):
+def match_existing_annots(ibs, gid_list, bbox_list, dedup_thresh):
+    r"""
+    Finds the existing annotation of the same image that overlaps each box
+    the most.
+
+    Args:
+        gid_list (list): image rowid of each box
+        bbox_list (list): (xtl, ytl, width, height) of each box
+        dedup_thresh (float): minimum intersection over union of a match
+
+    Returns:
+        list: aid of the matched annotation or None for each box
+
+    CommandLine:
+        python -m ibeis.web.apis_detect match_existing_annots
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.apis_detect import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> aid_list = ibs.get_valid_aids()[0:2]
+        >>> gid_list = ibs.get_annot_gids(aid_list)
+        >>> bbox_list = [(x + 1, y, w, h) for (x, y, w, h) in ibs.get_annot_bboxes(aid_list)]
+        >>> assert ibs.match_existing_annots(gid_list, bbox_list, 0.9) == aid_list
+        >>> assert ibs.match_existing_annots(gid_list, [(0, 0, 1, 1)] * 2, 0.5) == [None, None]
+    """
+    from ibeis.algo.detect.bbox_index import ImageBBoxIndex
+    unique_gids = sorted(set(gid_list))
+    existing_aid_list = ut.flatten(ibs.get_image_aids(unique_gids))
+    if len(existing_aid_list) == 0 or len(gid_list) == 0:
+        return [None] * len(gid_list)
+    index = ImageBBoxIndex(ibs.get_annot_gids(existing_aid_list),
+                           ibs.get_annot_bboxes(existing_aid_list),
+                           existing_aid_list)
+    match_arr = index.match(gid_list, bbox_list, dedup_thresh)
+    return [None if aid < 0 else int(aid) for aid in match_arr]
+
+
+def _commit_detections(ibs, gid_list, bboxes_list, thetas_list, species_list,
+                       confs_list, viewpoints_list=None, note=None,
+                       set_viewpoints=False, dedup_thresh=None,
+                       update_json_log=True):
+    """
+    Adds the detections of all images as annotations with one add_annots
+    call.
+
+    Detections overlapping an existing annotation of their image by at least
+    dedup_thresh are not added and return the aid of that annotation
+    instead. Viewpoints are passed to add_annots, or set afterwards if
+    set_viewpoints is True.
+
+    Returns:
+        list: aids_list - one list of aids per image
+    """
+    num_list = [len(bbox_list) for bbox_list in bboxes_list]
     if viewpoints_list is None:
         viewpoints_list = [None] * len(gid_list)
-
-    zipped_list = list(zip(gid_list, results_list, viewpoints_list))
-    aids_list = []
-    for gid, (score, bbox_list, theta_list, conf_list, class_list), viewpoint_list in zipped_list:
-        if viewpoint_list is not None:
-            assert len(viewpoint_list) == len(bbox_list)
-
-        num = len(bbox_list)
-        notes_list = None if note is None else [note] * num
-        aid_list = ibs.add_annots(
-            [gid] * num,
-            bbox_list,
-            theta_list,
-            class_list,
-            viewpoint_list=viewpoint_list,
-            detect_confidence_list=conf_list,
+    viewpoints_list = [
+        [None] * num if viewpoint_list is None else viewpoint_list
+        for num, viewpoint_list in zip(num_list, viewpoints_list)
+    ]
+    for num, viewpoint_list in zip(num_list, viewpoints_list):
+        assert len(viewpoint_list) == num
+    flat_gids = ut.flatten([[gid] * num for gid, num in zip(gid_list, num_list)])
+    flat_bboxes = ut.flatten(bboxes_list)
+    flat_thetas = ut.flatten(thetas_list)
+    flat_species = ut.flatten(species_list)
+    flat_confs = ut.flatten(confs_list)
+    flat_viewpoints = ut.flatten(viewpoints_list)
+
+    if dedup_thresh is None:
+        match_list = [None] * len(flat_gids)
+    else:
+        match_list = ibs.match_existing_annots(flat_gids, flat_bboxes, dedup_thresh)
+    add_flags = [aid is None for aid in match_list]
+    if any(add_flags):
+        num_add = sum(add_flags)
+        notes_list = None if note is None else [note] * num_add
+        viewpoint_list = ut.compress(flat_viewpoints, add_flags)
+        new_aid_list = ibs.add_annots(
+            ut.compress(flat_gids, add_flags),
+            ut.compress(flat_bboxes, add_flags),
+            ut.compress(flat_thetas, add_flags),
+            ut.compress(flat_species, add_flags),
+            viewpoint_list=None if set_viewpoints else viewpoint_list,
+            detect_confidence_list=ut.compress(flat_confs, add_flags),
             notes_list=notes_list,
             quiet_delete_thumbs=True,
             skip_cleaning=True
         )
-        aids_list.append(aid_list)
+        if set_viewpoints:
+            ibs.set_annot_viewpoints(new_aid_list, viewpoint_list)
+            # TODO ibs.set_annot_viewpoint_code(new_aid_list, viewpoint_list)
+    else:
+        new_aid_list = []
+    new_aid_iter = iter(new_aid_list)
+    flat_aids = [
+        next(new_aid_iter) if flag else aid
+        for aid, flag in zip(match_list, add_flags)
+    ]
+    aids_list = ut.unflatten2(flat_aids, np.cumsum(num_list).tolist())
     ibs._clean_species()
     if update_json_log:
-        aid_list = ut.flatten(aids_list)
-        ibs.log_detections(aid_list)
+        ibs.log_detections(new_aid_list if dedup_thresh is not None else flat_aids)
     return aids_list
 
 
+@register_ibs_method
+def commit_localization_results(ibs, gid_list, results_list, viewpoints_list=None, note=None,
+                                update_json_log=True, dedup_thresh=None):
+    r"""
+    Adds localization results as annotations.
+
+    Args:
+        gid_list (list): image rowids
+        results_list (list): (score, bboxes, thetas, confs, classes) per image
+        viewpoints_list (list): viewpoints of the boxes of each image
+        note (str): note of the new annotations
+        dedup_thresh (float): if specified, boxes overlapping an existing
+            annotation of their image by at least this IoU are not added
+
+    Returns:
+        list: aids_list - one list of aids per image
+
+    CommandLine:
+        python -m ibeis.web.apis_detect commit_localization_results
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.apis_detect import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()[0:3]
+        >>> existing_aid = ibs.get_image_aids(gid_list[0])[0]
+        >>> xtl, ytl, w, h = ibs.get_annot_bboxes(existing_aid)
+        >>> results_list = [
+        >>>     (0.0, np.array([[xtl, ytl, w, h], [0, 0, 10, 10]]), np.zeros(2),
+        >>>      np.array([0.9, 0.8]), np.array(['zebra_plains', 'zebra_plains'])),
+        >>>     (0.0, np.zeros((0, 4)), np.zeros(0), np.zeros(0), np.zeros(0)),
+        >>>     (0.0, np.array([[5, 5, 20, 20]]), np.zeros(1), np.array([0.7]),
+        >>>      np.array(['giraffe_masai'])),
+        >>> ]
+        >>> aids_list = ibs.commit_localization_results(
+        >>>     gid_list, results_list, dedup_thresh=0.75, update_json_log=False)
+        >>> assert aids_list[0][0] == existing_aid
+        >>> assert len(aids_list[1]) == 0
+        >>> new_aid_list = aids_list[0][1:] + aids_list[2]
+        >>> assert ibs.get_annot_bboxes(new_aid_list) == [(0, 0, 10, 10), (5, 5, 20, 20)]
+        >>> assert ibs.get_annot_species_texts(new_aid_list) == ['zebra_plains', 'giraffe_masai']
+        >>> ibs.delete_annots(new_aid_list)
+    """
+    bboxes_list = [result[1] for result in results_list]
+    thetas_list = [result[2] for result in results_list]
+    confs_list = [result[3] for result in results_list]
+    classes_list = [result[4] for result in results_list]
+    return _commit_detections(
+        ibs, gid_list, bboxes_list, thetas_list, classes_list, confs_list,
+        viewpoints_list=viewpoints_list, note=note, dedup_thresh=dedup_thresh,
+        update_json_log=update_json_log)
+
+
 @register_ibs_method
 def commit_detection_results(ibs, gid_list, results_list, note=None,
-                             update_json_log=True):
-    zipped_list = list(zip(gid_list, results_list))
-    aids_list = []
-    for gid, (score, bbox_list, theta_list, species_list, viewpoint_list, conf_list) in zipped_list:
-        num = len(bbox_list)
-        notes_list = None if note is None else [note] * num
-        aid_list = ibs.add_annots(
-            [gid] * num,
-            bbox_list,
-            theta_list,
-            species_list,
-            detect_confidence_list=conf_list,
-            notes_list=notes_list,
-            quiet_delete_thumbs=True,
-            skip_cleaning=True
-        )
-        ibs.set_annot_viewpoints(aid_list, viewpoint_list)
-        # TODO ibs.set_annot_viewpoint_code(aid_list, viewpoint_list)
-        aids_list.append(aid_list)
-    ibs._clean_species()
-    if update_json_log:
-        aid_list = ut.flatten(aids_list)
-        ibs.log_detections(aid_list)
-    return aids_list
+                             update_json_log=True, dedup_thresh=None):
+    """
+    Adds detection results, (score, bboxes, thetas, species, viewpoints,
+    confs) per image, as annotations. See commit_localization_results.
+    """
+    bboxes_list = [result[1] for result in results_list]
+    thetas_list = [result[2] for result in results_list]
+    species_list = [result[3] for result in results_list]
+    viewpoints_list = [result[4] for result in results_list]
+    confs_list = [result[5] for result in results_list]
+    return _commit_detections(
+        ibs, gid_list, bboxes_list, thetas_list, species_list, confs_list,
+        viewpoints_list=viewpoints_list, note=note, set_viewpoints=True,
+        dedup_thresh=dedup_thresh, update_json_log=update_json_log)
 
 
 @register_ibs_method
 def commit_detection_results_filtered(ibs, gid_list, filter_species_list=None,
                                       filter_viewpoint_list=None, note=None,
-                                      update_json_log=True):
+                                      update_json_log=True, dedup_thresh=None):
     depc = ibs.depc_image
     results_list = depc.get_property('detections', gid_list, None)
-    zipped_list = list(zip(gid_list, results_list))
-    aids_list = []
-    for gid, (score, bbox_list, theta_list, species_list, viewpoint_list, conf_list) in zipped_list:
-        aid_list = []
-        result_list = list(zip(bbox_list, theta_list, species_list, viewpoint_list, conf_list))
-        for bbox, theta, species, viewpoint, conf in result_list:
-            if not (filter_species_list is None or species in filter_species_list):
-                continue
-            if not (filter_viewpoint_list is None or viewpoint in filter_viewpoint_list):
-                continue
-            note_ = None if note is None else [note]
-            temp_list = ibs.add_annots(
-                [gid],
-                [bbox],
-                [theta],
-                [species],
-                detect_confidence_list=[conf],
-                notes_list=note_,
-                quiet_delete_thumbs=True,
-                skip_cleaning=True
-            )
-            aid = temp_list[0]
-            ibs.set_annot_viewpoints([aid], [viewpoint])
-            # TODO ibs.set_annot_viewpoint_code([aid], [viewpoint])
-            aid_list.append(aid)
-        aids_list.append(aid_list)
-    ibs._clean_species()
-    if update_json_log:
-        aid_list = ut.flatten(aids_list)
-        ibs.log_detections(aid_list)
-    return aids_list
+    filtered_list = []
+    for score, bbox_list, theta_list, species_list, viewpoint_list, conf_list in results_list:
+        flag_list = [
+            (filter_species_list is None or species in filter_species_list) and
+            (filter_viewpoint_list is None or viewpoint in filter_viewpoint_list)
+            for species, viewpoint in zip(species_list, viewpoint_list)
+        ]
+        filtered_list.append((score, ) + tuple(
+            ut.compress(list(value_list), flag_list)
+            for value_list in [bbox_list, theta_list, species_list,
+                               viewpoint_list, conf_list]
+        ))
+    return ibs.commit_detection_results(gid_list, filtered_list, note=note,
+                                        update_json_log=update_json_log,
+                                        dedup_thresh=dedup_thresh)
 
 
 @register_ibs_method
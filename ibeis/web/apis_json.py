@@ -11,9 +11,107 @@ from ibeis.control import controller_inject
 import utool as ut
 
 
+CLASS_INJECT_KEY, register_ibs_method = (
+    controller_inject.make_ibs_register_decorator(__name__))
 register_api   = controller_inject.get_ibeis_flask_api(__name__)
 
 
+# Bulk requests larger than this are processed by the job engine
+BULK_JOB_THRESHOLD = 1000
+
+
+def _ensure_uuid_list(list_):
+    return [
+        uuid.UUID(uuid_) if isinstance(uuid_, six.string_types) else uuid_
+        for uuid_ in list_
+    ]
+
+
+def _resolve_column(list_, num, default='', assert_=False):
+    """
+    Columnar version of per-index resolution for optional request lists.
+    Missing entries (short lists and nulls) get the default value.
+    """
+    if list_ is None:
+        if assert_:
+            raise ValueError('Must specify all required fields')
+        return [default] * num
+    column = list(list_[:num]) + [None] * max(0, num - len(list_))
+    if assert_:
+        if any(value is None for value in column):
+            raise ValueError('Must specify all required fields')
+        return column
+    return [default if value is None else value for value in column]
+
+
+def _get_standard_ext(gpath):
+    ext = splitext(gpath)[1].lower()
+    return '.jpg' if ext == '.jpeg' else ext
+
+
+def _parse_images_json_columns(ibs, image_uri_list, image_uuid_list,
+                               image_width_list, image_height_list,
+                               image_orig_name_list=None, image_ext_list=None,
+                               image_time_posix_list=None,
+                               image_gps_lat_list=None,
+                               image_gps_lon_list=None,
+                               image_orientation_list=None,
+                               image_notes_list=None):
+    r"""
+    Parses an image JSON request column by column into the ``add_images``
+    params format.
+
+    Returns:
+        tuple: (gpath_list, params_list)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.apis_json import *  # NOQA
+        >>> from ibeis.web.apis_json import _parse_images_json_columns
+        >>> ibs = ut.DynStruct()
+        >>> ibs.containerized = False
+        >>> gpath_list, params_list = _parse_images_json_columns(
+        >>>     ibs, ['http://localhost/a.JPEG', '/b.png'],
+        >>>     ['00000000-0000-0000-0000-000000000001',
+        >>>      uuid.UUID('00000000-0000-0000-0000-000000000002')],
+        >>>     [10, 20], [30, 40], image_time_posix_list=[None, 5])
+        >>> print(gpath_list)
+        >>> print(ut.repr2(params_list[1]))
+        ['http://localhost/a.JPEG', '/b.png']
+        (UUID('00000000-0000-0000-0000-000000000002'), '/b.png', '/b.png', 'b.png', '.png', 20, 40, 5, -1.0, -1.0, 0, '')
+    """
+    if image_uri_list is None:
+        raise ValueError('Must specify all required fields')
+    num = len(image_uri_list)
+    uri_list = _resolve_column(image_uri_list, num, assert_=True)
+    uri_list = [
+        ut.s3_dict_encode_to_str(uri) if isinstance(uri, dict) else uri
+        for uri in uri_list
+    ]
+    if ibs.containerized:
+        uri_list = [uri.replace('://localhost/', '://nginx:80/')
+                    for uri in uri_list]
+    uuid_list = _ensure_uuid_list(_resolve_column(image_uuid_list, num,
+                                                  assert_=True))
+    orig_gname_list = _resolve_column(image_orig_name_list, num, default=None)
+    orig_gname_list = [basename(uri) if gname is None else gname
+                       for gname, uri in zip(orig_gname_list, uri_list)]
+    ext_list = _resolve_column(image_ext_list, num, default=None)
+    ext_list = [_get_standard_ext(uri) if ext is None else ext
+                for ext, uri in zip(ext_list, uri_list)]
+    width_list = list(map(int, _resolve_column(image_width_list, num, assert_=True)))
+    height_list = list(map(int, _resolve_column(image_height_list, num, assert_=True)))
+    time_list = list(map(int, _resolve_column(image_time_posix_list, num, default=-1)))
+    lat_list = list(map(float, _resolve_column(image_gps_lat_list, num, default=-1.0)))
+    lon_list = list(map(float, _resolve_column(image_gps_lon_list, num, default=-1.0)))
+    orient_list = list(map(int, _resolve_column(image_orientation_list, num, default=0)))
+    notes_list = _resolve_column(image_notes_list, num)
+    params_list = list(zip(
+        uuid_list, uri_list, uri_list, orig_gname_list, ext_list, width_list,
+        height_list, time_list, lat_list, lon_list, orient_list, notes_list))
+    return uri_list, params_list
+
+
 @register_api('/api/imageset/json/', methods=['POST'])
 def add_imagesets_json(ibs, imageset_text_list, imageset_uuid_list=None, config_rowid_list=None,
                        imageset_notes_list=None):
@@ -149,66 +247,16 @@ def add_images_json(ibs, image_uri_list, image_uuid_list, image_width_list,
         >>> print(web_instance.get_image_paths(gid_list))
         >>> print(web_instance.get_image_uris_original(gid_list))
     """
-    def _get_standard_ext(gpath):
-        ext = splitext(gpath)[1].lower()
-        return '.jpg' if ext == '.jpeg' else ext
-
-    def _parse_imageinfo(index):
-        def _resolve_uri():
-            list_ = image_uri_list
-            if list_ is None or index >= len(list_) or list_[index] is None:
-                raise ValueError('Must specify all required fields')
-            value = list_[index]
-
-            if isinstance(value, dict):
-                value = ut.s3_dict_encode_to_str(value)
-
-            if ibs.containerized:
-                value = value.replace('://localhost/', '://nginx:80/')
-
-            return value
-
-        def _resolve(list_, default='', assert_=False):
-            if list_ is None or index >= len(list_) or list_[index] is None:
-                if assert_:
-                    raise ValueError('Must specify all required fields')
-                return default
-            return list_[index]
-
-        uri = _resolve_uri()
-        orig_gname = basename(uri)
-        ext = _get_standard_ext(uri)
-
-        uuid_ = _resolve(image_uuid_list, assert_=True)
-        if isinstance(uuid_, six.string_types):
-            uuid_ = uuid.UUID(uuid_)
-
-        param_tup = (
-            uuid_,
-            uri,
-            uri,
-            _resolve(image_orig_name_list, default=orig_gname),
-            _resolve(image_ext_list, default=ext),
-            int(_resolve(image_width_list, assert_=True)),
-            int(_resolve(image_height_list, assert_=True)),
-            int(_resolve(image_time_posix_list, default=-1)),
-            float(_resolve(image_gps_lat_list, default=-1.0)),
-            float(_resolve(image_gps_lon_list, default=-1.0)),
-            int(_resolve(image_orientation_list, default=0)),
-            _resolve(image_notes_list),
-        )
-        return param_tup
-
     # TODO: FIX ME SO THAT WE DON'T HAVE TO LOCALIZE EVERYTHING
     kwargs['auto_localize'] = kwargs.get('auto_localize', True)
     kwargs['sanitize'] = kwargs.get('sanitize', False)
 
-    index_list = range(len(image_uri_list))
-    params_gen = ut.generate2(_parse_imageinfo, zip(index_list),
-                              force_serial=True)
-    params_gen = list(params_gen)
-    gpath_list = [ _[1] for _ in params_gen ]
-    gid_list = ibs.add_images(gpath_list, params_list=params_gen, **kwargs)  # NOQA
+    gpath_list, params_list = _parse_images_json_columns(
+        ibs, image_uri_list, image_uuid_list, image_width_list,
+        image_height_list, image_orig_name_list, image_ext_list,
+        image_time_posix_list, image_gps_lat_list, image_gps_lon_list,
+        image_orientation_list, image_notes_list)
+    gid_list = ibs.add_images(gpath_list, params_list=params_list, **kwargs)  # NOQA
     # return gid_list
     image_uuid_list = ibs.get_image_uuids(gid_list)
     return image_uuid_list
@@ -272,14 +320,8 @@ def add_annots_json(ibs, image_uuid_list, annot_uuid_list, annot_bbox_list,
         >>> print(web_instance.get_annot_bboxes(aid_list))
     """
 
-    image_uuid_list = [
-        uuid.UUID(uuid_) if isinstance(uuid_, six.string_types) else uuid_
-        for uuid_ in image_uuid_list
-    ]
-    annot_uuid_list = [
-        uuid.UUID(uuid_) if isinstance(uuid_, six.string_types) else uuid_
-        for uuid_ in annot_uuid_list
-    ]
+    image_uuid_list = _ensure_uuid_list(image_uuid_list)
+    annot_uuid_list = _ensure_uuid_list(annot_uuid_list)
     gid_list = ibs.get_image_gids_from_uuid(image_uuid_list)
     aid_list = ibs.add_annots(gid_list,
                               bbox_list=annot_bbox_list, theta_list=annot_theta_list,
@@ -293,6 +335,192 @@ def add_annots_json(ibs, image_uuid_list, annot_uuid_list, annot_bbox_list,
     return annot_uuid_list
 
 
+@register_ibs_method
+@register_api('/api/image/json/bulk/', methods=['POST'])
+def add_images_json_bulk(ibs, image_uri_list, image_uuid_list, image_width_list,
+                         image_height_list, image_orig_name_list=None,
+                         image_ext_list=None, image_time_posix_list=None,
+                         image_gps_lat_list=None, image_gps_lon_list=None,
+                         image_orientation_list=None, image_notes_list=None,
+                         auto_localize=True, max_workers=8, synchronous=None,
+                         callback_url=None, callback_method=None):
+    r"""
+    Bulk version of :func:`add_images_json` for large batches.
+
+    The request is parsed column by column, new images are inserted with a
+    single ``executemany`` transaction, and images are localized by at most
+    ``max_workers`` concurrent downloads.  Batches larger than
+    ``BULK_JOB_THRESHOLD`` are handed to the job engine and a jobid is
+    returned instead of the image uuids.
+
+    REST:
+        Method: POST
+        URL: /api/image/json/bulk/
+
+    Args:
+        (see :func:`add_images_json` for the image columns)
+        auto_localize (bool): copy / download the images into the ibeis
+            image cache (default = True)
+        max_workers (int): maximum number of concurrent localizations
+        synchronous (bool): force (True) or prevent (False) synchronous
+            processing. If None, synchronous iff the batch is small.
+        callback_url (url): called when an asynchronous job finishes
+
+    Returns:
+        list or str: image_uuid_list or jobid
+
+    CommandLine:
+        python -m ibeis.web.apis_json add_images_json_bulk
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.apis_json import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> gid_list = ibs.get_valid_gids()[0:2]
+        >>> size_list = ibs.get_image_sizes(gid_list)
+        >>> image_uuid_list = add_images_json_bulk(
+        >>>     ibs, ibs.get_image_paths(gid_list), ibs.get_image_uuids(gid_list),
+        >>>     ut.take_column(size_list, 0), ut.take_column(size_list, 1),
+        >>>     auto_localize=False)
+        >>> assert image_uuid_list == ibs.get_image_uuids(gid_list)
+    """
+    num = len(image_uri_list)
+    if synchronous is None:
+        synchronous = num <= BULK_JOB_THRESHOLD
+    if not synchronous:
+        # The job engine serializes arguments as JSON
+        image_uuid_list = list(map(str, _ensure_uuid_list(image_uuid_list)))
+        jobid = ibs.job_manager.jobiface.queue_job(
+            'add_images_json_bulk', callback_url, callback_method,
+            image_uri_list, image_uuid_list, image_width_list,
+            image_height_list, image_orig_name_list=image_orig_name_list,
+            image_ext_list=image_ext_list,
+            image_time_posix_list=image_time_posix_list,
+            image_gps_lat_list=image_gps_lat_list,
+            image_gps_lon_list=image_gps_lon_list,
+            image_orientation_list=image_orientation_list,
+            image_notes_list=image_notes_list, auto_localize=auto_localize,
+            max_workers=max_workers, synchronous=True)
+        return jobid
+
+    with ut.Timer('[add_images_json_bulk] parse %d images' % (num,)):
+        gpath_list, params_list = _parse_images_json_columns(
+            ibs, image_uri_list, image_uuid_list, image_width_list,
+            image_height_list, image_orig_name_list, image_ext_list,
+            image_time_posix_list, image_gps_lat_list, image_gps_lon_list,
+            image_orientation_list, image_notes_list)
+    gid_list = ibs.add_images_bulk(gpath_list, params_list,
+                                   auto_localize=auto_localize,
+                                   max_workers=max_workers)
+    image_uuid_list = ibs.get_image_uuids(gid_list)
+    return image_uuid_list
+
+
+@register_ibs_method
+@register_api('/api/annot/json/bulk/', methods=['POST'])
+def add_annots_json_bulk(ibs, image_uuid_list, annot_uuid_list, annot_bbox_list,
+                         annot_theta_list=None, annot_viewpoint_list=None,
+                         annot_quality_list=None, annot_species_list=None,
+                         annot_multiple_list=None, annot_interest_list=None,
+                         annot_name_list=None, annot_notes_list=None,
+                         chunksize=10000, synchronous=None, callback_url=None,
+                         callback_method=None):
+    r"""
+    Bulk version of :func:`add_annots_json` for large batches.
+
+    Image uuids are resolved with one ``IN`` query per chunk instead of one
+    query per annotation, and annotations are added ``chunksize`` at a time
+    so each chunk is written in a single transaction.  Batches larger than
+    ``BULK_JOB_THRESHOLD`` are handed to the job engine and a jobid is
+    returned instead of the annotation uuids.
+
+    REST:
+        Method: POST
+        URL: /api/annot/json/bulk/
+
+    Args:
+        (see :func:`add_annots_json` for the annotation columns)
+        chunksize (int): number of annotations added per transaction
+        synchronous (bool): force (True) or prevent (False) synchronous
+            processing. If None, synchronous iff the batch is small.
+        callback_url (url): called when an asynchronous job finishes
+
+    Returns:
+        list or str: annot_uuid_list or jobid
+
+    CommandLine:
+        python -m ibeis.web.apis_json add_annots_json_bulk
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.apis_json import *  # NOQA
+        >>> import ibeis
+        >>> ibs = ibeis.opendb('testdb1')
+        >>> aid_list = ibs.get_valid_aids()[0:3]
+        >>> annot_uuid_list = add_annots_json_bulk(
+        >>>     ibs, ibs.get_annot_image_uuids(aid_list),
+        >>>     ibs.get_annot_uuids(aid_list), ibs.get_annot_bboxes(aid_list),
+        >>>     chunksize=2)
+        >>> assert annot_uuid_list == ibs.get_annot_uuids(aid_list)
+    """
+    num = len(annot_uuid_list)
+    if synchronous is None:
+        synchronous = num <= BULK_JOB_THRESHOLD
+    if not synchronous:
+        # The job engine serializes arguments as JSON
+        image_uuid_list = list(map(str, _ensure_uuid_list(image_uuid_list)))
+        annot_uuid_list = list(map(str, _ensure_uuid_list(annot_uuid_list)))
+        jobid = ibs.job_manager.jobiface.queue_job(
+            'add_annots_json_bulk', callback_url, callback_method,
+            image_uuid_list, annot_uuid_list, annot_bbox_list,
+            annot_theta_list=annot_theta_list,
+            annot_viewpoint_list=annot_viewpoint_list,
+            annot_quality_list=annot_quality_list,
+            annot_species_list=annot_species_list,
+            annot_multiple_list=annot_multiple_list,
+            annot_interest_list=annot_interest_list,
+            annot_name_list=annot_name_list,
+            annot_notes_list=annot_notes_list, chunksize=chunksize,
+            synchronous=True)
+        return jobid
+
+    from ibeis import constants as const
+    from ibeis.control import _sql_helpers
+    image_uuid_list = _ensure_uuid_list(image_uuid_list)
+    annot_uuid_list = _ensure_uuid_list(annot_uuid_list)
+    gid_list = _sql_helpers.get_rowids_where_in(
+        ibs.db, const.IMAGE_TABLE, 'image_uuid', image_uuid_list)
+    missing_flags = ut.flag_None_items(gid_list)
+    if any(missing_flags):
+        missing_image_uuid_list = ut.unique(ut.compress(image_uuid_list,
+                                                        missing_flags))
+        raise controller_inject.WebMissingUUIDException(
+            missing_image_uuid_list=missing_image_uuid_list)
+
+    column_dict = ut.odict([
+        ('bbox_list', annot_bbox_list),
+        ('theta_list', annot_theta_list),
+        ('species_list', annot_species_list),
+        ('name_list', annot_name_list),
+        ('viewpoint_list', annot_viewpoint_list),
+        ('quality_list', annot_quality_list),
+        ('multiple_list', annot_multiple_list),
+        ('interest_list', annot_interest_list),
+        ('notes_list', annot_notes_list),
+    ])
+    aid_list = []
+    for start in range(0, num, chunksize):
+        sl = slice(start, start + chunksize)
+        chunk_kw = {key: None if column is None else column[sl]
+                    for key, column in column_dict.items()}
+        aid_list += ibs.add_annots(gid_list[sl],
+                                   annot_uuid_list=annot_uuid_list[sl],
+                                   **chunk_kw)
+    annot_uuid_list = ibs.get_annot_uuids(aid_list)
+    return annot_uuid_list
+
+
 @register_api('/api/part/json/', methods=['POST'])
 def add_parts_json(ibs, annot_uuid_list, part_uuid_list, part_bbox_list,
                    part_theta_list=None, **kwargs):
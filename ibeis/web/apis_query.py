@@ -8,7 +8,7 @@ SeeAlso:
 from __future__ import absolute_import, division, print_function, unicode_literals
 from ibeis.control import accessor_decors, controller_inject
 from ibeis.algo.hots import pipeline
-from flask import url_for, request, current_app  # NOQA
+from flask import url_for, request, current_app, make_response  # NOQA
 from os.path import join, dirname, abspath, exists
 import cv2
 import numpy as np   # NOQA
@@ -34,6 +34,11 @@ GRAPH_CLIENT_PEEK = 100
 ANNOT_INFR_PEAK_MAX = 50
 
 
+# Number of shared graph host workers. If zero every review graph runs in its
+# own GraphActor process.
+GRAPH_HOST_WORKERS = ut.get_argval('--graph-hosts', type_=int, default=0)
+
+
 @register_ibs_method
 @accessor_decors.default_decorator
 @register_api('/api/query/annot/rowid/', methods=['GET'])
@@ -51,7 +56,7 @@ def get_recognition_query_aids(ibs, is_known, species=None):
 
 @register_ibs_method
 @register_api('/api/query/chip/dict/simple/', methods=['GET'])
-def query_chips_simple_dict(ibs, *args, **kwargs):
+def query_chips_simple_dict(ibs, *args, cancel_token=None, **kwargs):
     r"""
     Runs query_chips, but returns a json compatible dictionary
 
@@ -116,12 +121,12 @@ def query_chips_simple_dict(ibs, *args, **kwargs):
 
     """
     kwargs['return_cm_simple_dict'] = True
-    return ibs.query_chips(*args, **kwargs)
+    return ibs.query_chips(*args, cancel_token=cancel_token, **kwargs)
 
 
 @register_ibs_method
 @register_api('/api/query/chip/dict/', methods=['GET'])
-def query_chips_dict(ibs, *args, **kwargs):
+def query_chips_dict(ibs, *args, cancel_token=None, **kwargs):
     """
     Runs query_chips, but returns a json compatible dictionary
 
@@ -130,7 +135,7 @@ def query_chips_dict(ibs, *args, **kwargs):
         URL:    /api/query/chip/dict/
     """
     kwargs['return_cm_dict'] = True
-    return ibs.query_chips(*args, **kwargs)
+    return ibs.query_chips(*args, cancel_token=cancel_token, **kwargs)
 
 
 @register_ibs_method
@@ -570,7 +575,8 @@ def query_chips_test(ibs, **kwargs):
 @register_ibs_method
 @register_api('/api/query/graph/', methods=['GET', 'POST'])
 def query_chips_graph(ibs, qaid_list, daid_list, user_feedback=None,
-                      query_config_dict={}, echo_query_params=True):
+                      query_config_dict={}, echo_query_params=True,
+                      cancel_token=None):
     from ibeis.unstable.orig_graph_iden import OrigAnnotInference
     import theano  # NOQA
     import uuid
@@ -584,7 +590,8 @@ def query_chips_graph(ibs, qaid_list, daid_list, user_feedback=None,
         return uuid_
 
     cm_list, qreq_ = ibs.query_chips(qaid_list=qaid_list, daid_list=daid_list,
-                                     cfgdict=query_config_dict, return_request=True)
+                                     cfgdict=query_config_dict, return_request=True,
+                                     cancel_token=cancel_token)
     cm_dict = {
         str(ibs.get_annot_uuids(cm.qaid)): {
             # 'qaid'                  : cm.qaid,
@@ -636,7 +643,8 @@ def query_chips(ibs, qaid_list=None, daid_list=None, cfgdict=None,
                 use_cache=None, use_bigcache=None, qreq_=None,
                 return_request=False, verbose=pipeline.VERB_PIPELINE,
                 save_qcache=None, prog_hook=None, return_cm_dict=False,
-                return_cm_simple_dict=False):
+                return_cm_simple_dict=False, use_query_service=None,
+                cancel_token=None):
     r"""
     Submits a query request to the hotspotter recognition pipeline. Returns
     a list of QueryResult objects.
@@ -656,6 +664,14 @@ def query_chips(ibs, qaid_list=None, daid_list=None, cfgdict=None,
         return_request (bool): returns the request which will be created if
             one is not already specified
         verbose (bool): default=False, turns on verbose printing
+        use_query_service (bool): builds the request from a warm
+            QueryService of (daid_list, cfgdict), which keeps the indexer and
+            the database annotations loaded between calls. Defaults to the
+            --warm-query flag.
+        cancel_token (pipeline.CancelToken): runs the request with
+            execute_stream, which checks the token between chunks and
+            pipeline stages and raises pipeline.QueryCancelled. The job
+            engine passes one to every query job (see job_engine.cancel_job).
 
     Returns:
         list: a list of ChipMatch objects containing the matching
@@ -732,13 +748,25 @@ def query_chips(ibs, qaid_list=None, daid_list=None, cfgdict=None,
         qaid_list, was_scalar = ut.wrap_iterable(qaid_list)
         if daid_list is None:
             daid_list = ibs.get_valid_aids()
-        qreq_ = ibs.new_query_request(qaid_list, daid_list,
-                                      cfgdict=cfgdict, verbose=verbose)
+        from ibeis.algo.hots import query_service
+        if use_query_service is None:
+            use_query_service = query_service.USE_QUERY_SERVICE
+        if use_query_service:
+            service = query_service.get_query_service(ibs, daid_list, cfgdict)
+            qreq_ = service.new_query_request(qaid_list)
+        else:
+            qreq_ = ibs.new_query_request(qaid_list, daid_list,
+                                          cfgdict=cfgdict, verbose=verbose)
     else:
         assert qaid_list is None, 'do not specify qreq and qaids'
         assert daid_list is None, 'do not specify qreq and daids'
         was_scalar = False
-    cm_list = qreq_.execute()
+    if cancel_token is None:
+        cm_list = qreq_.execute()
+    else:
+        qaid2_cm = {cm.qaid: cm for cm in
+                    qreq_.execute_stream(cancel_token=cancel_token)}
+        cm_list = ut.take(qaid2_cm, qreq_.qaids)
     assert isinstance(cm_list, list), (
         'Chip matches were not returned as a list')
 
@@ -763,6 +791,63 @@ def query_chips(ibs, qaid_list=None, daid_list=None, cfgdict=None,
         return cm_list
 
 
+@register_ibs_method
+def query_chips_stream(ibs, qaid_list=None, daid_list=None, cfgdict=None,
+                       use_cache=None, qreq_=None, verbose=pipeline.VERB_PIPELINE,
+                       prog_hook=None, batch_size=None, cancel_token=None,
+                       stage_hook=None):
+    r"""
+    Streaming version of query_chips. Yields each ChipMatch as soon as its
+    chunk of queries is scored, so callers can show the first results while
+    the rest of the request runs.
+
+    Args:
+        cancel_token (pipeline.CancelToken): cancels the query between chunks
+            and pipeline stages. The generator then raises
+            pipeline.QueryCancelled.
+        stage_hook (callable): receives a dict for the start and end of
+            every pipeline stage
+
+    Yields:
+        ChipMatch: cm - cached results first, then in query order
+
+    CommandLine:
+        python -m ibeis.web.apis_query query_chips_stream
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.algo.hots import pipeline
+        >>> from ibeis.algo.hots.tests import bench
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'stream_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = bench.make_synthetic_database(dbdir, 9, num_feats=30,
+        >>>                                     verbose=False)
+        >>> aids = ibs.get_valid_aids()
+        >>> qreq_ = bench.new_bench_query_request(ibs, aids[0:3], aids)
+        >>> token = pipeline.CancelToken()
+        >>> cm_iter = ibs.query_chips_stream(qreq_=qreq_, use_cache=False,
+        >>>                                  batch_size=1, cancel_token=token)
+        >>> cm = next(cm_iter)
+        >>> token.cancel()
+        >>> import pytest
+        >>> with pytest.raises(pipeline.QueryCancelled):
+        >>>     list(cm_iter)
+    """
+    if qreq_ is None:
+        assert qaid_list is not None, 'do not specify qaids and qreq'
+        assert daid_list is not None, 'do not specify daids and qreq'
+        qaid_list, was_scalar = ut.wrap_iterable(qaid_list)
+        qreq_ = ibs.new_query_request(qaid_list, daid_list,
+                                      cfgdict=cfgdict, verbose=verbose)
+    else:
+        assert qaid_list is None, 'do not specify qreq and qaids'
+        assert daid_list is None, 'do not specify qreq and daids'
+    return qreq_.execute_stream(prog_hook=prog_hook, use_cache=use_cache,
+                                batch_size=batch_size,
+                                cancel_token=cancel_token,
+                                stage_hook=stage_hook)
+
+
 ##########################################################################################
 
 
@@ -779,6 +864,21 @@ def get_graph_client_query_chips_graph_v2(ibs, graph_uuid):
     return graph_client, graph_uuid_chain
 
 
+def get_graph_host_pool():
+    """
+    Returns the GraphHostPool shared by all review graphs, or None if the
+    server was not started with --graph-hosts
+    """
+    if GRAPH_HOST_WORKERS <= 0:
+        return None
+    host_pool = getattr(current_app, 'GRAPH_HOST_POOL', None)
+    if host_pool is None:
+        from ibeis.web.graph_server import GraphHostPool
+        host_pool = GraphHostPool(num_hosts=GRAPH_HOST_WORKERS)
+        current_app.GRAPH_HOST_POOL = host_pool
+    return host_pool
+
+
 def ensure_review_image_v2(ibs, match, draw_matches=False, draw_heatmask=False,
                            view_orientation='vertical', overlay=True):
     import plottool_ibeis as pt
@@ -901,7 +1001,8 @@ def query_chips_graph_v2(ibs, annot_uuid_list=None,
             'finished' : (finished_callback_url, finished_callback_method),
         }
         graph_client = GraphClient(graph_uuid, callbacks=callback_dict,
-                                   autoinit=True)
+                                   autoinit=True,
+                                   host_pool=get_graph_host_pool())
 
         if creation_imageset_rowid_list is not None:
             graph_client.imagesets = creation_imageset_rowid_list
@@ -922,11 +1023,14 @@ def query_chips_graph_v2(ibs, annot_uuid_list=None,
         current_app.GRAPH_CLIENT_DICT[graph_uuid] = graph_client
 
         # Start (create the Graph Inference object)
+        checkpoint_fpath = join(ibs.get_cachedir(), 'infr_checkpoints',
+                                '%s.pkl' % (graph_uuid,))
         payload = {
-            'action' : 'start',
-            'dbdir'  : ibs.dbdir,
-            'aids'   : graph_client.aids,
-            'config' : graph_client.config,
+            'action'     : 'start',
+            'dbdir'      : ibs.dbdir,
+            'aids'       : graph_client.aids,
+            'config'     : graph_client.config,
+            'checkpoint' : checkpoint_fpath,
         }
         future = graph_client.post(payload)
         future.result()  # Guarantee that this has happened before calling refresh
@@ -1127,6 +1231,57 @@ def view_graphs_status(ibs):
     return graph_dict
 
 
+@register_api('/api/status/query/graph/v2/host/', methods=['GET'], __api_plural_check__=False)
+def view_graph_hosts_status(ibs):
+    """
+    Per-host and per-session accounting of the shared graph hosts
+    """
+    host_pool = get_graph_host_pool()
+    if host_pool is None:
+        return []
+    return host_pool.host_stats()
+
+
+def _get_query_metrics(ibs):
+    """
+    The query metrics of this web process plus those reported by the job
+    engine workers, which run the identification jobs
+    """
+    from ibeis.algo.hots import query_metrics
+    metrics = query_metrics.QueryMetrics()
+    metrics.merge(query_metrics.get_process_metrics().asdict())
+    metrics.merge(ibs.get_engine_query_metrics())
+    return metrics
+
+
+@register_api('/api/query/metrics/', methods=['GET'], __api_plural_check__=False)
+def get_query_metrics(ibs):
+    """
+    Stage timing, item counts and cache counters of the queries run by this
+    web process and its job engine while metrics were enabled (start the
+    server with ``--query-metrics``).
+
+    RESTful:
+        Method: GET
+        URL:    /api/query/metrics/
+    """
+    return _get_query_metrics(ibs).asdict()
+
+
+@register_route('/metrics/query/', methods=['GET'], __route_authenticate__=False)
+def query_metrics_prometheus(**kwargs):
+    """
+    The query metrics of this web process and its job engine in the
+    Prometheus text format
+    """
+    ibs = current_app.ibs
+    text = _get_query_metrics(ibs).to_prometheus()
+    response = make_response(text)
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @register_ibs_method
 @register_api('/api/review/query/graph/v2/', methods=['POST'])
 def process_graph_match_html_v2(ibs, graph_uuid, **kwargs):
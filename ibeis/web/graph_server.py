@@ -2,8 +2,11 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 from ibeis.control import controller_inject
 import utool as ut
+import collections
 import concurrent
+import functools
 import random
+import threading
 import time
 # from ibeis.web import futures_utils as futures_actors
 import futures_actors
@@ -57,11 +60,13 @@ def ut_to_json_encode(dict_):
     return dict_
 
 
-def testdata_start_payload(aids='all'):
+def testdata_start_payload(aids='all', dbdir=None):
     import ibeis
+    if dbdir is None:
+        dbdir = ibeis.sysres.db_to_dbdir('PZ_MTEST')
     payload = {
         'action'       : 'start',
-        'dbdir'        : ibeis.sysres.db_to_dbdir('PZ_MTEST'),
+        'dbdir'        : dbdir,
         'aids'         : aids,
         'config'       : {
             'manual.n_peek'   : 50,
@@ -152,6 +157,22 @@ class GraphActor(GRAPH_ACTOR_CLASS):
 
     def __init__(actor):
         actor.infr = None
+        actor.checkpoint_fpath = None
+        actor.checkpoint_interval = None
+        actor.feedback_mode = 'staging'
+        # Controllers shared with other sessions in the same process
+        # (see GraphHost). None means each actor opens its own.
+        actor.ibs_cache = None
+
+    def _open_ibs(actor, dbdir):
+        import ibeis
+        if actor.ibs_cache is not None and dbdir in actor.ibs_cache:
+            return actor.ibs_cache[dbdir]
+        ibs = ibeis.opendb(dbdir=dbdir, use_cache=False, web=False,
+                           force_serial=True)
+        if actor.ibs_cache is not None:
+            actor.ibs_cache[dbdir] = ibs
+        return ibs
 
     def handle(actor, message):
         if not isinstance(message, dict):
@@ -195,31 +216,52 @@ class GraphActor(GRAPH_ACTOR_CLASS):
 
                     raise sys.exc_info()[0](trace)
 
-    def start(actor, dbdir, aids='all', config={},
-              **kwargs):
+    def start(actor, dbdir, aids='all', config={}, checkpoint=None,
+              checkpoint_interval=300, **kwargs):
+        """
+        Args:
+            checkpoint (str): path of a checkpoint file. If it exists and
+                matches the database feedback it is used to resume instead of
+                rebuilding the inference state. New checkpoints are written
+                here every checkpoint_interval seconds of review activity
+                and on shutdown.
+        """
         import ibeis
         assert dbdir is not None, 'must specify dbdir'
         assert actor.infr is None, ('AnnotInference already running')
-        ibs = ibeis.opendb(dbdir=dbdir, use_cache=False, web=False,
-                           force_serial=True)
-
-        # Create the AnnotInference
-        print('starting via actor with ibs = %r' % (ibs, ))
-        actor.infr = ibeis.AnnotInference(ibs=ibs, aids=aids, autoinit=True)
-        actor.infr.print('started via actor')
-        actor.infr.print('config = {}'.format(ut.repr3(config)))
-        # Configure query_annot_infr
-        for key in config:
-            actor.infr.params[key] = config[key]
-        # Initialize
-        # TODO: Initialize state from staging reviews after annotmatch
-        # timestamps (in case of crash)
-
-        actor.infr.print('Initializing infr tables')
+        ibs = actor._open_ibs(dbdir)
         table = kwargs.get('init', 'staging')
-        actor.infr.reset_feedback(table, apply=True)
-        actor.infr.ensure_mst()
-        actor.infr.apply_nondynamic_update()
+        actor.checkpoint_fpath = checkpoint
+        actor.checkpoint_interval = checkpoint_interval
+        actor.feedback_mode = table
+
+        if checkpoint is not None:
+            aids_ = ibs.get_valid_aids() if aids == 'all' else aids
+            actor.infr = ibeis.AnnotInference.load_checkpoint(
+                ibs, checkpoint, aids=aids_, mode=table)
+
+        if actor.infr is not None:
+            actor.infr.print('resumed via actor from checkpoint')
+            for key in config:
+                actor.infr.params[key] = config[key]
+        else:
+            # Create the AnnotInference
+            print('starting via actor with ibs = %r' % (ibs, ))
+            actor.infr = ibeis.AnnotInference(ibs=ibs, aids=aids, autoinit=True)
+            actor.infr.print('started via actor')
+            actor.infr.print('config = {}'.format(ut.repr3(config)))
+            # Configure query_annot_infr
+            for key in config:
+                actor.infr.params[key] = config[key]
+            # Initialize
+            # TODO: Initialize state from staging reviews after annotmatch
+            # timestamps (in case of crash)
+
+            actor.infr.print('Initializing infr tables')
+            actor.infr.reset_feedback(table, apply=True)
+            actor.infr.ensure_mst()
+            actor.infr.apply_nondynamic_update()
+            actor.save_checkpoint()
 
         actor.infr.print('infr.status() = {}'.format(ut.repr4(actor.infr.status())))
 
@@ -242,8 +284,18 @@ class GraphActor(GRAPH_ACTOR_CLASS):
 
     def add_feedback(actor, **feedback):
         response = actor.infr.accept(feedback)
+        if actor.checkpoint_fpath is not None:
+            actor.infr.checkpoint_if_due(actor.checkpoint_fpath,
+                                         actor.checkpoint_interval,
+                                         mode=actor.feedback_mode)
         return response
 
+    def save_checkpoint(actor):
+        if actor.infr is None or actor.checkpoint_fpath is None:
+            return None
+        return actor.infr.save_checkpoint(actor.checkpoint_fpath,
+                                          mode=actor.feedback_mode)
+
     def remove_annots(actor, aids, **kwargs):
         print('Removing aids=%r from AnnotInference' % (aids, ))
         response = actor.infr.remove_aids(aids)
@@ -306,6 +358,387 @@ class GraphActor(GRAPH_ACTOR_CLASS):
             return match_state_verifier.extr
 
 
+class GraphHost(GRAPH_ACTOR_CLASS):
+    """
+    Serves many review sessions from a single worker.
+
+    Each session is an in-process GraphActor addressed by the ``graph_uuid``
+    item of the message. Sessions on the same host share the database
+    controller (and its SQL connections), the published verifiers and the
+    neighbor index cache instead of loading a copy per review graph.
+
+    Sessions idle for ``idle_timeout`` seconds, or the least recently used
+    ones when more than ``max_resident`` are in memory, are checkpointed to
+    disk and dropped. The next message for an evicted session restores it
+    from the checkpoint.
+
+    CommandLine:
+        python -m ibeis.web.graph_server GraphHost
+
+    Doctest:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.graph_server import *
+        >>> from ibeis.algo.hots.tests import bench
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'graph_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = bench.make_synthetic_database(dbdir, 9, num_feats=30,
+        >>>                                     verbose=False)
+        >>> # The host runs in this process when it is not used as an actor
+        >>> host = GraphHost(idle_timeout=None, max_resident=1)
+        >>> payload = testdata_start_payload(dbdir=dbdir)
+        >>> payload['config']['ranking.enabled'] = False
+        >>> host.handle(dict(payload, graph_uuid='a'))
+        >>> host.handle(dict(payload, graph_uuid='b'))
+        >>> stats = host.handle({'action': 'host_stats'})
+        >>> assert not stats['sessions']['a']['resident']
+        >>> # The evicted session is restored from its checkpoint
+        >>> user_request = host.handle({'action': 'continue_review',
+        >>>                             'graph_uuid': 'a'})
+        >>> infr_a = host.sessions['a'].infr
+        >>> assert infr_a.ibs is host.ibs_cache[payload['dbdir']]
+    """
+
+    def __init__(host, idle_timeout=1800, max_resident=None):
+        host.idle_timeout = idle_timeout
+        host.max_resident = max_resident
+        host.ibs_cache = {}
+        # Resident sessions
+        host.sessions = {}
+        # Bookkeeping for every open session, resident or evicted
+        host.session_info = {}
+
+    def handle(host, message):
+        if not isinstance(message, dict):
+            raise ValueError('Commands must be passed in a message dict')
+        message = message.copy()
+        action = message.get('action', None)
+        if action == 'host_stats':
+            return host.host_stats()
+        elif action == 'evict_idle':
+            return host.evict_idle()
+        graph_uuid = message.pop('graph_uuid', None)
+        if graph_uuid is None:
+            raise ValueError('Payload must have a graph_uuid item')
+        if action == 'close_session':
+            return host.close_session(graph_uuid)
+        elif action == 'start':
+            return host._start_session(graph_uuid, message)
+        session = host._get_session(graph_uuid)
+        return host._dispatch(graph_uuid, session, message)
+
+    def _new_session(host):
+        session = GraphActor()
+        session.ibs_cache = host.ibs_cache
+        return session
+
+    def _dispatch(host, graph_uuid, session, message):
+        info = host.session_info[graph_uuid]
+        tt = time.time()
+        try:
+            return session.handle(message)
+        finally:
+            now = time.time()
+            info['busy_time'] += now - tt
+            info['num_messages'] += 1
+            info['last_active'] = now
+            host.evict_idle(exclude=graph_uuid)
+
+    def _start_session(host, graph_uuid, message):
+        from os.path import join
+        if graph_uuid in host.session_info:
+            raise ValueError('Session graph_uuid=%r already started' % (
+                graph_uuid,))
+        session = host._new_session()
+        if message.get('checkpoint', None) is None and message.get('dbdir', None) is not None:
+            # Eviction needs somewhere to write the session state
+            ibs = session._open_ibs(message['dbdir'])
+            message['checkpoint'] = join(ibs.get_cachedir(),
+                                         'infr_checkpoints',
+                                         '%s.pkl' % (graph_uuid,))
+        response = session.handle(message)
+        host.sessions[graph_uuid] = session
+        host.session_info[graph_uuid] = {
+            'start_message': message,
+            'last_active': time.time(),
+            'busy_time': 0.0,
+            'num_messages': 1,
+            'num_evictions': 0,
+        }
+        host.evict_idle(exclude=graph_uuid)
+        return response
+
+    def _get_session(host, graph_uuid):
+        session = host.sessions.get(graph_uuid, None)
+        if session is None:
+            info = host.session_info.get(graph_uuid, None)
+            if info is None:
+                raise ValueError('Unknown graph_uuid=%r' % (graph_uuid,))
+            print('[graph_host] restoring session %r' % (graph_uuid,))
+            session = host._new_session()
+            session.handle(info['start_message'])
+            host.sessions[graph_uuid] = session
+        return session
+
+    def evict_session(host, graph_uuid):
+        session = host.sessions.pop(graph_uuid)
+        session.save_checkpoint()
+        host.session_info[graph_uuid]['num_evictions'] += 1
+        print('[graph_host] evicted session %r' % (graph_uuid,))
+
+    def evict_idle(host, exclude=None):
+        """
+        Checkpoints and drops sessions that are idle or over the resident
+        limit, least recently used first.
+
+        Returns:
+            list: graph_uuids of the evicted sessions
+        """
+        now = time.time()
+        candidates = sorted(
+            (graph_uuid for graph_uuid in host.sessions if graph_uuid != exclude),
+            key=lambda graph_uuid: host.session_info[graph_uuid]['last_active'])
+        evicted = []
+        for graph_uuid in candidates:
+            idle_time = now - host.session_info[graph_uuid]['last_active']
+            over_limit = (host.max_resident is not None and
+                          len(host.sessions) > host.max_resident)
+            is_idle = (host.idle_timeout is not None and
+                       idle_time >= host.idle_timeout)
+            if over_limit or is_idle:
+                host.evict_session(graph_uuid)
+                evicted.append(graph_uuid)
+        return evicted
+
+    def close_session(host, graph_uuid):
+        session = host.sessions.pop(graph_uuid, None)
+        if session is not None:
+            session.save_checkpoint()
+        host.session_info.pop(graph_uuid, None)
+        return 'closed'
+
+    def host_stats(host):
+        """
+        Per-session accounting. ``nbytes`` is the serialized size of the
+        inference state of resident sessions and ``checkpoint_nbytes`` the
+        size of the last checkpoint on disk.
+        """
+        from os.path import exists, getsize
+        import pickle
+        now = time.time()
+        session_stats = {}
+        for graph_uuid, info in host.session_info.items():
+            session = host.sessions.get(graph_uuid, None)
+            nbytes = None
+            if session is not None and session.infr is not None:
+                state = session.infr._checkpoint_state()
+                nbytes = len(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+            checkpoint = info['start_message'].get('checkpoint', None)
+            checkpoint_nbytes = None
+            if checkpoint is not None and exists(checkpoint):
+                checkpoint_nbytes = getsize(checkpoint)
+            session_stats[graph_uuid] = {
+                'resident': session is not None,
+                'nbytes': nbytes,
+                'checkpoint_nbytes': checkpoint_nbytes,
+                'idle_time': now - info['last_active'],
+                'busy_time': info['busy_time'],
+                'num_messages': info['num_messages'],
+                'num_evictions': info['num_evictions'],
+            }
+        return {
+            'num_sessions': len(host.session_info),
+            'num_resident': len(host.sessions),
+            'dbdirs': sorted(host.ibs_cache.keys()),
+            'sessions': session_stats,
+        }
+
+
+class SessionRoundRobin(object):
+    """
+    Pending messages of the sessions on one host. Sessions take turns, so a
+    session with a long backlog does not delay the others.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.graph_server import *
+        >>> queue = SessionRoundRobin()
+        >>> for item in ['a1', 'a2', 'a3']:
+        >>>     queue.push('a', item)
+        >>> queue.push('b', 'b1')
+        >>> queue.push('c', 'c1')
+        >>> queue.push('b', 'b2')
+        >>> print([queue.pop() for _ in range(len(queue))])
+        ['a1', 'b1', 'c1', 'a2', 'b2', 'a3']
+        >>> assert queue.pop() is None
+    """
+
+    def __init__(queue):
+        # Sessions with pending messages in the order of their next turn
+        queue.session_queues = collections.OrderedDict()
+
+    def __len__(queue):
+        return sum(map(len, queue.session_queues.values()))
+
+    def push(queue, graph_uuid, item):
+        if graph_uuid not in queue.session_queues:
+            queue.session_queues[graph_uuid] = collections.deque()
+        queue.session_queues[graph_uuid].append(item)
+
+    def pop(queue):
+        """ Returns the next message of the next session, or None """
+        if len(queue.session_queues) == 0:
+            return None
+        graph_uuid, items = queue.session_queues.popitem(last=False)
+        item = items.popleft()
+        if len(items) > 0:
+            # Back of the line
+            queue.session_queues[graph_uuid] = items
+        return item
+
+
+class GraphSessionExecutor(object):
+    """
+    Executor-like handle for one session on a GraphHostPool. Posts are routed
+    to the session's host and shutting down closes only the session.
+    """
+
+    def __init__(executor, pool, graph_uuid):
+        executor.pool = pool
+        executor.graph_uuid = graph_uuid
+
+    def post(executor, message):
+        return executor.pool.post(executor.graph_uuid, message)
+
+    def shutdown(executor, wait=True):
+        future = executor.pool.close_session(executor.graph_uuid)
+        if wait and future is not None:
+            future.result()
+
+
+@ut.reloadable_class
+class GraphHostPool(object):
+    """
+    A fixed number of GraphHost workers shared by all review sessions.
+
+    New sessions are assigned to the host with the fewest open sessions.
+    Each host works on one message at a time. Pending messages wait in a
+    SessionRoundRobin, so the sessions of a host take turns. A background
+    thread asks the hosts to evict idle sessions every ``evict_interval``
+    seconds, even when no messages arrive.
+
+    Example:
+        >>> # xdoctest: +SKIP
+        >>> from ibeis.web.graph_server import *
+        >>> pool = GraphHostPool(num_hosts=2)
+        >>> client1 = GraphClient('a', host_pool=pool, autoinit=True)
+        >>> client2 = GraphClient('b', host_pool=pool, autoinit=True)
+        >>> client1.post(testdata_start_payload()).result()
+        >>> client2.post(testdata_start_payload()).result()
+        >>> print(ut.repr4(pool.host_stats()))
+        >>> client1.shutdown()
+        >>> client2.shutdown()
+        >>> pool.shutdown()
+    """
+
+    def __init__(pool, num_hosts=2, idle_timeout=1800, max_resident=None,
+                 evict_interval=60):
+        pool.executors = [
+            GraphHost.executor(idle_timeout=idle_timeout,
+                               max_resident=max_resident)
+            for _ in range(num_hosts)
+        ]
+        # Mapping from graph_uuid to host index
+        pool.assignment = {}
+        # Pending (message, future) pairs and the busy flag of each host
+        pool.pending = [SessionRoundRobin() for _ in range(num_hosts)]
+        pool.busy = [False] * num_hosts
+        pool._lock = threading.RLock()
+        pool._stop_event = threading.Event()
+        pool._evict_thread = None
+        if idle_timeout is not None and evict_interval is not None:
+            pool._evict_thread = threading.Thread(
+                target=pool._evict_loop, args=(evict_interval,),
+                name='graph_host_evict')
+            pool._evict_thread.daemon = True
+            pool._evict_thread.start()
+
+    def _evict_loop(pool, evict_interval):
+        while not pool._stop_event.wait(evict_interval):
+            with pool._lock:
+                executors = list(pool.executors)
+            for executor in executors:
+                try:
+                    executor.post({'action': 'evict_idle'})
+                except Exception as ex:
+                    print('[graph_pool] could not evict idle sessions: %r' % (ex,))
+
+    def _dispatch_next(pool, hostx):
+        """ Sends the next pending message of hostx if the host is free """
+        with pool._lock:
+            while not pool.busy[hostx]:
+                pair = pool.pending[hostx].pop()
+                if pair is None:
+                    return
+                message, future = pair
+                # Skip messages the client cancelled while they waited
+                if future.set_running_or_notify_cancel():
+                    pool.busy[hostx] = True
+                    host_future = pool.executors[hostx].post(message)
+                    host_future.add_done_callback(functools.partial(
+                        pool._on_host_done, hostx, future))
+
+    def _on_host_done(pool, hostx, future, host_future):
+        try:
+            future.set_result(host_future.result())
+        except Exception as ex:
+            future.set_exception(ex)
+        with pool._lock:
+            pool.busy[hostx] = False
+        pool._dispatch_next(hostx)
+
+    def session_executor(pool, graph_uuid):
+        with pool._lock:
+            if graph_uuid not in pool.assignment:
+                num_sessions = [0] * len(pool.executors)
+                for hostx in pool.assignment.values():
+                    num_sessions[hostx] += 1
+                hostx = num_sessions.index(min(num_sessions))
+                pool.assignment[graph_uuid] = hostx
+        return GraphSessionExecutor(pool, graph_uuid)
+
+    def post(pool, graph_uuid, message):
+        hostx = pool.assignment[graph_uuid]
+        message = dict(message, graph_uuid=graph_uuid)
+        future = concurrent.futures.Future()
+        with pool._lock:
+            pool.pending[hostx].push(graph_uuid, (message, future))
+        pool._dispatch_next(hostx)
+        return future
+
+    def close_session(pool, graph_uuid):
+        if graph_uuid not in pool.assignment:
+            return None
+        future = pool.post(graph_uuid, {'action': 'close_session'})
+        del pool.assignment[graph_uuid]
+        return future
+
+    def host_stats(pool):
+        futures = [executor.post({'action': 'host_stats'})
+                   for executor in pool.executors]
+        return [future.result() for future in futures]
+
+    def shutdown(pool, wait=True):
+        pool._stop_event.set()
+        if pool._evict_thread is not None and wait:
+            pool._evict_thread.join()
+        with pool._lock:
+            executors = pool.executors
+            pool.executors = []
+            pool.assignment = {}
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+
 @ut.reloadable_class
 class GraphClient(object):
     """
@@ -379,8 +812,12 @@ class GraphClient(object):
 
     """
 
-    def __init__(client, graph_uuid=None, callbacks={}, autoinit=False):
+    def __init__(client, graph_uuid=None, callbacks={}, autoinit=False,
+                 host_pool=None):
         client.graph_uuid = graph_uuid
+        # If given, the session runs on a shared GraphHostPool instead of in
+        # its own GraphActor process
+        client.host_pool = host_pool
         client.callbacks = callbacks
         client.executor = None
         client.review_dict = {}
@@ -404,7 +841,10 @@ class GraphClient(object):
             client.initialize()
 
     def initialize(client):
-        client.executor = GraphActor.executor()
+        if client.host_pool is None:
+            client.executor = GraphActor.executor()
+        else:
+            client.executor = client.host_pool.session_executor(client.graph_uuid)
 
     def __del__(client):
         client.shutdown()
@@ -413,6 +853,13 @@ class GraphClient(object):
         for action, future in client.futures:
             future.cancel()
         client.futures = []
+        if client.executor is not None and client.host_pool is None:
+            # Persist the inference state so the session can resume quickly.
+            # A GraphHost saves it when the session is closed.
+            try:
+                client.executor.post({'action': 'save_checkpoint'}).result()
+            except Exception as ex:
+                print('[graph_client] could not save checkpoint: %r' % (ex,))
         client.status = 'Shutdown'
         if client.executor is not None:
             client.executor.shutdown(wait=True)
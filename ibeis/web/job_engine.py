@@ -61,6 +61,8 @@ import uuid  # NOQA
 import numpy as np
 import shelve
 import random
+import inspect
+import threading
 from os.path import join
 from functools import partial
 from ibeis.control import controller_inject
@@ -78,6 +80,12 @@ URL = 'tcp://127.0.0.1'
 NUM_ENGINES = 1
 VERBOSE_JOBS = ut.get_argflag('--bg') or ut.get_argflag('--fg') or ut.get_argflag('--verbose-jobs')
 
+# pipeline.CancelToken of every job that is queued or running in an engine
+# of this process, by jobid. The engines and the collector are threads of
+# the web process by default, so the collector's cancel action reaches them.
+JOB_CANCEL_TOKENS = {}
+JOB_CANCEL_LOCK = threading.Lock()
+
 
 def update_proctitle(procname):
     try:
@@ -215,6 +223,20 @@ def get_job_id_list(ibs):
     return jobid_list
 
 
+@register_ibs_method
+def get_engine_query_metrics(ibs):
+    """
+    Returns:
+        dict: the query metrics (query_metrics.QueryMetrics.asdict) reported
+            by the job engine workers, or {} if the job manager is not
+            running
+    """
+    if getattr(ibs, 'job_manager', None) is None:
+        return {}
+    reply = ibs.job_manager.jobiface.get_query_metrics()
+    return reply.get('query_metrics', {})
+
+
 @register_ibs_method
 @register_api('/api/engine/job/status/', methods=['GET', 'POST'], __api_plural_check__=False)
 def get_job_status(ibs, jobid):
@@ -247,6 +269,22 @@ def get_job_status(ibs, jobid):
     return status
 
 
+@register_ibs_method
+@register_api('/api/engine/job/cancel/', methods=['POST'], __api_plural_check__=False)
+def cancel_job(ibs, jobid):
+    """
+    Web call that cancels a queued or running job. A running query stops
+    before its next chunk or pipeline stage and the job completes with
+    exec_status 'cancelled'.
+
+    Returns:
+        dict: reply with 'cancelled' False if the job is unknown or already
+            completed
+    """
+    status = ibs.job_manager.jobiface.cancel_job(jobid)
+    return status
+
+
 @register_ibs_method
 @register_api('/api/engine/job/result/', methods=['GET', 'POST'])
 def get_job_result(ibs, jobid):
@@ -540,6 +578,22 @@ class JobInterface(object):
                 print('got reply = %s' % (ut.repr2(reply, truncate=True),))
         return reply
 
+    def get_query_metrics(jobiface):
+        with ut.Indenter('[client %d] ' % (jobiface.id_)):
+            print = partial(ut.colorprint, color='teal')
+            if jobiface.verbose >= 1:
+                print('----')
+                print('Request query metrics of the engines')
+            pair_msg = dict(action='query_metrics')
+            # CALLS: collector_request_query_metrics
+            jobiface.collect_deal_sock.send_json(pair_msg)
+            if jobiface.verbose >= 3:
+                print('... waiting for collector reply')
+            reply = jobiface.collect_deal_sock.recv_json()
+            if jobiface.verbose >= 2:
+                print('got reply = %s' % (ut.repr2(reply, truncate=True),))
+        return reply
+
     def get_job_status(jobiface, jobid):
         with ut.Indenter('[client %d] ' % (jobiface.id_)):
             print = partial(ut.colorprint, color='teal')
@@ -556,6 +610,22 @@ class JobInterface(object):
                 print('got reply = %s' % (ut.repr2(reply, truncate=True),))
         return reply
 
+    def cancel_job(jobiface, jobid):
+        with ut.Indenter('[client %d] ' % (jobiface.id_)):
+            print = partial(ut.colorprint, color='teal')
+            if jobiface.verbose >= 1:
+                print('----')
+                print('Request cancel of jobid=%r' % (jobid,))
+            pair_msg = dict(action='cancel', jobid=jobid)
+            # CALLS: collector_request_cancel
+            jobiface.collect_deal_sock.send_json(pair_msg)
+            if jobiface.verbose >= 3:
+                print('... waiting for collector reply')
+            reply = jobiface.collect_deal_sock.recv_json()
+            if jobiface.verbose >= 2:
+                print('got reply = %s' % (ut.repr2(reply, truncate=True),))
+        return reply
+
     def get_job_result(jobiface, jobid):
         with ut.Indenter('[client %d] ' % (jobiface.id_)):
             if jobiface.verbose >= 1:
@@ -828,8 +898,54 @@ def engine_loop(id_, port_dict, dbdir=None):
             print('Exiting engine loop')
 
 
+def get_job_cancel_token(jobid):
+    """ Returns the pipeline.CancelToken of jobid, creating it if needed """
+    from ibeis.algo.hots import pipeline
+    with JOB_CANCEL_LOCK:
+        cancel_token = JOB_CANCEL_TOKENS.get(jobid, None)
+        if cancel_token is None:
+            cancel_token = pipeline.CancelToken()
+            JOB_CANCEL_TOKENS[jobid] = cancel_token
+    return cancel_token
+
+
 def on_engine_request(ibs, jobid, action, args, kwargs):
-    """ Run whenever the engine recieves a message """
+    """
+    Run whenever the engine recieves a message
+
+    Actions that take a cancel_token argument (e.g. the query_chips jobs)
+    receive the job's token, so the collector's cancel action can stop them.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.job_engine import *  # NOQA
+        >>> from ibeis.algo.hots.tests import bench
+        >>> dbdir = ut.ensure_app_resource_dir('ibeis', 'stream_synth_test')
+        >>> ut.delete(dbdir)
+        >>> ibs = bench.make_synthetic_database(dbdir, 9, num_feats=30,
+        >>>                                     verbose=False)
+        >>> aids = ibs.get_valid_aids()
+        >>> qreq_ = bench.new_bench_query_request(ibs, aids[0:3], aids)
+        >>> shelve_path = ut.ensure_app_resource_dir('ibeis', 'test_collect_shelves')
+        >>> kwargs = dict(qreq_=qreq_, return_cm_simple_dict=True)
+        >>> result = on_engine_request(ibs, 'job1', 'query_chips', [], kwargs)
+        >>> assert result['exec_status'] == 'ok'
+        >>> assert len(ut.from_json(result['json_result'])) == 3
+        >>> # Cancel a queued job through the collector
+        >>> awaiting_data = {'job2': 'job accepted'}
+        >>> reply = on_collect_request(dict(action='cancel', jobid='job2'), {},
+        >>>                            awaiting_data, shelve_path)
+        >>> assert reply['cancelled']
+        >>> result = on_engine_request(ibs, 'job2', 'query_chips', [], kwargs)
+        >>> assert result['exec_status'] == 'cancelled'
+        >>> assert 'job2' not in JOB_CANCEL_TOKENS
+        >>> # Completed and unknown jobs cannot be cancelled
+        >>> reply = on_collect_request(dict(action='cancel', jobid='job2'),
+        >>>                            {'job2': 'cancelled'}, awaiting_data,
+        >>>                            shelve_path)
+        >>> assert not reply['cancelled']
+    """
+    from ibeis.algo.hots import pipeline
     # Start working
     if VERBOSE_JOBS:
         print('starting job=%r' % (jobid,))
@@ -845,19 +961,35 @@ def on_engine_request(ibs, jobid, action, args, kwargs):
         action_func = getattr(ibs, action)
         if VERBOSE_JOBS:
             print('resolving action=%r to ibeis function=%r' % (action, action_func))
+    cancel_token = get_job_cancel_token(jobid)
     try:
+        if 'cancel_token' in inspect.signature(action_func).parameters:
+            kwargs = dict(kwargs, cancel_token=cancel_token)
+        # The job may have been cancelled while it was queued
+        cancel_token.check()
         result = action_func(*args, **kwargs)
         exec_status = 'ok'
+    except pipeline.QueryCancelled as ex:
+        result = str(ex)
+        exec_status = 'cancelled'
     except Exception as ex:
         result = ut.formatex(ex, keys=['jobid'], tb=True)
         result = ut.strip_ansi(result)
         exec_status = 'exception'
+    finally:
+        with JOB_CANCEL_LOCK:
+            JOB_CANCEL_TOKENS.pop(jobid, None)
     json_result = ut.to_json(result)
     engine_result = dict(
         exec_status=exec_status,
         json_result=json_result,
         jobid=jobid,
     )
+    # Send the query metrics recorded by this job to the collector
+    from ibeis.algo.hots import query_metrics
+    metrics_info = query_metrics.get_process_metrics().drain()
+    if any(metrics_info.values()):
+        engine_result['query_metrics'] = metrics_info
     return engine_result
 
 
@@ -866,6 +998,7 @@ def collector_loop(port_dict, dbdir, containerized):
     Service that stores completed algorithm results
     """
     import ibeis
+    from ibeis.algo.hots import query_metrics
     update_proctitle('collector_loop')
     print = partial(ut.colorprint, color='yellow')
     with ut.Indenter('[collect] '):
@@ -883,6 +1016,8 @@ def collector_loop(port_dict, dbdir, containerized):
 
         collecter_data = {}
         awaiting_data = {}
+        # Totals of the query metrics reported by the engines
+        collected_metrics = query_metrics.QueryMetrics()
         try:
             while True:
                 # several callers here
@@ -890,11 +1025,14 @@ def collector_loop(port_dict, dbdir, containerized):
                 # CALLER: collector_store
                 # CALLER: collector_request_status
                 # CALLER: collector_request_result
+                # CALLER: collector_request_query_metrics
+                # CALLER: collector_request_cancel
                 idents, collect_request = rcv_multipart_json(collect_rout_sock, print=print)
                 try:
                     reply = on_collect_request(collect_request, collecter_data,
                                                awaiting_data, shelve_path,
-                                               containerized=containerized)
+                                               containerized=containerized,
+                                               collected_metrics=collected_metrics)
                 except Exception as ex:
                     print(ut.repr3(collect_request))
                     ut.printex(ex, 'ERROR in collection')
@@ -906,8 +1044,28 @@ def collector_loop(port_dict, dbdir, containerized):
 
 
 def on_collect_request(collect_request, collecter_data, awaiting_data, shelve_path,
-                       containerized=False):
-    """ Run whenever the collector recieves a message """
+                       containerized=False, collected_metrics=None):
+    """
+    Run whenever the collector recieves a message
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from ibeis.web.job_engine import *  # NOQA
+        >>> from ibeis.algo.hots import query_metrics
+        >>> shelve_path = ut.ensure_app_resource_dir('ibeis', 'test_collect_shelves')
+        >>> collected_metrics = query_metrics.QueryMetrics()
+        >>> worker = query_metrics.QueryMetrics()
+        >>> worker.add_items(queries=2)
+        >>> for jobid in ['job1', 'job2']:
+        >>>     engine_result = dict(exec_status='ok', json_result='1', jobid=jobid,
+        >>>                          query_metrics=worker.asdict())
+        >>>     on_collect_request(dict(action='store', engine_result=engine_result,
+        >>>                             callback_url=None, callback_method=None),
+        >>>                        {}, {}, shelve_path, collected_metrics=collected_metrics)
+        >>> reply = on_collect_request(dict(action='query_metrics'), {}, {}, shelve_path,
+        >>>                            collected_metrics=collected_metrics)
+        >>> assert reply['query_metrics']['items'] == {'queries': 4}
+    """
     import requests
     reply = {}
     action = collect_request['action']
@@ -934,6 +1092,10 @@ def on_collect_request(collect_request, collecter_data, awaiting_data, shelve_pa
         # collecter_data[jobid] = engine_result
         collecter_data[jobid] = engine_result['exec_status']
 
+        metrics_info = engine_result.get('query_metrics', None)
+        if metrics_info and collected_metrics is not None:
+            collected_metrics.merge(metrics_info)
+
         # NEW METHOD
         shelve_filepath = join(shelve_path, '%s.shelve' % (jobid, ))
         shelf = shelve.open(shelve_filepath, writeback=True)
@@ -995,6 +1157,21 @@ def on_collect_request(collect_request, collecter_data, awaiting_data, shelve_pa
     elif action == 'job_id_list':
         reply['status'] = 'ok'
         reply['jobid_list'] = list(collecter_data.keys())
+    elif action == 'cancel':
+        # From a Client
+        jobid = collect_request['jobid']
+        # Only queued or running jobs have a token to cancel
+        cancelled = jobid in awaiting_data and jobid not in collecter_data
+        if cancelled:
+            get_job_cancel_token(jobid).cancel()
+        reply['status'] = 'ok'
+        reply['jobid'] = jobid
+        reply['cancelled'] = cancelled
+    elif action == 'query_metrics':
+        # From a Client
+        reply['status'] = 'ok'
+        reply['query_metrics'] = (
+            {} if collected_metrics is None else collected_metrics.asdict())
     elif action == 'job_result':
         # From a Client
         jobid = collect_request['jobid']